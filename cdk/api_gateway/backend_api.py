@@ -3,8 +3,11 @@ from aws_cdk import (
     Stack,
     Environment,
     aws_lambda,
+    aws_lambda_event_sources,
     aws_iam,
     aws_secretsmanager,
+    aws_ses,
+    aws_sqs,
     PhysicalName,
     Duration,
     SecretValue
@@ -35,9 +38,15 @@ class BackendApi(Stack):
         - **Qualifications Handler**: Tracks user progress in training programs.
         - **Equipment Handler**: Manages equipment usage logs.
         - **Tiger Training Handler**: Integrates with Bridge LMS to manage training data.
-    2. IAM Policies:
+        - **Registration Email Handler**: Emails users who checked in without registering.
+    2. Registration Queue:
+        - The visits handler queues every user who checks in instead of emailing them itself,
+          so check-ins never wait on SES. The registration email handler drains the queue in
+          batches, dedupes the users, and sends the unregistered ones a templated bulk email.
+        - Messages that keep failing are moved to a dead letter queue.
+    3. IAM Policies:
         - Grants all Lambda functions the `execute-api:Invoke` and `execute-api:ManageConnections` actions.
-    3. Integration with External Services:
+    4. Integration with External Services:
         - Uses AWS Secrets Manager to securely retrieve credentials for Bridge LMS integration.
 
     Parameters:
@@ -48,7 +57,23 @@ class BackendApi(Stack):
     - equipment_table_name (str): The name of the DynamoDB table for equipment usage logs.
     - qualifications_table_name (str): The name of the DynamoDB table for training qualifications.
     - env (Environment): The AWS environment, including account and region.
+    - legacy_qualifications_table_name (str): Optional name of the (user_id, last_updated) keyed
+      qualifications table, read from for users not yet migrated into the qualifications table.
     - zones (MakerspaceDns): Optional Makerspace DNS configuration.
+    - timestamp_index_shards (int): The number of shards each table's TimestampIndex is spread
+      over (see Database). Passed to the visits, equipment, and qualifications handlers.
+    - timestamp_bucket_length (int): The length of the timestamp prefix the TimestampBucketIndex
+      of the visits and equipment tables partitions by (see Database).
+    - timestamp_bucket_reads (bool): Whether the visits and equipment handlers read date
+      ranges from the TimestampBucketIndex.
+    - registration_reminders_table_name (str): The name of the DynamoDB table holding the
+      last registration reminder sent to each user.
+    - registration_reminder_window_days (int): Days a reminded user isn't sent another
+      registration reminder.
+    - visit_rollups_table_name (str): The name of the DynamoDB table of visit counts per
+      location per day, kept by the visits handler.
+    - equipment_rollups_table_name (str): The name of the DynamoDB table of equipment usage
+      per printer per day, kept by the equipment handler.
 
     Key Features:
     - **Lambda Function Provisioning**:
@@ -78,6 +103,12 @@ class BackendApi(Stack):
             - https://docs.aws.amazon.com/cdk/api/v2/python/aws_cdk.aws_lambda/Runtime.html
         - aws_lambda.EnvironmentVariable:
             - https://docs.aws.amazon.com/cdk/api/v2/python/aws_cdk.aws_lambda/EnvironmentVariable.html
+        - aws_sqs.Queue:
+            - https://docs.aws.amazon.com/cdk/api/v2/python/aws_cdk.aws_sqs/Queue.html
+        - aws_lambda_event_sources.SqsEventSource:
+            - https://docs.aws.amazon.com/cdk/api/v2/python/aws_cdk.aws_lambda_event_sources/SqsEventSource.html
+        - aws_ses.CfnTemplate:
+            - https://docs.aws.amazon.com/cdk/api/v2/python/aws_cdk.aws_ses/CfnTemplate.html
     """
 
     def __init__(self, scope: Construct,
@@ -88,7 +119,15 @@ class BackendApi(Stack):
                  qualifications_table_name: str,
                  *,
                  env: Environment,
-                 zones: MakerspaceDns = None):
+                 legacy_qualifications_table_name: str = None,
+                 zones: MakerspaceDns = None,
+                 timestamp_index_shards: int = 1,
+                 timestamp_bucket_length: int = 10,
+                 timestamp_bucket_reads: bool = False,
+                 registration_reminders_table_name: str = None,
+                 registration_reminder_window_days: int = 7,
+                 visit_rollups_table_name: str = None,
+                 equipment_rollups_table_name: str = None):
 
         super().__init__(scope, 'BackendApi', env=env)
         
@@ -98,16 +137,23 @@ class BackendApi(Stack):
 
         self.stage = stage
         self.zones = zones
+        self.timestamp_index_shards = timestamp_index_shards
+        self.timestamp_bucket_length = timestamp_bucket_length
+        self.timestamp_bucket_reads = timestamp_bucket_reads
+        self.registration_reminder_window_days = registration_reminder_window_days
 
         self.domain_name = self.distribution.domain_name if stage == 'Dev' else self.zones.visit.zone_name
 
         self.endpoint: str = "https://" + self.domain_name
 
-        # Provision lambda functions
-        self.visits_handler_lambda(visits_table_name, users_table_name, self.endpoint)
+        # Provision lambda functions. The registration queue (and the lambda
+        # draining it) must exist before the visits handler sends to it.
+        self.registration_email_handler_lambda(users_table_name, registration_reminders_table_name)
+        self.visits_handler_lambda(visits_table_name, visit_rollups_table_name, self.endpoint)
         self.users_handler_lambda(users_table_name, self.endpoint)
-        self.qualifications_handler_lambda(qualifications_table_name, self.endpoint)
-        self.equipment_handler_lambda(equipment_table_name, self.endpoint)
+        self.qualifications_handler_lambda(qualifications_table_name, self.endpoint,
+                                           legacy_qualifications_table_name)
+        self.equipment_handler_lambda(equipment_table_name, equipment_rollups_table_name, self.endpoint)
 
         # Tiger training handler depends on qualifications handler's function name.
         # Create last to ensure this dependency is met.
@@ -130,7 +176,69 @@ class BackendApi(Stack):
         self.lambda_qualifications_handler.grant_invoke(self.lambda_tiger_training_handler)
 
 
-    def visits_handler_lambda(self, visits_table_name: str, users_table_name: str, domain_name: str):
+    def registration_email_handler_lambda(self, users_table_name: str, reminders_table_name: str):
+
+        # Messages emailed (or found registered) are deleted; ones that fail
+        # max_receive_count times end up here
+        self.registration_dead_letter_queue = aws_sqs.Queue(
+            self,
+            'RegistrationDeadLetterQueue',
+            retention_period=Duration.days(14))
+
+        # A message is hidden while a batch holding it is handled, so the
+        # visibility timeout must outlast the lambda (and its retries)
+        self.registration_queue = aws_sqs.Queue(
+            self,
+            'RegistrationQueue',
+            visibility_timeout=Duration.seconds(180),
+            dead_letter_queue=aws_sqs.DeadLetterQueue(
+                max_receive_count=3,
+                queue=self.registration_dead_letter_queue))
+
+        # The email registration reminders are sent with; {{user}} is filled
+        # in with each recipient's address
+        template_name: str = "MakerspaceRegistration"
+        self.registration_email_template = aws_ses.CfnTemplate(
+            self,
+            'RegistrationEmailTemplate',
+            template=aws_ses.CfnTemplate.TemplateProperty(
+                template_name=template_name,
+                subject_part="Clemson University Makerspace Registration",
+                text_part=("Hello {{user}},\n"
+                           "Our records indicate that you have not registered as an existing user.\n"
+                           "Please go to visit.cumaker.space/register to register as an existing user.\n")))
+
+        self.lambda_registration_email_handler = aws_lambda.Function(
+            self,
+            'RegistrationEmailHandlerLambda',
+            function_name=PhysicalName.GENERATE_IF_NEEDED,
+            code=aws_lambda.Code.from_asset('api_gateway/lambda_code/registration_email_handler'),
+            environment={
+                'USERS_TABLE_NAME': users_table_name,
+                'REMINDERS_TABLE_NAME': reminders_table_name,
+                'REGISTRATION_REMINDER_WINDOW_DAYS': str(self.registration_reminder_window_days),
+                'REGISTRATION_TEMPLATE_NAME': template_name,
+            },
+            handler='registration_email_handler.handler',
+            timeout=Duration.seconds(30),
+            runtime=aws_lambda.Runtime.PYTHON_3_12)
+
+        # Hand the lambda up to 100 messages at once, waiting up to a minute
+        # to fill a batch; failed messages are reported one by one so the
+        # rest of the batch isn't emailed again
+        self.lambda_registration_email_handler.add_event_source(
+            aws_lambda_event_sources.SqsEventSource(
+                self.registration_queue,
+                batch_size=100,
+                max_batching_window=Duration.seconds(60),
+                report_batch_item_failures=True))
+
+        self.lambda_registration_email_handler.role.add_to_policy(aws_iam.PolicyStatement(
+            actions=["ses:SendBulkTemplatedEmail"],
+            resources=["*"]
+        ))
+
+    def visits_handler_lambda(self, visits_table_name: str, visit_rollups_table_name: str, domain_name: str):
 
         self.lambda_visits_handler = aws_lambda.Function(
             self,
@@ -140,12 +248,18 @@ class BackendApi(Stack):
             environment={
                 'DOMAIN_NAME': domain_name,
                 'VISITS_TABLE_NAME': visits_table_name,
-                'USERS_TABLE_NAME': users_table_name
+                'VISIT_ROLLUPS_TABLE_NAME': visit_rollups_table_name,
+                'REGISTRATION_QUEUE_URL': self.registration_queue.queue_url,
+                'TIMESTAMP_INDEX_SHARDS': str(self.timestamp_index_shards),
+                'TIMESTAMP_BUCKET_LENGTH': str(self.timestamp_bucket_length),
+                'TIMESTAMP_BUCKET_READS': "1" if self.timestamp_bucket_reads else "0",
             },
             handler='visits_handler.handler',
             timeout=Duration.seconds(30),
             runtime=aws_lambda.Runtime.PYTHON_3_12)
 
+        self.registration_queue.grant_send_messages(self.lambda_visits_handler)
+
     
     def users_handler_lambda(self, users_table_name: str, domain_name: str):
 
@@ -163,23 +277,32 @@ class BackendApi(Stack):
             runtime=aws_lambda.Runtime.PYTHON_3_12)
 
     
-    def qualifications_handler_lambda(self, qualifications_table_name: str, domain_name: str):
+    def qualifications_handler_lambda(self, qualifications_table_name: str, domain_name: str,
+                                      legacy_qualifications_table_name: str = None):
+
+        environment: dict = {
+            'DOMAIN_NAME': domain_name,
+            'QUALIFICATIONS_TABLE_NAME': qualifications_table_name,
+            'TIMESTAMP_INDEX_SHARDS': str(self.timestamp_index_shards),
+        }
+
+        # Read users that haven't been migrated yet from the legacy table
+        if legacy_qualifications_table_name:
+            environment['LEGACY_QUALIFICATIONS_TABLE_NAME'] = legacy_qualifications_table_name
         
         self.lambda_qualifications_handler = aws_lambda.Function(
             self,
             'QualificationsHandlerLambda',
             function_name=PhysicalName.GENERATE_IF_NEEDED,
             code=aws_lambda.Code.from_asset('api_gateway/lambda_code/qualifications_handler'),
-            environment={
-                'DOMAIN_NAME': domain_name,
-                'QUALIFICATIONS_TABLE_NAME': qualifications_table_name,
-            },
+            environment=environment,
             handler='qualifications_handler.handler',
             timeout=Duration.seconds(30),
             runtime=aws_lambda.Runtime.PYTHON_3_12)
 
     
-    def equipment_handler_lambda(self, equipment_table_name: str, domain_name: str):
+    def equipment_handler_lambda(self, equipment_table_name: str, equipment_rollups_table_name: str,
+                                 domain_name: str):
         
         self.lambda_equipment_handler = aws_lambda.Function(
             self,
@@ -189,6 +312,10 @@ class BackendApi(Stack):
             environment={
                 'DOMAIN_NAME': domain_name,
                 'EQUIPMENT_TABLE_NAME': equipment_table_name,
+                'EQUIPMENT_ROLLUPS_TABLE_NAME': equipment_rollups_table_name,
+                'TIMESTAMP_INDEX_SHARDS': str(self.timestamp_index_shards),
+                'TIMESTAMP_BUCKET_LENGTH': str(self.timestamp_bucket_length),
+                'TIMESTAMP_BUCKET_READS': "1" if self.timestamp_bucket_reads else "0",
             },
             handler='equipment_handler.handler',
             timeout=Duration.seconds(30),
@@ -17,10 +17,32 @@ sys.path.append(os.path.dirname(SCRIPT_DIR))
 from api_defaults import *
 """
 import boto3
-from boto3.dynamodb.conditions import Key, Attr
+from boto3.dynamodb.conditions import Key, Attr, ConditionExpressionBuilder
+from boto3.dynamodb.types import TypeSerializer, TypeDeserializer
+from botocore.config import Config
+from botocore.exceptions import ClientError
+from functools import lru_cache
+from itertools import islice
+import base64
+import binascii
+import calendar
+import os
 import json
-from datetime import datetime
+import logging
+import math
+import re
+import time
+import zlib
+from datetime import datetime, timedelta, timezone
 from dataclasses import dataclass
+from decimal import Decimal
+
+# orjson is a faster (optional) JSON encoder. It is only used when it has
+# been packaged with the lambda; otherwise the standard json module is used.
+try:
+    import orjson
+except ImportError:
+    orjson = None
 
 class InvalidQueryParameters(BaseException):
     """
@@ -60,10 +82,188 @@ class InvalidRequestBody(BaseException):
 class FieldCheck():
     """
     Class to be used when checking fields for a key. Comprised of string lists of
-    'required' and 'disallowed' fields.
+    'required' and 'disallowed' fields, and optionally a 'nested' dictionary of
+    object fields and the string list of fields each object requires.
     """
     required: list[str]
     disallowed: list[str]
+    nested: dict = None
+
+@dataclass
+class VariantField():
+    """
+    Class describing a field whose value decides which other fields a request
+    body requires (or disallows). Comprised of the field's 'name', a 'checks'
+    dictionary of values and the FieldCheck to use for each, and an optional
+    'fallback' FieldCheck for any other value. Without a fallback, values not
+    in 'checks' are invalid.
+    """
+    name: str
+    checks: dict
+    fallback: FieldCheck = None
+
+@dataclass
+class RequestSchema():
+    """
+    Class declaring what a valid request body looks like. Comprised of the
+    string list of 'required' fields, a list of VariantFields, an 'enums'
+    dictionary of fields and their valid values (checked if the field is
+    present), and a 'formats' dictionary of fields and a (check function,
+    error message) tuple. Compile it once with compileRequestSchema.
+    """
+    required: list[str]
+    variants: list = None
+    enums: dict = None
+    formats: dict = None
+
+@dataclass
+class UpdatePlan():
+    """
+    Class describing a partial (PATCH) update of a single item. Comprised of
+    the 'set_fields' dictionary of fields and their new values, the
+    'remove_fields' string list of fields to delete, a 'default_fields'
+    dictionary of fields only set if the item doesn't have them yet, the
+    'conditions' (boto3 condition objects) the stored item must meet, and the
+    string list of variant fields the update 'depends_on'.
+    """
+    set_fields: dict
+    remove_fields: list[str]
+    default_fields: dict = None
+    conditions: list = None
+    depends_on: list = None
+
+@dataclass
+class HydrationResult():
+    """
+    Class returned when hydrating index keys into full table items.
+    Comprised of the hydrated 'items' (in the same order as the keys
+    they came from) and the number of 'round_trips' made to DynamoDB.
+    """
+    items: list
+    round_trips: int = 0
+
+@dataclass
+class Page():
+    """
+    Class representing one page read from a paginated DynamoDB operation.
+    Comprised of the page's 'items' (minus any skipped through 'offset'),
+    the 'start_key' the page was read from, and the page's
+    'last_evaluated_key' (None for the last page).
+    """
+    items: list
+    start_key: dict = None
+    offset: int = 0
+    last_evaluated_key: dict = None
+
+@dataclass
+class ShardedIndex():
+    """
+    Class describing a write sharded global secondary index. Items are spread
+    over 'shards' values ("1" to str(shards)) of the index's 'partition_key',
+    picked from a hash of the table's 'key_attributes', and reads query every
+    shard and merge the results by the index's 'sort_key'. Comprised of the
+    index 'name', 'partition_key', 'sort_key', the table's 'key_attributes',
+    the number of 'shards', and an optional 'bucket_index' that reads of a
+    bounded time range use instead. A single shard ("1") is an unsharded index.
+    """
+    name: str
+    partition_key: str
+    sort_key: str
+    key_attributes: list[str]
+    shards: int = 1
+    bucket_index: "BucketedIndex" = None
+
+    def shardKey(self, item: dict) -> str:
+        """
+        Returns the index partition key value to write an item with. The
+        hash (crc32) doesn't change between processes, so every write of the
+        same item picks the same shard.
+
+        :params item: The item (or just its key).
+        """
+        if self.shards == 1:
+            return "1"
+
+        key: str = "\x1f".join(str(item[name]) for name in self.key_attributes)
+        return str(zlib.crc32(key.encode()) % self.shards + 1)
+
+    def shardKeys(self) -> list[str]:
+        """
+        Returns every index partition key value, in shard order.
+        """
+        return [str(shard) for shard in range(1, self.shards + 1)]
+
+    def indexAttributes(self, item: dict) -> dict:
+        """
+        Returns the attributes an item is written with to be found through
+        the index (and its bucket index, if there is one).
+
+        :params item: The item (or just its key).
+        """
+        attributes: dict = { self.partition_key: self.shardKey(item) }
+        if self.bucket_index is not None:
+            attributes[self.bucket_index.partition_key] = self.bucket_index.bucketKey(item)
+
+        return attributes
+
+@dataclass
+class BucketedIndex():
+    """
+    Class describing a global secondary index partitioned by time. Items are
+    written with a 'partition_key' value (bucket) of the first 'bucket_length'
+    characters of their 'sort_key' timestamp: 10 for a day ("YYYY-MM-DD") or
+    7 for a month ("YYYY-MM"). Comprised of the index 'name',
+    'partition_key', 'sort_key', 'bucket_length', and whether 'reads' use
+    it yet (only once every item has a bucket).
+    """
+    name: str
+    partition_key: str
+    sort_key: str
+    bucket_length: int = 10
+    reads: bool = True
+
+    def bucketKey(self, item: dict) -> str:
+        """
+        Returns the bucket to write an item with.
+
+        :params item: The item (or just its key).
+        """
+        return item[self.sort_key][:self.bucket_length]
+
+    def bucketKeys(self, start_timestamp: str, end_timestamp: str) -> list[str]:
+        """
+        Returns every bucket holding timestamps between start_timestamp and
+        end_timestamp (inclusive), newest first.
+
+        :params start_timestamp: The earliest timestamp of the range.
+        :params end_timestamp: The latest timestamp of the range.
+        :returns: The buckets, or None if the range doesn't start and end
+                  with a date or covers more than MAX_TIMESTAMP_BUCKETS buckets.
+        """
+        for timestamp in (start_timestamp, end_timestamp):
+            if not DATE_PATTERN.match(timestamp) or not _validTimestampDate(timestamp[:DAY_BUCKET_LENGTH]):
+                return None
+
+        start = datetime(int(start_timestamp[0:4]), int(start_timestamp[5:7]), int(start_timestamp[8:10]))
+        end = datetime(int(end_timestamp[0:4]), int(end_timestamp[5:7]), int(end_timestamp[8:10]))
+
+        if self.bucket_length == MONTH_BUCKET_LENGTH:
+            months: int = (end.year - start.year) * 12 + end.month - start.month
+            if months >= MAX_TIMESTAMP_BUCKETS:
+                return None
+
+            buckets: list[str] = []
+            year, month = end.year, end.month
+            for _ in range(months + 1):
+                buckets.append(f"{year:04d}-{month:02d}")
+                year, month = (year, month - 1) if month > 1 else (year - 1, 12)
+            return buckets
+
+        days: int = (end - start).days
+        if days >= MAX_TIMESTAMP_BUCKETS:
+            return None
+
+        return [formatTimestamp(end - timedelta(days = day))[:DAY_BUCKET_LENGTH] for day in range(days + 1)]
 
 @dataclass
 class CompletableItem():
@@ -89,8 +289,11 @@ users_path: str = "/users"
 users_param_path: str = users_path + user_endpoint
 visits_path: str = "/visits"
 visits_param_path: str = visits_path + user_endpoint
+visits_batch_path: str = visits_path + "/batch"
+visits_stats_path: str = visits_path + "/stats"
 equipment_path: str = "/equipment"
 equipment_param_path: str = equipment_path + user_endpoint
+equipment_stats_path: str = equipment_path + "/stats"
 qualifications_path: str = "/qualifications"
 qualifications_param_path: str = qualifications_path + user_endpoint
 tiger_training_path: str = "/tiger_training"
@@ -98,17 +301,519 @@ tiger_training_path: str = "/tiger_training"
 # Other global values
 DEFAULT_SCAN_LIMIT: int = 1000
 TIMESTAMP_FORMAT: str = "%Y-%m-%dT%H:%M:%S"
+# Fixed width layout of a TIMESTAMP_FORMAT timestamp (ASCII digits only)
+TIMESTAMP_PATTERN = re.compile(r"\d{4}-\d{2}-\d{2}T\d{2}:\d{2}:\d{2}", re.ASCII)
+# Date ('YYYY-MM-DD') a timestamp (or timestamp prefix) starts with
+DATE_PATTERN = re.compile(r"\d{4}-\d{2}-\d{2}", re.ASCII)
 TIMESTAMP_INDEX: str = "TimestampIndex"
 GSI_ATTRIBUTE_NAME: str = "_ignore"
+# Number of GSI_ATTRIBUTE_NAME values (shards) a TimestampIndex is spread over
+# when the lambda's TIMESTAMP_INDEX_SHARDS isn't set (see Database). Items
+# written before sharding are all in shard "1", so they stay readable.
+DEFAULT_TIMESTAMP_INDEX_SHARDS: int = 1
+# Index (and attribute) partitioning entries by a day or month of their timestamp
+TIMESTAMP_BUCKET_INDEX: str = "TimestampBucketIndex"
+BUCKET_ATTRIBUTE_NAME: str = "_bucket"
+# Attributes kept on stored items for their indexes. Set by the handlers only;
+# request bodies may never set them.
+INTERNAL_ATTRIBUTES: list[str] = [GSI_ATTRIBUTE_NAME, BUCKET_ATTRIBUTE_NAME]
+# Number of characters of a timestamp kept for a day ("YYYY-MM-DD") or month ("YYYY-MM") bucket
+DAY_BUCKET_LENGTH: int = 10
+MONTH_BUCKET_LENGTH: int = 7
+# Bucket length used when the lambda's TIMESTAMP_BUCKET_LENGTH isn't set
+DEFAULT_TIMESTAMP_BUCKET_LENGTH: int = DAY_BUCKET_LENGTH
+# Most buckets a range read expands into; longer ranges read the TimestampIndex
+MAX_TIMESTAMP_BUCKETS: int = 400
+# Most buckets a limited range read fetches at the same time
+TIMESTAMP_BUCKET_WINDOW: int = 4
 VALID_LOCATIONS: list[str] = ["Watt", "Cooper", "CUICAR"]
+# Qualifications fields holding completable items (stored as name: status maps)
+COMPLETABLE_ITEM_LISTS: list[str] = ["trainings", "waivers", "miscellaneous"]
 VALID_QUERY_PARAMETERS: list[str] = [
     "start_timestamp",
     "end_timestamp",
-    "limit"
+    "limit",
+    "next_token",
+    "fields",
+    "location",
+    "equipment_type",
+    "printer_name"
 ]
 INT_QUERY_PARAMETERS: list[str] = ["limit"]
+# Query parameters that select the sorted (timestamp index) read path
+SORTED_QUERY_PARAMETERS: list[str] = [
+    "start_timestamp",
+    "end_timestamp",
+    "limit"
+]
 QUERY_LIMIT_RETURN_ALL: int = -1
 SCAN_LIMIT_RETURN_ALL: int = -1
+# Largest number of items a single list response will hold
+MAX_PAGE_LIMIT: int = 1000
+# Largest Limit sent with a single query/scan request when a limit is set
+MAX_REQUEST_LIMIT: int = 1000
+# Pattern each (dot separated) part of a requested field name must match
+FIELD_NAME_PATTERN = re.compile(r"^[A-Za-z_][A-Za-z0-9_]*$")
+# Largest number of keys DynamoDB accepts in one BatchGetItem request
+BATCH_GET_LIMIT: int = 100
+# Largest number of items DynamoDB accepts in one BatchWriteItem request
+BATCH_WRITE_LIMIT: int = 25
+# Largest number of items DynamoDB accepts in one TransactWriteItems request
+TRANSACT_WRITE_LIMIT: int = 100
+# Largest number of messages SQS accepts in one SendMessageBatch request
+QUEUE_SEND_LIMIT: int = 10
+# Environment variable holding the url of the queue check-ins report
+# (possibly) unregistered users to (see RegistrationEmailHandler)
+REGISTRATION_QUEUE_URL_ENV: str = "REGISTRATION_QUEUE_URL"
+# Attribute suppression entries expire on (epoch seconds, the table's TTL attribute)
+SUPPRESSION_TTL_ATTRIBUTE: str = "expires_at"
+# Attribute holding the time an entry was last recorded
+SUPPRESSION_RECORDED_ATTRIBUTE: str = "last_sent"
+# Most suppressed keys a SuppressionStore keeps cached in the container
+SUPPRESSION_CACHE_SIZE: int = 10000
+# Key of the visit rollups table: one item per location per day
+VISIT_ROLLUP_KEY: list[str] = ["location", "day"]
+# Rollup counter of the visits on a day
+VISIT_COUNT_ATTRIBUTE: str = "visits"
+# Prefix of the rollup counters of the visits in each hour of a day ("h00" to "h23")
+HOUR_COUNT_PREFIX: str = "h"
+# Key of the equipment rollups table: one item per equipment type per day per
+# printer, whose sort key is "YYYY-MM-DD#printer_name" ("YYYY-MM-DD#" for
+# equipment that isn't a printer)
+EQUIPMENT_ROLLUP_KEY: list[str] = ["equipment_type", "bucket"]
+EQUIPMENT_ROLLUP_SEPARATOR: str = "#"
+# Rollup counters of the usage logs, the grams of filament (print_mass), and
+# the minutes of printing (print_duration) on a day
+EQUIPMENT_COUNT_ATTRIBUTE: str = "logs"
+EQUIPMENT_SUM_ATTRIBUTES: list[str] = ["print_mass", "print_duration"]
+# Prefix of the rollup counters of the logs with each print_status (e.g., "status_Failed")
+STATUS_COUNT_PREFIX: str = "status_"
+# Number of times to retry unprocessed keys before giving up
+BATCH_MAX_RETRIES: int = 5
+# Seconds to wait before the first retry; doubles on every retry after
+BATCH_RETRY_BASE_DELAY: float = 0.05
+# Segment count that tells scans to pick a count from the table size
+SCAN_SEGMENTS_AUTO: int = 0
+# Most segments a parallel scan will split a table into
+MAX_SCAN_SEGMENTS: int = 16
+# Approximate amount of table data each automatically chosen segment reads
+SCAN_SEGMENT_TARGET_BYTES: int = 2 * 1024 * 1024
+# Most segments a parallel scan reads at the same time
+MAX_SCAN_WORKERS: int = 8
+# Media types the rest api treats as binary (see SharedApiGateway.create_rest_api).
+# API Gateway only turns a base64 encoded (e.g., compressed) response body back
+# into bytes when the first media type in the request's Accept header is one
+# of these, so responses to any other request are never compressed.
+BINARY_MEDIA_TYPES: list[str] = ["application/json"]
+# Smallest response body (in bytes) worth compressing
+COMPRESSION_MIN_BYTES: int = 1024
+# gzip compression level; favors speed since every response is compressed live
+GZIP_COMPRESS_LEVEL: int = 5
+# brotli quality; favors speed for the same reason
+BROTLI_QUALITY: int = 4
+# Bytes of the body hash used as a response's ETag
+ETAG_DIGEST_BYTES: int = 16
+# Seconds to wait when opening a connection to an AWS service
+AWS_CONNECT_TIMEOUT: float = 2
+# Seconds to wait for an AWS service to respond on an open connection
+AWS_READ_TIMEOUT: float = 5
+# Most attempts (including the first) made for a single AWS request
+AWS_MAX_ATTEMPTS: int = 4
+# Settings shared by every client/resource the lambdas create. Connections
+# are kept alive between (warm) invocations, the pool is large enough for
+# every parallel scan worker, and retries back off adaptively when throttled.
+AWS_CLIENT_CONFIG = Config(
+    tcp_keepalive = True,
+    max_pool_connections = MAX_SCAN_WORKERS * 2,
+    connect_timeout = AWS_CONNECT_TIMEOUT,
+    read_timeout = AWS_READ_TIMEOUT,
+    retries = {
+        'mode': 'adaptive',
+        'max_attempts': AWS_MAX_ATTEMPTS,
+    },
+)
+
+# Clients, resources, and tables created by this container. Lambda reuses the
+# module between warm invocations, so anything cached here skips client setup
+# (and the TLS handshake) on every request after the first.
+_aws_clients: dict = {}
+_aws_resources: dict = {}
+_aws_tables: dict = {}
+
+def getClient(service_name: str, region_name: str = None):
+    """
+    Returns a low level client for the given service, creating it the first
+    time it is asked for and reusing it for the life of the container.
+
+    :params service_name: The AWS service the client is for (e.g., 'ses').
+    :params region_name: The region to create the client in. Defaults to
+                         the region of the environment.
+    """
+    cache_key = (service_name, region_name)
+    if cache_key not in _aws_clients:
+        _aws_clients[cache_key] = boto3.client(service_name,
+                                               region_name = region_name,
+                                               config = AWS_CLIENT_CONFIG)
+
+    return _aws_clients[cache_key]
+
+def getResource(service_name: str, region_name: str = None):
+    """
+    Returns a service resource for the given service, creating it the first
+    time it is asked for and reusing it for the life of the container.
+
+    :params service_name: The AWS service the resource is for (e.g., 'dynamodb').
+    :params region_name: The region to create the resource in. Defaults to
+                         the region of the environment.
+    """
+    cache_key = (service_name, region_name)
+    if cache_key not in _aws_resources:
+        _aws_resources[cache_key] = boto3.resource(service_name,
+                                                   region_name = region_name,
+                                                   config = AWS_CLIENT_CONFIG)
+
+    return _aws_resources[cache_key]
+
+def getTable(table_name_env: str, region_name: str = None):
+    """
+    Returns the dynamodb Table whose name is stored in the given environment
+    variable. The Table is created once per container and reused afterwards.
+
+    :params table_name_env: The environment variable holding the table name
+                            (e.g., 'USERS_TABLE_NAME').
+    :params region_name: The region the table lives in. Defaults to the
+                         region of the environment.
+    """
+    cache_key = (table_name_env, region_name)
+    if cache_key not in _aws_tables:
+        dynamodb = getResource('dynamodb', region_name)
+        _aws_tables[cache_key] = dynamodb.Table(os.environ[table_name_env])
+
+    return _aws_tables[cache_key]
+
+class MessageQueue():
+    """
+    Sends json messages to an SQS queue, using SendMessageBatch requests of
+    up to QUEUE_SEND_LIMIT messages each. Messages SQS fails to accept are
+    retried with exponential backoff.
+    """
+
+    def __init__(self, queue_url: str, client = None):
+        """
+        :params queue_url: The url of the queue.
+        :params client: Optional SQS client. Defaults to the (container wide)
+                        client, created on first use.
+        """
+        self.queue_url = queue_url
+        self._client = client
+
+    @property
+    def client(self):
+        """
+        The Simple Queue Service client. Created on first use.
+        """
+        if self._client is None:
+            self._client = getClient('sqs')
+
+        return self._client
+
+    def send(self, messages: list[dict]) -> int:
+        """
+        Sends messages to the queue.
+
+        :params messages: The json objects to send.
+        :returns: The number of round trips made to SQS.
+        :raises Exception: If messages still failed after BATCH_MAX_RETRIES.
+        """
+        round_trips: int = 0
+
+        for start in range(0, len(messages), QUEUE_SEND_LIMIT):
+            entries: list[dict] = [
+                { 'Id': str(i), 'MessageBody': dumpsJSON(message) }
+                for i, message in enumerate(messages[start:start + QUEUE_SEND_LIMIT])
+            ]
+
+            retries: int = 0
+            while entries:
+                response = self.client.send_message_batch(QueueUrl=self.queue_url, Entries=entries)
+                round_trips += 1
+
+                # Retry anything SQS failed to accept on its side; errors
+                # caused by the message itself would fail again
+                failed: dict = {
+                    failure['Id']: failure for failure in response.get('Failed', [])
+                    if not failure.get('SenderFault')
+                }
+                if len(failed) != len(response.get('Failed', [])):
+                    raise Exception(f"Messages were rejected by {self.queue_url}.")
+
+                entries = [entry for entry in entries if entry['Id'] in failed]
+                if entries:
+                    if retries >= BATCH_MAX_RETRIES:
+                        raise Exception(f"Messages to {self.queue_url} still failed after {retries} retries.")
+
+                    time.sleep(BATCH_RETRY_BASE_DELAY * (2 ** retries))
+                    retries += 1
+
+        return round_trips
+
+class InMemoryQueue():
+    """
+    Local stand-in for a MessageQueue (e.g., for tests), holding the sent
+    messages in memory. receiveEvent() takes messages off the queue in the
+    shape of the event an SQS event source invokes a lambda with, and
+    process() drains the queue through a handler the same way the event
+    source would.
+    """
+
+    def __init__(self):
+        self.messages: list[dict] = []
+        self._message_count: int = 0
+
+    def __len__(self) -> int:
+        return len(self.messages)
+
+    def send(self, messages: list[dict]) -> int:
+        """
+        Adds messages to the queue.
+
+        :params messages: The json objects to send.
+        :returns: The number of round trips a MessageQueue would have made.
+        """
+        for message in messages:
+            self._message_count += 1
+            self.messages.append({
+                'messageId': str(self._message_count),
+                'body': dumpsJSON(message),
+            })
+
+        return math.ceil(len(messages) / QUEUE_SEND_LIMIT)
+
+    def receiveEvent(self, batch_size: int = QUEUE_SEND_LIMIT) -> dict:
+        """
+        Takes up to batch_size messages off the queue.
+
+        :params batch_size: The most messages to take.
+        :returns: An SQS event: { 'Records': [{ 'messageId', 'body' }] }
+        """
+        records: list[dict] = self.messages[:batch_size]
+        del self.messages[:batch_size]
+
+        return { 'Records': records }
+
+    def process(self, handler, batch_size: int = QUEUE_SEND_LIMIT, max_receives: int = 3) -> int:
+        """
+        Drains the queue through a handler. Messages the handler reports as
+        failed (through 'batchItemFailures') are put back on the queue, and
+        dropped after max_receives attempts (as if sent to a dead letter queue).
+
+        :params handler: An object whose handle_event(event, context) takes SQS events.
+        :params batch_size: The most messages to hand the handler at once.
+        :params max_receives: The most times a single message is handed over.
+        :returns: The number of messages dropped.
+        """
+        receives: dict = {}
+        dropped: int = 0
+
+        while self.messages:
+            event: dict = self.receiveEvent(batch_size)
+            response: dict = handler.handle_event(event, None) or {}
+
+            failed_ids: set = { failure['itemIdentifier'] for failure in response.get('batchItemFailures', []) }
+            for record in event['Records']:
+                if record['messageId'] not in failed_ids:
+                    continue
+
+                receives[record['messageId']] = receives.get(record['messageId'], 1) + 1
+                if receives[record['messageId']] > max_receives:
+                    dropped += 1
+                else:
+                    self.messages.append(record)
+
+        return dropped
+
+class SuppressionStore():
+    """
+    Records when something (e.g., a registration reminder) was last done for
+    each key of a table, and answers whether it was done within a window, so
+    it isn't done again until the window passes. Entries expire through the
+    table's TTL attribute (SUPPRESSION_TTL_ATTRIBUTE) when their window ends;
+    TTL deletes lazily, so the expiry is also checked on read.
+
+    Suppressed keys are cached in the container until their entry expires, so
+    repeat lookups skip DynamoDB. Keys that aren't suppressed are always
+    looked up, since another container may have recorded them since.
+    """
+
+    def __init__(self, table, window: timedelta, key_attribute: str = PRIMARY_KEY,
+                 clock = time.time):
+        """
+        :params table: The dynamodb.Table holding the entries, keyed by key_attribute.
+        :params window: How long a key stays suppressed once recorded. A window
+                        of zero (or less) never suppresses anything.
+        :params key_attribute: The name of the table's partition key.
+        :params clock: Function returning the current epoch time in seconds.
+        """
+        self.table = table
+        self.window = window
+        self.key_attribute = key_attribute
+        self.clock = clock
+
+        # Expiry (epoch seconds) of each key known to be suppressed
+        self._cache: dict = {}
+
+    @property
+    def enabled(self) -> bool:
+        return self.window.total_seconds() > 0
+
+    def isSuppressed(self, key: str) -> bool:
+        """
+        Checks whether a single key is suppressed (one key lookup, or none
+        if the key is cached).
+
+        :params key: The key to check.
+        """
+        return key in self.suppressedKeys([key])
+
+    def suppressedKeys(self, keys: list[str]) -> set:
+        """
+        Finds the keys that are suppressed. Keys that aren't cached are looked
+        up at once with batched gets.
+
+        :params keys: The keys to check.
+        :returns: The set of suppressed keys.
+        """
+        if not self.enabled:
+            return set()
+
+        now: float = self.clock()
+        suppressed: set = set()
+        lookup_keys: list[dict] = []
+
+        for key in dict.fromkeys(keys):
+            if self._cache.get(key, 0) > now:
+                suppressed.add(key)
+            else:
+                self._cache.pop(key, None)
+                lookup_keys.append({ self.key_attribute: key })
+
+        if lookup_keys:
+            found = hydrateKeys(self.table, lookup_keys, [self.key_attribute],
+                                fields = [self.key_attribute, SUPPRESSION_TTL_ATTRIBUTE])
+
+            for item in found.items:
+                expires_at: int = int(item.get(SUPPRESSION_TTL_ATTRIBUTE, 0))
+                if expires_at > now:
+                    suppressed.add(item[self.key_attribute])
+                    self._cacheKey(item[self.key_attribute], expires_at, now)
+
+        return suppressed
+
+    def record(self, keys: list[str]) -> int:
+        """
+        Records that something was just done for every key, suppressing the
+        keys until the window passes.
+
+        :params keys: The keys to record.
+        :returns: The number of round trips made to DynamoDB.
+        """
+        if not self.enabled or not keys:
+            return 0
+
+        now: float = self.clock()
+        expires_at: int = int(now + self.window.total_seconds())
+        recorded: str = formatTimestamp(datetime.fromtimestamp(now, timezone.utc))
+
+        keys = list(dict.fromkeys(keys))
+        round_trips: int = batchPutItems(self.table, [
+            {
+                self.key_attribute: key,
+                SUPPRESSION_RECORDED_ATTRIBUTE: recorded,
+                SUPPRESSION_TTL_ATTRIBUTE: expires_at,
+            }
+            for key in keys
+        ])
+
+        for key in keys:
+            self._cacheKey(key, expires_at, now)
+
+        return round_trips
+
+    def _cacheKey(self, key: str, expires_at: int, now: float):
+        """
+        Caches a suppressed key, dropping expired keys (or, if none have
+        expired, every key) when the cache is full.
+        """
+        if len(self._cache) >= SUPPRESSION_CACHE_SIZE:
+            self._cache = { cached: expiry for cached, expiry in self._cache.items() if expiry > now }
+            if len(self._cache) >= SUPPRESSION_CACHE_SIZE:
+                self._cache.clear()
+
+        self._cache[key] = expires_at
+
+def getQueue(queue_url_env: str):
+    """
+    Returns a MessageQueue for the queue whose url is stored in the given
+    environment variable.
+
+    :params queue_url_env: The environment variable holding the queue url
+                           (e.g., REGISTRATION_QUEUE_URL_ENV).
+    """
+    return MessageQueue(os.environ[queue_url_env])
+
+def _jsonDefault(obj):
+    """
+    Converts the non JSON types returned by dynamodb into JSON types. Called
+    by the encoder only for objects it can't serialize on its own.
+
+    Decimals holding whole numbers become ints; all other Decimals become
+    floats. Sets (e.g., dynamodb string sets) become sorted lists so the same
+    item always serializes to the same JSON.
+
+    :params obj: The object the encoder couldn't serialize.
+    :raises: TypeError if obj is of any other type.
+    """
+    if isinstance(obj, Decimal):
+        if obj.is_finite() and obj == obj.to_integral_value():
+            return int(obj)
+        return float(obj)
+
+    if isinstance(obj, (set, frozenset)):
+        try:
+            return sorted(obj)
+        except TypeError:
+            return list(obj)
+
+    raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+
+# One encoder shared by every response. Items read from dynamodb can't
+# contain reference cycles, so the circular reference check is skipped.
+_json_encoder = json.JSONEncoder(
+    default = _jsonDefault,
+    check_circular = False,
+    separators = (',', ':'),
+)
+
+def dumpsJSON(body) -> str:
+    """
+    Serializes a response body to a JSON string. Supports everything the json
+    module does, plus the Decimals and sets returned by dynamodb.
+
+    Items made up of only strings (the common case for these tables) are
+    encoded entirely by the C encoder; the Python fallback is only entered
+    for Decimals and sets. When orjson is available it is used instead.
+
+    :params body: The content to serialize.
+    :returns: The JSON string.
+    """
+    if orjson is not None:
+        try:
+            return orjson.dumps(body, default = _jsonDefault).decode()
+        except orjson.JSONEncodeError:
+            # E.g., integers too large for orjson; the json module has no limit
+            pass
+
+    return _json_encoder.encode(body)
 
 def buildResponse(statusCode: int, body: dict):
     """
@@ -125,9 +830,268 @@ def buildResponse(statusCode: int, body: dict):
             'Access-Control-Allow-Methods': '*',
             "Content-Type": "application/json",
 		},
-        "body": json.dumps(body)
+        "body": dumpsJSON(body)
+    }
+
+def getHeader(event: dict, name: str, default: str = None) -> str:
+    """
+    Returns the value of a request header from an API Gateway event. Header
+    names are matched regardless of case.
+
+    :params event: The API Gateway event.
+    :params name: The name of the header (e.g., 'Accept-Encoding').
+    :params default: The value to return if the header is not present.
+    """
+    headers: dict = event.get("headers") or {}
+    name = name.lower()
+
+    for key in headers:
+        if key.lower() == name:
+            return headers[key]
+
+    return default
+
+def getRequestBody(event: dict) -> str:
+    """
+    Returns the request body of an API Gateway event as a string. API Gateway
+    base64 encodes bodies whose Content-Type is a binary media type, so those
+    are decoded first.
+
+    :params event: The API Gateway event.
+    """
+    body: str = event['body']
+
+    if event.get("isBase64Encoded") and body is not None:
+        body = base64.b64decode(body).decode()
+
+    return body
+
+@lru_cache(maxsize = None)
+def _importBrotli():
+    """
+    Imports brotli, which compresses JSON better than gzip. Like orjson, it is
+    only used when it has been packaged with the lambda. Only compressed
+    responses need it, so it is imported the first time one is built instead
+    of on every cold start (and a missing package is only looked for once).
+
+    :returns: The brotli module, or None if it isn't packaged.
+    """
+    try:
+        import brotli
+    except ImportError:
+        return None
+
+    return brotli
+
+def chooseContentEncoding(accept_encoding: str) -> str:
+    """
+    Returns the content encoding to compress a response with, given the value of
+    a request's Accept-Encoding header, or None if the response should not be
+    compressed. brotli ('br') is preferred over gzip when the client accepts
+    both equally and brotli is available.
+
+    :params accept_encoding: The Accept-Encoding header (e.g., 'gzip, br;q=0.8').
+    """
+    if not accept_encoding:
+        return None
+
+    supported: list[str] = ["gzip"]
+    if _importBrotli() is not None:
+        supported.insert(0, "br")
+
+    # Parse the weight (q value) of every listed encoding
+    weights: dict = {}
+    for coding in accept_encoding.split(","):
+        name, _, parameters = coding.strip().partition(";")
+        name = name.strip().lower()
+        weight: float = 1.0
+
+        parameter, _, value = parameters.strip().partition("=")
+        if parameter.strip().lower() == "q":
+            try:
+                weight = float(value)
+            except ValueError:
+                weight = 0.0
+
+        if name:
+            weights[name] = weight
+
+    # '*' matches any encoding not listed by name
+    best_encoding: str = None
+    best_weight: float = 0.0
+    for encoding in supported:
+        weight = weights.get(encoding, weights.get("*", 0.0))
+        if weight > best_weight:
+            best_encoding = encoding
+            best_weight = weight
+
+    return best_encoding
+
+def _etagOpaque(etag: str, strip_encoding: bool = False) -> str:
+    """
+    Returns the quoted value of an entity tag without any weak ('W/') prefix.
+    Optionally strips the content encoding suffix compressResponse adds.
+
+    :params etag: The entity tag (e.g., 'W/"abc"').
+    :params strip_encoding: Whether to remove a '-gzip'/'-br' suffix.
+    """
+    etag = etag.strip()
+    if etag.startswith("W/"):
+        etag = etag[2:]
+
+    if strip_encoding:
+        for encoding in ["gzip", "br"]:
+            suffix: str = f"-{encoding}\""
+            if etag.endswith(suffix):
+                etag = etag[:-len(suffix)] + "\""
+                break
+
+    return etag
+
+def applyETag(response: dict, event: dict) -> dict:
+    """
+    Adds a strong ETag (a hash of the response body) to a successful GET
+    response. If the request's If-None-Match header matches the ETag, a
+    304 Not Modified response with an empty body is returned instead.
+
+    Must be called before compressResponse, which marks the ETag of
+    compressed bodies with the encoding used.
+
+    :params response: The response built by buildResponse.
+    :params event: The API Gateway event the response is for.
+    :returns: The response with an ETag header, or a 304 response.
+    """
+    if event.get("httpMethod") != "GET" or response.get("statusCode") != 200:
+        return response
+
+    body: str = response.get("body")
+    if body is None or response.get("isBase64Encoded"):
+        return response
+
+    # Only successful GET responses are hashed, so hashlib is imported here
+    # instead of on every cold start.
+    import hashlib
+
+    digest: str = hashlib.blake2b(body.encode(), digest_size = ETAG_DIGEST_BYTES).hexdigest()
+    etag: str = f"\"{digest}\""
+
+    headers: dict = dict(response.get("headers", {}))
+    headers["ETag"] = etag
+    # Lets browser clients read the ETag from cross origin responses
+    headers["Access-Control-Expose-Headers"] = "ETag"
+
+    # If-None-Match uses weak comparison, and '*' matches any current item
+    if_none_match: str = getHeader(event, "If-None-Match")
+    if if_none_match:
+        tags: list[str] = [tag.strip() for tag in if_none_match.split(",")]
+        if "*" in tags or etag in [_etagOpaque(tag, strip_encoding = True) for tag in tags]:
+            return {
+                **response,
+                "statusCode": 304,
+                "headers": headers,
+                "body": "",
+            }
+
+    return {
+        **response,
+        "headers": headers,
+    }
+
+def compressResponse(response: dict, event: dict) -> dict:
+    """
+    Compresses the body of a response built by buildResponse when the request
+    allows it. The body must be at least COMPRESSION_MIN_BYTES long, the
+    request's Accept-Encoding must include a supported encoding, and its
+    Accept header must be a binary media type (so API Gateway decodes the
+    base64 body before sending it). Otherwise the response is returned as is.
+
+    :params response: The response to compress.
+    :params event: The API Gateway event the response is for.
+    :returns: The (possibly) compressed response.
+    """
+    body: str = response.get("body")
+    if body is None or response.get("isBase64Encoded"):
+        return response
+
+    # API Gateway compares only the first media type of the Accept header
+    accept: str = getHeader(event, "Accept", "")
+    accept = accept.split(",")[0].split(";")[0].strip().lower()
+    if accept not in BINARY_MEDIA_TYPES:
+        return response
+
+    encoding: str = chooseContentEncoding(getHeader(event, "Accept-Encoding"))
+    data: bytes = body.encode()
+    if encoding is None or len(data) < COMPRESSION_MIN_BYTES:
+        return response
+
+    # Only compressed responses need the codecs, so they are imported here
+    # instead of on every cold start.
+    if encoding == "br":
+        data = _importBrotli().compress(data, quality = BROTLI_QUALITY)
+    else:
+        import gzip
+
+        # A fixed mtime keeps the same body compressing to the same bytes
+        data = gzip.compress(data, compresslevel = GZIP_COMPRESS_LEVEL, mtime = 0)
+
+    headers: dict = dict(response.get("headers", {}))
+    headers["Content-Encoding"] = encoding
+    headers["Vary"] = "Accept-Encoding"
+
+    # A compressed body is a different representation, so it needs a
+    # different strong ETag (applyETag accepts either form)
+    if "ETag" in headers:
+        headers["ETag"] = _etagOpaque(headers["ETag"])[:-1] + f"-{encoding}\""
+
+    return {
+        **response,
+        "headers": headers,
+        "body": base64.b64encode(data).decode(),
+        "isBase64Encoded": True,
     }
 
+def flushApiCache(event: dict, response: dict = None) -> bool:
+    """
+    Flushes the API Gateway response cache of the stage an event came through,
+    so cached GET responses from before a write are not returned after it.
+
+    The whole stage is flushed, not just the entries of the written resource:
+    FlushStageCache is the only server side invalidation API Gateway has.
+    Single entries can only be invalidated by a signed client request (with
+    Cache-Control: max-age=0) for each exact cache key, and the keys of a
+    resource (every query parameter and header variant) can't be listed.
+    Flushing everything is acceptable since only rare writes call this:
+    users registering, qualification syncs, and equipment logs being patched
+    when a print ends. Visits and new equipment logs, written constantly,
+    never flush and rely on their short TTLs instead (see ROUTE_CACHE_TTLS
+    in shared_api_gateway.py). A flush costs each cached key one miss.
+
+    Events that did not come through API Gateway (e.g., direct lambda
+    invocations) have no stage to flush and are ignored. A failed flush is
+    logged, not raised; cached responses still expire after their TTL.
+
+    :params event: The API Gateway event of the write.
+    :params response: The response to the write. If given, the cache is only
+                      flushed when the write succeeded (2xx status code).
+    :returns: True if the cache was flushed, False otherwise.
+    """
+    if response is not None and not 200 <= response.get("statusCode", 0) < 300:
+        return False
+
+    request_context: dict = event.get("requestContext") or {}
+    api_id: str = request_context.get("apiId")
+    stage: str = request_context.get("stage")
+    if not api_id or not stage:
+        return False
+
+    try:
+        getClient('apigateway').flush_stage_cache(restApiId = api_id, stageName = stage)
+    except ClientError as e:
+        logging.getLogger().warning(f"Failed to flush the api cache of stage {stage}: {e}")
+        return False
+
+    return True
+
 def buildTimestampKeyExpression(query_parameters: dict, timestamp_attr_name: str):
     """
     Returns a valid Key() expression to use when sorting by timestamp. Use this
@@ -181,95 +1145,1092 @@ def buildTimestampKeyExpression(query_parameters: dict, timestamp_attr_name: str
 
     return expression
 
-def queryByKeyExpression(table, key_expression, GSI = None,
-                         limit: int = QUERY_LIMIT_RETURN_ALL) -> list:
+def getPageLimit(query_parameters: dict) -> int:
     """
-    Queries a given table for all entries that match the provided key
-    expression. When desiring to search by timestamp, table is required
-    to have a secondary global index with a primary key of {"S": "_ignore"}
-    and a sort key set to the timestamp attribute name. All entries to be
-    queried by timestamp must have an _ignore value of "1". Any other table
-    entry with an _ignore value that isn't "1" will be ignored.
+    Returns the number of items a list endpoint should return for a request.
+    Uses the 'limit' query parameter when it is a positive number, but never
+    returns more than MAX_PAGE_LIMIT items so a response never has to hold
+    a whole table.
 
-    :note: This will return a list of objects containing the values of the
-           primary key of the table, the corresponding timestamp, and the
-           _ignore value ("1"). Additional queries using this data may be
-           needed to get more information from the table. Also, the queried
-           table MUST have the timestamp field provided to the key expression
-           as a sort key.
-    :params table: The dynamodb.Table to scan.
-    :params key_expression: A valid Key() expression to filter results by.
-                            Common problems result from trying to use a
-                            non primary key (primary+sort) in the expression.
-    :params GSI: The string name of the global secondary index that has _ignore
-                 primary key and timestamp as the sort key. Required if
-                 trying to query by timestamps.
-    :params limit: The maximum number of results to return. Specifying any
-                   negative number indicates to return all matching items.
-                   Defaults to the value that represents returning as many
-                   items as possible.
-    :return: A list containing all entries that pass the timestamp filtering.
+    :params query_parameters: The (cleaned) query parameters of the request.
+    :returns: The page size to request.
     """
 
+    limit = query_parameters.get("limit", MAX_PAGE_LIMIT)
+
+    if limit <= 0 or limit > MAX_PAGE_LIMIT:
+        return MAX_PAGE_LIMIT
+
+    return limit
+
+def parseFieldsParameter(query_parameters: dict):
     """
-    Query at least once, then keep querying until queries
-    stop exceeding response limit.
+    Parses the 'fields' query parameter: a comma separated list of the
+    attributes to return for each item. Nested attributes can be selected
+    with dots (e.g., printer_3d_info.print_mass).
+
+    :params query_parameters: The (cleaned) query parameters of the request.
+    :returns: The list of requested fields, or None if every field should
+              be returned.
+    :raises InvalidQueryParameters: If a field name is not valid.
     """
 
-    # The list that will store all matching query items
-    items: list = []
-    try:
-        if GSI != None:
-            response = table.query(
-                IndexName=GSI,
-                KeyConditionExpression=key_expression,
-                ScanIndexForward=False, # Orders results by descending timestamp
-            )
-        else:
-            response = table.query(
-                KeyConditionExpression=key_expression,
-                ScanIndexForward=False, # Orders results by descending timestamp
-            )
+    if "fields" not in query_parameters:
+        return None
 
-        items += response['Items']
+    fields: list[str] = []
+    for field in str(query_parameters["fields"]).split(","):
+        field = field.strip()
+        if not field:
+            continue
 
-        """
-        Query until "LastEvaluatedKey" isn't in response (all appropriate keys
-        where checked)
-        """
-        while "LastEvaluatedKey" in response:
+        if not all(FIELD_NAME_PATTERN.match(part) for part in field.split(".")):
+            raise InvalidQueryParameters(f"'{field}' is not a valid field name.")
 
-            # Stop scanning if the number of items has reached the imposed limit
-            if limit > 0 and len(items) >= limit:
-                break
+        if field not in fields:
+            fields.append(field)
 
-            if GSI != None:
-                response = table.query(
-                    IndexName=GSI,
-                    KeyConditionExpression=key_expression,
-                    ScanIndexForward=False, # Orders results by descending timestamp
-                )
-            else:
-                response = table.query(
-                    KeyConditionExpression=key_expression,
-                    ScanIndexForward=False, # Orders results by descending timestamp
-                )
+    if not fields:
+        raise InvalidQueryParameters("The fields query parameter must name at least one field.")
+
+    return fields
+
+def buildProjection(fields) -> dict:
+    """
+    Builds the ProjectionExpression (and the ExpressionAttributeNames it
+    uses) for a list of fields. Every name is replaced by a placeholder so
+    reserved words such as 'timestamp' and 'location' can be projected.
+
+    :params fields: The list of fields to project, or None for all fields.
+    :returns: The keyword arguments to add to a get_item, query, or scan
+              request. Empty if fields is None.
+    """
+
+    if not fields:
+        return {}
+
+    # DynamoDB rejects overlapping paths, and the parent covers the child
+    fields = [field for field in fields
+              if not any(field.startswith(other + ".") for other in fields)]
+
+    attribute_names: dict = {}
+    placeholders: dict = {}
+    paths: list[str] = []
+    for field in fields:
+        parts: list[str] = []
+        for part in field.split("."):
+            if part not in placeholders:
+                placeholders[part] = f"#f{len(placeholders)}"
+                attribute_names[placeholders[part]] = part
+            parts.append(placeholders[part])
+        paths.append(".".join(parts))
+
+    return {
+        'ProjectionExpression': ", ".join(paths),
+        'ExpressionAttributeNames': attribute_names,
+    }
+
+def _encodeToken(token: dict) -> str:
+    """
+    Encodes a json object as an opaque, url-safe token.
+
+    :params token: The object to encode.
+    :returns: The token string.
+    """
+
+    token = json.dumps(token, separators=(',', ':'))
+
+    # Strip padding so the token can be used in a query string as is
+    return base64.urlsafe_b64encode(token.encode()).decode().rstrip('=')
+
+def _decodeToken(next_token: str) -> dict:
+    """
+    Reverses _encodeToken.
+
+    :params next_token: The token string.
+    :returns: The decoded json object.
+    :raises InvalidQueryParameters: If the token can't be decoded.
+    """
+
+    try:
+        padding = '=' * (-len(next_token) % 4)
+        token = json.loads(base64.urlsafe_b64decode(next_token + padding))
+
+    except (binascii.Error, ValueError, TypeError):
+        raise InvalidQueryParameters("The provided next_token is not valid.")
+
+    if not isinstance(token, dict):
+        raise InvalidQueryParameters("The provided next_token is not valid.")
+
+    return token
+
+def encodeNextToken(start_key, offset: int = 0) -> str:
+    """
+    Builds the opaque next_token returned by list endpoints. The token stores
+    the DynamoDB key the next read should start after and how many items of
+    that read were already returned.
+
+    :params start_key: The ExclusiveStartKey of the next read. None when the
+                       next read starts at the beginning of the table/index.
+    :params offset: The number of items of the next read to skip.
+    :returns: A url-safe string representing the position to resume from.
+    """
+
+    serializer = TypeSerializer()
+
+    if start_key is not None:
+        start_key = { key: serializer.serialize(value) for key, value in start_key.items() }
+
+    return _encodeToken({ 'key': start_key, 'offset': offset })
+
+def decodeNextToken(next_token: str) -> tuple:
+    """
+    Reverses encodeNextToken.
+
+    :params next_token: A token previously returned by encodeNextToken.
+    :returns: The tuple (start_key, offset).
+    :raises InvalidQueryParameters: If the token can't be decoded.
+    """
+
+    deserializer = TypeDeserializer()
+    token = _decodeToken(next_token)
+
+    try:
+        start_key = token['key']
+        offset = int(token['offset'])
+
+        if start_key is not None:
+            start_key = { key: deserializer.deserialize(value) for key, value in start_key.items() }
+
+    except (ValueError, TypeError, KeyError, AttributeError):
+        raise InvalidQueryParameters("The provided next_token is not valid.")
+
+    if offset < 0:
+        raise InvalidQueryParameters("The provided next_token is not valid.")
+
+    return (start_key, offset)
+
+def iteratePages(read, next_token: str = None, limit: int = QUERY_LIMIT_RETURN_ALL,
+                 page_size: int = None):
+    """
+    Lazily reads pages from a paginated DynamoDB operation (query or scan),
+    following LastEvaluatedKey. The next page is only requested once the
+    consumer asks for it, so stopping early stops reading.
+
+    :params read: A callable taking the keyword arguments of a table.query()
+                  or table.scan() call that are not set by this function
+                  (i.e., ExclusiveStartKey and Limit) and returning its response.
+    :params next_token: Optional token to resume from.
+    :params limit: The number of items the consumer needs. When positive, each
+                   request only asks DynamoDB for the items still needed (up to
+                   MAX_REQUEST_LIMIT) and no pages are read past the limit.
+                   Specifying any negative number reads until no items remain.
+    :params page_size: Optional Limit to send with every request when limit
+                       doesn't set a smaller one.
+    :yields: A Page for every response read.
+    :raises InvalidQueryParameters: If next_token is not valid.
+    """
+
+    start_key = None
+    offset = 0
+    if next_token:
+        start_key, offset = decodeNextToken(next_token)
+
+    # Number of items yielded so far
+    count: int = 0
+
+    while True:
+        request: dict = {}
+        if start_key is not None:
+            request['ExclusiveStartKey'] = start_key
+
+        # Ask for only the items still needed (plus any being skipped)
+        if limit > 0:
+            request['Limit'] = min(offset + limit - count, page_size or MAX_REQUEST_LIMIT)
+        elif page_size:
+            request['Limit'] = page_size
+
+        try:
+            response = read(**request)
+        except ClientError as e:
+            # A token from a different request doesn't match this key schema
+            if next_token and e.response['Error']['Code'] == 'ValidationException':
+                raise InvalidQueryParameters("The provided next_token is not valid for this request.")
+            raise e
+
+        last_evaluated_key = response.get('LastEvaluatedKey')
+        page = Page(
+            items = response.get('Items', [])[offset:],
+            start_key = start_key,
+            offset = offset,
+            last_evaluated_key = last_evaluated_key
+        )
+        count += len(page.items)
+
+        yield page
+
+        if last_evaluated_key is None:
+            return
+
+        # Don't request another page once the limit has been read
+        if limit > 0 and count >= limit:
+            return
+
+        start_key = last_evaluated_key
+        offset = 0
+
+def readPage(read, limit: int = QUERY_LIMIT_RETURN_ALL, next_token: str = None,
+             page_size: int = None) -> tuple:
+    """
+    Reads items from a paginated DynamoDB operation (query or scan), following
+    LastEvaluatedKey until limit items are collected or no items remain.
+
+    :params read: A callable taking the keyword arguments of a table.query()
+                  or table.scan() call that are not set by this function
+                  (i.e., ExclusiveStartKey and Limit) and returning its response.
+    :params limit: The maximum number of items to return. Specifying any
+                   negative number indicates to return all items.
+    :params next_token: Optional token from a previous call to resume from.
+    :params page_size: Optional Limit to send with every request (see
+                       iteratePages).
+    :returns: The tuple (items, next_token). next_token is None when there
+              are no more items to read.
+    :raises InvalidQueryParameters: If next_token is not valid.
+    """
+
+    # The list that will store all read items
+    items: list = []
+
+    for page in iteratePages(read, next_token, limit = limit, page_size = page_size):
+
+        # Stop part way through the page if it holds more than needed
+        if limit > 0 and len(items) + len(page.items) > limit:
+            remaining: int = limit - len(items)
+            items += page.items[0:remaining]
+            return (items, encodeNextToken(page.start_key, page.offset + remaining))
+
+        items += page.items
+
+        if page.last_evaluated_key is None:
+            break
+
+        if limit > 0 and len(items) >= limit:
+            return (items, encodeNextToken(page.last_evaluated_key))
+
+    return (items, None)
+
+def getTimestampIndexShards() -> int:
+    """
+    Gets the number of shards the TimestampIndex of this lambda's tables is
+    spread over.
+
+    :returns: The TIMESTAMP_INDEX_SHARDS environment variable, or
+              DEFAULT_TIMESTAMP_INDEX_SHARDS when it isn't set (or valid).
+    """
+
+    try:
+        return max(1, int(os.environ.get("TIMESTAMP_INDEX_SHARDS", DEFAULT_TIMESTAMP_INDEX_SHARDS)))
+
+    except ValueError:
+        return DEFAULT_TIMESTAMP_INDEX_SHARDS
+
+def getTimestampBuckets() -> tuple:
+    """
+    Gets how the TimestampBucketIndex of this lambda's tables is bucketed.
+
+    :returns: The tuple (bucket_length, reads). bucket_length is the
+              TIMESTAMP_BUCKET_LENGTH environment variable (or
+              DEFAULT_TIMESTAMP_BUCKET_LENGTH), and reads is whether
+              TIMESTAMP_BUCKET_READS is "1".
+    """
+
+    bucket_length: str = os.environ.get("TIMESTAMP_BUCKET_LENGTH", str(DEFAULT_TIMESTAMP_BUCKET_LENGTH))
+    if bucket_length not in (str(DAY_BUCKET_LENGTH), str(MONTH_BUCKET_LENGTH)):
+        bucket_length = str(DEFAULT_TIMESTAMP_BUCKET_LENGTH)
+
+    return (int(bucket_length), os.environ.get("TIMESTAMP_BUCKET_READS") == "1")
+
+def timestampIndex(sort_key: str, key_attributes: list[str], shards: int = None,
+                   bucketed: bool = False) -> ShardedIndex:
+    """
+    Describes the TimestampIndex of a table.
+
+    :params sort_key: The name of the timestamp attribute the index sorts by.
+    :params key_attributes: The names of the table's key attributes.
+    :params shards: Optional number of shards. Defaults to getTimestampIndexShards().
+    :params bucketed: Whether the table also has a TimestampBucketIndex
+                      (bucketed as getTimestampBuckets() says).
+    :returns: The ShardedIndex to query the index with, and to pick the
+              index attributes of written items from.
+    """
+
+    if shards is None:
+        shards = getTimestampIndexShards()
+
+    bucket_index: BucketedIndex = None
+    if bucketed:
+        bucket_length, reads = getTimestampBuckets()
+        bucket_index = BucketedIndex(name = TIMESTAMP_BUCKET_INDEX, partition_key = BUCKET_ATTRIBUTE_NAME,
+                                     sort_key = sort_key, bucket_length = bucket_length,
+                                     reads = reads)
+
+    return ShardedIndex(name = TIMESTAMP_INDEX, partition_key = GSI_ATTRIBUTE_NAME,
+                        sort_key = sort_key, key_attributes = key_attributes,
+                        shards = shards, bucket_index = bucket_index)
+
+def _timestampRange(key_expression) -> tuple:
+    """
+    Gets the range of timestamps a sort key expression (from
+    buildTimestampKeyExpression) is bounded by.
+
+    :params key_expression: The Key() expression, or None.
+    :returns: The tuple (start_timestamp, end_timestamp), or None if the
+              expression isn't bounded on both ends.
+    """
+
+    if key_expression is None:
+        return None
+
+    expression: dict = key_expression.get_expression()
+    values: tuple = expression['values']
+
+    if expression['operator'] == 'BETWEEN':
+        return (values[1], values[2])
+
+    if expression['operator'] == '=':
+        return (values[1], values[1])
+
+    return None
+
+def _rangeBuckets(index: ShardedIndex, key_expression) -> list[str]:
+    """
+    Gets the buckets of an index's bucket index a query reads instead of the
+    index itself.
+
+    :params index: The ShardedIndex being queried.
+    :params key_expression: The Key() expression on the index's sort key.
+    :returns: The buckets (newest first), or None when the index has no
+              bucket index (being read) or the range isn't bounded on both
+              ends by dates MAX_TIMESTAMP_BUCKETS buckets apart at most.
+    """
+
+    if index.bucket_index is None or not index.bucket_index.reads:
+        return None
+
+    timestamp_range: tuple = _timestampRange(key_expression)
+    if timestamp_range is None:
+        return None
+
+    return index.bucket_index.bucketKeys(*timestamp_range)
+
+def _shardKeyExpression(index: ShardedIndex, shard: str, key_expression = None):
+    """
+    Builds the key expression to query a single shard of a sharded index.
+
+    :params index: The ShardedIndex to query.
+    :params shard: The shard's partition key value.
+    :params key_expression: Optional Key() expression on the index's sort key.
+    """
+
+    shard_expression = Key(index.partition_key).eq(shard)
+    if key_expression is None:
+        return shard_expression
+
+    return shard_expression & key_expression
+
+def _withSortKey(fields: list[str], index: ShardedIndex) -> list[str]:
+    """
+    Adds an index's sort key to the fields projected by a query of its
+    shards, since the shards are merged by it.
+
+    :params fields: The list of fields to project, or None for all fields.
+    :params index: The ShardedIndex being queried.
+    :returns: The fields to project.
+    """
+
+    if not fields or index.sort_key in fields:
+        return fields
+
+    return fields + [index.sort_key]
+
+def _withoutSortKey(item: dict, fields: list[str], index: ShardedIndex) -> dict:
+    """
+    Removes the sort key _withSortKey added to an item's projection if it
+    wasn't one of the requested fields.
+
+    :params item: An item read from a shard.
+    :params fields: The list of requested fields, or None for all fields.
+    :params index: The ShardedIndex being queried.
+    :returns: The item.
+    """
+
+    if fields and index.sort_key not in fields:
+        item.pop(index.sort_key, None)
+
+    return item
+
+def _decodeShardTokens(next_token: str, index: ShardedIndex) -> list:
+    """
+    Gets the position of each shard of a sharded index to resume from.
+
+    :params next_token: Optional token from a previous query of the shards.
+    :params index: The ShardedIndex being queried.
+    :returns: The list of each shard's token (see encodeNextToken), or None
+              for shards that have no items left. Every shard starts from its
+              beginning when next_token isn't given.
+    :raises InvalidQueryParameters: If next_token is not valid.
+    """
+
+    if not next_token:
+        return [encodeNextToken(None)] * index.shards
+
+    shard_tokens = _decodeToken(next_token).get('shards')
+
+    if (not isinstance(shard_tokens, list)
+            or len(shard_tokens) != index.shards
+            or not all(token is None or isinstance(token, str) for token in shard_tokens)):
+        raise InvalidQueryParameters("The provided next_token is not valid.")
+
+    return shard_tokens
+
+def _decodeBucketToken(next_token: str, buckets: list[str]) -> tuple:
+    """
+    Gets the bucket (and position in it) of a bucketed query to resume from.
+
+    :params next_token: Optional token from a previous query of the buckets.
+    :params buckets: The buckets covering the range being queried.
+    :returns: The tuple (position, bucket_token). position is the index of
+              the bucket in buckets, and bucket_token the token to resume
+              that bucket from (or None to read it from its beginning).
+    :raises InvalidQueryParameters: If next_token is not valid.
+    """
+
+    if not next_token:
+        return (0, None)
+
+    token: dict = _decodeToken(next_token)
+    bucket_token = token.get('position')
+
+    if token.get('bucket') not in buckets or not (bucket_token is None or isinstance(bucket_token, str)):
+        raise InvalidQueryParameters("The provided next_token is not valid.")
+
+    return (buckets.index(token['bucket']), bucket_token)
+
+def _readPositions(read, next_token: str = None, limit: int = QUERY_LIMIT_RETURN_ALL) -> list[tuple]:
+    """
+    Reads items from a paginated DynamoDB operation (see iteratePages), tagging
+    each item with the position to resume reading from it.
+
+    :params read: The callable to read pages with (see iteratePages).
+    :params next_token: Optional token to resume from.
+    :params limit: The maximum number of items to read. Specifying any
+                   negative number indicates to read every item.
+    :returns: A list of (item, start_key, offset) tuples in the order read.
+              encodeNextToken(start_key, offset) resumes from the item.
+    """
+
+    entries: list[tuple] = []
+    for page in iteratePages(read, next_token, limit = limit):
+        for index_in_page, item in enumerate(page.items):
+            entries.append((item, page.start_key, page.offset + index_in_page))
+
+    return entries
+
+def _queryBuckets(table, key_expression, index: BucketedIndex, buckets: list[str],
+                  limit: int = QUERY_LIMIT_RETURN_ALL,
+                  next_token: str = None,
+                  fields: list[str] = None) -> tuple:
+    """
+    Queries the buckets of a time bucketed index covering a range, newest
+    bucket first. Every item of a bucket is newer than every item of the
+    buckets after it, so the results of each bucket are just appended. A
+    limited read fetches TIMESTAMP_BUCKET_WINDOW buckets at the same time and
+    stops once the limit is met; otherwise every bucket is read at once.
+
+    :params table: The dynamodb.Table to query.
+    :params key_expression: The Key() expression on the index's sort key.
+    :params index: The BucketedIndex to query.
+    :params buckets: The buckets covering the range (see BucketedIndex.bucketKeys).
+    :params limit: The maximum number of results to return. Specifying any
+                   negative number indicates to return all matching items.
+    :params next_token: Optional token from a previous call to resume from.
+    :params fields: Optional list of the fields to return for each item.
+    :returns: The tuple (items, next_token).
+    :raises InvalidQueryParameters: If next_token is not valid.
+    """
+
+    # Get the bucket (and position in it) to resume from
+    position, bucket_token = _decodeBucketToken(next_token, buckets)
+
+    def read_bucket(bucket: int, bucket_token: str, bucket_limit: int) -> list[tuple]:
+        query_kwargs: dict = {
+            'TableName': table.name,
+            'IndexName': index.name,
+            'KeyConditionExpression': Key(index.partition_key).eq(buckets[bucket]) & key_expression,
+            'ScanIndexForward': False, # Orders results by descending timestamp
+            **buildProjection(fields),
+        }
+
+        # The low level client is thread safe, unlike the table resource
+        read = lambda **kwargs: table.meta.client.query(**query_kwargs, **kwargs)
+
+        return _readPositions(read, bucket_token, bucket_limit)
+
+    # Only bucketed queries need threads, so the executor is imported here
+    # instead of on every cold start.
+    from concurrent.futures import ThreadPoolExecutor
+
+    items: list = []
+    with ThreadPoolExecutor(max_workers=MAX_SCAN_WORKERS) as executor:
+        while position < len(buckets):
+            window: int = TIMESTAMP_BUCKET_WINDOW if limit > 0 else MAX_SCAN_WORKERS
+            window_buckets: list[int] = list(range(position, min(len(buckets), position + window)))
+
+            # Reading one more item than needed tells whether a bucket has more
+            bucket_limit: int = limit - len(items) + 1 if limit > 0 else limit
+            results = list(executor.map(
+                lambda bucket: read_bucket(bucket, bucket_token if bucket == position else None, bucket_limit),
+                window_buckets
+            ))
+
+            for bucket, entries in zip(window_buckets, results):
+                taken: list[tuple] = entries if limit <= 0 else entries[:limit - len(items)]
+                items += [entry[0] for entry in taken]
+
+                # Stopped part way through the bucket
+                if len(taken) < len(entries):
+                    _, start_key, offset = entries[len(taken)]
+                    return (items, _encodeToken({
+                        'bucket': buckets[bucket],
+                        'position': encodeNextToken(start_key, offset),
+                    }))
+
+                # The bucket was read to its end, and the limit is met
+                if limit > 0 and len(items) >= limit:
+                    if bucket + 1 == len(buckets):
+                        return (items, None)
+                    return (items, _encodeToken({ 'bucket': buckets[bucket + 1], 'position': None }))
+
+            position = window_buckets[-1] + 1
+            bucket_token = None
+
+    return (items, None)
+
+def _queryShards(table, key_expression, index: ShardedIndex,
+                 limit: int = QUERY_LIMIT_RETURN_ALL,
+                 next_token: str = None,
+                 fields: list[str] = None) -> tuple:
+    """
+    Queries every shard of a sharded index at the same time and merges the
+    results into a single page in descending sort key order.
+
+    :params table: The dynamodb.Table to query.
+    :params key_expression: Optional Key() expression on the index's sort key.
+    :params index: The ShardedIndex to query.
+    :params limit: The maximum number of results to return. Specifying any
+                   negative number indicates to return all matching items.
+    :params next_token: Optional token from a previous call to resume from.
+    :params fields: Optional list of the fields to return for each item.
+    :returns: The tuple (items, next_token).
+    :raises InvalidQueryParameters: If next_token is not valid.
+    """
+
+    # Get the position of each shard from the token, or start every shard
+    shard_tokens: list = _decodeShardTokens(next_token, index)
+
+    active_shards: list[int] = [i for i, token in enumerate(shard_tokens) if token is not None]
+    shard_keys: list[str] = index.shardKeys()
+
+    # Any single shard may hold every item of the page. Reading one more lets
+    # each shard that isn't finished resume from the first item not returned.
+    shard_limit: int = limit + 1 if limit > 0 else limit
+
+    def read_shard(shard: int) -> list[tuple]:
+        query_kwargs: dict = {
+            'TableName': table.name,
+            'IndexName': index.name,
+            'KeyConditionExpression': _shardKeyExpression(index, shard_keys[shard], key_expression),
+            'ScanIndexForward': False, # Orders results by descending timestamp
+            **buildProjection(_withSortKey(fields, index)),
+        }
+
+        # The low level client is thread safe, unlike the table resource
+        read = lambda **kwargs: table.meta.client.query(**query_kwargs, **kwargs)
+
+        return [(shard, *entry) for entry in _readPositions(read, shard_tokens[shard], shard_limit)]
+
+    # Only sharded queries need threads, so the executor (and heapq) are
+    # imported here instead of on every cold start.
+    from concurrent.futures import ThreadPoolExecutor
+    import heapq
+
+    with ThreadPoolExecutor(max_workers=max(1, min(MAX_SCAN_WORKERS, len(active_shards)))) as executor:
+        results = list(executor.map(read_shard, active_shards))
+
+    # Each shard is already in descending order, so merging keeps the order
+    merged = heapq.merge(*results, key=lambda entry: entry[1][index.sort_key], reverse=True)
+    if limit > 0:
+        merged = islice(merged, limit)
+
+    items: list = []
+    returned: dict = dict.fromkeys(active_shards, 0)
+    for shard, item, _, _ in merged:
+        items.append(_withoutSortKey(item, fields, index))
+        returned[shard] += 1
+
+    # Resume each shard from its first item that wasn't returned
+    next_shard_tokens: list = list(shard_tokens)
+    for shard, entries in zip(active_shards, results):
+        if returned[shard] < len(entries):
+            _, _, start_key, offset = entries[returned[shard]]
+            next_shard_tokens[shard] = encodeNextToken(start_key, offset)
+        else:
+            next_shard_tokens[shard] = None
+
+    if all(token is None for token in next_shard_tokens):
+        return (items, None)
+
+    return (items, _encodeToken({ 'shards': next_shard_tokens }))
+
+def _iterateBuckets(table, key_expression, index: BucketedIndex, buckets: list[str],
+                    limit: int = QUERY_LIMIT_RETURN_ALL,
+                    next_token: str = None,
+                    fields: list[str] = None):
+    """
+    Generator version of _queryBuckets. Every item of a bucket is newer than
+    every item of the buckets after it, so the buckets are read one at a
+    time, newest first, and a bucket is only queried once the consumer
+    reaches it.
+
+    :params table: The dynamodb.Table to query.
+    :params key_expression: The Key() expression on the index's sort key.
+    :params index: The BucketedIndex to query.
+    :params buckets: The buckets covering the range (see BucketedIndex.bucketKeys).
+    :params limit: The maximum number of items to yield. Specifying any
+                   negative number indicates to yield all matching items.
+    :params next_token: Optional token from _queryBuckets to resume from.
+    :params fields: Optional list of the fields to return for each item.
+    :yields: Each matching item.
+    :raises InvalidQueryParameters: If next_token is not valid.
+    """
+
+    position, bucket_token = _decodeBucketToken(next_token, buckets)
+
+    # Number of items yielded so far
+    count: int = 0
+
+    for bucket in buckets[position:]:
+        # Don't query the next bucket once limit items have been yielded
+        if limit >= 0 and count >= limit:
+            return
+
+        query_kwargs: dict = {
+            'IndexName': index.name,
+            'KeyConditionExpression': Key(index.partition_key).eq(bucket) & key_expression,
+            'ScanIndexForward': False, # Orders results by descending timestamp
+            **buildProjection(fields),
+        }
+
+        # Only ask the bucket for the items still needed
+        bucket_limit: int = limit - count if limit > 0 else limit
+        pages = iteratePages(lambda **kwargs: table.query(**query_kwargs, **kwargs),
+                             bucket_token, limit = bucket_limit)
+
+        items = (item for page in pages for item in page.items)
+        if bucket_limit >= 0:
+            items = islice(items, bucket_limit)
+
+        for item in items:
+            yield item
+            count += 1
+
+        bucket_token = None
+
+def _iterateShards(table, key_expression, index: ShardedIndex,
+                   limit: int = QUERY_LIMIT_RETURN_ALL,
+                   next_token: str = None,
+                   fields: list[str] = None):
+    """
+    Generator version of _queryShards. Each shard is read one page at a time
+    and the shards are merged by the sort key as they are read, so only the
+    first page of every shard is queried before the first item is yielded.
+
+    :params table: The dynamodb.Table to query.
+    :params key_expression: Optional Key() expression on the index's sort key.
+    :params index: The ShardedIndex to query.
+    :params limit: The maximum number of items to yield. Specifying any
+                   negative number indicates to yield all matching items.
+    :params next_token: Optional token from _queryShards to resume from.
+    :params fields: Optional list of the fields to return for each item.
+    :yields: Each matching item.
+    :raises InvalidQueryParameters: If next_token is not valid.
+    """
+
+    shard_tokens: list = _decodeShardTokens(next_token, index)
+    shard_keys: list[str] = index.shardKeys()
+
+    def shard_items(shard: int):
+        query_kwargs: dict = {
+            'IndexName': index.name,
+            'KeyConditionExpression': _shardKeyExpression(index, shard_keys[shard], key_expression),
+            'ScanIndexForward': False, # Orders results by descending timestamp
+            **buildProjection(_withSortKey(fields, index)),
+        }
+
+        # Any single shard may hold every item yielded
+        pages = iteratePages(lambda **kwargs: table.query(**query_kwargs, **kwargs),
+                             shard_tokens[shard], limit = limit)
+
+        return (item for page in pages for item in page.items)
+
+    # Only sharded queries merge, so heapq is imported here instead of on
+    # every cold start.
+    import heapq
+
+    # Each shard is already in descending order, so merging keeps the order
+    items = heapq.merge(*[shard_items(shard) for shard, token in enumerate(shard_tokens) if token is not None],
+                        key=lambda item: item[index.sort_key], reverse=True)
+
+    # Stop once limit items have been yielded
+    if limit >= 0:
+        items = islice(items, limit)
+
+    for item in items:
+        yield _withoutSortKey(item, fields, index)
+
+def iterateQueryByKeyExpression(table, key_expression, GSI = None,
+                                next_token: str = None,
+                                limit: int = QUERY_LIMIT_RETURN_ALL,
+                                fields: list[str] = None):
+    """
+    Generator version of queryByKeyExpression. Yields matching items in
+    descending sort key order one page at a time, only querying for the
+    next page when the consumer reaches it.
+
+    :params table: The dynamodb.Table to query.
+    :params key_expression: A valid Key() expression to filter results by.
+    :params GSI: The optional string name of the global secondary index
+                 to query, or the ShardedIndex to query (see
+                 queryByKeyExpression).
+    :params next_token: Optional token from queryPageByKeyExpression to
+                        resume from.
+    :params limit: The maximum number of items to yield. Only this many items
+                   are requested from DynamoDB. Specifying any negative number
+                   indicates to yield all matching items.
+    :params fields: Optional list of the fields to return for each item.
+    :yields: Each matching item.
+    :raises InvalidQueryParameters: If next_token is not valid.
+    """
+
+    if isinstance(GSI, ShardedIndex):
+        # Bounded ranges only read the buckets covering them
+        buckets: list[str] = _rangeBuckets(GSI, key_expression)
+        if buckets is not None:
+            yield from _iterateBuckets(table, key_expression, GSI.bucket_index, buckets,
+                                       limit = limit, next_token = next_token, fields = fields)
+            return
+
+        if GSI.shards > 1:
+            yield from _iterateShards(table, key_expression, GSI, limit = limit,
+                                      next_token = next_token, fields = fields)
+            return
+
+        key_expression = _shardKeyExpression(GSI, "1", key_expression)
+        GSI = GSI.name
+
+    query_kwargs: dict = {
+        'KeyConditionExpression': key_expression,
+        'ScanIndexForward': False, # Orders results by descending timestamp
+        **buildProjection(fields),
+    }
+    if GSI != None:
+        query_kwargs['IndexName'] = GSI
+
+    pages = iteratePages(lambda **kwargs: table.query(**query_kwargs, **kwargs),
+                         next_token, limit = limit)
+    items = (item for page in pages for item in page.items)
+
+    # Stop once limit items have been yielded
+    if limit >= 0:
+        items = islice(items, limit)
+
+    yield from items
+
+def iterateScanTable(table, filter_expression = None, next_token: str = None,
+                     limit: int = SCAN_LIMIT_RETURN_ALL,
+                     fields: list[str] = None):
+    """
+    Generator version of scanTable. Yields items one page at a time, only
+    scanning for the next page when the consumer reaches it.
+
+    :note: Always scans serially; use scanTable or scanTablePage for
+           parallel scans.
+    :params table: The dynamodb.Table to use.
+    :params filter_expression: The optional Attr() filter to use.
+    :params next_token: Optional token from a serial scanTablePage to
+                        resume from.
+    :params limit: The maximum number of items to yield. No more than this
+                   many items are requested from DynamoDB. Specifying any
+                   negative number indicates to yield all items.
+    :params fields: Optional list of the fields to return for each item.
+    :yields: Each (matching) item.
+    :raises InvalidQueryParameters: If next_token is not valid.
+    """
+
+    scan_kwargs: dict = buildProjection(fields)
+    if not filter_expression == None:
+        scan_kwargs['FilterExpression'] = filter_expression
+
+    pages = iteratePages(lambda **kwargs: table.scan(**scan_kwargs, **kwargs),
+                         next_token, limit = limit, page_size = DEFAULT_SCAN_LIMIT)
+    items = (item for page in pages for item in page.items)
+
+    # Stop once limit items have been yielded
+    if limit >= 0:
+        items = islice(items, limit)
+
+    yield from items
+
+def queryPageByKeyExpression(table, key_expression, GSI = None,
+                             limit: int = QUERY_LIMIT_RETURN_ALL,
+                             next_token: str = None,
+                             fields: list[str] = None) -> tuple:
+    """
+    Same as queryByKeyExpression, but returns a single page of results and
+    a token to resume reading from.
+
+    :params table: The dynamodb.Table to query.
+    :params key_expression: A valid Key() expression to filter results by.
+    :params GSI: The optional string name of the global secondary index
+                 to query, or the ShardedIndex to query (see
+                 queryByKeyExpression).
+    :params limit: The maximum number of results to return. Specifying any
+                   negative number indicates to return all matching items.
+    :params next_token: Optional token from a previous call to resume from.
+                        A token from a sharded index only resumes a query of
+                        an index with the same number of shards.
+    :params fields: Optional list of the fields to return for each item.
+    :return: The tuple (items, next_token). next_token is None when there
+             are no more matching items.
+    :raises InvalidQueryParameters: If next_token is not valid.
+    """
+
+    if isinstance(GSI, ShardedIndex):
+        # Bounded ranges only read the buckets covering them
+        buckets: list[str] = _rangeBuckets(GSI, key_expression)
+        if buckets is not None:
+            return _queryBuckets(table, key_expression, GSI.bucket_index, buckets,
+                                 limit = limit, next_token = next_token, fields = fields)
+
+        if GSI.shards > 1:
+            return _queryShards(table, key_expression, GSI, limit = limit,
+                                next_token = next_token, fields = fields)
+
+        key_expression = _shardKeyExpression(GSI, "1", key_expression)
+        GSI = GSI.name
+
+    query_kwargs: dict = {
+        'KeyConditionExpression': key_expression,
+        'ScanIndexForward': False, # Orders results by descending timestamp
+        **buildProjection(fields),
+    }
+    if GSI != None:
+        query_kwargs['IndexName'] = GSI
+
+    return readPage(lambda **kwargs: table.query(**query_kwargs, **kwargs),
+                    limit = limit, next_token = next_token)
+
+def queryByKeyExpression(table, key_expression, GSI = None,
+                         limit: int = QUERY_LIMIT_RETURN_ALL,
+                         fields: list[str] = None) -> list:
+    """
+    Queries a given table for all entries that match the provided key
+    expression. When desiring to search by timestamp, table is required
+    to have a secondary global index with a primary key of {"S": "_ignore"}
+    and a sort key set to the timestamp attribute name. All entries to be
+    queried by timestamp must have an _ignore value of "1". Any other table
+    entry with an _ignore value that isn't "1" will be ignored.
 
-            items += response['Items']
+    When GSI is a ShardedIndex, key_expression only holds the (optional)
+    condition on the index's sort key. Entries are written with _ignore values
+    from "1" to the number of shards (see ShardedIndex.shardKey), every shard
+    is queried at the same time, and the results are merged by the sort key.
+    If the index has a bucket index, a range bounded on both ends only reads
+    the (day or month) buckets covering it instead.
+
+    :note: This will return a list of objects containing the values of the
+           primary key of the table, the corresponding timestamp, and the
+           _ignore value ("1"). Additional queries using this data may be
+           needed to get more information from the table. Also, the queried
+           table MUST have the timestamp field provided to the key expression
+           as a sort key.
+    :params table: The dynamodb.Table to scan.
+    :params key_expression: A valid Key() expression to filter results by.
+                            Common problems result from trying to use a
+                            non primary key (primary+sort) in the expression.
+    :params GSI: The string name of the global secondary index that has _ignore
+                 primary key and timestamp as the sort key, or the ShardedIndex
+                 describing it. Required if trying to query by timestamps.
+    :params limit: The maximum number of results to return. Specifying any
+                   negative number indicates to return all matching items.
+                   Defaults to the value that represents returning as many
+                   items as possible.
+    :params fields: Optional list of the fields to return for each item.
+    :return: A list containing all entries that pass the timestamp filtering.
+    """
+
+    try:
+        # Reading every shard (or bucket) at the same time is faster than
+        # merging them one page at a time when every item is needed anyway
+        if isinstance(GSI, ShardedIndex):
+            items, _ = queryPageByKeyExpression(table, key_expression, GSI = GSI,
+                                                limit = limit, fields = fields)
+
+        else:
+            items: list = list(iterateQueryByKeyExpression(table, key_expression, GSI = GSI,
+                                                           limit = limit, fields = fields))
 
     except Exception as e:
         # Don't log since this function's errors should be handled by caller
         raise Exception(e)
 
+    return items
+
+def chooseScanSegments(table) -> int:
+    """
+    Picks how many segments to split a parallel scan of a table into, aiming
+    for about SCAN_SEGMENT_TARGET_BYTES of data per segment.
+
+    :note: The table size is only updated by DynamoDB every ~6 hours, so this
+           is an estimate.
+    :params table: The dynamodb.Table to scan.
+    :returns: A segment count between 1 and MAX_SCAN_SEGMENTS.
+    """
+
+    try:
+        table_size: int = table.table_size_bytes
+
+    # Fall back to a serial scan if the table can't be described
+    except Exception:
+        return 1
+
+    segments: int = math.ceil(table_size / SCAN_SEGMENT_TARGET_BYTES)
+
+    return max(1, min(segments, MAX_SCAN_SEGMENTS))
+
+def _scanSegments(table, scan_kwargs: dict, segment_tokens: list, limit: int) -> tuple:
+    """
+    Reads the next items of every unfinished segment of a parallel scan at
+    the same time and merges them.
+
+    :params table: The dynamodb.Table to scan.
+    :params scan_kwargs: Keyword arguments shared by every segment's scan.
+    :params segment_tokens: One readPage next_token per segment, or None for
+                            segments that were already read to the end.
+    :params limit: The maximum number of results to return. Specifying any
+                   negative number indicates to return all matching items.
+    :returns: The tuple (items, next_token).
+    """
+
+    total_segments: int = len(segment_tokens)
+    active_segments: list[int] = [i for i, token in enumerate(segment_tokens) if token is not None]
+
+    # Split the limit between the unfinished segments
+    shares: dict = {}
+    for index, segment in enumerate(active_segments):
+        if limit > 0:
+            shares[segment] = limit // len(active_segments) + (1 if index < limit % len(active_segments) else 0)
+        else:
+            shares[segment] = limit
+
+    def read_segment(segment: int) -> tuple:
+        # The low level client is thread safe, unlike the table resource
+        read = lambda **kwargs: table.meta.client.scan(
+            TableName=table.name,
+            Segment=segment,
+            TotalSegments=total_segments,
+            **scan_kwargs,
+            **kwargs
+        )
+        return readPage(read, limit = shares[segment], next_token = segment_tokens[segment],
+                        page_size = DEFAULT_SCAN_LIMIT)
+
+    # Segments with no share of the limit wait for the next page
+    segments_to_read: list[int] = [segment for segment in active_segments if shares[segment] != 0]
+
+    # Only parallel scans need threads, so the executor is imported here
+    # instead of on every cold start.
+    from concurrent.futures import ThreadPoolExecutor
+
+    with ThreadPoolExecutor(max_workers=max(1, min(MAX_SCAN_WORKERS, len(segments_to_read)))) as executor:
+        results = list(executor.map(read_segment, segments_to_read))
+
+    items: list = []
+    next_segment_tokens: list = list(segment_tokens)
+    for segment, (segment_items, segment_token) in zip(segments_to_read, results):
+        items += segment_items
+        next_segment_tokens[segment] = segment_token
+
+    if all(token is None for token in next_segment_tokens):
+        return (items, None)
+
+    return (items, _encodeToken({ 'segments': next_segment_tokens }))
+
+def scanTablePage(table, filter_expression = None,
+                  limit: int = SCAN_LIMIT_RETURN_ALL,
+                  next_token: str = None,
+                  segments: int = 1,
+                  fields: list[str] = None) -> tuple:
+    """
+    Same as scanTable, but returns a single page of results and a token to
+    resume scanning from.
+
+    :params table: The dynamodb.Table to use.
+    :params filter_expression: The optional Attr() filter to use.
+    :params limit: The maximum number of results to return. Specifying any
+                   negative number indicates to return all matching items.
+    :params next_token: Optional token from a previous call to resume from.
+                        A token from a parallel scan keeps using the segment
+                        count it was created with.
+    :params segments: The number of segments to scan in parallel. Use
+                      SCAN_SEGMENTS_AUTO to pick a count from the table size.
+    :params fields: Optional list of the fields to return for each item.
+    :return: The tuple (items, next_token). next_token is None when the end
+             of the table was reached.
+    :raises InvalidQueryParameters: If next_token is not valid.
+    """
+
+    scan_kwargs: dict = buildProjection(fields)
+    if not filter_expression == None:
+        scan_kwargs['FilterExpression'] = filter_expression
+
+    # Get the state of each segment from the token, or start every segment
+    segment_tokens = None
+    if next_token:
+        segment_tokens = _decodeToken(next_token).get('segments')
+
+        if segment_tokens is not None and (
+                not isinstance(segment_tokens, list)
+                or not 0 < len(segment_tokens) <= MAX_SCAN_SEGMENTS
+                or not all(token is None or isinstance(token, str) for token in segment_tokens)):
+            raise InvalidQueryParameters("The provided next_token is not valid.")
 
-    # Return the full list of items if limit is QUERY_LIMIT_RETURN_ALL
-    if limit == QUERY_LIMIT_RETURN_ALL:
-        return items
-    # Otherwise return the first limit items
     else:
-        return items[0:limit]
+        if segments == SCAN_SEGMENTS_AUTO:
+            segments = chooseScanSegments(table)
+
+        if segments > 1:
+            segment_tokens = [encodeNextToken(None)] * min(segments, MAX_SCAN_SEGMENTS)
 
-def scanTable(table, filter_expression = None, limit: int = SCAN_LIMIT_RETURN_ALL) -> list:
+    if segment_tokens is not None:
+        return _scanSegments(table, scan_kwargs, segment_tokens, limit)
+
+    return readPage(lambda **kwargs: table.scan(**scan_kwargs, **kwargs),
+                    limit = limit, next_token = next_token,
+                    page_size = DEFAULT_SCAN_LIMIT)
+
+def scanTable(table, filter_expression = None, limit: int = SCAN_LIMIT_RETURN_ALL,
+              segments: int = 1, fields: list[str] = None) -> list:
     """
     Scans an entire dynamodb table. Optionally uses a passed in filter expression
     to limit the results returned.
@@ -280,65 +2241,600 @@ def scanTable(table, filter_expression = None, limit: int = SCAN_LIMIT_RETURN_AL
                    negative number indicates to return all matching items.
                    Defaults to the value that represents returning as many
                    items as possible.
+    :params segments: The number of segments to scan in parallel. Defaults to
+                      a serial scan. Use SCAN_SEGMENTS_AUTO to pick a count
+                      from the table size.
+    :params fields: Optional list of the fields to return for each item.
     :return: A list of all returned items (that optionally match
               filter_expression).
     """
 
-    # List to store returned items
-    items: list = []
+    if segments == 1:
+        return list(iterateScanTable(table, filter_expression = filter_expression,
+                                     limit = limit, fields = fields))
+
+    items, _ = scanTablePage(table, filter_expression = filter_expression, limit = limit,
+                             segments = segments, fields = fields)
 
+    return items
+
+def hydrateKeys(table, keys: list, key_attributes: list[str],
+                fields: list[str] = None) -> HydrationResult:
     """
-    Scan at least once, then keep scanning until either no more
-    items are returned or the end of the table is reached.
+    Turns a list of keys (e.g., the results of querying a KEYS_ONLY index)
+    into the full table items using BatchGetItem requests of up to
+    BATCH_GET_LIMIT keys each. Keys DynamoDB leaves unprocessed are retried
+    with exponential backoff.
+
+    :params table: The dynamodb.Table the keys belong to.
+    :params keys: The list of key objects to look up. Any attribute that isn't
+                  in key_attributes (e.g., index keys) is ignored.
+    :params key_attributes: The names of the table's partition (and sort) key.
+    :params fields: Optional list of the fields to return for each item.
+    :returns: A HydrationResult with the found items in the same order as keys.
+    :raises Exception: If keys are still unprocessed after BATCH_MAX_RETRIES.
     """
-    try:
-        if not filter_expression == None:
-            response = table.scan(
-                FilterExpression=filter_expression,
-                Limit=DEFAULT_SCAN_LIMIT
-            )
 
-        else:
-            response = table.scan(
-                Limit=DEFAULT_SCAN_LIMIT
-            )
+    # Strip index attributes from the keys, dropping any repeated keys
+    lookup_keys: dict = {}
+    for key in keys:
+        key_values = tuple(key[attribute] for attribute in key_attributes)
+        lookup_keys[key_values] = { attribute: key[attribute] for attribute in key_attributes }
+
+    # The key attributes are always needed to put the items back in order
+    projection: dict = {}
+    if fields:
+        projection = buildProjection(fields + [attribute for attribute in key_attributes
+                                               if attribute not in fields])
+
+    # Map of key values to the item stored under them
+    found_items: dict = {}
+    round_trips: int = 0
+
+    pending: list = list(lookup_keys.values())
+    for start in range(0, len(pending), BATCH_GET_LIMIT):
+        request_items: dict = {
+            table.name: { 'Keys': pending[start:start + BATCH_GET_LIMIT], **projection }
+        }
+
+        retries: int = 0
+        while request_items:
+            response = table.meta.client.batch_get_item(RequestItems=request_items)
+            round_trips += 1
+
+            for item in response['Responses'].get(table.name, []):
+                key_values = tuple(item[attribute] for attribute in key_attributes)
+                found_items[key_values] = item
+
+            # Retry anything DynamoDB didn't get to (throttling, size limits)
+            request_items = response.get('UnprocessedKeys', {})
+            if request_items:
+                if retries >= BATCH_MAX_RETRIES:
+                    raise Exception(f"Keys in {table.name} were still unprocessed after {retries} retries.")
+
+                time.sleep(BATCH_RETRY_BASE_DELAY * (2 ** retries))
+                retries += 1
+
+    # Rebuild the original (e.g., descending timestamp) order
+    items: list = [found_items[key_values] for key_values in lookup_keys if key_values in found_items]
+
+    # Drop key attributes that were only fetched for ordering
+    if fields:
+        unrequested: list[str] = [attribute for attribute in key_attributes if attribute not in fields]
+        for item in items:
+            for attribute in unrequested:
+                item.pop(attribute, None)
+
+    return HydrationResult(items = items, round_trips = round_trips)
+
+def batchPutItems(table, items: list[dict]) -> int:
+    """
+    Puts many items into a table using BatchWriteItem requests of up to
+    BATCH_WRITE_LIMIT items each. Items DynamoDB leaves unprocessed are
+    retried with exponential backoff.
+
+    :note: Batch writes can't be conditional, so an item replaces any stored
+           item with the same key. Items must not repeat a key.
+    :params table: The dynamodb.Table to put the items into.
+    :params items: The list of items to put.
+    :returns: The number of round trips made to DynamoDB.
+    :raises Exception: If items are still unprocessed after BATCH_MAX_RETRIES.
+    """
+
+    round_trips: int = 0
+
+    for start in range(0, len(items), BATCH_WRITE_LIMIT):
+        request_items: dict = {
+            table.name: [{ 'PutRequest': { 'Item': item } } for item in items[start:start + BATCH_WRITE_LIMIT]]
+        }
 
-        items += (response['Items'])
+        retries: int = 0
+        while request_items:
+            response = table.meta.client.batch_write_item(RequestItems=request_items)
+            round_trips += 1
 
-        # Keep scanning for more items until no more return
-        while 'Items' in response and 'LastEvaluatedKey' in response:
+            # Retry anything DynamoDB didn't get to (throttling, size limits)
+            request_items = response.get('UnprocessedItems', {})
+            if request_items:
+                if retries >= BATCH_MAX_RETRIES:
+                    raise Exception(f"Items in {table.name} were still unprocessed after {retries} retries.")
 
-            # Stop scanning if the number of items has reached the imposed limit
-            if limit > 0 and len(items) >= limit:
+                time.sleep(BATCH_RETRY_BASE_DELAY * (2 ** retries))
+                retries += 1
+
+    return round_trips
+
+def putItemIfNotExists(table, item: dict) -> bool:
+    """
+    Puts an item into a table only if no item with the same key is already
+    stored, in a single conditional write (instead of a read to check for the
+    item followed by a put, which costs two round trips and lets two requests
+    both pass the check).
+
+    :params table: The dynamodb.Table to put the item into.
+    :params item: The item to put. Must hold the table's full key.
+    :returns: True if the item was put. False if an item with the same key
+              already exists.
+    :raises ClientError: If the put failed for any other reason.
+    """
+    try:
+        # The partition key is part of every key, so it only exists on an
+        # item already stored under the same (full) key
+        table.put_item(
+            Item=item,
+            ConditionExpression=Attr(PRIMARY_KEY).not_exists()
+        )
+    except ClientError as e:
+        if e.response['Error']['Code'] == 'ConditionalCheckFailedException':
+            return False
+        raise
+
+    return True
+
+def transactPutItemsIfNotExist(table, items: list[dict]) -> list[int]:
+    """
+    Puts many items into a table, each only if no item with the same key is
+    already stored, using TransactWriteItems requests of up to
+    TRANSACT_WRITE_LIMIT items each. Unlike batchPutItems, the check and the
+    put can't be split by another request writing the same key. Items that
+    already exist are left out, and the rest of their request is tried again
+    without them.
+
+    :params table: The dynamodb.Table to put the items into.
+    :params items: The list of items to put. Each must hold the table's full
+                   key, and no two may share a key.
+    :returns: The indexes (in items) of the items that weren't put because an
+              item with the same key already exists.
+    :raises ClientError: If a transaction failed for any other reason.
+    """
+    existing: list[int] = []
+
+    indexed_items: list[tuple] = list(enumerate(items))
+    for start in range(0, len(indexed_items), TRANSACT_WRITE_LIMIT):
+        pending: list[tuple] = indexed_items[start:start + TRANSACT_WRITE_LIMIT]
+
+        while pending:
+            # The partition key is part of every key, so it only exists on an
+            # item already stored under the same (full) key
+            transact_items: list[dict] = [
+                { 'Put': {
+                    'TableName': table.name,
+                    'Item': item,
+                    'ConditionExpression': "attribute_not_exists(#pk)",
+                    'ExpressionAttributeNames': { '#pk': PRIMARY_KEY },
+                } }
+                for _, item in pending
+            ]
+
+            try:
+                # The low level client is used since the table resource has no
+                # transactions; it still converts python values
+                table.meta.client.transact_write_items(TransactItems=transact_items)
                 break
 
-            if not filter_expression == None:
-                response = table.scan(
-                    FilterExpression=filter_expression,
-                    Limit=DEFAULT_SCAN_LIMIT,
-                    ExclusiveStartKey=response['LastEvaluatedKey']
-                )
+            except ClientError as e:
+                if e.response['Error']['Code'] != 'TransactionCanceledException':
+                    raise
 
-            else:
-                response = table.scan(
-                    Limit=DEFAULT_SCAN_LIMIT,
-                    ExclusiveStartKey=response['LastEvaluatedKey']
-                )
+                # One reason per put, in the same order
+                reasons: list = e.response.get('CancellationReasons', [])
+                conflicting: list[int] = [
+                    position for position, reason in enumerate(reasons)
+                    if reason.get('Code') == 'ConditionalCheckFailed'
+                ]
 
-            items += (response['Items'])
+                # Anything else (e.g., a conflicting transaction) is the caller's to retry
+                if not conflicting:
+                    raise
 
-    except KeyError:
-        pass
+                existing += [pending[position][0] for position in conflicting]
+                pending = [entry for position, entry in enumerate(pending) if position not in conflicting]
 
-    except Exception as e:
-        raise e
+    return sorted(existing)
 
-    # Return the full list of items if limit is SCAN_LIMIT_RETURN_ALL
-    if limit == SCAN_LIMIT_RETURN_ALL:
-        return items
-    # Otherwise return the first limit items
-    else:
-        return items[0:limit]
+def addToRollups(table, key_attributes: list[str], increments: dict) -> int:
+    """
+    Adds amounts to the counters of rollup items (e.g., the visits of a
+    location on a day) with one atomic UpdateItem (ADD) per item. Items and
+    counters that don't exist yet start from 0. The updates never read the
+    items, so concurrent writers never lose each other's amounts.
+
+    :params table: The dynamodb.Table holding the rollups.
+    :params key_attributes: The names of the table's partition (and sort) key.
+    :params increments: The amounts to add to each rollup item:
+                        { (key values...): { counter name: amount } }. Amounts
+                        may be negative (e.g., to take back an old value).
+    :returns: The number of round trips made to DynamoDB.
+    """
+    round_trips: int = 0
+
+    for key_values, counters in increments.items():
+        # Adding 0 changes nothing
+        counters = { name: amount for name, amount in counters.items() if amount }
+        if not counters:
+            continue
+
+        table.update_item(
+            Key=dict(zip(key_attributes, key_values)),
+            UpdateExpression="ADD " + ", ".join(f"#a{i} :a{i}" for i in range(len(counters))),
+            ExpressionAttributeNames={ f"#a{i}": name for i, name in enumerate(counters) },
+            ExpressionAttributeValues={
+                # The resource only takes Decimals for non integer numbers
+                f":a{i}": Decimal(str(amount)) if isinstance(amount, float) else amount
+                for i, amount in enumerate(counters.values())
+            }
+        )
+        round_trips += 1
+
+    return round_trips
+
+def queryRollups(table, key_attributes: list[str], partition_values: list[str],
+                 sort_key_expression = None) -> list[dict]:
+    """
+    Reads the rollup items of every given partition (e.g., location),
+    querying every partition at the same time. Costs one query per partition
+    (plus one per MB of rollups read), however much history the rollups
+    summarize.
+
+    :params table: The dynamodb.Table holding the rollups.
+    :params key_attributes: The names of the table's partition and sort key.
+    :params partition_values: The partitions to read.
+    :params sort_key_expression: Optional Key() condition on the sort key
+                                 (e.g., Key('day').between(start, end)).
+    :returns: The rollup items, sorted by sort key (then partition, in the
+              order given).
+    """
+    from concurrent.futures import ThreadPoolExecutor
+
+    partition_key, sort_key = key_attributes
+
+    def readPartition(partition_value):
+        key_expression = Key(partition_key).eq(partition_value)
+        if sort_key_expression is not None:
+            key_expression = key_expression & sort_key_expression
+
+        return queryByKeyExpression(table, key_expression)
+
+    with ThreadPoolExecutor(max_workers=max(1, min(MAX_SCAN_WORKERS, len(partition_values)))) as executor:
+        partitions = list(executor.map(readPartition, partition_values))
+
+    # Sorting is stable, so items with the same sort key keep the partition order
+    items: list[dict] = [item for partition in partitions for item in partition]
+    items.sort(key=lambda item: item[sort_key])
+
+    return items
+
+def visitRollupIncrements(visits: list[dict]) -> dict:
+    """
+    Counts visits into the increments of the visit rollups (see addToRollups):
+    for each location and day (the first DAY_BUCKET_LENGTH characters of the
+    timestamp), the number of visits and the number of visits in each hour.
+
+    :params visits: The visits (each with a 'location' and 'timestamp').
+    :returns: { (location, day): { 'visits': count, 'hNN': count } }
+    """
+    increments: dict = {}
+
+    for visit in visits:
+        timestamp: str = visit['timestamp']
+        counters: dict = increments.setdefault((visit['location'], timestamp[:DAY_BUCKET_LENGTH]), {})
+
+        for name in (VISIT_COUNT_ATTRIBUTE, HOUR_COUNT_PREFIX + timestamp[11:13]):
+            counters[name] = counters.get(name, 0) + 1
+
+    return increments
+
+def _rollupNumber(value) -> Decimal:
+    """
+    Converts a stored number (e.g., a print_mass of "12.5" or Decimal("12.5"))
+    into the Decimal added to a rollup. Returns None for anything that isn't a
+    finite number (e.g., a print_mass of "" that hasn't been filled in yet).
+    """
+    if isinstance(value, bool):
+        return None
+
+    try:
+        number = Decimal(str(value).strip())
+    except (ArithmeticError, ValueError):
+        return None
+
+    return number if number.is_finite() else None
+
+def equipmentRollupIncrements(logs: list[dict], sign: int = 1) -> dict:
+    """
+    Counts equipment usage logs into the increments of the equipment rollups
+    (see addToRollups): for each equipment type, day, and printer, the number
+    of logs, the summed print_mass and print_duration, and the number of logs
+    with each print_status.
+
+    :params logs: The equipment usage logs.
+    :params sign: 1 to add the logs, or -1 to take them back out (e.g., the
+                  old version of a patched log).
+    :returns: { (equipment_type, "YYYY-MM-DD#printer_name"): { counter: amount } }
+    """
+    increments: dict = {}
+
+    for log in logs:
+        printer_3d_info = log.get('printer_3d_info')
+        if not isinstance(printer_3d_info, dict):
+            printer_3d_info = {}
+
+        bucket: str = (log['timestamp'][:DAY_BUCKET_LENGTH] + EQUIPMENT_ROLLUP_SEPARATOR
+                       + str(printer_3d_info.get('printer_name', "")))
+        counters: dict = increments.setdefault((log['equipment_type'], bucket), {})
+
+        amounts: dict = { EQUIPMENT_COUNT_ATTRIBUTE: 1 }
+        for name in EQUIPMENT_SUM_ATTRIBUTES:
+            number = _rollupNumber(printer_3d_info.get(name))
+            if number is not None:
+                amounts[name] = number
+        if printer_3d_info.get('print_status'):
+            amounts[STATUS_COUNT_PREFIX + str(printer_3d_info['print_status'])] = 1
+
+        for name, amount in amounts.items():
+            counters[name] = counters.get(name, 0) + sign * amount
+
+    return increments
+
+def mergeRollupIncrements(*increments: dict) -> dict:
+    """
+    Adds rollup increments (see addToRollups) together, e.g., a log's new
+    values and its old values taken back out. Counters that cancel out are
+    left at 0, which addToRollups skips.
+    """
+    merged: dict = {}
+
+    for increment in increments:
+        for key, counters in increment.items():
+            merged_counters: dict = merged.setdefault(key, {})
+            for name, amount in counters.items():
+                merged_counters[name] = merged_counters.get(name, 0) + amount
+
+    return merged
+
+def _updatePath(path, names: dict) -> str:
+    """
+    Adds a placeholder for every part of a field path to names, and returns
+    the placeholder path (e.g., ('trainings', 'Laser Training') becomes
+    '#u0.#u1').
+
+    :params path: A field name, or a tuple of the names of a nested field
+                  (e.g., a key of a map stored in the item).
+    :params names: The ExpressionAttributeNames to add the placeholders to.
+    """
+    parts: tuple = path if isinstance(path, tuple) else (path,)
+
+    placeholders: list[str] = []
+    for part in parts:
+        placeholder: str = f"#u{len(names)}"
+        names[placeholder] = part
+        placeholders.append(placeholder)
+
+    return ".".join(placeholders)
+
+def buildUpdateExpression(plan: UpdatePlan) -> dict:
+    """
+    Builds the keyword arguments of an UpdateItem request from an UpdatePlan.
+    Every field name and value goes through a placeholder, since many of the
+    fields (e.g., 'location', 'timestamp') are DynamoDB reserved words. Fields
+    may be nested paths (tuples), so one value in a stored map can be updated
+    without rewriting the whole map. The update is always conditional on the
+    item already existing.
+
+    :params plan: The UpdatePlan to build the request for.
+    :returns: The keyword arguments to add to an update_item request (or to
+              the 'Update' of a transact_write_items request), minus the
+              'Key'.
+    """
+    names: dict = {}
+    values: dict = {}
+    set_clauses: list[str] = []
+
+    for field, value in plan.set_fields.items():
+        path: str = _updatePath(field, names)
+        placeholder: str = f":u{len(values)}"
+        values[placeholder] = value
+        set_clauses.append(f"{path} = {placeholder}")
+
+    for field, value in (plan.default_fields or {}).items():
+        path: str = _updatePath(field, names)
+        placeholder: str = f":u{len(values)}"
+        values[placeholder] = value
+        set_clauses.append(f"{path} = if_not_exists({path}, {placeholder})")
+
+    remove_clauses: list[str] = [_updatePath(field, names) for field in plan.remove_fields]
+
+    update_expression: list[str] = []
+    if set_clauses:
+        update_expression.append("SET " + ", ".join(set_clauses))
+    if remove_clauses:
+        update_expression.append("REMOVE " + ", ".join(remove_clauses))
+
+    condition = Attr(PRIMARY_KEY).exists()
+    for dependent_condition in plan.conditions or []:
+        condition = condition & dependent_condition
+
+    # Rendered here (instead of by boto3) so the request also works inside a
+    # transaction. Its '#n'/':v' placeholders don't clash with the '#u'/':u' ones.
+    built_condition = ConditionExpressionBuilder().build_expression(condition)
+    names.update(built_condition.attribute_name_placeholders)
+    values.update(built_condition.attribute_value_placeholders)
+
+    kwargs: dict = {
+        'ConditionExpression': built_condition.condition_expression,
+        'ExpressionAttributeNames': names,
+    }
+    if update_expression:
+        kwargs['UpdateExpression'] = " ".join(update_expression)
+    if values:
+        kwargs['ExpressionAttributeValues'] = values
+
+    return kwargs
+
+def updateItemIfExists(table, key: dict, plan: UpdatePlan) -> bool:
+    """
+    Applies an UpdatePlan to a stored item in a single conditional UpdateItem
+    request (instead of reading the item, changing it, and putting the whole
+    item back, which costs two round trips and loses any update made in
+    between).
+
+    :params table: The dynamodb.Table holding the item.
+    :params key: The item's full key.
+    :params plan: The UpdatePlan to apply.
+    :returns: True if the item was updated. False if the item doesn't exist
+              or doesn't meet the plan's conditions.
+    :raises ClientError: If the update failed for any other reason.
+    """
+    kwargs: dict = buildUpdateExpression(plan)
+
+    # Nothing to change, so only the item's existence needs checking
+    if 'UpdateExpression' not in kwargs and not plan.conditions:
+        return 'Item' in table.get_item(Key=key, **buildProjection([PRIMARY_KEY]))
+
+    try:
+        table.update_item(Key=key, **kwargs)
+    except ClientError as e:
+        if e.response['Error']['Code'] == 'ConditionalCheckFailedException':
+            return False
+        raise
+
+    return True
+
+def updateItemReturningOld(table, key: dict, plan: UpdatePlan) -> dict:
+    """
+    Same as updateItemIfExists, but returns the whole item as it was before
+    the update, in the same single UpdateItem request (ReturnValues ALL_OLD).
+    With applyUpdatePlan, this gives both versions of the item (e.g., to take
+    its old values out of rollups) without reading it first.
+
+    :params table: The dynamodb.Table holding the item.
+    :params key: The item's full key.
+    :params plan: The UpdatePlan to apply.
+    :returns: The item before the update. None if the item doesn't exist or
+              doesn't meet the plan's conditions.
+    :raises ClientError: If the update failed for any other reason.
+    """
+    kwargs: dict = buildUpdateExpression(plan)
+
+    # Nothing to change, so the item is only read
+    if 'UpdateExpression' not in kwargs and not plan.conditions:
+        return table.get_item(Key=key).get('Item')
+
+    try:
+        response = table.update_item(Key=key, ReturnValues='ALL_OLD', **kwargs)
+    except ClientError as e:
+        if e.response['Error']['Code'] == 'ConditionalCheckFailedException':
+            return None
+        raise
+
+    return response['Attributes']
+
+def applyUpdatePlan(item: dict, plan: UpdatePlan) -> dict:
+    """
+    Returns a copy of an item with an UpdatePlan applied to it, the same way
+    the request buildUpdateExpression builds changes the stored item. The
+    plan's conditions aren't checked.
+
+    :params item: The item before the update.
+    :params plan: The UpdatePlan to apply.
+    """
+    import copy
+
+    updated: dict = copy.deepcopy(item)
+
+    def parentOf(path) -> tuple:
+        parts: tuple = path if isinstance(path, tuple) else (path,)
+        parent: dict = updated
+        for part in parts[:-1]:
+            parent = parent.setdefault(part, {})
+        return parent, parts[-1]
+
+    for field, value in plan.set_fields.items():
+        parent, name = parentOf(field)
+        parent[name] = copy.deepcopy(value)
+
+    for field, value in (plan.default_fields or {}).items():
+        parent, name = parentOf(field)
+        parent.setdefault(name, copy.deepcopy(value))
+
+    for field in plan.remove_fields:
+        parent, name = parentOf(field)
+        parent.pop(name, None)
+
+    return updated
+
+def transactUpdateItems(table, updates: list[tuple]) -> list[int]:
+    """
+    Applies UpdatePlans to many stored items using TransactWriteItems
+    requests of up to TRANSACT_WRITE_LIMIT updates each, so every update in a
+    request is applied, or none are. Updates whose item doesn't exist (or
+    doesn't meet its plan's conditions) are left out, and the rest of their
+    request is tried again without them.
+
+    :params table: The dynamodb.Table holding the items.
+    :params updates: A list of (key, UpdatePlan) tuples. No two may update
+                     the same item.
+    :returns: The indexes (in updates) of the updates that weren't applied
+              because their conditions failed.
+    :raises ClientError: If a transaction failed for any other reason.
+    """
+    failed: list[int] = []
+
+    indexed_updates: list[tuple] = list(enumerate(updates))
+    for start in range(0, len(indexed_updates), TRANSACT_WRITE_LIMIT):
+        pending: list[tuple] = indexed_updates[start:start + TRANSACT_WRITE_LIMIT]
+
+        while pending:
+            transact_items: list[dict] = [
+                { 'Update': { 'TableName': table.name, 'Key': key, **buildUpdateExpression(plan) } }
+                for _, (key, plan) in pending
+            ]
+
+            try:
+                # The low level client is used since the table resource has no
+                # transactions; it still converts python values
+                table.meta.client.transact_write_items(TransactItems=transact_items)
+                break
+
+            except ClientError as e:
+                if e.response['Error']['Code'] != 'TransactionCanceledException':
+                    raise
+
+                # One reason per update, in the same order
+                reasons: list = e.response.get('CancellationReasons', [])
+                conflicting: list[int] = [
+                    position for position, reason in enumerate(reasons)
+                    if reason.get('Code') == 'ConditionalCheckFailed'
+                ]
+
+                # Anything else (e.g., a conflicting transaction) is the caller's to retry
+                if not conflicting:
+                    raise
+
+                failed += [pending[position][0] for position in conflicting]
+                pending = [update for position, update in enumerate(pending) if position not in conflicting]
+
+    return sorted(failed)
 
 def allKeysPresent(keys: list[str], data: dict) -> bool:
     """
@@ -397,23 +2893,329 @@ def checkAndCleanRequestFields(data: dict, field_check):
     
     return data
 
+class _CompiledFieldCheck():
+    """
+    A FieldCheck converted into sets for fast membership checks.
+    """
+    __slots__ = ("required", "disallowed", "nested", "required_list")
+
+    def __init__(self, field_check: FieldCheck):
+        self.required_list: list[str] = list(field_check.required)
+        self.required: frozenset = frozenset(field_check.required)
+        self.disallowed: tuple = tuple(field_check.disallowed)
+        self.nested: tuple = tuple(
+            (name, frozenset(fields), list(fields))
+            for name, fields in (field_check.nested or {}).items()
+        )
+
+class RequestValidator():
+    """
+    Validates request bodies against a RequestSchema. Everything the schema
+    declares is converted into sets and lookup tables once, when the
+    validator is created, so each validation is a single pass over the body.
+    Create validators at import (see compileRequestSchema) and reuse them.
+    """
+    def __init__(self, schema: RequestSchema):
+        self.required_list: list[str] = list(schema.required)
+        self.required: frozenset = frozenset(schema.required)
+
+        # (name, {value: check}, fallback check, valid values) of each variant
+        self.variants: list[tuple] = []
+        for variant in schema.variants or []:
+            checks: dict = {value: _CompiledFieldCheck(check) for value, check in variant.checks.items()}
+            fallback = _CompiledFieldCheck(variant.fallback) if variant.fallback is not None else None
+            self.variants.append((variant.name, checks, fallback, list(variant.checks)))
+
+        self.enums: list[tuple] = [
+            (name, frozenset(values), list(values))
+            for name, values in (schema.enums or {}).items()
+        ]
+        self.formats: list[tuple] = list((schema.formats or {}).items())
+
+    def validate(self, data: dict) -> dict:
+        """
+        Validates a request body, removing any fields disallowed by its
+        variant fields' values. The body is changed in place.
+
+        :params data: The request body to validate.
+        :returns: The valid (cleaned) request body.
+        :raises: InvalidRequestBody
+        """
+        if not self.required <= data.keys():
+            errorMsg: str = f"Missing at least one field from {self.required_list} in request body."
+            raise InvalidRequestBody(errorMsg)
+
+        # Pick the FieldCheck for every variant field before changing the body
+        selected: list[tuple] = []
+        for name, checks, fallback, valid_values in self.variants:
+            value = data[name]
+            check = checks.get(value, fallback) if isinstance(value, str) else fallback
+            if check is None:
+                errorMsg: str = f"The provided {name} ('{value}') is not one of the valid values ({valid_values})."
+                raise InvalidRequestBody(errorMsg)
+            selected.append((name, value, check))
+
+        for name, value, check in selected:
+            if not check.required <= data.keys():
+                errorMsg: str = f"Missing at least one field from {check.required_list} for a {name} value of '{value}' in request body."
+                raise InvalidRequestBody(errorMsg)
+
+            for disallowed_field in check.disallowed:
+                data.pop(disallowed_field, None)
+
+            for nested_name, nested_required, nested_list in check.nested:
+                nested = data[nested_name]
+                if not isinstance(nested, dict) or not nested_required <= nested.keys():
+                    errorMsg: str = f"Missing at least one field from {nested_list} in the '{nested_name}' object in the request body."
+                    raise InvalidRequestBody(errorMsg)
+
+        for name, valid_values, valid_list in self.enums:
+            if name in data and (not isinstance(data[name], str) or data[name] not in valid_values):
+                errorMsg: str = f"Specified {name} ('{data[name]}') is not one of the valid values {valid_list} in request body."
+                raise InvalidRequestBody(errorMsg)
+
+        for name, (check_function, errorMsg) in self.formats:
+            if name in data and not check_function(data[name]):
+                raise InvalidRequestBody(errorMsg)
+
+        return data
+
+    def _patchAllowed(self, check, data: dict) -> bool:
+        """
+        Checks if the fields of a PATCH body are allowed under a (compiled)
+        FieldCheck, including the nested requirements of any object in it.
+        """
+        for disallowed_field in check.disallowed:
+            if disallowed_field in data:
+                return False
+
+        for nested_name, nested_required, _ in check.nested:
+            if nested_name in data:
+                nested = data[nested_name]
+                if not isinstance(nested, dict) or not nested_required <= nested.keys():
+                    return False
+
+        return True
+
+    def validatePatch(self, data: dict) -> UpdatePlan:
+        """
+        Validates a PATCH body against only the fields it changes, and turns
+        it into an UpdatePlan. Rules that depend on stored fields (e.g., which
+        fields a stored 'university_status' allows) become conditions on the
+        update, so the stored item never has to be read first:
+          - Changing a variant field removes the fields its new value
+            disallows, and requires the fields its new value requires to
+            either be in the body or already be stored.
+          - Changing any other field requires the stored value of every
+            variant field (that isn't changed too) to allow it.
+
+        :params data: The PATCH body to validate. Must not hold key fields.
+        :returns: The UpdatePlan for the body.
+        :raises: InvalidRequestBody
+        """
+        rejectInternalAttributes(data)
+
+        set_fields: dict = dict(data)
+        remove_fields: list[str] = []
+        conditions: list = []
+        depends_on: list[str] = []
+
+        for name, checks, fallback, valid_values in self.variants:
+            if name in data:
+                value = data[name]
+                check = checks.get(value, fallback) if isinstance(value, str) else fallback
+                if check is None:
+                    errorMsg: str = f"The provided {name} ('{value}') is not one of the valid values ({valid_values})."
+                    raise InvalidRequestBody(errorMsg)
+
+                for disallowed_field in check.disallowed:
+                    set_fields.pop(disallowed_field, None)
+                    if disallowed_field not in remove_fields:
+                        remove_fields.append(disallowed_field)
+
+                for required_field in check.required_list:
+                    if required_field not in data:
+                        conditions.append(Attr(required_field).exists())
+
+                for nested_name, nested_required, nested_list in check.nested:
+                    if nested_name not in data:
+                        conditions.extend(Attr(f"{nested_name}.{field}").exists() for field in nested_list)
+                    elif not isinstance(data[nested_name], dict) or not nested_required <= data[nested_name].keys():
+                        errorMsg: str = f"Missing at least one field from {nested_list} in the '{nested_name}' object in the request body."
+                        raise InvalidRequestBody(errorMsg)
+                continue
+
+            # The stored value of this variant field must allow the changes
+            failing: list[str] = [value for value, check in checks.items() if not self._patchAllowed(check, data)]
+            if not failing:
+                continue
+
+            if fallback is not None and self._patchAllowed(fallback, data):
+                conditions.append(~Attr(name).is_in(failing))
+            else:
+                passing: list[str] = [value for value in checks if value not in failing]
+                if not passing:
+                    errorMsg: str = f"The fields in the request body are not allowed for any {name}."
+                    raise InvalidRequestBody(errorMsg)
+                conditions.append(Attr(name).is_in(passing))
+            depends_on.append(name)
+
+        for name, valid_values, valid_list in self.enums:
+            if name in set_fields and (not isinstance(set_fields[name], str) or set_fields[name] not in valid_values):
+                errorMsg: str = f"Specified {name} ('{set_fields[name]}') is not one of the valid values {valid_list} in request body."
+                raise InvalidRequestBody(errorMsg)
+
+        for name, (check_function, errorMsg) in self.formats:
+            if name in set_fields and not check_function(set_fields[name]):
+                raise InvalidRequestBody(errorMsg)
+
+        return UpdatePlan(set_fields = set_fields, remove_fields = remove_fields,
+                          conditions = conditions, depends_on = depends_on)
+
+def rejectInternalAttributes(data: dict):
+    """
+    Checks a request body doesn't set any of the INTERNAL_ATTRIBUTES, which
+    would move the stored item to another shard or bucket of its indexes.
+
+    :params data: The request body to check.
+    :raises: InvalidRequestBody
+    """
+    internal: list[str] = [name for name in INTERNAL_ATTRIBUTES if name in data]
+    if internal:
+        errorMsg: str = f"The fields {internal} are kept by the api and can't be set in the request body."
+        raise InvalidRequestBody(errorMsg)
+
+def compileRequestSchema(schema: RequestSchema) -> RequestValidator:
+    """
+    Compiles a RequestSchema into a reusable RequestValidator. Call this once,
+    at import, for each kind of request body a handler validates.
+
+    :params schema: The RequestSchema to compile.
+    """
+    return RequestValidator(schema)
+
+@lru_cache(maxsize = 4096)
+def _validTimestampDate(date: str) -> bool:
+    """
+    Checks the (already digit checked) 'YYYY-MM-DD' part of a timestamp is a
+    real calendar date. Cached, since timestamps validated together (e.g.,
+    a day of visits) almost always share their dates.
+
+    :params date: The first 10 characters of a timestamp.
+    """
+    year: int = int(date[0:4])
+    month: int = int(date[5:7])
+    day: int = int(date[8:10])
+
+    # strftime doesn't zero pad years before 1000, so they never round
+    # tripped through the TIMESTAMP_FORMAT; keep rejecting them
+    if year < 1000 or not 1 <= month <= 12 or day < 1:
+        return False
+
+    return day <= calendar.monthrange(year, month)[1]
+
 def validTimestamp(timestamp: str) -> bool:
     """
     Checks if a timestamp matches the TIMESTAMP_FORMAT.
 
+    Timestamps in this format are fixed width, so the layout is checked
+    directly (instead of parsing and re-formatting the timestamp), and only
+    the date needs a calendar check.
+
     :params timestamp: The timestamp to compare.
     :returns: True if the timestamp matches the expected format.
               False otherwise.
     """
+    if type(timestamp) is not str or TIMESTAMP_PATTERN.fullmatch(timestamp) is None:
+        return False
 
-    # Parse the timestamp into a datetime object
-    try:
-        parsed = datetime.strptime(timestamp, TIMESTAMP_FORMAT)
+    # Two digit fields compare correctly as strings
+    return (timestamp[11:13] < "24" and timestamp[14:16] < "60" and
+            timestamp[17:19] < "60" and _validTimestampDate(timestamp[:10]))
 
-    # Timestamp not valid if an error occurs during parsing
-    except:
-        return False
+def parseTimestamp(timestamp: str) -> datetime:
+    """
+    Converts a TIMESTAMP_FORMAT timestamp into a datetime.
+
+    :params timestamp: The timestamp to convert.
+    :raises: ValueError if the timestamp is not valid.
+    """
+    if not validTimestamp(timestamp):
+        raise ValueError(f"Timestamp '{timestamp}' does not match the format {TIMESTAMP_FORMAT}.")
+
+    return datetime(int(timestamp[0:4]), int(timestamp[5:7]), int(timestamp[8:10]),
+                    int(timestamp[11:13]), int(timestamp[14:16]), int(timestamp[17:19]))
+
+def formatTimestamp(value: datetime) -> str:
+    """
+    Converts a datetime into a TIMESTAMP_FORMAT timestamp. Any fraction of a
+    second and timezone information is dropped.
+
+    :params value: The datetime to convert.
+    """
+    return (f"{value.year:04d}-{value.month:02d}-{value.day:02d}T"
+            f"{value.hour:02d}:{value.minute:02d}:{value.second:02d}")
+
+def normalizeTimestamps(timestamps, input_formats: list[str] = None) -> list:
+    """
+    Converts a whole column of timestamps into the TIMESTAMP_FORMAT.
+    Timestamps already in the format (checked with validTimestamp) are kept as
+    they are; any others are parsed with the first of input_formats that
+    matches (e.g., the '%m/%d/%Y %H:%M:%S' timestamps of a form export).
+
+    :params timestamps: An iterable of timestamps.
+    :params input_formats: Optional strptime formats the other timestamps may be in.
+    :returns: A list of normalized timestamps, with None for any timestamp
+              that could not be converted.
+    """
+    if input_formats is None:
+        input_formats = []
+
+    normalized: list = []
+
+    for timestamp in timestamps:
+        if validTimestamp(timestamp):
+            normalized.append(timestamp)
+            continue
+
+        converted: str = None
+        if type(timestamp) is str:
+            for input_format in input_formats:
+                try:
+                    converted = formatTimestamp(datetime.strptime(timestamp.strip(), input_format))
+                    break
+                except ValueError:
+                    pass
+
+        normalized.append(converted)
+
+    return normalized
+
+def completableItemsToMap(items: list[dict]) -> dict:
+    """
+    Converts a list of completable items (as sent to the api) into the map
+    they are stored as: each item's name mapped to its completion status.
+    Storing them keyed by name lets a single item be added or updated with
+    one UpdateItem request. When a name is in the list more than once, the
+    last item with that name wins.
+
+    :params items: A list of {'name': ..., 'completion_status': ...} objects.
+    """
+    return { str(item['name']): item['completion_status'] for item in items }
+
+def completableItemsFromMap(stored) -> list[dict]:
+    """
+    Converts stored completable items back into the list the api returns,
+    sorted by name.
+
+    :params stored: The stored map of names and completion statuses. Entries
+                    stored before items were kept in maps hold the list itself,
+                    which is returned (sorted) as is.
+    """
+    if isinstance(stored, dict):
+        return [
+            { 'name': name, 'completion_status': stored[name] }
+            for name in sorted(stored)
+        ]
 
-    # "Recreate" the timestamp from the parsed object according
-    # to the TIMESTAMP_FORMAT and compare it to the original
-    return timestamp == parsed.strftime(TIMESTAMP_FORMAT)
+    return sorted(stored, key=lambda item: str(item['name']))
@@ -1,11 +1,7 @@
 import json
-from pydoc import cli
-import boto3
 from boto3.dynamodb.conditions import Key
-from botocore.exceptions import ClientError
 import os
 import logging
-from datetime import datetime
 import sys
 
 SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
@@ -28,22 +24,86 @@ EQUIPMENT_NAMES: dict = {
     "EMBROIDERY_STRING": "Embroidery Machine",
 }
 
+# General required fields all 'printer_3d_info' objects are required to have
+GENERAL_PRINTER_3D_INFO_FIELDS: list[str] = ["printer_name", "print_name", "print_duration",
+                                             "print_status", "print_notes"]
+
+"""
+Due to the lack of data collection from other equipment, the only real
+required field to check is 'printer_3d_info' when the type is 'SLA Printer'
+or 'FDM 3D Printer'. Otherwise, just make sure that the 'printer_3d_info'
+field is disallowed for all other types. In the future, split equipment
+type fields into more specificaly defined ones as needed.
+"""
+# What a valid equipment request body looks like. Compiled once at import.
+EQUIPMENT_REQUEST_VALIDATOR: RequestValidator = compileRequestSchema(RequestSchema(
+    required = ["user_id", "timestamp", "location",
+                "project_name", "project_type", "equipment_type"],
+    variants = [
+        # Project Type Fields
+        VariantField(name = "project_type", checks = {
+            'Personal': FieldCheck(
+                required = [],
+                disallowed = ["class_number", "faculty_name", "project_sponsor", "organization_affiliation"],
+            ),
+            'Class': FieldCheck(
+                required = ["class_number", "faculty_name", "project_sponsor"],
+                disallowed = ["organization_affiliation"],
+            ),
+            'Club': FieldCheck(
+                required = ["organization_affiliation"],
+                disallowed = ["class_number", "faculty_name", "project_sponsor"],
+            ),
+        }),
+        # Equipment Type Fields
+        VariantField(name = "equipment_type", checks = {
+            EQUIPMENT_NAMES["FDM_PRINTER_STRING"]: FieldCheck(
+                required = ["printer_3d_info"],
+                disallowed = [], # intentionally left blank to not delete other fields
+                nested = {
+                    "printer_3d_info": ["print_mass_estimate", "print_mass"] + GENERAL_PRINTER_3D_INFO_FIELDS,
+                },
+            ),
+            EQUIPMENT_NAMES["SLA_PRINTER_STRING"]: FieldCheck(
+                required = ["printer_3d_info"],
+                disallowed = [],
+                nested = {
+                    "printer_3d_info": ["resin_volume", "resin_type"] + GENERAL_PRINTER_3D_INFO_FIELDS,
+                },
+            ),
+        }, fallback = FieldCheck(
+            required = [],
+            disallowed = ["printer_3d_info"],
+        )),
+    ],
+    formats = {
+        "timestamp": (validTimestamp, "Timestamp not in the approved format. Approved format is 'YYYY-MM-DDThh:mm:ss'."),
+    },
+))
+
 class EquipmentHandler():
-    def __init__(self, equipment_table):
+    def __init__(self, equipment_table, equipment_rollups_table):
         # TODO: Setup CloudWatch Logs
         # Sets up CloudWatch logs and sets level to INFO
         # self.logger = logging.getLogger()
         # self.logger.setLevel(logging.INFO)
         
         if equipment_table is None:
-            # Get the service resource.
-            dynamodb = boto3.resource('dynamodb')
-            # Get the table name.
-            EQUIPMENT_TABLE_NAME = os.environ["EQUIPMENT_TABLE_NAME"]
-            # Get table objects
-            self.equipment_table = dynamodb.Table(EQUIPMENT_TABLE_NAME)
+            # Get the (container wide) table object
+            self.equipment_table = getTable("EQUIPMENT_TABLE_NAME")
         else:
             self.equipment_table = equipment_table
+
+        if equipment_rollups_table is None:
+            # Get the (container wide) table object
+            self.equipment_rollups_table = getTable("EQUIPMENT_ROLLUPS_TABLE_NAME")
+        else:
+            self.equipment_rollups_table = equipment_rollups_table
+
+        # The (sharded) index usage logs are listed by timestamp through, and the
+        # index of day (or month) buckets bounded time ranges are read from
+        self.timestamp_index: ShardedIndex = timestampIndex('timestamp', ['user_id', 'timestamp'],
+                                                            bucketed = True)
             
     # Main handler function
     def handle_event(self, event, context):
@@ -72,7 +132,7 @@ class EquipmentHandler():
                     errorMsg: str = "REST method {http_method} requires a request body."
                     body = { 'errorMsg': errorMsg }
                     return buildResponse(statusCode = 400, body = body)
-                data = json.loads(event['body'])
+                data = json.loads(getRequestBody(event))
 
             # Try to get any query parameters
             try:
@@ -92,13 +152,18 @@ class EquipmentHandler():
                 response = self.get_all_equipment_usage_information(query_parameters)
             elif http_method == "POST" and resource_path == equipment_path:
                 response = self.create_user_equipment_usage(data)
+            elif http_method == "GET" and resource_path == equipment_stats_path:
+                response = self.get_equipment_stats(query_parameters)
 
             elif http_method == "GET" and resource_path == equipment_param_path:
                 response = self.get_user_equipment_usage(user_id, query_parameters)
             elif http_method == "PATCH" and resource_path == equipment_param_path:
                 response = self.patch_user_equipment_usage(user_id, data)
+                # New logs show up once cached responses expire; changes to
+                # existing logs (e.g., print status) are flushed right away
+                flushApiCache(event, response)
 
-            return response
+            return compressResponse(applyETag(response, event), event)
         except:
             errorMsg: str = f"We're sorry, but something happened. Try again later."
             body = { 'errorMsg': errorMsg }
@@ -110,11 +175,25 @@ class EquipmentHandler():
     def get_all_equipment_usage_information(self, query_parameters: dict):
         """
         Returns all the equipment usage objects from the equipment usage table.
+        Results are paginated; pass the returned 'next_token' back as a query
+        parameter to get the next page.
 
         :params query_parameters: A dictionary of parameter names and values to filter by.
         """
 
-        if query_parameters:
+        # Get the fields to return for each item
+        try:
+            fields = parseFieldsParameter(query_parameters)
+
+        except InvalidQueryParameters as iqp:
+            body = { 'errorMsg': str(iqp) }
+            return buildResponse(statusCode = 400, body = body)
+
+        # Get the number of items to return and where to resume from
+        limit = getPageLimit(query_parameters)
+        next_token = query_parameters.get("next_token")
+
+        if anyKeysPresent(SORTED_QUERY_PARAMETERS, query_parameters):
             try:
                 timestamp_expression = buildTimestampKeyExpression(query_parameters, 'timestamp')
 
@@ -122,47 +201,48 @@ class EquipmentHandler():
                 body = { 'errorMsg': str(iqp) }
                 return buildResponse(statusCode = 400, body = body)
 
-            # Get the number of items to return
-            if "limit" in query_parameters:
-                limit = query_parameters["limit"]
-
-            # Otherwise return as many as possible
-            else:
-                limit = QUERY_LIMIT_RETURN_ALL
-
             try:
-                if timestamp_expression:
-                    key_expression = Key(GSI_ATTRIBUTE_NAME).eq("1") & timestamp_expression
-                else:
-                    key_expression = Key(GSI_ATTRIBUTE_NAME).eq("1")
+                # Queries every shard of the index and merges them by timestamp
+                items, next_token = queryPageByKeyExpression(self.equipment_table, timestamp_expression,
+                                                             GSI = self.timestamp_index, limit = limit,
+                                                             next_token = next_token)
 
-                items = queryByKeyExpression(self.equipment_table, key_expression,
-                                             GSI = TIMESTAMP_INDEX, limit = limit)
+            except InvalidQueryParameters as iqp:
+                body = { 'errorMsg': str(iqp) }
+                return buildResponse(statusCode = 400, body = body)
 
             except Exception as e:
                 body = { 'errorMsg': "Something went wrong on the server." }
                 return buildResponse(statusCode = 500, body = body)
 
-            # Do a second lookup for all returned items to get the rest of the data
-            equipment_logs = []
-            for item in items:
-                user_id = item['user_id']
-                timestamp = item['timestamp']
+            # Do a batched second lookup for all returned items to get the rest of the data
+            try:
+                hydrated = hydrateKeys(self.equipment_table, items, ['user_id', 'timestamp'],
+                                       fields = fields)
 
-                response = self.equipment_table.get_item(
-                    Key={ 
-                        'user_id': user_id,
-                        'timestamp': timestamp
-                    }
-                )
+            except Exception:
+                body = { 'errorMsg': "Something went wrong on the server." }
+                return buildResponse(statusCode = 500, body = body)
 
-                equipment_logs.append(response['Item'])
+            equipment_logs = hydrated.items
 
         else:
-            equipment_logs = scanTable(self.equipment_table, limit = SCAN_LIMIT_RETURN_ALL)
+            try:
+                equipment_logs, next_token = scanTablePage(self.equipment_table, limit = limit,
+                                                           next_token = next_token,
+                                                           segments = SCAN_SEGMENTS_AUTO,
+                                                           fields = fields)
+
+            except InvalidQueryParameters as iqp:
+                body = { 'errorMsg': str(iqp) }
+                return buildResponse(statusCode = 400, body = body)
 
         body = { 'equipment_logs': equipment_logs }
 
+        # Only include a token if there are more equipment logs to get
+        if next_token:
+            body['next_token'] = next_token
+
         return buildResponse(statusCode = 200, body = body)
 
 
@@ -180,83 +260,85 @@ class EquipmentHandler():
             body = { 'errorMsg': str(irb) }
             return buildResponse(statusCode = 400, body = body)
 
-        # Ensure no other entry with same user_id and timestamp already exists
+        # Spread entries over the shards of the TimestampIndex, and put them
+        # in the bucket of their timestamp
+        data.update(self.timestamp_index.indexAttributes(data))
+
+        # Actually try putting the item into the table. Fails (without
+        # overwriting anything) if another entry with the same user_id and
+        # timestamp already exists.
         user_id: str = data['user_id']
         timestamp: str = data['timestamp']
-        response = self.equipment_table.get_item(
-            Key={
-                'user_id': user_id,
-                'timestamp': timestamp,
-            }
-        )
-        if 'Item' in response:
-            errorMsg: str = f"Equipment usage entry for user {user_id} at timestamp {timestamp} already exists. Did you mean to input a different user or timestamp?"
-            body = { 'errorMsg': errorMsg}
-            return buildResponse(statusCode = 400, body = body)
-
-        # Always force GSI_ATTRIBUTE_NAME key to have value of "1"
-        data[GSI_ATTRIBUTE_NAME] = "1"
-
-        # Actually try putting the item into the table
         try:
-            self.equipment_table.put_item(
-                Item=data
-            )
+            created: bool = putItemIfNotExists(self.equipment_table, data)
         except Exception as e:
             body = { 'errorMsg': "Something went wrong on the server." }
             return buildResponse(statusCode = 500, body = body)
 
+        if not created:
+            errorMsg: str = f"Equipment usage entry for user {user_id} at timestamp {timestamp} already exists. Did you mean to input a different user or timestamp?"
+            body = { 'errorMsg': errorMsg}
+            return buildResponse(statusCode = 400, body = body)
+
+        self.updateEquipmentRollups(equipmentRollupIncrements([data]))
+
         # If here, put action succeeded. Return 201
         return buildResponse(statusCode = 201, body = {})
 
     def get_user_equipment_usage(self, user_id: str, query_parameters: dict = {}):
         """
         Gets all of the equipment usage objects for a specified user from the equipment usage table.
+        Results are paginated; pass the returned 'next_token' back as a query
+        parameter to get the next page.
 
         :params user_id: The name of the user.
         :params query_parameters: A dictionary of parameter names and values to filter by.
         """
 
-        if query_parameters:
-            try:
-                timestamp_expression = buildTimestampKeyExpression(query_parameters, 'timestamp')
+        # Get the fields to return for each item
+        try:
+            fields = parseFieldsParameter(query_parameters)
 
-            except InvalidQueryParameters as iqp:
-                body = { 'errorMsg': str(iqp) }
-                return buildResponse(statusCode = 400, body = body)
+        except InvalidQueryParameters as iqp:
+            body = { 'errorMsg': str(iqp) }
+            return buildResponse(statusCode = 400, body = body)
 
-            # Get the number of items to return
-            if "limit" in query_parameters:
-                limit = query_parameters["limit"]
+        try:
+            timestamp_expression = buildTimestampKeyExpression(query_parameters, 'timestamp')
 
-            # Otherwise return as many as possible
-            else:
-                limit = QUERY_LIMIT_RETURN_ALL
+        except InvalidQueryParameters as iqp:
+            body = { 'errorMsg': str(iqp) }
+            return buildResponse(statusCode = 400, body = body)
 
-            try:
-                if timestamp_expression:
-                    key_expression = Key('user_id').eq(user_id) & timestamp_expression
-                else:
-                    key_expression = Key('user_id').eq(user_id)
+        # Get the number of items to return and where to resume from
+        limit = getPageLimit(query_parameters)
+        next_token = query_parameters.get("next_token")
 
-                equipment_logs = queryByKeyExpression(self.equipment_table, key_expression,
-                                                      GSI = None, limit = limit)
+        try:
+            if timestamp_expression:
+                key_expression = Key('user_id').eq(user_id) & timestamp_expression
+            else:
+                key_expression = Key('user_id').eq(user_id)
 
-            except Exception as e:
-                body = { 'errorMsg': "Something went wrong on the server." }
-                return buildResponse(statusCode = 500, body = body)
+            equipment_logs, next_token = queryPageByKeyExpression(self.equipment_table, key_expression,
+                                                                  GSI = None, limit = limit,
+                                                                  next_token = next_token,
+                                                                  fields = fields)
 
-        else:
-            key_expression = Key('user_id').eq(user_id)
-            equipment_logs = queryByKeyExpression(
-                    self.equipment_table,
-                    key_expression,
-                    GSI = None,
-                    limit = QUERY_LIMIT_RETURN_ALL
-            )
+        except InvalidQueryParameters as iqp:
+            body = { 'errorMsg': str(iqp) }
+            return buildResponse(statusCode = 400, body = body)
+
+        except Exception:
+            body = { 'errorMsg': "Something went wrong on the server." }
+            return buildResponse(statusCode = 500, body = body)
 
         body = { 'equipment_logs': equipment_logs }
 
+        # Only include a token if there are more equipment logs to get
+        if next_token:
+            body['next_token'] = next_token
+
         return buildResponse(statusCode = 200, body = body)
 
     def patch_user_equipment_usage(self, user_id: str, data: dict):
@@ -268,200 +350,203 @@ class EquipmentHandler():
         :params data: The updated equipment usage entry.
         """
 
-        # Ensure an entry to update actually exists
-        query_parameters: dict = {
-            'limit': 1
-        }
-
-        # Use a specific timestamp if provided
-        if 'timestamp' in data:
-            query_parameters['start_timestamp'] = data['timestamp']
-            query_parameters['end_timestamp'] = data['timestamp']
-
-        response = self.get_user_equipment_usage(user_id, query_parameters)
-
-        statusCode = response['statusCode']
-        response = json.loads(response['body'])
-
-        # If we get request fails or there are more than one responses to work with, return 400
-        if statusCode != 200 or len(response['equipment_logs']) != 1:
-            errorMsg: str = f"Equipment usage logs for {user_id} could not be found. Did you mean to add a usage log?"
-            body = { 'errorMsg': errorMsg }
-            return buildResponse(statusCode = 400, body = body)
-
-        else:
-            equipment_log = response['equipment_logs'][0]
-
         # "user_id" field is never allowed for update
         if 'user_id' in data:
             errorMsg: str = "Updating the 'user_id' field is not allowed. Please remove it before trying to update user {user_id}'s information."
             body = { 'errorMsg': errorMsg }
             return buildResponse(statusCode = 400, body = body)
 
-        # Delete the timestamp key in data if it exists before copying values
-        try:
-            del data['timestamp']
-        except KeyError:
-            pass
-        
-        # Ensure data[GSI_ATTRIBUTE_NAME] == '1'
-        data[GSI_ATTRIBUTE_NAME] = '1'
+        # The timestamp picks the entry to update; it is never updated itself
+        timestamp: str = data.pop('timestamp', None)
 
-        # Make sure "print_mass" field at least exists
-        if "print_mass" not in data:
-            data["print_mass"] = ""
-
-        # Copy all all fields from data to user
-        for key in data:
-            equipment_log[key] = data[key]
-        
-        # Validate new item
+        # Validate only the changed fields. Rules depending on the stored
+        # entry (e.g., its 'equipment_type') become conditions of the update.
         try:
-            equipment_log = self.validateEquipmentRequestBody(equipment_log)
+            plan: UpdatePlan = EQUIPMENT_REQUEST_VALIDATOR.validatePatch(data)
         except InvalidRequestBody as irb:
             body = { 'errorMsg': str(irb) }
             return buildResponse(statusCode = 400, body = body)
 
-        # Try putting item back into table
-        self.equipment_table.put_item(Item=equipment_log)
+        # Make sure "print_mass" field at least exists
+        if "print_mass" not in plan.set_fields:
+            plan.default_fields = { "print_mass": "" }
+
+        # Without a specific timestamp, update the first (latest) entry
+        if timestamp is None:
+            equipment_key = next(
+                iterateQueryByKeyExpression(self.equipment_table, Key('user_id').eq(user_id),
+                                            GSI = None, limit = 1, fields = ['user_id', 'timestamp']),
+                None
+            )
+            if equipment_key is None:
+                errorMsg: str = f"Equipment usage logs for {user_id} could not be found. Did you mean to add a usage log?"
+                body = { 'errorMsg': errorMsg }
+                return buildResponse(statusCode = 400, body = body)
+            timestamp = equipment_key['timestamp']
+
+        key: dict = { 'user_id': user_id, 'timestamp': timestamp }
+
+        # Ensure the entry is in its shard (and bucket) of the timestamp indexes
+        plan.set_fields.update(self.timestamp_index.indexAttributes(key))
+
+        # Update only the changed fields, if the entry exists, getting the
+        # entry as it was before the update back
+        old_log = updateItemReturningOld(self.equipment_table, key, plan)
+        if old_log is None:
+            # Find out which condition failed
+            response = self.equipment_table.get_item(Key=key)
+            if 'Item' not in response:
+                errorMsg: str = f"Equipment usage logs for {user_id} could not be found. Did you mean to add a usage log?"
+            else:
+                errorMsg: str = f"The update doesn't fit the stored equipment usage log for {user_id} at timestamp {timestamp}. Check the fields its project_type and equipment_type require and allow."
+            body = { 'errorMsg': errorMsg }
+            return buildResponse(statusCode = 400, body = body)
+
+        # Take the old values of the entry out of the rollups, and add the new ones
+        self.updateEquipmentRollups(mergeRollupIncrements(
+            equipmentRollupIncrements([applyUpdatePlan(old_log, plan)]),
+            equipmentRollupIncrements([old_log], sign = -1),
+        ))
 
         # Successfully updated user
         return buildResponse(statusCode = 204, body = {})
     
-    def validateEquipmentRequestBody(self, data: dict):
+    def updateEquipmentRollups(self, increments: dict):
         """
-        Valides the request body used when adding/updating equipment information.
-        Removes any unnecessary keys and values from the request body.
-        Will raise an InvalidRequestBody error with the details explaining
-        what part of the body is invalid.
+        Adds to the equipment rollups (see get_equipment_stats). Failing to
+        update them doesn't fail the request, since the usage log is already
+        stored; the day can be recounted with
+        utilsFolder/rebuild_equipment_rollups.py.
 
-        :params data: The request body to validate.
-        :returns: A valid equipment request body.
-        :raises: InvalidRequestBody
+        :params increments: The amounts to add (see equipmentRollupIncrements).
         """
+        try:
+            addToRollups(self.equipment_rollups_table, EQUIPMENT_ROLLUP_KEY, increments)
+        except Exception as e:
+            logging.getLogger().error(f"Could not update {len(increments)} equipment rollups: {e}")
 
-        # Equipment required fields
-        required_fields: list[str] = ["user_id", "timestamp", "location",
-                                    "project_name", "project_type", "equipment_type"]
-
-        # Project Type Fields
-        personal_project_fields = FieldCheck(
-            required = [],
-            disallowed = ["class_number", "faculty_name", "project_sponsor", "organization_affiliation"],
-        )
-
-        class_project_fields = FieldCheck(
-            required = ["class_number", "faculty_name", "project_sponsor"],
-            disallowed = ["organization_affiliation"]
-        )
+    def get_equipment_stats(self, query_parameters: dict):
+        """
+        Returns the equipment usage per equipment type, per printer, per day
+        (the number of logs, the grams of filament and minutes of printing,
+        and the number of logs with each print status), read from the
+        equipment rollups (kept as logs are added and patched) instead of from
+        the logs themselves. Costs one query per equipment type, however many
+        logs there are.
+
+        :params query_parameters: Optional 'start_timestamp' and 'end_timestamp'
+                                  (every day they touch is counted in full),
+                                  'equipment_type' (one of EQUIPMENT_NAMES;
+                                  defaults to all of them), and 'printer_name'
+                                  to count the usage of.
+        :returns: A 200 response whose body holds { 'stats': [{ 'equipment_type',
+                  'printer_name', 'day', 'logs', 'print_mass', 'print_duration',
+                  'print_status': { status: logs } }] (by day), and 'totals':
+                  the same per equipment type and printer (without 'day'), with
+                  the 'failure_rate' of the finished prints }
+        """
 
-        club_project_fields = FieldCheck(
-            required = ["organization_affiliation"],
-            disallowed = ["class_number", "faculty_name", "project_sponsor"]
-        )
+        equipment_types: list[str] = list(EQUIPMENT_NAMES.values())
+        if "equipment_type" in query_parameters:
+            if query_parameters["equipment_type"] not in equipment_types:
+                errorMsg: str = f"Equipment type must be one of {equipment_types}."
+                body = { 'errorMsg': errorMsg }
+                return buildResponse(statusCode = 400, body = body)
 
-        project_type_field_lookup = {
-            'Personal': personal_project_fields,
-            'Class': class_project_fields,
-            'Club': club_project_fields
-        }
+            equipment_types = [query_parameters["equipment_type"]]
 
-        valid_project_types: list[str] = [key for key in project_type_field_lookup]
+        start_timestamp: str = query_parameters.get("start_timestamp")
+        end_timestamp: str = query_parameters.get("end_timestamp")
+        for timestamp in (start_timestamp, end_timestamp):
+            if timestamp and not validTimestamp(timestamp):
+                errorMsg: str = "Timestamp not in the approved format. Approved format is 'YYYY-MM-DDThh:mm:ss'."
+                body = { 'errorMsg': errorMsg }
+                return buildResponse(statusCode = 400, body = body)
 
-        # Equipment Type Fields
-        """
-        Due to the lack of data collection from other equipment, the only real
-        required field to check is 'printer_3d_info' when the type is 'SLA Printer'
-        or 'FDM 3D Printer'. Otherwise, just make sure that the 'printer_3d_info'
-        field is disallowed for all other types. In the future, split equipment
-        type fields into more specificaly defined ones as needed.
-        """
+        if start_timestamp and end_timestamp and end_timestamp < start_timestamp:
+            errorMsg: str = "When searching with both start and end timestamps, end_timestamp cannot occur before start_timestamp."
+            body = { 'errorMsg': errorMsg }
+            return buildResponse(statusCode = 400, body = body)
 
-        printer_3d_fields = FieldCheck(
-            required = ["printer_3d_info"],
-            disallowed = [] # intentionally left blank to not delete other fields
-        )
+        # Buckets start with their day, so a range of days is a range of
+        # buckets: from the start day, up to (past) every printer of the end day
+        bucket_expression = buildTimestampKeyExpression({
+            name: bound for name, bound in (
+                ("start_timestamp", start_timestamp and start_timestamp[:DAY_BUCKET_LENGTH]),
+                ("end_timestamp", end_timestamp and end_timestamp[:DAY_BUCKET_LENGTH] + chr(ord(EQUIPMENT_ROLLUP_SEPARATOR) + 1)),
+            ) if bound
+        }, EQUIPMENT_ROLLUP_KEY[1])
 
-        other_equipment_type_fields = FieldCheck(
-            required = [],
-            disallowed = ["printer_3d_info"]
-        )
-
-        # Lookup dictionary to retrieve the appropriate FieldCheck object
-        required_equipment_field_check_lookup: dict = {
-            EQUIPMENT_NAMES["FDM_PRINTER_STRING"]: printer_3d_fields,
-            EQUIPMENT_NAMES["SLA_PRINTER_STRING"]: printer_3d_fields,
-            "Other": other_equipment_type_fields,
-        }
-
-        # Ensure all required fields are present
-        if not allKeysPresent(required_fields, data):
-            errorMsg: str = f"Missing at least one field from {required_fields} in request body."
-            raise InvalidRequestBody(errorMsg)
-
-        # Error if project_type is not one of the defined ones
-        project_type: str = data['project_type']
-        if project_type not in project_type_field_lookup:
-            errorMsg: str = f"project_type {project_type} is not one of the valid project types {valid_project_types}."
-            raise InvalidRequestBody(errorMsg)
-
-        # Set equipment_type to "Other" if it doesn't require field checks
-        equipment_type: str = data['equipment_type']
-        if equipment_type not in required_equipment_field_check_lookup:
-            equipment_type = "Other"
-
-        # Check for and clean fields related to 'project_type'
-        checking_fields = project_type_field_lookup[project_type]
-        try:
-            data = checkAndCleanRequestFields(data, checking_fields)
-        except InvalidRequestBody:
-            # Re-raise InvalidRequestBody if the exception occurs
-            errorMsg: str = f"Missing at least one field in request body from {checking_fields.required} for a project_type value of '{project_type}'."
-            raise InvalidRequestBody(errorMsg)
-
-        # Check for and clean fields related to 'equipment_type'
-        checking_fields = required_equipment_field_check_lookup[equipment_type]
         try:
-            data = checkAndCleanRequestFields(data, checking_fields)
-        except InvalidRequestBody:
-            # Re-raise InvalidRequestBody if the exception occurs
-            errorMsg: str = f"Missing at least one field in request body from {checking_fields.required} for an equipment_type value of '{equipment_type}'."
-            raise InvalidRequestBody(errorMsg)
+            rollups: list[dict] = queryRollups(self.equipment_rollups_table, EQUIPMENT_ROLLUP_KEY,
+                                               equipment_types, bucket_expression)
 
-        # Ensure printer_3d_info object has all required fields if it is in data
-        # General required fields all 'printer_3d_info' objects are required to have
-        general_printer_3d_info_fields: list[str] = ["printer_name", "print_name", "print_duration",
-                                                     "print_status", "print_notes"]
-        # Required fields specific to FDM 3D Printers
-        fdm_printer_3d_required_fields: list[str] = ["print_mass_estimate", "print_mass"] + general_printer_3d_info_fields
-
-        # Required fields specific to SLA 3D Printers
-        sla_printer_3d_required_fields: list[str] = ["resin_volume", "resin_type"] + general_printer_3d_info_fields
+        except Exception:
+            body = { 'errorMsg': "Something went wrong on the server." }
+            return buildResponse(statusCode = 500, body = body)
 
-        # Check FDM printer fields
-        if data["equipment_type"] == EQUIPMENT_NAMES["FDM_PRINTER_STRING"] and not \
-            allKeysPresent(fdm_printer_3d_required_fields, data['printer_3d_info']):
+        printer_name = query_parameters.get("printer_name")
 
-                errorMsg: str = f"Missing at least one field in 'printer_3d_info' object from {fdm_printer_3d_required_fields} in the 'printer_3d_info' object in the request body."
-                raise InvalidRequestBody(errorMsg)
+        stats: list[dict] = []
+        totals: dict = {}
+        for rollup in rollups:
+            day, _, rollup_printer = rollup[EQUIPMENT_ROLLUP_KEY[1]].partition(EQUIPMENT_ROLLUP_SEPARATOR)
+            if printer_name is not None and rollup_printer != printer_name:
+                continue
 
-        # Check SLA printer fields
-        elif data["equipment_type"] == EQUIPMENT_NAMES["SLA_PRINTER_STRING"] and not \
-            allKeysPresent(sla_printer_3d_required_fields, data['printer_3d_info']):
+            usage: dict = {
+                name: rollup.get(name, 0) for name in [EQUIPMENT_COUNT_ATTRIBUTE] + EQUIPMENT_SUM_ATTRIBUTES
+            }
+            usage['print_status'] = {
+                name[len(STATUS_COUNT_PREFIX):]: count for name, count in sorted(rollup.items())
+                if name.startswith(STATUS_COUNT_PREFIX) and count
+            }
 
-                errorMsg: str = f"Missing at least one field in 'printer_3d_info' object from {fdm_printer_3d_required_fields} in the 'printer_3d_info' object in the request body."
-                raise InvalidRequestBody(errorMsg)
+            # Every log of the day was patched away (e.g., moved to another printer)
+            if not usage[EQUIPMENT_COUNT_ATTRIBUTE]:
+                continue
+
+            stats.append({ 'equipment_type': rollup['equipment_type'], 'printer_name': rollup_printer,
+                           'day': day, **usage })
+
+            total: dict = totals.setdefault((rollup['equipment_type'], rollup_printer), {
+                'equipment_type': rollup['equipment_type'], 'printer_name': rollup_printer,
+                **{ name: 0 for name in [EQUIPMENT_COUNT_ATTRIBUTE] + EQUIPMENT_SUM_ATTRIBUTES },
+                'print_status': {},
+            })
+            for name in [EQUIPMENT_COUNT_ATTRIBUTE] + EQUIPMENT_SUM_ATTRIBUTES:
+                total[name] += usage[name]
+            for status, count in usage['print_status'].items():
+                total['print_status'][status] = total['print_status'].get(status, 0) + count
+
+        for total in totals.values():
+            # Share of the finished (not in progress) prints that failed
+            finished = total['print_status'].get("Complete", 0) + total['print_status'].get("Failed", 0)
+            total['failure_rate'] = float(total['print_status'].get("Failed", 0) / finished) if finished else None
+
+        body = { 'stats': stats, 'totals': list(totals.values()) }
+        return buildResponse(statusCode = 200, body = body)
 
+    def validateEquipmentRequestBody(self, data: dict):
+        """
+        Valides the request body used when adding/updating equipment information.
+        Removes any unnecessary keys and values from the request body.
+        Will raise an InvalidRequestBody error with the details explaining
+        what part of the body is invalid.
 
-        # Ensure timestamp is in the correct format
-        if not validTimestamp(data['timestamp']):
-            errorMsg: str = f"Timestamp not in the approved format. Approved format is 'YYYY-MM-DDThh:mm:ss'."
-            raise InvalidRequestBody(errorMsg)
-        
-        return data
+        :params data: The request body to validate.
+        :returns: A valid equipment request body.
+        :raises: InvalidRequestBody
+        """
+        return EQUIPMENT_REQUEST_VALIDATOR.validate(data)
 
             
 
+# Handler reused between warm invocations of the same container
+equipment_handler = None
+
 def handler(request, context):
-    equipment_handler = EquipmentHandler(None)
+    global equipment_handler
+    if equipment_handler is None:
+        equipment_handler = EquipmentHandler(None, None)
     return equipment_handler.handle_event(request, context)
@@ -1,12 +1,7 @@
 import json
-from pydoc import cli
-import boto3
 from boto3.dynamodb.conditions import Key
-from botocore.exceptions import ClientError
 import os
 import logging
-from datetime import datetime
-from zoneinfo import ZoneInfo
 import sys
 
 SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
@@ -14,25 +9,35 @@ sys.path.append(os.path.dirname(SCRIPT_DIR))
 
 from api_defaults import *
 
+# Times a patch is retried when another request changed the same user's
+# qualifications between reading and updating them
+PATCH_ATTEMPTS: int = 3
+
 class QualificationsHandler():
-    def __init__(self, qualifications_table):
+    def __init__(self, qualifications_table, legacy_qualifications_table = None):
         # TODO: Setup CloudWatch Logs
         # Sets up CloudWatch logs and sets level to INFO
         # self.logger = logging.getLogger()
         # self.logger.setLevel(logging.INFO)
         
         if qualifications_table is None:
-            # Get the service resource.
-            dynamodb = boto3.resource('dynamodb')
-            # Get the table name.
-            QUALIFICATIONS_TABLE_NAME = os.environ["QUALIFICATIONS_TABLE_NAME"]
-            # Get table objects
-            self.qualifications_table = dynamodb.Table(QUALIFICATIONS_TABLE_NAME)
+            # Get the (container wide) table object
+            self.qualifications_table = getTable("QUALIFICATIONS_TABLE_NAME")
+
+            # While entries are being migrated out of the old (user_id, last_updated)
+            # keyed table, users not found in the new table are read from the old one
+            if "LEGACY_QUALIFICATIONS_TABLE_NAME" in os.environ:
+                legacy_qualifications_table = getTable("LEGACY_QUALIFICATIONS_TABLE_NAME")
         else:
             self.qualifications_table = qualifications_table
 
+        self.legacy_qualifications_table = legacy_qualifications_table
+
+        # The (sharded) index entries are listed by last_updated through
+        self.timestamp_index: ShardedIndex = timestampIndex('last_updated', ['user_id'])
+
         self.required_fields: list[str] = ["user_id", "trainings", "waivers", "miscellaneous", "last_updated"]
-        self.completable_item_lists: list[str] = ["trainings", "waivers", "miscellaneous"]
+        self.completable_item_lists: list[str] = COMPLETABLE_ITEM_LISTS
         self.completable_item_fields: list [str] = ["name", "completion_status"]
         self.valid_completion_statuses: list[str] = ["Complete", "Incomplete"]
             
@@ -68,7 +73,7 @@ class QualificationsHandler():
                     errorMsg: str = "REST method {http_method} requires a request body."
                     body = { 'errorMsg': errorMsg }
                     return buildResponse(statusCode = 400, body = body)
-                data = json.loads(event['body'])
+                data = json.loads(getRequestBody(event))
 
             # Try to get any query parameters
             try:
@@ -88,14 +93,19 @@ class QualificationsHandler():
                 response = self.get_all_qualifications_information(query_parameters)
             elif http_method == "POST" and resource_path == qualifications_path:
                 response = self.create_user_qualifications(data)
+                flushApiCache(event, response)
+            elif http_method == "PATCH" and resource_path == qualifications_path:
+                response = self.patch_qualifications(data)
+                flushApiCache(event, response)
 
             elif http_method == "GET" and resource_path == qualifications_param_path:
-                response = self.get_user_qualifications(user_id)
+                response = self.get_user_qualifications(user_id, query_parameters)
             elif http_method == "PATCH" and resource_path == qualifications_param_path:
                 response = self.patch_user_qualifications(user_id, data)
+                flushApiCache(event, response)
 
 
-            return response
+            return compressResponse(applyETag(response, event), event)
         except:
             errorMsg: str = f"We're sorry, but something happened. Try again later."
             body = { 'errorMsg': errorMsg }
@@ -107,11 +117,25 @@ class QualificationsHandler():
     def get_all_qualifications_information(self, query_parameters: dict):
         """
         Returns all the qualifications information entries from the qualifications table.
+        Results are paginated; pass the returned 'next_token' back as a query
+        parameter to get the next page.
 
         :params query_parameters: A dictionary of parameter names and values to filter by.
         """
 
-        if query_parameters:
+        # Get the fields to return for each item
+        try:
+            fields = parseFieldsParameter(query_parameters)
+
+        except InvalidQueryParameters as iqp:
+            body = { 'errorMsg': str(iqp) }
+            return buildResponse(statusCode = 400, body = body)
+
+        # Get the number of items to return and where to resume from
+        limit = getPageLimit(query_parameters)
+        next_token = query_parameters.get("next_token")
+
+        if anyKeysPresent(SORTED_QUERY_PARAMETERS, query_parameters):
             try:
                 timestamp_expression = buildTimestampKeyExpression(query_parameters, 'last_updated')
 
@@ -119,47 +143,48 @@ class QualificationsHandler():
                 body = { 'errorMsg': str(iqp) }
                 return buildResponse(statusCode = 400, body = body)
 
-            # Get the number of items to return
-            if "limit" in query_parameters:
-                limit = query_parameters["limit"]
-
-            # Otherwise return as many as possible
-            else:
-                limit = QUERY_LIMIT_RETURN_ALL
-
             # Query for matching qualifcation entries
             try:
-                if timestamp_expression:
-                    key_expression = Key(GSI_ATTRIBUTE_NAME).eq("1") & timestamp_expression
-                else:
-                    key_expression = Key(GSI_ATTRIBUTE_NAME).eq("1")
+                # Queries every shard of the index and merges them by timestamp
+                items, next_token = queryPageByKeyExpression(self.qualifications_table, timestamp_expression,
+                                                             GSI = self.timestamp_index, limit = limit,
+                                                             next_token = next_token)
 
-                items = queryByKeyExpression(self.qualifications_table, key_expression,
-                                             GSI = TIMESTAMP_INDEX, limit = limit)
+            except InvalidQueryParameters as iqp:
+                body = { 'errorMsg': str(iqp) }
+                return buildResponse(statusCode = 400, body = body)
 
             except Exception as e:
                 body = { 'errorMsg': "Something went wrong on the server." }
                 return buildResponse(statusCode = 500, body = body)
 
-            # Do a second lookup for all returned items to get the rest of the data
-            qualifications = []
-            for item in items:
-                user_id = item['user_id']
-                last_updated = item['last_updated']
+            # Do a batched second lookup for all returned items to get the rest of the data
+            try:
+                hydrated = hydrateKeys(self.qualifications_table, items, ['user_id'],
+                                       fields = fields)
 
-                response = self.qualifications_table.get_item(
-                    Key={
-                        'user_id': user_id,
-                        'last_updated': last_updated,
-                    }
-                )
+            except Exception:
+                body = { 'errorMsg': "Something went wrong on the server." }
+                return buildResponse(statusCode = 500, body = body)
 
-                qualifications.append(response['Item'])
+            qualifications = hydrated.items
 
         else:
-            qualifications = scanTable(self.qualifications_table, limit = SCAN_LIMIT_RETURN_ALL)
+            try:
+                qualifications, next_token = scanTablePage(self.qualifications_table, limit = limit,
+                                                           next_token = next_token,
+                                                           segments = SCAN_SEGMENTS_AUTO,
+                                                           fields = fields)
+
+            except InvalidQueryParameters as iqp:
+                body = { 'errorMsg': str(iqp) }
+                return buildResponse(statusCode = 400, body = body)
 
-        body = { 'qualifications': qualifications }
+        body = { 'qualifications': [self.toResponseBody(item) for item in qualifications] }
+
+        # Only include a token if there are more qualifications to get
+        if next_token:
+            body['next_token'] = next_token
 
         return buildResponse(statusCode = 200, body = body)
 
@@ -177,10 +202,9 @@ class QualificationsHandler():
             body = { 'errorMsg': str(irb) }
             return buildResponse(statusCode = 400, body = body)
 
-        # Check to make sure the user doesn't already exist. Return 400 if user does exist.
+        # Users that haven't been migrated yet already exist too
         user_id: str = data['user_id']
-        response = self.get_user_qualifications(user_id)
-        if response['statusCode'] == 200:
+        if self.getLegacyQualifications(user_id, fields = [PRIMARY_KEY]) is not None:
             errorMsg: str = f"User {user_id} qualifications already exist. Did you mean to update?"
             body = { 'errorMsg': errorMsg }
             return buildResponse(statusCode = 400, body = body)
@@ -197,139 +221,322 @@ class QualificationsHandler():
         if 'miscellaneous' not in data:
             data['miscellaneous'] = []
 
-        # Always force GSI_ATTRIBUTE_NAME key to have value of "1"
-        data[GSI_ATTRIBUTE_NAME] = "1"
+        # Store completable items keyed by name
+        for key in self.completable_item_lists:
+            data[key] = completableItemsToMap(data[key])
+
+        # Spread entries over the shards of the TimestampIndex
+        data[GSI_ATTRIBUTE_NAME] = self.timestamp_index.shardKey(data)
 
-        # Actually try putting the item into the table
+        # Actually try putting the item into the table. Fails (without
+        # overwriting anything) if the user's qualifications already exist.
         try:
-            self.qualifications_table.put_item(
-                Item=data
-            )
+            created: bool = putItemIfNotExists(self.qualifications_table, data)
         except Exception as e:
             body = { 'errorMsg': "Something went wrong on the server." }
             return buildResponse(statusCode = 500, body = body)
 
+        if not created:
+            errorMsg: str = f"User {user_id} qualifications already exist. Did you mean to update?"
+            body = { 'errorMsg': errorMsg }
+            return buildResponse(statusCode = 400, body = body)
+
         # If here, put action succeeded. Return 201
         return buildResponse(statusCode = 201, body = {})
 
-    def get_user_qualifications(self, user_id: str):
+    def get_user_qualifications(self, user_id: str, query_parameters: dict = {}):
         """
         Gets the qualifications information entry for a specified user from the qualifications table.
 
         :params user_id: The name of the user.
+        :params query_parameters: A dictionary of parameter names and values to filter by.
         """
 
+        # Get the fields to return
+        try:
+            fields = parseFieldsParameter(query_parameters)
+
+        except InvalidQueryParameters as iqp:
+            body = { 'errorMsg': str(iqp) }
+            return buildResponse(statusCode = 400, body = body)
+
+        qualifications = self.getQualifications(user_id, fields = fields)
+
+        if qualifications is None:
+            errorMsg: str = f"No qualifications for the user {user_id} could be found. Is there a typo?"
+            body = { 'errorMsg': errorMsg }
+            return buildResponse(statusCode = 400, body = body)
+
+        return buildResponse(statusCode = 200, body = self.toResponseBody(qualifications))
+
+    def patch_qualifications(self, data: dict):
         """
-        Query the table (because get_item doesn't play nice without specifying sort key).
-        Limit the results to 1 since we are enforcing 1 qualifications entry per user.
-        If an item already exists, this will return an "array" of 1 item in the 'Items'
-        key. For these purposes, ['Items'][0] is equivalent to retrieving the desired
-        user's qualifications.
+        Updates the qualifications information entries of many users at once (e.g.,
+        every learner in a Tiger Training sync). The updates are applied in
+        transactions of up to TRANSACT_WRITE_LIMIT users, so each transaction's
+        updates are all applied or none are. A transaction that fails (e.g., on
+        a conflicting transaction or throttling) is applied one user at a time
+        instead. Routed as PATCH /qualifications.
+
+        Each entry succeeds or fails on its own: invalid entries, and entries
+        that still couldn't be updated, are reported instead of failing the
+        rest of the batch.
+
+        :params data: A 'qualifications' list of update bodies, each also holding
+                      the 'user_id' of the entry to update.
+        :returns: A 200 response whose 'not_updated' list holds the user_ids that
+                  don't have a qualifications entry, and whose 'failed' list
+                  holds a { 'user_id', 'errorMsg' } for every other entry that
+                  wasn't updated.
         """
-        response = self.qualifications_table.query(
-                KeyConditionExpression=Key('user_id').eq(user_id),
-                Limit=1
-        )
 
-        # User qualifications doesn't exist if length of response['Items'] == 0
-        if len(response['Items']) == 0:
-            errorMsg: str = f"No qualifications for the user {user_id} could be found. Is there a typo?"
+        entries = data.get('qualifications')
+        if type(entries) != type([]):
+            errorMsg: str = "The request body requires a 'qualifications' list."
             body = { 'errorMsg': errorMsg }
             return buildResponse(statusCode = 400, body = body)
 
-        qualifications = response['Items'][0]
+        # Validate every update before applying any
+        failed: list[dict] = []
+        user_ids: list[str] = []
+        updates: list[tuple] = []
+        for entry in entries:
+            entry = dict(entry) if isinstance(entry, dict) else {}
+            user_id = entry.pop('user_id', None)
+
+            if not user_id or type(user_id) != str or user_id in user_ids:
+                errorMsg: str = "Every entry in 'qualifications' requires a different 'user_id'."
+                failed.append({ 'user_id': user_id, 'errorMsg': errorMsg })
+                continue
+
+            try:
+                plan: UpdatePlan = self.buildQualificationsUpdate(user_id, entry)
+            except InvalidRequestBody as irb:
+                failed.append({ 'user_id': user_id, 'errorMsg': str(irb) })
+                continue
+
+            user_ids.append(user_id)
+            updates.append(({ 'user_id': user_id }, plan, entry))
+
+        # Indexes (in updates) of the entries to update one at a time
+        retried: list[int] = []
+        for start in range(0, len(updates), TRANSACT_WRITE_LIMIT):
+            chunk: list[tuple] = updates[start:start + TRANSACT_WRITE_LIMIT]
 
-        return buildResponse(statusCode = 200, body = qualifications)
+            try:
+                # Entries that don't exist (or still store their completable
+                # items as lists) are left out of the transaction
+                conflicting: list[int] = transactUpdateItems(self.qualifications_table,
+                                                             [(key, plan) for key, plan, _ in chunk])
+                retried += [start + index for index in conflicting]
+            except ClientError:
+                # None of the chunk was applied; every update in it sets
+                # values, so applying them again one at a time is safe
+                retried += range(start, start + len(chunk))
+
+        not_updated: list[str] = []
+        for index in retried:
+            user_id: str = user_ids[index]
+            try:
+                response = self.patch_user_qualifications(user_id, updates[index][2])
+            except Exception:
+                failed.append({ 'user_id': user_id, 'errorMsg': "Something went wrong on the server." })
+                continue
+
+            if response['statusCode'] == 204:
+                continue
+
+            if self.getQualifications(user_id, fields = [PRIMARY_KEY]) is None:
+                not_updated.append(user_id)
+            else:
+                errorMsg: str = json.loads(response['body']).get('errorMsg', "")
+                failed.append({ 'user_id': user_id, 'errorMsg': errorMsg })
+
+        return buildResponse(statusCode = 200, body = { 'not_updated': not_updated, 'failed': failed })
 
     def patch_user_qualifications(self, user_id: str, data: dict):
         """
         Updates the qualifications information entry for a specified user. Fails if a
-        qualifications entry does not exist for the user. Always appends lists to
-        existing lists in the qualifications entry, though it does ensure the lists
-        'trainings', 'waivers', and 'miscellaneous' are valid sets.
+        qualifications entry does not exist for the user. Completable items are
+        merged into the existing ones by name: items with a new name are added, and
+        items with an existing name update its completion status.
 
         :params user_id: The name of the user.
         :params data: The updated qualifications information entry.
         """
 
-        # Ensure an entry to update actually exists
-        response = self.get_user_qualifications(user_id)
-        if response['statusCode'] != 200:
-            errorMsg: str = f"User {user_id} could not be found. Did you mean to add the user?"
-            body = { 'errorMsg': errorMsg }
-            return buildResponse(statusCode = 400, body = body)
-
-        else:
-            # Load the json object stored in response['body']
-            qualifications = json.loads(response['body'])
-
-            """
-            Because the last_updated timestamp will be changed (making a new copy),
-            save a copy of the original entry to delete.
-            """
-            entry_to_delete = qualifications.copy()
-
         # "user_id" field is never allowed for update
         if 'user_id' in data:
             errorMsg: str = "Updating the 'user_id' field is not allowed. Please remove it before trying to update user {user_id}'s information."
             body = { 'errorMsg': errorMsg }
             return buildResponse(statusCode = 400, body = body)
 
-        # Ensure data[GSI_ATTRIBUTE_NAME] == '1'
-        data[GSI_ATTRIBUTE_NAME] = '1'
+        try:
+            plan: UpdatePlan = self.buildQualificationsUpdate(user_id, data)
+        except InvalidRequestBody as irb:
+            body = { 'errorMsg': str(irb) }
+            return buildResponse(statusCode = 400, body = body)
 
-        # Copy all all fields from data to user
-        for key in data:
+        # Update just the changed completable items (and fields) server side
+        if updateItemIfExists(self.qualifications_table, { 'user_id': user_id }, plan):
+            # Successfully updated user
+            return buildResponse(statusCode = 204, body = {})
+
+        # The entry doesn't exist, or still stores its completable items as lists
+        return self.mergeUserQualifications(user_id, data)
+
+    def buildQualificationsUpdate(self, user_id: str, data: dict) -> UpdatePlan:
+        """
+        Validates a qualifications update body and turns it into an UpdatePlan
+        that sets each completable item in the stored maps by name, and replaces
+        any other field. The plan only applies to entries storing their
+        completable items as maps.
+
+        :params user_id: The name of the user the update is for.
+        :params data: The update body. Must not hold the 'user_id'.
+        :returns: The UpdatePlan for the body.
+        :raises: InvalidRequestBody
+        """
+        # The shard (and any other index attribute) is only ever set here
+        rejectInternalAttributes(data)
 
-            # Handle appending completable item lists
+        set_fields: dict = { GSI_ATTRIBUTE_NAME: self.timestamp_index.shardKey({ 'user_id': user_id }) }
+        conditions: list = []
+
+        for key in data:
             if key in self.completable_item_lists:
+                self.validateCompletableItems(key, data[key])
 
-                # Check that it is actually a list. Use an empty list for type comparison
-                if type(data[key]) != type([]):
-                    errorMsg: str = "The provided value for key {key} is not a list."
-                    body = { 'errorMsg': errorMsg }
-                    return buildResponse(statusCode = 400, body = body)
+                for name, completion_status in completableItemsToMap(data[key]).items():
+                    set_fields[(key, name)] = completion_status
+                conditions.append(Attr(key).attribute_type('M'))
+
+            elif key == 'last_updated' and not validTimestamp(data[key]):
+                errorMsg: str = "Timestamp 'last_updated' not in the approved format. Approved format is 'YYYY-MM-DDThh:mm:ss'."
+                raise InvalidRequestBody(errorMsg)
 
-                # Build the unique set of qualifications[key] and data[key] CompletableItems
-                unique_items: set[CompletableItem] = set()
-                unique_items.update([
-                    CompletableItem(k["name"], k["completion_status"])
-                    for k in qualifications[key]
-                ])
-                unique_items.update([
-                    CompletableItem(k["name"], k["completion_status"])
-                    for k in data[key]
-                ])
-
-                # Convert unique_items from CompletableItems to dictionaries
-                # and update qualifications[key]
-                qualifications[key] = [item.__dict__ for item in unique_items]
-
-            # Otherwise, just replace the item in the qualifications entry
             else:
-                qualifications[key] = data[key]
+                set_fields[key] = data[key]
 
-        # Validate new item
-        try:
-            qualifications = self.validateQualificationRequestBody(qualifications)
-        except InvalidRequestBody as irb:
-            body = { 'errorMsg': str(irb) }
-            return buildResponse(statusCode = 400, body = body)
-        
-        # Try putting item back into table
-        self.qualifications_table.put_item(Item=qualifications)
-
-        # Delete the old entry only if the timestamps are different
-        if entry_to_delete['last_updated'] != qualifications['last_updated']:
-            self.qualifications_table.delete_item(
-                Key={
-                    'user_id': entry_to_delete['user_id'],
-                    'last_updated': entry_to_delete['last_updated']
-                }
-            )
-
-        # Successfully updated user
-        return buildResponse(statusCode = 204, body = {})
+        return UpdatePlan(set_fields = set_fields, remove_fields = [], conditions = conditions)
+
+    def mergeUserQualifications(self, user_id: str, data: dict):
+        """
+        Updates a user's qualifications entry by reading it, merging the update
+        into it, and writing the changed fields back. Only used for entries the
+        server side update can't be applied to: entries still in the legacy
+        table, and entries storing their completable items as lists (which are
+        converted into maps).
+
+        :params user_id: The name of the user.
+        :params data: The (validated) update body.
+        """
+
+        for attempt in range(PATCH_ATTEMPTS):
+            # Ensure an entry to update actually exists
+            response = self.qualifications_table.get_item(Key={ 'user_id': user_id }, ConsistentRead=True)
+            migrated: bool = 'Item' in response
+            if migrated:
+                qualifications = response['Item']
+            else:
+                qualifications = self.getLegacyQualifications(user_id)
+
+            if qualifications is None:
+                errorMsg: str = f"User {user_id} could not be found. Did you mean to add the user?"
+                body = { 'errorMsg': errorMsg }
+                return buildResponse(statusCode = 400, body = body)
+
+            changes: dict = { key: value for key, value in data.items() if key not in self.completable_item_lists }
+            changes[GSI_ATTRIBUTE_NAME] = self.timestamp_index.shardKey({ 'user_id': user_id })
+
+            # Merge the completable items by name
+            for key in self.completable_item_lists:
+                stored = qualifications.get(key, {})
+                merged: dict = dict(stored) if isinstance(stored, dict) else completableItemsToMap(stored)
+                merged.update(completableItemsToMap(data.get(key, [])))
+
+                if merged != stored:
+                    changes[key] = merged
+
+            if migrated:
+                # Update only the changed fields, as long as no other request
+                # changed them since they were read
+                conditions: list = [
+                    Attr(key).eq(qualifications[key]) if key in qualifications else Attr(key).not_exists()
+                    for key in changes
+                ]
+                plan = UpdatePlan(set_fields = changes, remove_fields = [], conditions = conditions)
+                updated: bool = updateItemIfExists(self.qualifications_table, { 'user_id': user_id }, plan)
+            else:
+                # Move the user into the new table, unless the migration (or
+                # another request) already did
+                qualifications.update(changes)
+                updated: bool = putItemIfNotExists(self.qualifications_table, qualifications)
+
+            if updated:
+                # Successfully updated user
+                return buildResponse(statusCode = 204, body = {})
+
+        errorMsg: str = f"User {user_id}'s qualifications are being updated by another request. Try again later."
+        body = { 'errorMsg': errorMsg }
+        return buildResponse(statusCode = 400, body = body)
+
+    def toResponseBody(self, qualifications: dict) -> dict:
+        """
+        Converts a stored qualifications entry into the one the api returns, with
+        each (stored) map of completable items as a list.
+
+        :params qualifications: The stored qualifications entry.
+        """
+        for key in self.completable_item_lists:
+            if key in qualifications:
+                qualifications[key] = completableItemsFromMap(qualifications[key])
+
+        return qualifications
+
+    def getQualifications(self, user_id: str, fields: list[str] = None) -> dict:
+        """
+        Reads a user's qualifications entry with a single GetItem request. Users
+        not found are read from the legacy table (if there is one) instead.
+
+        :params user_id: The name of the user.
+        :params fields: Optional list of the fields to return.
+        :returns: The user's qualifications, or None if they don't have any.
+        """
+        response = self.qualifications_table.get_item(
+                Key={ 'user_id': user_id },
+                **buildProjection(fields)
+        )
+
+        if 'Item' in response:
+            return response['Item']
+
+        return self.getLegacyQualifications(user_id, fields = fields)
+
+    def getLegacyQualifications(self, user_id: str, fields: list[str] = None) -> dict:
+        """
+        Reads a user's latest qualifications entry from the legacy table, which
+        is keyed by (user_id, last_updated).
+
+        :params user_id: The name of the user.
+        :params fields: Optional list of the fields to return.
+        :returns: The user's qualifications, or None if they don't have any
+                  (or there is no legacy table).
+        """
+        if self.legacy_qualifications_table is None:
+            return None
+
+        response = self.legacy_qualifications_table.query(
+                KeyConditionExpression=Key('user_id').eq(user_id),
+                ScanIndexForward=False, # Latest entry first
+                Limit=1,
+                **buildProjection(fields)
+        )
+
+        if len(response['Items']) == 0:
+            return None
+
+        return response['Items'][0]
     
     def validateQualificationRequestBody(self, data: dict):
         """
@@ -351,24 +558,45 @@ class QualificationsHandler():
 
         # Ensure last_updated is in the correct format
         if not validTimestamp(data['last_updated']):
-            errorMsg: str = f"Timestamp 'last_updated 'not in the approved format. Approved format is 'YYYY-MM-DDThh:mm:ss'."
+            errorMsg: str = "Timestamp 'last_updated' not in the approved format. Approved format is 'YYYY-MM-DDThh:mm:ss'."
             raise InvalidRequestBody(errorMsg)
 
         for completable_list in self.completable_item_lists:
-            for item in data[completable_list]:
-                if not allKeysPresent(self.completable_item_fields, item):
-                    errorMsg: str = f"Missing at least one field from {self.completable_item_fields} for at least one completeable item in {completable_list}."
-                    raise InvalidRequestBody(errorMsg)
-
-                name = str(item['name'])
-                status = str(item['completion_status'])
-                if status not in self.valid_completion_statuses:
-                    errorMsg: str = f"Completion status '{status}' is not one of the valid completion statuses {self.valid_completion_statuses} for object with name {name} in {completable_list}."
-                    raise InvalidRequestBody(errorMsg)
+            self.validateCompletableItems(completable_list, data[completable_list])
 
         return data
+
+    def validateCompletableItems(self, completable_list: str, items: list):
+        """
+        Validates a list of completable items from a request body.
+
+        :params completable_list: The name of the list (e.g., 'trainings').
+        :params items: The list of completable items to validate.
+        :raises: InvalidRequestBody
+        """
+
+        # Check that it is actually a list. Use an empty list for type comparison
+        if type(items) != type([]):
+            errorMsg: str = f"The provided value for key {completable_list} is not a list."
+            raise InvalidRequestBody(errorMsg)
+
+        for item in items:
+            if type(item) != type({}) or not allKeysPresent(self.completable_item_fields, item):
+                errorMsg: str = f"Missing at least one field from {self.completable_item_fields} for at least one completeable item in {completable_list}."
+                raise InvalidRequestBody(errorMsg)
+
+            name = str(item['name'])
+            status = str(item['completion_status'])
+            if status not in self.valid_completion_statuses:
+                errorMsg: str = f"Completion status '{status}' is not one of the valid completion statuses {self.valid_completion_statuses} for object with name {name} in {completable_list}."
+                raise InvalidRequestBody(errorMsg)
             
 
+# Handler reused between warm invocations of the same container
+qualification_handler = None
+
 def handler(request, context):
-    qualification_handler = QualificationsHandler(None)
+    global qualification_handler
+    if qualification_handler is None:
+        qualification_handler = QualificationsHandler(None)
     return qualification_handler.handle_event(request, context)
@@ -0,0 +1,6 @@
+""" 
+    Required to be treated as a sub-package of the api_gateway/ folder directory.
+    
+    Why does this need to be a sub-package?
+        - Importing gets a little weird.
+"""
\ No newline at end of file
@@ -0,0 +1,228 @@
+import json
+from botocore.exceptions import ClientError
+import logging
+import os
+import re
+import sys
+
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.append(os.path.dirname(SCRIPT_DIR))
+
+from api_defaults import *
+
+# This address must be verified with Amazon SES.
+SENDER: str = "no-reply@visit.cumaker.space"
+REPLY_TO: str = "makerspace@clemson.edu"
+# Domain added to user_ids that aren't email addresses
+USER_EMAIL_DOMAIN: str = "clemson.edu"
+EMAIL_PATTERN = re.compile(r"[^@]+@[^@]+\.[^@]+")
+# Name of the SES template registration emails are sent with (see
+# BackendApi.registration_email_handler_lambda). The template fills in
+# {{user}} with the address it is sent to.
+DEFAULT_REGISTRATION_TEMPLATE_NAME: str = "MakerspaceRegistration"
+# Days after a reminder before the same user can be reminded again
+DEFAULT_REMINDER_WINDOW_DAYS: float = 7
+# Largest number of destinations SES accepts in one SendBulkTemplatedEmail request
+BULK_EMAIL_LIMIT: int = 50
+# Bulk email statuses worth retrying the message of; every other status
+# (e.g., an invalid address) would fail again
+RETRYABLE_EMAIL_STATUSES: list[str] = ["TransientFailure", "AccountThrottled", "Failed"]
+
+class RegistrationEmailHandler():
+    """
+    This class wraps the functionality of the lambda draining the registration
+    queue, so we can more easily test it with moto. Check-ins queue every user
+    who checked in (see VisitsHandler.queueRegistrationChecks). The queue hands
+    this lambda batches of those messages; each batch is deduped, looked up in
+    the users table at once, and the users that aren't registered are emailed
+    the registration link with bulk templated emails.
+
+    Users reminded within the reminder window are skipped (before the users
+    table is read), so a user who checks in every day is emailed once per
+    window instead of once per visit.
+    """
+
+    def __init__(self, users_table, reminders_table, ses_client):
+        # Sets up CloudWatch logs and sets level to INFO
+        self.logger = logging.getLogger()
+        self.logger.setLevel(logging.INFO)
+
+        if users_table is None:
+            # Get the (container wide) table object
+            self.users_table = getTable("USERS_TABLE_NAME")
+        else:
+            self.users_table = users_table
+
+        if reminders_table is None:
+            # Get the (container wide) table object
+            reminders_table = getTable("REMINDERS_TABLE_NAME")
+
+        # The last reminder sent to each user. Kept by the (container wide)
+        # handler, so reminded users stay cached between invocations.
+        window_days: float = float(os.environ.get("REGISTRATION_REMINDER_WINDOW_DAYS",
+                                                  DEFAULT_REMINDER_WINDOW_DAYS))
+        self.reminders: SuppressionStore = SuppressionStore(reminders_table, timedelta(days = window_days))
+
+        self.template_name: str = os.environ.get("REGISTRATION_TEMPLATE_NAME",
+                                                 DEFAULT_REGISTRATION_TEMPLATE_NAME)
+
+        # Not created until the first email is sent
+        self._client = ses_client
+
+    @property
+    def client(self):
+        """
+        The Simple Email Service client. Created on first use.
+        """
+        if self._client is None:
+            self._client = getClient('ses', region_name=os.environ['AWS_REGION'])
+
+        return self._client
+
+    # Main handler function
+    def handle_event(self, event, context):
+        """
+        Emails the unregistered users in a batch of queue messages.
+
+        :params event: The SQS event: { 'Records': [{ 'messageId', 'body' }] }
+        :returns: The messages to retry: { 'batchItemFailures': [{ 'itemIdentifier' }] }
+        """
+        records: list[dict] = event.get('Records', [])
+
+        # The ids of the messages naming each user, in the order they came in
+        user_messages: dict = {}
+        for record in records:
+            try:
+                user_id = json.loads(record['body'])['user_id']
+                if not isinstance(user_id, str) or not user_id:
+                    raise ValueError("user_id must be a non empty string")
+            except (KeyError, TypeError, ValueError) as e:
+                # Retrying a malformed message would only fail again
+                self.logger.error(f"Dropping malformed message {record.get('messageId')}: {e}")
+                continue
+
+            user_messages.setdefault(user_id, []).append(record['messageId'])
+
+        try:
+            # Users reminded recently aren't looked up (or emailed) again
+            suppressed: set = self.reminders.suppressedKeys(list(user_messages))
+            user_ids: list[str] = [user_id for user_id in user_messages if user_id not in suppressed]
+
+            unregistered: list[str] = self.findUnregisteredUsers(user_ids)
+        except Exception as e:
+            self.logger.error(f"Could not check the registration of {len(user_messages)} users: {e}")
+            return self.buildFailures(user_messages, list(user_messages))
+
+        self.logger.info(f"{len(records)} messages for {len(user_messages)} users; "
+                         f"{len(suppressed)} reminded recently.")
+
+        failed_users: list[str] = []
+        for start in range(0, len(unregistered), BULK_EMAIL_LIMIT):
+            failed_users.extend(self.sendRegistrationEmails(unregistered[start:start + BULK_EMAIL_LIMIT]))
+
+        self.logger.info(f"Emailed {len(unregistered) - len(failed_users)} unregistered users; "
+                         f"{len(failed_users)} to retry.")
+
+        # Start the reminder window of everyone who won't be retried. The
+        # emails are already sent, so failing here doesn't fail the messages.
+        retried: set = set(failed_users)
+        reminded: list[str] = [user_id for user_id in unregistered if user_id not in retried]
+        try:
+            self.reminders.record(reminded)
+        except Exception as e:
+            self.logger.error(f"Could not record the reminders of {len(reminded)} users: {e}")
+
+        return self.buildFailures(user_messages, failed_users)
+
+    def findUnregisteredUsers(self, user_ids: list[str]) -> list[str]:
+        """
+        Looks up every user at once and returns the ones that aren't registered.
+
+        :params user_ids: The distinct users to look up.
+        """
+        registered = hydrateKeys(self.users_table, [{ 'user_id': user_id } for user_id in user_ids],
+                                 ['user_id'], fields = ['user_id'])
+        registered_ids: set = { user['user_id'] for user in registered.items }
+
+        return [user_id for user_id in user_ids if user_id not in registered_ids]
+
+    def sendRegistrationEmails(self, user_ids: list[str]) -> list[str]:
+        """
+        Sends the registration link to up to BULK_EMAIL_LIMIT users in one
+        SendBulkTemplatedEmail request.
+
+        :params user_ids: The users to email.
+        :returns: The users whose email should be retried.
+        """
+        addresses: list[str] = [getUserEmail(user_id) for user_id in user_ids]
+
+        try:
+            response = self.client.send_bulk_templated_email(
+                Source=SENDER,
+                ReplyToAddresses=[REPLY_TO],
+                Template=self.template_name,
+                DefaultTemplateData=json.dumps({ 'user': "" }),
+                Destinations=[
+                    {
+                        'Destination': { 'ToAddresses': [address] },
+                        'ReplacementTemplateData': json.dumps({ 'user': address }),
+                    }
+                    for address in addresses
+                ],
+            )
+        except ClientError as e:
+            self.logger.error(e.response['Error']['Message'])
+            return list(user_ids)
+
+        failed_users: list[str] = []
+        # One status per destination, in the order they were sent
+        for user_id, status in zip(user_ids, response.get('Status', [])):
+            result: str = status.get('Status', "Success")
+            if result == "Success":
+                continue
+
+            self.logger.error(f"Registration email to {user_id} failed: {result} {status.get('Error', '')}")
+            if result in RETRYABLE_EMAIL_STATUSES:
+                failed_users.append(user_id)
+
+        return failed_users
+
+    def buildFailures(self, user_messages: dict, failed_users: list[str]) -> dict:
+        """
+        Builds the partial batch response that puts the messages of the failed
+        users back on the queue.
+
+        :params user_messages: The ids of the messages naming each user.
+        :params failed_users: The users whose messages should be retried.
+        """
+        return {
+            'batchItemFailures': [
+                { 'itemIdentifier': message_id }
+                for user_id in failed_users
+                for message_id in user_messages[user_id]
+            ]
+        }
+
+def getUserEmail(user_id: str) -> str:
+    """
+    Returns the email address of a user; user_ids that aren't email
+    addresses are Clemson usernames.
+
+    :params user_id: The user to email.
+    """
+    if EMAIL_PATTERN.match(user_id):
+        return user_id
+
+    return f"{user_id}@{USER_EMAIL_DOMAIN}"
+
+
+# Handler reused between warm invocations of the same container
+registration_email_handler = None
+
+def handler(event, context):
+    # This will be hit in prod, and will connect to the stood-up dynamodb
+    # and Simple Email Service clients.
+    global registration_email_handler
+    if registration_email_handler is None:
+        registration_email_handler = RegistrationEmailHandler(None, None, None)
+    return registration_email_handler.handle_event(event, context)
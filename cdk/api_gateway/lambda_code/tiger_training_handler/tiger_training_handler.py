@@ -336,19 +336,20 @@ class TigerTrainingHandler():
                 learners[latest_learner.user_id].update_timestamp(latest_learner.last_updated)
 
 
-            # Send patch request to the backend api to update each user's qualifications
-            for user_id in learners:
-                learner = learners[user_id]
-                status, response = self.patch_learner_aws(
-                        learner
-                )
+            # Update (or add) every learner's qualifications
+            failed: list[str] = self.sync_learners(list(learners.values()))
+
+            # The qualifications lambda is invoked directly (not through the
+            # api), so it can't flush the api cache for these updates itself.
+            # Flushed even if some learners failed, since the rest are stored.
+            flushApiCache(event)
 
-                """
-                Patch returning 400 means the user hasn't been created for qualifications
-                yet. Post the enrollments instead to add the user to the qualifications.
-                """
-                if status == 400:
-                    self.post_learner_aws(learner)
+            # Report the learners that couldn't be stored to the caller
+            if failed:
+                logger.error(f"Could not update the qualifications of {len(failed)} learners: {failed}")
+                errorMsg: str = f"Could not update the qualifications of {len(failed)} learners."
+                body = { 'errorMsg': errorMsg, 'failed': failed }
+                return buildResponse(statusCode = 500, body = body)
 
             response = buildResponse(statusCode = 200, body = {})
 
@@ -359,6 +360,73 @@ class TigerTrainingHandler():
 
         return response
 
+    def sync_learners(self, learners: list[Learner]) -> list[str]:
+        """
+        Updates every learner's qualifications with one batch patch request,
+        and posts the learners that don't have qualifications yet. If the
+        batch request fails as a whole, each learner is patched (or posted)
+        on their own instead, as are the learners the batch reported failed.
+
+        :params learners: The learners to update.
+        :returns: The user_ids of the learners that couldn't be updated or added.
+        """
+
+        try:
+            status, response = self.patch_learners_aws(learners)
+        except Exception as e:
+            logger.error(f"Batch qualifications patch failed: {e}")
+            status, response = 500, {}
+
+        if status != 200:
+            logger.error(f"Batch qualifications patch returned {status}: {response.get('errorMsg', '')}")
+            return [learner.user_id for learner in learners if not self.sync_learner(learner)]
+
+        by_user_id: dict[str, Learner] = { learner.user_id: learner for learner in learners }
+        failed: list[str] = []
+
+        # Users that haven't been created for qualifications yet are returned
+        # as not_updated. Post their enrollments instead to add them.
+        for user_id in response.get('not_updated', []):
+            status, _ = self.post_learner_aws(by_user_id[user_id])
+            if status != 201:
+                failed.append(user_id)
+
+        # Patch the learners the batch couldn't update one at a time
+        for failure in response.get('failed', []):
+            logger.error(f"Batch qualifications patch failed for {failure.get('user_id')}: "
+                         f"{failure.get('errorMsg')}")
+            learner = by_user_id.get(failure.get('user_id'))
+            if learner is not None and not self.sync_learner(learner):
+                failed.append(learner.user_id)
+
+        return failed
+
+    def sync_learner(self, learner: Learner) -> bool:
+        """
+        Patches a single learner's qualifications, and posts them instead if
+        the learner doesn't have qualifications yet.
+
+        :params learner: The learner to update.
+        :returns: True if the learner was updated or added, False otherwise.
+        """
+
+        try:
+            status, response = self.patch_learner_aws(learner)
+            if status == 204:
+                return True
+
+            # Patch returning 400 means the user may not have been created
+            # for qualifications yet. Post the enrollments instead.
+            status, response = self.post_learner_aws(learner)
+            if status == 201:
+                return True
+
+            logger.error(f"Could not update or add learner {learner.user_id}: {response.get('errorMsg', '')}")
+        except Exception as e:
+            logger.error(f"Could not update or add learner {learner.user_id}: {e}")
+
+        return False
+
     def send_event_to_lambda(self, target_lambda: str, event: dict) -> dict:
         """
         Sends an event to a lambda function.
@@ -476,6 +544,43 @@ class TigerTrainingHandler():
         return request_body
 
 
+    def patch_learners_aws(self, learners: list[Learner]) -> tuple[int, dict]:
+        """
+        Sends a single patch request event to the qualifications handler to
+        update many learners' completed courses.
+
+        :params learners: The learners to update.
+        :returns: (statusCode, response_body). On success, response_body lists
+                  the user_ids of learners that weren't found as 'not_updated',
+                  and the learners that couldn't be updated as 'failed'.
+        """
+
+        # Create a qualifications patch body for each learner, keyed by user_id
+        qualifications: list[dict] = []
+        for learner in learners:
+            patch_body: dict = self.create_qualifications_patch_body(learner)
+            patch_body["user_id"] = learner.user_id
+            qualifications.append(patch_body)
+
+        # Create an event for the qualifications handler
+        event: dict = create_rest_http_event(
+            "PATCH",
+            resource="/qualifications",
+            body={ "qualifications": qualifications }
+        )
+
+        # Send event to qualifications handler
+        response = self.send_event_to_lambda(self.qualifications_lambda, event)
+
+        # Extract the response body
+        data: dict = json.loads(response['body'])
+
+        # Get response body, if one exists
+        response_body = data
+
+        return (response['statusCode'], response_body)
+
+
     def patch_learner_aws(self, learner: Learner) -> tuple[int, dict]:
         """
         Sends a patch request event to the qualifications handler to update
@@ -491,8 +596,9 @@ class TigerTrainingHandler():
         # Create an event for the qualifications handler
         event: dict = create_rest_http_event(
             "PATCH",
-            resource="/qualifications",
-            body=request_body
+            resource="/qualifications/{user_id}",
+            body=request_body,
+            pathParameters={ "user_id": learner.user_id }
         )
 
         # Send event to qualifications handler
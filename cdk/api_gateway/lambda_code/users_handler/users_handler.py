@@ -1,5 +1,4 @@
 import json
-import boto3
 from boto3.dynamodb.conditions import Key
 import os
 import logging
@@ -10,6 +9,26 @@ sys.path.append(os.path.dirname(SCRIPT_DIR))
 
 from api_defaults import *
 
+# What a valid user request body looks like. Compiled once at import.
+USER_REQUEST_VALIDATOR: RequestValidator = compileRequestSchema(RequestSchema(
+    required = ["user_id", "university_status"],
+    variants = [
+        # Fields required and disallowed for each 'university_status'
+        VariantField(name = "university_status", checks = {
+            'Undergraduate': FieldCheck(required = ["undergraduate_class", "major"],
+                                        disallowed = []),
+            'Graduate': FieldCheck(required = ["major"],
+                                   disallowed = ["undergraduate_class"]),
+            'Faculty': FieldCheck(required = [],
+                                  disallowed = ["undergraduate_class", "major"]),
+        }),
+    ],
+    enums = {
+        # Checked only if it's still in the body
+        "undergraduate_class": ["Freshman", "Sophomore", "Junior", "Senior"],
+    },
+))
+
 class UsersHandler():
     """
     This class wraps the functionality of the lambda so we can more easily test
@@ -26,9 +45,8 @@ class UsersHandler():
         # self.logger.setLevel(logging.INFO)
         
         if users_table is None:
-            dynamodbresource = boto3.resource('dynamodb', region_name="us-east-1")
             self.USERS_TABLE_NAME = os.environ["USERS_TABLE_NAME"]
-            self.users_table = dynamodbresource.Table(self.USERS_TABLE_NAME)
+            self.users_table = getTable("USERS_TABLE_NAME", region_name="us-east-1")
         else:
             self.users_table = users_table
             
@@ -56,7 +74,7 @@ class UsersHandler():
                     errorMsg: str = "REST method {http_method} requires a request body."
                     body = { 'errorMsg': errorMsg }
                     return buildResponse(statusCode = 400, body = body)
-                data = json.loads(event['body'])
+                data = json.loads(getRequestBody(event))
 
             # Try to get any query parameters
             try:
@@ -76,13 +94,15 @@ class UsersHandler():
                 response = self.get_all_user_information(query_parameters)
             elif http_method == "POST" and resource_path == users_path:
                 response = self.create_user_information(data)
+                flushApiCache(event, response)
 
             elif http_method == "GET" and resource_path == users_param_path:
-                response = self.get_user_information(user_id)
+                response = self.get_user_information(user_id, query_parameters)
             elif http_method == "PATCH" and resource_path == users_param_path:
                 response = self.patch_user_information(user_id, data)
+                flushApiCache(event, response)
 
-            return response
+            return compressResponse(applyETag(response, event), event)
         except Exception as e:
             #errorMsg: str = f"We're sorry, but something happened. Try again later."
             errorMsg = str(e)
@@ -95,22 +115,40 @@ class UsersHandler():
     def get_all_user_information(self, query_parameters: dict = {}):
         """
         Returns all user information entries from the user information table.
+        Results are paginated; pass the returned 'next_token' back as a query
+        parameter to get the next page.
 
         :params query_parameters: A dictionary of parameter names and values to filter by.
         """
 
-        # Try to get the number of items to return
-        if "limit" in query_parameters:
-            limit = query_parameters["limit"]
+        # Get the fields to return for each item
+        try:
+            fields = parseFieldsParameter(query_parameters)
 
-        # Otherwise return as many as possible
-        else:
-            limit = QUERY_LIMIT_RETURN_ALL
+        except InvalidQueryParameters as iqp:
+            body = { 'errorMsg': str(iqp) }
+            return buildResponse(statusCode = 400, body = body)
+
+        # Get the number of items to return and where to resume from
+        limit = getPageLimit(query_parameters)
+        next_token = query_parameters.get("next_token")
 
-        users = scanTable(self.users_table, limit = limit)
+        try:
+            users, next_token = scanTablePage(self.users_table, limit = limit,
+                                              next_token = next_token,
+                                              segments = SCAN_SEGMENTS_AUTO,
+                                              fields = fields)
+
+        except InvalidQueryParameters as iqp:
+            body = { 'errorMsg': str(iqp) }
+            return buildResponse(statusCode = 400, body = body)
 
         body = { 'users': users }
 
+        # Only include a token if there are more users to get
+        if next_token:
+            body['next_token'] = next_token
+
         return buildResponse(statusCode = 200, body = body)
 
     def create_user_information(self, data: dict):
@@ -126,35 +164,43 @@ class UsersHandler():
             body = { 'errorMsg': str(irb) }
             return buildResponse(statusCode = 400, body = body)
 
-        # Check to make sure the user doesn't already exist. Return 400 if user does exist.
+        # Actually try putting the item into the table. Fails (without
+        # overwriting anything) if the user already exists.
         user_id: str = data['user_id']
-        response = self.get_user_information(user_id)
-        if response['statusCode'] == 200:
-            errorMsg: str = f"User {user_id} information already exists. Did you mean to update?"
-            body = { 'errorMsg': errorMsg }
-            return buildResponse(statusCode = 400, body = body)
-
-        # Actually try putting the item into the table
         try:
-            self.users_table.put_item(
-                Item=data
-            )
+            created: bool = putItemIfNotExists(self.users_table, data)
         except Exception as e:
             body = { 'errorMsg': "Something went wrong on the server." }
             return buildResponse(statusCode = 500, body = body)
 
+        # Return 400 if user does exist
+        if not created:
+            errorMsg: str = f"User {user_id} information already exists. Did you mean to update?"
+            body = { 'errorMsg': errorMsg }
+            return buildResponse(statusCode = 400, body = body)
+
         # If here, put action succeeded. Return 201
         return buildResponse(statusCode = 201, body = {})
 
-    def get_user_information(self, user_id: str):
+    def get_user_information(self, user_id: str, query_parameters: dict = {}):
         """
         Gets all of the information for the specified user.
 
         :params user_id: The name of the user.
+        :params query_parameters: A dictionary of parameter names and values to filter by.
         """
 
+        # Get the fields to return
+        try:
+            fields = parseFieldsParameter(query_parameters)
+
+        except InvalidQueryParameters as iqp:
+            body = { 'errorMsg': str(iqp) }
+            return buildResponse(statusCode = 400, body = body)
+
         response = self.users_table.get_item(
-                Key={ 'user_id': user_id }
+                Key={ 'user_id': user_id },
+                **buildProjection(fields)
         )
 
         # user_id doesn't exist if 'Item' not in response
@@ -175,36 +221,30 @@ class UsersHandler():
         :params data: The updated user information.
         """
 
-        # Ensure an entry to update actually exists
-        response = self.get_user_information(user_id)
-        if response['statusCode'] != 200:
-            errorMsg: str = f"User {user_id} could not be found. Did you mean to add the user?"
-            body = { 'errorMsg': errorMsg }
-            return buildResponse(statusCode = 400, body = body)
-
-        else:
-            # Load the json object stored in response['body']
-            user = json.loads(response['body'])
-
         # "user_id" field is never allowed for update
         if 'user_id' in data:
             errorMsg: str = "Updating the 'user_id' field is not allowed. Please remove it before trying to update user {user_id}'s information."
             body = { 'errorMsg': errorMsg }
             return buildResponse(statusCode = 400, body = body)
 
-        # Copy all all fields from data to user
-        for key in data:
-            user[key] = data[key]
-        
-        # Validate new item
+        # Validate only the changed fields. Rules depending on the stored
+        # user (e.g., its 'university_status') become conditions of the update.
         try:
-            user = self.validateUserRequestBody(user)
+            plan: UpdatePlan = USER_REQUEST_VALIDATOR.validatePatch(data)
         except InvalidRequestBody as irb:
             body = { 'errorMsg': str(irb) }
             return buildResponse(statusCode = 400, body = body)
 
-        # Try putting item back into table
-        self.users_table.put_item(Item=user)
+        # Update only the changed fields, if the user exists
+        if not updateItemIfExists(self.users_table, { 'user_id': user_id }, plan):
+            # Find out which condition failed
+            response = self.users_table.get_item(Key={ 'user_id': user_id })
+            if 'Item' not in response:
+                errorMsg: str = f"User {user_id} could not be found. Did you mean to add the user?"
+            else:
+                errorMsg: str = f"The update doesn't fit user {user_id}'s stored information. Check the fields their university_status requires and allows."
+            body = { 'errorMsg': errorMsg }
+            return buildResponse(statusCode = 400, body = body)
 
         # Successfully updated user
         return buildResponse(statusCode = 204, body = {})
@@ -220,62 +260,16 @@ class UsersHandler():
         :returns: A valid user request body.
         :raises: InvalidRequestBody
         """
+        return USER_REQUEST_VALIDATOR.validate(data)
 
-        required_fields: list[str] = ["user_id", "university_status"]
-
-        # Define required and disallowed fields for checking
-        undergrad_fields = FieldCheck(required = ["undergraduate_class", "major"],
-                                    disallowed = []
-        )
-
-        grad_fields = FieldCheck(required = ["major"],
-                                disallowed = ["undergraduate_class"]
-        )
-
-        faculty_fields = FieldCheck(required = [],
-                                    disallowed = ["undergraduate_class", "major"]
-        )
-
-        fields_lookup: dict = {
-            'Undergraduate': undergrad_fields,
-            'Graduate': grad_fields,
-            'Faculty': faculty_fields,
-        }
-
-        valid_undergraduate_classes: list[str] = ["Freshman", "Sophomore", "Junior", "Senior"]
-
-        # Ensure all required fields are present
-        if not allKeysPresent(required_fields, data):
-            errorMsg: str = f"Missing at least one field from {required_fields} in request body."
-            raise InvalidRequestBody(errorMsg)
-
-        # Error if university_status is not one of the defined ones
-        university_status: str = data['university_status']
-        if university_status not in fields_lookup:
-            valid_statuses: list[str] = [key for key in fields_lookup]
-            errorMsg: str = f"The provided university_status ('{university_status}') is not one of the valid statuses ({valid_statuses})."
-            raise InvalidRequestBody(errorMsg)
-
-        # Check for and clean fields related to 'university_status'
-        checking_fields = fields_lookup[university_status]
-        try:
-            data = checkAndCleanRequestFields(data, checking_fields)
-        except InvalidRequestBody:
-            # Re-raise InvalidRequestBody if the exception occurs
-            errorMsg: str = f"Missing at least one field from {checking_fields.required} due to a 'university_status' value of '{university_status}' in request body."
-            raise InvalidRequestBody(errorMsg)
-        
-        # Check that the undergraduate class is valid if it's still in data
-        if 'undergraduate_class' in data:
-            if data['undergraduate_class'] not in valid_undergraduate_classes:
-                errorMsg: str = f"Specified undergraduate_class ('{data['undergraduate_class']}') is not one of the valid classes {valid_undergraduate_classes} in request body."
-                raise InvalidRequestBody(errorMsg)
-        return data
-
+# Handler reused between warm invocations of the same container
+user_handler = None
 
 def handler(request, context):
     # Register user information from the makerspace/register console
     # Since this will be hit in prod, it will go ahead and hit our prod
     # dynamodb table
-    user_handler = UsersHandler(users_table = None)
+    global user_handler
+    if user_handler is None:
+        user_handler = UsersHandler(users_table = None)
     return user_handler.handle_event(request, context)
@@ -1,12 +1,7 @@
 import json
-from pydoc import cli
-import boto3
 from boto3.dynamodb.conditions import Key
-from botocore.exceptions import ClientError
 import logging
 import os
-import re
-from datetime import datetime
 import sys
 
 SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
@@ -14,43 +9,94 @@ sys.path.append(os.path.dirname(SCRIPT_DIR))
 
 from api_defaults import *
 
+# What a valid visit request body looks like. Compiled once at import.
+VISIT_REQUEST_VALIDATOR: RequestValidator = compileRequestSchema(RequestSchema(
+    required = ["user_id", "timestamp", "location"],
+    enums = {
+        "location": VALID_LOCATIONS,
+    },
+    formats = {
+        "user_id": (lambda user_id: isinstance(user_id, str) and user_id != "", "User id must be a non-empty string."),
+        "timestamp": (validTimestamp, "Timestamp not in the approved format. Approved format is 'YYYY-MM-DDThh:mm:ss'."),
+    },
+))
+
+# Most visits a single batch check-in request may hold
+MAX_BATCH_VISITS: int = 100
+
 class VisitsHandler():
     """
     This function will be used to wrap the functionality of the lambda
     so we can more easily test with pytest.
     """
 
-    def __init__(self, visits_table, users_table, ses_client):
+    def __init__(self, visits_table, visit_rollups_table, registration_queue):
         # TODO: Setup CloudWatch Logs
         # Sets up CloudWatch logs and sets level to INFO
         self.logger = logging.getLogger()
         self.logger.setLevel(logging.INFO)
 
         if visits_table is None:
-            # Get the service resource.
-            dynamodb = boto3.resource('dynamodb')
-            # Get the table name.
-            VISITS_TABLE_NAME = os.environ["VISITS_TABLE_NAME"]
-            # Get table objects
-            self.visits_table = dynamodb.Table(VISITS_TABLE_NAME)
+            # Get the (container wide) table object
+            self.visits_table = getTable("VISITS_TABLE_NAME")
         else:
             self.visits_table = visits_table
 
-        if users_table is None:
-            # Get the service resource.
-            dynamodb = boto3.resource('dynamodb')
-            # Get the table name.
-            USERS_TABLE_NAME = os.environ["USERS_TABLE_NAME"]
-            # Get table objects
-            self.users_table = dynamodb.Table(USERS_TABLE_NAME)
+        if visit_rollups_table is None:
+            # Get the (container wide) table object
+            self.visit_rollups_table = getTable("VISIT_ROLLUPS_TABLE_NAME")
         else:
-            self.users_table = users_table
+            self.visit_rollups_table = visit_rollups_table
+
+        # The (sharded) index visits are listed by timestamp through, and the
+        # index of day (or month) buckets bounded time ranges are read from
+        self.timestamp_index: ShardedIndex = timestampIndex('timestamp', ['user_id', 'timestamp'],
+                                                            bucketed = True)
+
+        # The queue users who checked in are sent to, so the registration
+        # email handler can email the ones that aren't registered. Not
+        # created until the first time it is used.
+        self._registration_queue = registration_queue
+
+    @property
+    def registration_queue(self):
+        """
+        The queue of (possibly) unregistered users. Created on first use.
+        """
+        if self._registration_queue is None:
+            self._registration_queue = getQueue(REGISTRATION_QUEUE_URL_ENV)
+
+        return self._registration_queue
+
+    def addVisitRollups(self, visits: list[dict]):
+        """
+        Counts new visits in the visit rollups (per location, per day and per
+        hour; see get_visit_stats). Failing to count them doesn't fail the
+        check-in, since the visits are already stored; the day can be
+        recounted with utilsFolder/rebuild_visit_rollups.py.
+
+        :params visits: The visits just added.
+        """
+        try:
+            addToRollups(self.visit_rollups_table, VISIT_ROLLUP_KEY, visitRollupIncrements(visits))
+        except Exception as e:
+            self.logger.error(f"Could not count {len(visits)} visits in the visit rollups: {e}")
+
+    def queueRegistrationChecks(self, user_ids: list[str]):
+        """
+        Sends the users who checked in to the registration queue. Whether
+        they are registered is checked (and the unregistered ones emailed)
+        later by the registration email handler, so a check-in never waits
+        on the users table or SES. Failing to queue them doesn't fail the
+        check-in, since the visits are already stored.
+
+        :params user_ids: The distinct users who checked in.
+        """
+        try:
+            self.registration_queue.send([{ 'user_id': user_id } for user_id in user_ids])
+        except Exception as e:
+            self.logger.error(f"Could not queue the registration check of {len(user_ids)} users: {e}")
 
-        if ses_client is None:
-            self.client = boto3.client('ses', region_name=os.environ['AWS_REGION'])
-        else:
-            self.client = ses_client
-            
     # Main handler function
     def handle_event(self, event, context):
         self.logger.info(f"EVENT: {event}")
@@ -76,7 +122,7 @@ class VisitsHandler():
                     errorMsg: str = "REST method {http_method} requires a request body."
                     body = { 'errorMsg': errorMsg }
                     return buildResponse(statusCode = 400, body = body)
-                data = json.loads(event['body'])
+                data = json.loads(getRequestBody(event))
 
             # Try to get any query parameters
             try:
@@ -99,90 +145,45 @@ class VisitsHandler():
                 response = self.get_all_visit_information(query_parameters)
             elif http_method == "POST" and resource_path == visits_path:
                 response = self.create_user_visit_information(data)
+            elif http_method == "POST" and resource_path == visits_batch_path:
+                response = self.create_visits_batch(data)
+            elif http_method == "GET" and resource_path == visits_stats_path:
+                response = self.get_visit_stats(query_parameters)
             elif http_method == "GET" and resource_path == visits_param_path:
                 response = self.get_user_visit_information(user_id, query_parameters)
                 
-            return response
+            return compressResponse(applyETag(response, event), event)
         except Exception as e:
             self.logger.info(f"Exception: {e}")
             errorMsg: str = f"We're sorry, but something happened. Try again later."
             body = { 'errorMsg': errorMsg }
             return buildResponse(statusCode = 500, body = body)
 
-    def isUserRegistered(self, current_user):
-        """
-        true if the user has registered
-        """
-        user_table_response = self.users_table.query(
-            KeyConditionExpression=Key('user_id').eq(current_user)
-        )
-        return user_table_response['Count'] != 0
-
-    # This code was written following the example from:
-    # https://docs.aws.amazon.com/ses/latest/DeveloperGuide/send-using-sdk-python.html
-    def registrationWorkflow(self, current_user):
-        # This address must be verified with Amazon SES.
-        SENDER = "no-reply@visit.cumaker.space"
-
-        email_regex = re.compile(r"[^@]+@[^@]+\.[^@]+")
-        if not email_regex.match(current_user):
-            current_user = current_user + "@clemson.edu"
-
-        RECIPIENT = current_user
-
-        # One could consider using a configuration set here.
-        # To learn more about them please visit:
-        # https://docs.aws.amazon.com/ses/latest/DeveloperGuide/using-configuration-sets.html
-
-        SUBJECT = "Clemson University Makerspace Registration"
-        BODY_TEXT = ("Hello " + current_user + ",\n"
-                     "Our records indicate that you have not registered as an existing user.\n"
-                     "Please go to visit.cumaker.space/register to register as an existing user.\n"
-                     )
-        # The character encoding for the email.
-        CHARSET = "UTF-8"
-        
-        # Try to send the email.
-        try:
-            response = self.client.send_email(
-                Destination={
-                    'ToAddresses': [
-                        RECIPIENT,
-                    ],
-                },
-                Message={
-                    'Body': {
-                        'Text': {
-                            'Charset': CHARSET,
-                            'Data': BODY_TEXT,
-                        },
-                    },
-                    'Subject': {
-                        'Charset': CHARSET,
-                        'Data': SUBJECT,
-                    },
-                },
-                ReplyToAddresses=["makerspace@clemson.edu"],
-                Source=SENDER,
-                # If we were using a configuration set we would need the following line.
-                # ConfigurationSetName=CONFIGURATION_SET,
-            )
-
-        # Display an error if something goes wrong.
-        except ClientError as e:
-            self.logger.error(e.response['Error']['Message'])
-            
     #######################################
     # Visit information function handlers #
     #######################################
     def get_all_visit_information(self, query_parameters: dict):
         """
         Returns all visit information entries from the visit information table.
+        Results are paginated; pass the returned 'next_token' back as a query
+        parameter to get the next page.
 
         :params query_parameters: A dictionary of parameter names and values to filter by.
         """
 
-        if query_parameters:
+        # Get the fields to return for each item
+        try:
+            fields = parseFieldsParameter(query_parameters)
+
+        except InvalidQueryParameters as iqp:
+            body = { 'errorMsg': str(iqp) }
+            return buildResponse(statusCode = 400, body = body)
+
+        # Get the number of items to return and where to resume from
+        limit = getPageLimit(query_parameters)
+        next_token = query_parameters.get("next_token")
+
+        if anyKeysPresent(SORTED_QUERY_PARAMETERS, query_parameters):
             try:
                 timestamp_expression = buildTimestampKeyExpression(query_parameters, 'timestamp')
 
@@ -190,53 +191,56 @@ class VisitsHandler():
                 body = { 'errorMsg': str(iqp) }
                 return buildResponse(statusCode = 400, body = body)
 
-            # Get the number of items to return
-            if "limit" in query_parameters:
-                limit = query_parameters["limit"]
-
-            # Otherwise return as many as possible
-            else:
-                limit = QUERY_LIMIT_RETURN_ALL
-
             try:
-                if timestamp_expression:
-                    key_expression = Key(GSI_ATTRIBUTE_NAME).eq("1") & timestamp_expression
-                else:
-                    key_expression = Key(GSI_ATTRIBUTE_NAME).eq("1")
+                # Queries every shard of the index and merges them by timestamp
+                items, next_token = queryPageByKeyExpression(self.visits_table, timestamp_expression,
+                                                             GSI = self.timestamp_index, limit = limit,
+                                                             next_token = next_token)
 
-                items = queryByKeyExpression(self.visits_table, key_expression,
-                                             GSI = TIMESTAMP_INDEX, limit = limit)
+            except InvalidQueryParameters as iqp:
+                body = { 'errorMsg': str(iqp) }
+                return buildResponse(statusCode = 400, body = body)
 
             except Exception as e:
                 body = { 'errorMsg': "Something went wrong on the server." }
                 return buildResponse(statusCode = 500, body = body)
 
-            # Do a second lookup for all returned items to get the rest of the data
-            visits = []
-            for item in items:
-                user_id = item['user_id']
-                timestamp = item['timestamp']
+            # Do a batched second lookup for all returned items to get the rest of the data
+            try:
+                hydrated = hydrateKeys(self.visits_table, items, ['user_id', 'timestamp'],
+                                       fields = fields)
 
-                response = self.visits_table.get_item(
-                    Key={
-                        'user_id': user_id,
-                        'timestamp': timestamp,
-                    }
-                )
+            except Exception as e:
+                self.logger.error(f"Could not hydrate {len(items)} visits: {e}")
+                body = { 'errorMsg': "Something went wrong on the server." }
+                return buildResponse(statusCode = 500, body = body)
 
-                visits.append(response['Item'])
+            visits = hydrated.items
+            self.logger.info(f"Hydrated {len(visits)} visits in {hydrated.round_trips} round trips.")
 
         else:
-            visits = scanTable(self.visits_table, limit = SCAN_LIMIT_RETURN_ALL)
+            try:
+                visits, next_token = scanTablePage(self.visits_table, limit = limit,
+                                                   next_token = next_token,
+                                                   segments = SCAN_SEGMENTS_AUTO,
+                                                   fields = fields)
+
+            except InvalidQueryParameters as iqp:
+                body = { 'errorMsg': str(iqp) }
+                return buildResponse(statusCode = 400, body = body)
 
         body = { 'visits': visits }
 
+        # Only include a token if there are more visits to get
+        if next_token:
+            body['next_token'] = next_token
+
         return buildResponse(statusCode = 200, body = body)
 
     def create_user_visit_information(self, data: dict):
         """
         Adds a new visit entry for a user to the visit information table.
-        Also, emails a user if they're not registered.
+        Also, queues the user to be emailed if they're not registered.
 
         :params data: The visit entry to add.
         """
@@ -247,84 +251,254 @@ class VisitsHandler():
             body = { 'errorMsg': str(irb) }
             return buildResponse(statusCode = 400, body = body)
 
-        # Ensure no other entry with same user_id and timestamp already exists
-        user_id: str = data['user_id']        
+        # Spread entries over the shards of the TimestampIndex, and put them
+        # in the bucket of their timestamp
+        data.update(self.timestamp_index.indexAttributes(data))
+
+        # Actually try putting the item into the table. Fails (without
+        # overwriting anything) if another entry with the same user_id and
+        # timestamp already exists.
+        user_id: str = data['user_id']
         timestamp: str = data['timestamp']
-        response = self.visits_table.get_item(
-            Key={
-                'user_id': user_id,
-                'timestamp': timestamp,
-            }
-        )
-        if 'Item' in response:
+        try:
+            created: bool = putItemIfNotExists(self.visits_table, data)
+        except Exception as e:
+            body = { 'errorMsg': "Something went wrong on the server." }
+            return buildResponse(statusCode = 500, body = body)
+
+        if not created:
             errorMsg: str = f"Visit entry for user {user_id} at timestamp {timestamp} already exists. Did you mean to input a different user or timestamp?"
             body = { 'errorMsg': errorMsg}
             return buildResponse(statusCode = 400, body = body)
+        
+        self.addVisitRollups([data])
+
+        # Send the user the registration link (later) if not registered
+        self.queueRegistrationChecks([user_id])
+
+        # If here, put action succeeded. Return 201
+        return buildResponse(statusCode = 201, body = {})
+
+    def create_visits_batch(self, data: dict):
+        """
+        Adds many new visit entries (e.g., a class checking in together) to
+        the visit information table. Every visit is validated first, then the
+        valid visits are written with transactions that only put visits that
+        don't already exist, so a visit is never counted twice even when
+        another request adds it at the same time. Every user who checked in is queued once
+        (however many of their visits are in the batch) to be emailed if they
+        aren't registered.
+
+        :params data: The request body: { 'visits': [visit entries to add] }
+        :returns: A 200 response whose body lists a status for each visit,
+                  in request order: { 'visits': [{ 'user_id', 'timestamp',
+                  'statusCode', and 'errorMsg' if it wasn't added }] }
+        """
+
+        visits = data.get('visits') if isinstance(data, dict) else None
+        if not isinstance(visits, list) or not 0 < len(visits) <= MAX_BATCH_VISITS:
+            errorMsg: str = f"Request body requires a 'visits' list of 1 to {MAX_BATCH_VISITS} visit entries."
+            body = { 'errorMsg': errorMsg }
+            return buildResponse(statusCode = 400, body = body)
+
+        statuses: list[dict] = []
+        # Index in visits of each valid visit, by (user_id, timestamp)
+        valid_visits: dict = {}
 
-        # Always force GSI_ATTRIBUTE_NAME key to have value of "1"
-        data[GSI_ATTRIBUTE_NAME] = "1"
+        # Validate every visit in one pass
+        for visit in visits:
+            status: dict = {}
+            statuses.append(status)
+
+            if not isinstance(visit, dict):
+                status.update(statusCode = 400, errorMsg = "Each visit entry must be an object.")
+                continue
+
+            status.update(user_id = visit.get('user_id'), timestamp = visit.get('timestamp'))
+
+            try:
+                self.validateVisitRequestBody(visit)
+            except InvalidRequestBody as irb:
+                status.update(statusCode = 400, errorMsg = str(irb))
+                continue
+
+            key: tuple = (visit['user_id'], visit['timestamp'])
+            if key in valid_visits:
+                errorMsg: str = f"Visit entry for user {key[0]} at timestamp {key[1]} is in the batch more than once."
+                status.update(statusCode = 400, errorMsg = errorMsg)
+                continue
+
+            # Spread entries over the shards of the TimestampIndex, and put them
+            # in the bucket of their timestamp
+            visit.update(self.timestamp_index.indexAttributes(visit))
+            valid_visits[key] = len(statuses) - 1
 
-        # Actually try putting the item into the table
         try:
-            self.visits_table.put_item(
-                Item=data
-            )
+            # Batch writes can't be conditional, and checking for the visits
+            # first lets another request add them before the write, so the
+            # visits are put with conditional transactions instead
+            keys: list[tuple] = list(valid_visits)
+            existing: list[int] = transactPutItemsIfNotExist(self.visits_table, [visits[valid_visits[key]] for key in keys])
+
+            for position in existing:
+                user_id, timestamp = keys[position]
+                errorMsg: str = f"Visit entry for user {user_id} at timestamp {timestamp} already exists. Did you mean to input a different user or timestamp?"
+                statuses[valid_visits.pop((user_id, timestamp))].update(statusCode = 400, errorMsg = errorMsg)
+
         except Exception as e:
+            self.logger.error(f"Could not add {len(valid_visits)} visits: {e}")
             body = { 'errorMsg': "Something went wrong on the server." }
             return buildResponse(statusCode = 500, body = body)
-        
-        # send user the registration link if not registered
-        user_registered = self.isUserRegistered(user_id)
-        if not user_registered:
-            self.registrationWorkflow(user_id)
 
-        # If here, put action succeeded. Return 201
-        return buildResponse(statusCode = 201, body = {})
+        self.logger.info(f"Added {len(valid_visits)} visits.")
+        for index in valid_visits.values():
+            statuses[index]['statusCode'] = 201
+
+        self.addVisitRollups([visits[index] for index in valid_visits.values()])
+
+        # Send each unregistered user the registration link (later)
+        user_ids: list[str] = list(dict.fromkeys(user_id for user_id, _ in valid_visits))
+        if user_ids:
+            self.queueRegistrationChecks(user_ids)
+
+        return buildResponse(statusCode = 200, body = { 'visits': statuses })
+
+    def get_visit_stats(self, query_parameters: dict):
+        """
+        Returns the number of visits per location per day, and per hour of
+        each day, read from the visit rollups (counted as visits are added)
+        instead of from the visits themselves. Costs one query per location,
+        however many visits there are.
+
+        :params query_parameters: Optional 'start_timestamp' and 'end_timestamp'
+                                  (inclusive; hours of the first and last day
+                                  outside them aren't counted), and optional
+                                  'location' to count visits of.
+        :returns: A 200 response whose body holds { 'stats': [{ 'location',
+                  'day', 'visits', 'hours': { 'hh': visits } }] (by day),
+                  'totals': { location: visits }, 'total': visits }
+        """
+
+        locations: list[str] = VALID_LOCATIONS
+        if "location" in query_parameters:
+            if query_parameters["location"] not in VALID_LOCATIONS:
+                errorMsg: str = f"Location must be one of {VALID_LOCATIONS}."
+                body = { 'errorMsg': errorMsg }
+                return buildResponse(statusCode = 400, body = body)
+
+            locations = [query_parameters["location"]]
+
+        start_timestamp: str = query_parameters.get("start_timestamp")
+        end_timestamp: str = query_parameters.get("end_timestamp")
+        for timestamp in (start_timestamp, end_timestamp):
+            if timestamp and not validTimestamp(timestamp):
+                errorMsg: str = "Timestamp not in the approved format. Approved format is 'YYYY-MM-DDThh:mm:ss'."
+                body = { 'errorMsg': errorMsg }
+                return buildResponse(statusCode = 400, body = body)
+
+        try:
+            # Rollups are kept by day, so read every day the range touches
+            day_expression = buildTimestampKeyExpression({
+                name: timestamp[:DAY_BUCKET_LENGTH]
+                for name, timestamp in (("start_timestamp", start_timestamp), ("end_timestamp", end_timestamp))
+                if timestamp
+            }, VISIT_ROLLUP_KEY[1])
+
+            if start_timestamp and end_timestamp and end_timestamp < start_timestamp:
+                raise InvalidQueryParameters("When searching with both start and end timestamps, end_timestamp cannot occur before start_timestamp.")
+
+        except InvalidQueryParameters as iqp:
+            body = { 'errorMsg': str(iqp) }
+            return buildResponse(statusCode = 400, body = body)
+
+        try:
+            rollups: list[dict] = queryRollups(self.visit_rollups_table, VISIT_ROLLUP_KEY,
+                                               locations, day_expression)
+
+        except Exception as e:
+            self.logger.error(f"Could not read the visit rollups: {e}")
+            body = { 'errorMsg': "Something went wrong on the server." }
+            return buildResponse(statusCode = 500, body = body)
+
+        stats: list[dict] = []
+        totals: dict = { location: 0 for location in locations }
+        for rollup in rollups:
+            hours: dict = {
+                name[len(HOUR_COUNT_PREFIX):]: int(count) for name, count in sorted(rollup.items())
+                if name.startswith(HOUR_COUNT_PREFIX) and name[len(HOUR_COUNT_PREFIX):].isdigit()
+            }
+
+            # Leave out the hours of the first and last day outside the range
+            if start_timestamp and rollup['day'] == start_timestamp[:DAY_BUCKET_LENGTH]:
+                hours = { hour: count for hour, count in hours.items() if hour >= start_timestamp[11:13] }
+            if end_timestamp and rollup['day'] == end_timestamp[:DAY_BUCKET_LENGTH]:
+                hours = { hour: count for hour, count in hours.items() if hour <= end_timestamp[11:13] }
+
+            visits: int = sum(hours.values())
+            if not visits:
+                continue
+
+            stats.append({ 'location': rollup['location'], 'day': rollup['day'], 'visits': visits, 'hours': hours })
+            totals[rollup['location']] += visits
+
+        body = { 'stats': stats, 'totals': totals, 'total': sum(totals.values()) }
+        return buildResponse(statusCode = 200, body = body)
 
     def get_user_visit_information(self, user_id: str, query_parameters: dict):
         """
         Gets all of the visit information entries for a specified user from the visit information table.
+        Results are paginated; pass the returned 'next_token' back as a query
+        parameter to get the next page.
 
         :params user_id: The name of the user.
         :params query_parameters: A dictionary of parameter names and values to filter by.
         """
 
-        if query_parameters:
-            try:
-                timestamp_expression = buildTimestampKeyExpression(query_parameters, 'timestamp')
+        # Get the fields to return for each item
+        try:
+            fields = parseFieldsParameter(query_parameters)
 
-            except InvalidQueryParameters as iqp:
-                body = { 'errorMsg': str(iqp) }
-                return buildResponse(statusCode = 400, body = body)
+        except InvalidQueryParameters as iqp:
+            body = { 'errorMsg': str(iqp) }
+            return buildResponse(statusCode = 400, body = body)
+
+        try:
+            timestamp_expression = buildTimestampKeyExpression(query_parameters, 'timestamp')
 
-            # Get the number of items to return
-            if "limit" in query_parameters:
-                limit = query_parameters["limit"]
+        except InvalidQueryParameters as iqp:
+            body = { 'errorMsg': str(iqp) }
+            return buildResponse(statusCode = 400, body = body)
 
-            # Otherwise return as many as possible
-            else:
-                limit = QUERY_LIMIT_RETURN_ALL
+        # Get the number of items to return and where to resume from
+        limit = getPageLimit(query_parameters)
+        next_token = query_parameters.get("next_token")
 
-            try:
-                if timestamp_expression:
-                    key_expression = Key('user_id').eq(user_id) & timestamp_expression
-                else:
-                    key_expression = Key('user_id').eq(user_id)
+        try:
+            if timestamp_expression:
+                key_expression = Key('user_id').eq(user_id) & timestamp_expression
+            else:
+                key_expression = Key('user_id').eq(user_id)
 
-                visits = queryByKeyExpression(self.visits_table, key_expression,
-                                              GSI = None, limit = limit)
+            visits, next_token = queryPageByKeyExpression(self.visits_table, key_expression,
+                                                          GSI = None, limit = limit,
+                                                          next_token = next_token,
+                                                          fields = fields)
 
-            except Exception as e:
-                body = { 'errorMsg': "Something went wrong on the server." }
-                return buildResponse(statusCode = 500, body = body)
+        except InvalidQueryParameters as iqp:
+            body = { 'errorMsg': str(iqp) }
+            return buildResponse(statusCode = 400, body = body)
 
-        else:
-            key_expression = Key('user_id').eq(user_id)
-            visits = queryByKeyExpression(self.visits_table, key_expression,
-                                          GSI = None, limit = QUERY_LIMIT_RETURN_ALL)
+        except Exception as e:
+            self.logger.error(f"Could not query the visits of {user_id}: {e}")
+            body = { 'errorMsg': "Something went wrong on the server." }
+            return buildResponse(statusCode = 500, body = body)
 
         body = { 'visits': visits }
 
+        # Only include a token if there are more visits to get
+        if next_token:
+            body['next_token'] = next_token
+
         return buildResponse(statusCode = 200, body = body)
     
     def validateVisitRequestBody(self, data: dict):
@@ -336,30 +510,16 @@ class VisitsHandler():
         :params data: The request body to validate.
         :raises: InvalidRequestBody
         """
-
-        required_fields: list[str] = ["user_id", "timestamp", "location"]
-
-        # Ensure all required fields are present
-        if not allKeysPresent(required_fields, data):
-            errorMsg: str = f"Missing at least one field from {required_fields} in request body."
-            raise InvalidRequestBody(errorMsg)
-
-        # Ensure timestamp is in the correct format
-        if not validTimestamp(data['timestamp']):
-            errorMsg: str = f"Timestamp not in the approved format. Approved format is 'YYYY-MM-DDThh:mm:ss'."
-            raise InvalidRequestBody(errorMsg)
-
-        # Check that the location is valid if it's still in data
-        if 'location' in data:
-            if data['location'] not in VALID_LOCATIONS:
-                errorMsg: str = f"Specified location '{data['location']} is not one of the valid locations {VALID_LOCATIONS}'."
-                raise InvalidRequestBody(errorMsg)
-
+        VISIT_REQUEST_VALIDATOR.validate(data)
 
 
+# Handler reused between warm invocations of the same container
+visit_handler = None
 
 def handler(request, context):
     # This will be hit in prod, and will connect to the stood-up dynamodb
-    # and Simple Email Service clients.
-    visit_handler = VisitsHandler(None, None, None)
+    # tables and registration queue.
+    global visit_handler
+    if visit_handler is None:
+        visit_handler = VisitsHandler(None, None, None)
     return visit_handler.handle_event(request, context)
@@ -20,6 +20,46 @@ from constructs import Construct
 from dns import MakerspaceDns
 
 
+# Size (in GB) of the stage's response cache cluster
+API_CACHE_CLUSTER_SIZE: str = "0.5"
+
+# Seconds each GET route's responses are cached for. Visits and equipment
+# logs are added constantly (and new ones don't flush the cache), so they
+# are cached briefly; the other routes are flushed by their writes. A flush
+# empties the whole stage cache, since API Gateway can't flush one route
+# (see api_defaults.flushApiCache); those writes are rare enough for that.
+ROUTE_CACHE_TTLS: dict[str, int] = {
+    "/users": 300,
+    "/users/{user_id}": 300,
+    "/visits": 30,
+    "/visits/{user_id}": 30,
+    "/visits/stats": 30,
+    "/equipment": 60,
+    "/equipment/{user_id}": 60,
+    "/equipment/stats": 60,
+    "/qualifications": 300,
+    "/qualifications/{user_id}": 300,
+}
+
+# Query parameters and headers that change a GET response. Each one is part
+# of the cache key of every cached route, along with its path parameters.
+CACHE_KEY_QUERY_PARAMETERS: list[str] = [
+    "start_timestamp",
+    "end_timestamp",
+    "limit",
+    "next_token",
+    "fields",
+    "location",
+    "equipment_type",
+    "printer_name",
+]
+CACHE_KEY_HEADERS: list[str] = [
+    "Accept",
+    "Accept-Encoding",
+    "If-None-Match",
+]
+
+
 class SharedApiGateway(Stack):
     """
     The SharedApiGateway stack sets up an Amazon API Gateway to manage API requests 
@@ -42,6 +82,7 @@ class SharedApiGateway(Stack):
     - `/visits`: Track visits to the Makerspace (GET, POST).
     - `/visits/{user_id}`: Retrieve visits for a specific user (GET).
     - `/equipment`: Manage equipment usage logs (GET, POST).
+    - `/equipment/stats`: Get printer usage per equipment type, printer, and day (GET).
     - `/equipment/{user_id}`: Retrieve or update equipment logs for a specific user (GET, PATCH).
     - `/qualifications`: Track Tiger Training qualifications (GET, POST).
     - `/qualifications/{user_id}`: Retrieve or update a user's qualifications (GET, PATCH).
@@ -136,6 +177,9 @@ class SharedApiGateway(Stack):
         stage_name: str = f"{stage}"
         self.deploy_api_stage(stage_name)
 
+        # Let the lambdas that write to cached routes flush the cache
+        self.grant_cache_flush([user, qualifications, equipment, tiger_training])
+
         # Thing to do in the future:
         # Automate the creation of a usage plan and api key
         # alongside the deployed stage. Currently not implemented
@@ -157,6 +201,9 @@ class SharedApiGateway(Stack):
                 allow_methods=aws_apigateway.Cors.ALL_METHODS,  # Allow all HTTP methods
                 allow_headers=["*"],  # Allow all headers
             ),
+            # Lets the lambdas return compressed (base64 encoded) JSON bodies.
+            # Must match BINARY_MEDIA_TYPES in lambda_code/api_defaults.py
+            binary_media_types=["application/json"],
         )
 
         # Handle dns integration
@@ -184,10 +231,80 @@ class SharedApiGateway(Stack):
         else:
             deployment = self.api.latest_deployment
 
+        # Cache GET responses of each route for its TTL
+        method_options: dict = {
+            f"{path}/GET": aws_apigateway.MethodDeploymentOptions(
+                caching_enabled=True,
+                cache_ttl=Duration.seconds(ttl),
+                cache_data_encrypted=True,
+            )
+            for path, ttl in ROUTE_CACHE_TTLS.items()
+        }
+
         self.stage = aws_apigateway.Stage(
             self, id=f"SharedApiGatewayDeploymentStage{stage_name}",
             deployment=deployment,
             stage_name=stage_name,
+            cache_cluster_enabled=True,
+            cache_cluster_size=API_CACHE_CLUSTER_SIZE,
+            method_options=method_options,
+        )
+
+    def add_cached_get(self, resource: aws_apigateway.Resource,
+                       function: aws_lambda.Function,
+                       path_parameters: list[str] = None):
+        """
+        Adds a GET method to a resource whose responses can be cached. The
+        cache key is made up of the path parameters plus every query parameter
+        and header that changes the response (see CACHE_KEY_QUERY_PARAMETERS
+        and CACHE_KEY_HEADERS). Whether (and for how long) the route is
+        actually cached is set by ROUTE_CACHE_TTLS.
+
+        :params resource: The resource to add the GET method to.
+        :params function: The lambda function handling the requests.
+        :params path_parameters: Optional names of the resource's path parameters.
+        """
+        if path_parameters is None:
+            path_parameters = []
+
+        request_parameters: dict[str, bool] = {}
+        for parameter in path_parameters:
+            request_parameters[f"method.request.path.{parameter}"] = True
+        for parameter in CACHE_KEY_QUERY_PARAMETERS:
+            request_parameters[f"method.request.querystring.{parameter}"] = False
+        for header in CACHE_KEY_HEADERS:
+            request_parameters[f"method.request.header.{header}"] = False
+
+        # Cache key parameters are set on the integration, so GET can't share
+        # an integration with the (uncached) methods of the resource
+        integration = aws_apigateway.LambdaIntegration(
+            function,
+            cache_key_parameters=list(request_parameters),
+        )
+
+        resource.add_method('GET', integration,
+                            api_key_required=True,
+                            request_parameters=request_parameters)
+
+    def grant_cache_flush(self, functions: list[aws_lambda.Function]):
+        """
+        Allows lambda functions to flush the stage's response cache
+        (api_defaults.flushApiCache) after they write to a cached resource.
+
+        :params functions: The lambda functions to allow.
+        """
+        aws_iam.Policy(
+            self, 'FlushApiCachePolicy',
+            statements=[
+                aws_iam.PolicyStatement(
+                    actions=["apigateway:DELETE"],
+                    resources=[
+                        f"arn:aws:apigateway:{self.region}::/restapis/{self.api.rest_api_id}"
+                        f"/stages/{self.stage.stage_name}/cache/data"
+                    ],
+                )
+            ],
+            roles=[function.role for function in functions],
         )
 
     
@@ -234,7 +351,7 @@ class SharedApiGateway(Stack):
         self.users = self.api.root.add_resource('users')
 
         # methods
-        self.users.add_method('GET', users_handler, api_key_required=True)
+        self.add_cached_get(self.users, users)
         self.users.add_method('POST', users_handler)
     
 
@@ -245,7 +362,7 @@ class SharedApiGateway(Stack):
         self.users_user_id = self.users.add_resource('{user_id}')
 
         # methods
-        self.users_user_id.add_method('GET', users_handler, api_key_required=True)
+        self.add_cached_get(self.users_user_id, users, ['user_id'])
         self.users_user_id.add_method('PATCH', users_handler, api_key_required=True)
     
 
@@ -253,13 +370,20 @@ class SharedApiGateway(Stack):
     Visits:
 
     Used to track visits. Can get all visits, add a new visit,
-    and retrieve visits by users and timestamps.
+    add many visits at once, retrieve visits by users and timestamps,
+    and get visit counts per location, day, and hour.
 
     Endpoints:
     /visits
       - GET
       - POST
 
+    /visits/batch
+      - POST
+
+    /visits/stats
+      - GET
+
     /visits/{user_id}
       - GET
     """
@@ -270,17 +394,24 @@ class SharedApiGateway(Stack):
         self.visits = self.api.root.add_resource('visits')
 
         # methods
-        self.visits.add_method('GET', visits_handler, api_key_required=True)
+        self.add_cached_get(self.visits, visits)
         self.visits.add_method('POST', visits_handler, api_key_required=True)
 
+        # create resource '/visits/batch' for checking in many visits at once
+        self.visits_batch = self.visits.add_resource('batch')
+        self.visits_batch.add_method('POST', visits_handler, api_key_required=True)
+
+        # create resource '/visits/stats' for visit counts read from the rollups
+        self.visits_stats = self.visits.add_resource('stats')
+        self.add_cached_get(self.visits_stats, visits)
+
     def route_visits_user_id(self, visits: aws_lambda.Function):
         
         # adds a path parameter '{user_id}' to /visits
-        visits_user_id = aws_apigateway.LambdaIntegration(visits)
         self.visits_user_id = self.visits.add_resource('{user_id}')
 
         # methods
-        self.visits_user_id.add_method('GET', visits_user_id, api_key_required=True)
+        self.add_cached_get(self.visits_user_id, visits, ['user_id'])
 
 
     """
@@ -289,14 +420,18 @@ class SharedApiGateway(Stack):
     Used to manage storing, retrieving, and updating equipment usage
     logs gathered from the equipment usage form. Can retrieve all
     equipment data, add a new entry based on a submission, get the
-    equipment logs by user and timestamps, and update any equipment
-    log relating to a user (given a timestamp or the latest without one).
+    equipment logs by user and timestamps, update any equipment
+    log relating to a user (given a timestamp or the latest without one),
+    and get printer usage per equipment type, printer, and day.
 
     Endpoints:
     /equipment
       - GET
       - POST
 
+    /equipment/stats
+      - GET
+
     /equipment/{user_id}
       - GET
       - PATCH
@@ -304,12 +439,16 @@ class SharedApiGateway(Stack):
     def route_equipment(self, equipment: aws_lambda.Function):
 
         # create resource '/equipment'
-        equipment = aws_apigateway.LambdaIntegration(equipment)
+        equipment_handler = aws_apigateway.LambdaIntegration(equipment)
         self.equipment = self.api.root.add_resource('equipment')
 
         # methods
-        self.equipment.add_method('GET', equipment, api_key_required=True)
-        self.equipment.add_method('POST', equipment)
+        self.add_cached_get(self.equipment, equipment)
+        self.equipment.add_method('POST', equipment_handler)
+
+        # create resource '/equipment/stats' for usage read from the rollups
+        self.equipment_stats = self.equipment.add_resource('stats')
+        self.add_cached_get(self.equipment_stats, equipment)
         
     def route_equipment_user_id(self, equipment: aws_lambda.Function):
         
@@ -318,7 +457,7 @@ class SharedApiGateway(Stack):
         self.equipment_user_id = self.equipment.add_resource('{user_id}')
 
         # methods
-        self.equipment_user_id.add_method('GET', equipment_user_id, api_key_required=True)
+        self.add_cached_get(self.equipment_user_id, equipment, ['user_id'])
         self.equipment_user_id.add_method('PATCH', equipment_user_id, api_key_required=True)
 
 
@@ -342,12 +481,12 @@ class SharedApiGateway(Stack):
     def route_qualifications(self, qualifications: aws_lambda.Function):
 
         # create resource '/qualifications'
-        qualifications = aws_apigateway.LambdaIntegration(qualifications)
+        qualifications_handler = aws_apigateway.LambdaIntegration(qualifications)
         self.qualifications = self.api.root.add_resource('qualifications')
 
         # methods
-        self.qualifications.add_method('GET', qualifications, api_key_required=True)
-        self.qualifications.add_method('POST', qualifications, api_key_required=True)
+        self.add_cached_get(self.qualifications, qualifications)
+        self.qualifications.add_method('POST', qualifications_handler, api_key_required=True)
         
     def route_qualifications_user_id(self, qualifications: aws_lambda.Function):
         
@@ -356,7 +495,7 @@ class SharedApiGateway(Stack):
         self.qualifications_user_id = self.qualifications.add_resource('{user_id}')
 
         # methods
-        self.qualifications_user_id.add_method('GET', qualifications_user_id, api_key_required=True)
+        self.add_cached_get(self.qualifications_user_id, qualifications, ['user_id'])
         self.qualifications_user_id.add_method('PATCH', qualifications_user_id, api_key_required=True)
 
 
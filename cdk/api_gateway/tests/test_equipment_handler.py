@@ -1,4 +1,5 @@
 import json
+from decimal import Decimal
 from moto import mock_aws
 import pytest
 from datetime import datetime
@@ -13,17 +14,20 @@ from ..lambda_code.api_defaults import (
     PRIMARY_KEY,
     equipment_path,
     equipment_param_path,
+    equipment_stats_path,
     TIMESTAMP_FORMAT,
 )
 
 # Test util imports
 from ..utilsFolder.utils import (
     create_gsi_table,
+    create_sorted_table,
     create_rest_http_event,
     jsonify_response,
     get_all_table_items,
     put_all_items_in_table
 )
+from ..utilsFolder.rebuild_equipment_rollups import countEquipmentRollups
 
 
 def generate_request_body(rest_method: str,
@@ -165,6 +169,26 @@ def create_get_user_equipment_event_contex(user_id: str):
 
     return (event, context)
 
+def create_get_user_equipment_fields_event_contex(user_id: str, fields: str):
+
+    path_parameters: dict = {
+        'user_id': user_id
+    }
+
+    query_parameters: dict = {
+        'fields': fields,
+    }
+
+    event = create_rest_http_event(
+        httpMethod = "GET",
+        resource = equipment_param_path,
+        pathParameters = path_parameters,
+        queryStringParameters = query_parameters,
+    )
+    context = None
+
+    return (event, context)
+
 def create_patch_user_equipment_event_contex(user_id: str, request_body: dict):
     path_parameters: dict = {
         'user_id': user_id
@@ -199,8 +223,8 @@ class TestEquipment():
     @pytest.fixture
     def get_equipment_handler(self):
         """
-        Creates a new 'equipment' dynamodb table, provides this table
-        to an EquipmentHandler, and yields the new EquipmentHandler to the
+        Creates new 'equipment' and 'equipment_rollups' dynamodb tables,
+        provides these tables to an EquipmentHandler, and yields the new EquipmentHandler to the
         test function. Yielding allows for the table to persist
         through to the test function; otherwise, the mock_aws
         decorator would "tear down the environment", thus preventing
@@ -225,8 +249,10 @@ class TestEquipment():
             table_name: str = "equipment"
             table = create_gsi_table(table_name, PRIMARY_KEY, "timestamp")
 
+            rollups_table = create_sorted_table("equipment_rollups", "equipment_type", "bucket")
+
             # Setup the users handler
-            equipment_handler = EquipmentHandler(table)
+            equipment_handler = EquipmentHandler(table, rollups_table)
             yield (equipment_handler, table)
 
 
@@ -346,6 +372,119 @@ class TestEquipment():
         assert len(body['equipment_logs']) <= limit
 
 
+    def test_get_user_equipment_with_fields(self, get_equipment_handler):
+        """
+        Tests that the 'fields' query parameter projects the returned
+        equipment logs down to only the requested attributes, including
+        attribute names that are DynamoDB reserved words and nested paths.
+        """
+
+        # Get the equipment handler to use.
+        equipment_handler, table = get_equipment_handler
+
+        # Create some test equipment logs for a single user
+        user_ids: list[str] = ["test1", "test1"]
+        timestamps: list[str] = ["2024-10-01T10:00:00", "2024-10-02T10:00:00"]
+        locations: list[str] = ["Watt", "Watt"]
+        project_names: list[str] = ["test", "test"]
+        project_types: list[str] = ["Personal", "Personal"]
+        equipment_types: list[str] = [EQUIPMENT_NAMES["FDM_PRINTER_STRING"]] * 2
+        class_numbers: list[str] = [""] * 2
+        faculty_names: list[str] = [""] * 2
+        project_sponsors: list[str] = [""] * 2
+        organization_affiliations: list[str] = [""] * 2
+        printer_3d_infos: dict = {
+            "test1": {
+                "printer_name": "test-printer",
+                "print_name": "test print",
+                "print_duration": "5",
+                "print_status": "In Progress",
+                "print_notes": "",
+                "print_mass_estimate": "5",
+                "print_mass": "",
+            }
+        }
+
+        put_items: list[dict] = generate_items(
+                "POST",
+                user_ids,
+                timestamps,
+                locations,
+                project_names,
+                project_types,
+                equipment_types,
+                class_numbers=class_numbers,
+                faculty_names=faculty_names,
+                project_sponsors=project_sponsors,
+                organization_affiliations=organization_affiliations,
+                printer_3d_infos=printer_3d_infos,
+        )
+
+        # Put them into the table
+        put_all_items_in_table(table, put_items)
+
+        # 'timestamp' and 'location' are both DynamoDB reserved words
+        fields: str = "timestamp,location,printer_3d_info.printer_name"
+        event, context = create_get_user_equipment_fields_event_contex("test1", fields)
+
+        # Simulate handling the event
+        response = equipment_handler.handle_event(event, context)
+        response = jsonify_response(response)
+
+        statusCode = response['statusCode']
+        body = response['body']
+
+        assert statusCode == 200
+        assert len(body['equipment_logs']) == 2
+        for log in body['equipment_logs']:
+            assert set(log.keys()) == {"timestamp", "location", "printer_3d_info"}
+            assert log["printer_3d_info"] == {"printer_name": "test-printer"}
+
+        # Malformed field names are rejected
+        event, context = create_get_user_equipment_fields_event_contex("test1", "timestamp,bad-name")
+        response = equipment_handler.handle_event(event, context)
+
+        assert response['statusCode'] == 400
+
+
+    def test_get_equipment_with_number_and_set_attributes(self, get_equipment_handler):
+        """
+        Tests that equipment logs holding dynamodb numbers (Decimals) and sets
+        are serialized into JSON numbers and lists.
+        """
+
+        # Get the equipment handler to use.
+        equipment_handler, table = get_equipment_handler
+
+        # Put an equipment log with number and set attributes into the table
+        table.put_item(Item={
+            "user_id": "test1",
+            "timestamp": "2024-10-01T10:00:00",
+            "location": "Watt",
+            "printer_3d_info": {
+                "print_duration": Decimal("5"),
+                "print_mass": Decimal("12.5"),
+                "print_tags": {"pla", "black"},
+            },
+        })
+
+        event, context = create_get_user_equipment_event_contex("test1")
+
+        # Simulate handling the event
+        response = equipment_handler.handle_event(event, context)
+        response = jsonify_response(response)
+
+        statusCode = response['statusCode']
+        body = response['body']
+
+        assert statusCode == 200
+        printer_3d_info: dict = body['equipment_logs'][0]['printer_3d_info']
+        assert printer_3d_info['print_duration'] == 5
+        assert type(printer_3d_info['print_duration']) == int
+        assert printer_3d_info['print_mass'] == 12.5
+        assert printer_3d_info['print_tags'] == ["black", "pla"]
+
+
     def test_post_new_equipment_log(self, get_equipment_handler):
         """
         Tests for the successful creation of a new equipment log.
@@ -568,6 +707,50 @@ class TestEquipment():
         items: list = data['items']
         assert len(items) == 0
 
+    def test_post_sla_printer_missing_resin_fields(self, get_equipment_handler):
+        """
+        Tests that an sla printer equipment log is rejected when its
+        'printer_3d_info' object has the fdm printer fields instead of the
+        sla (resin) ones.
+        """
+
+        # Get the equipment handler to use.
+        equipment_handler, table = get_equipment_handler
+
+        printer_3d_info: dict = {
+            "printer_name": "test-printer",
+            "print_name": "test print",
+            "print_duration": "5",
+            "print_status": "In Progress",
+            "print_notes": "",
+            "print_mass_estimate": "5",
+            "print_mass": "",
+        }
+
+        request_body: dict = generate_request_body(
+                "POST",
+                "test1",
+                datetime.now().strftime(TIMESTAMP_FORMAT),
+                "Watt",
+                "test",
+                "Personal",
+                EQUIPMENT_NAMES["SLA_PRINTER_STRING"],
+                printer_3d_info=printer_3d_info,
+        )
+
+        # Create the post event and context for the new equipment log
+        event, context = create_post_equipment_event_contex(request_body)
+
+        # Simulate handling the event
+        response = equipment_handler.handle_event(event, context)
+
+        assert response['statusCode'] == 400
+        assert "resin_volume" in jsonify_response(response)['body']['errorMsg']
+
+        # Nothing should have been stored
+        assert len(get_all_table_items(table)['items']) == 0
+
+
     def test_get_user_equipment_logs(self, get_equipment_handler):
         """
         Tests for a successful get response when requesting a specific
@@ -724,3 +907,178 @@ class TestEquipment():
         for key in expected_body:
             assert key in equipment_log
             assert expected_body[key] == equipment_log[key]
+
+
+    def test_patch_equipment_log_partial_update(self, get_equipment_handler):
+        """
+        Tests that patches only change the patched fields, and are checked
+        against the fields the stored equipment_type allows.
+        """
+
+        # Get the equipment handler to use.
+        equipment_handler, table = get_equipment_handler
+
+        printer_3d_info: dict = {
+            "printer_name": "test-printer",
+            "print_name": "test print",
+            "print_duration": "5",
+            "print_status": "In Progress",
+            "print_notes": "",
+            "print_mass_estimate": "5",
+            "print_mass": "",
+        }
+
+        # Create a 3d printer log and a log for other equipment
+        timestamp: str = "2024-10-01T10:00:00"
+        for user_id, equipment_type, info in [("printer", EQUIPMENT_NAMES["FDM_PRINTER_STRING"], printer_3d_info),
+                                              ("other", "Laser Cutter", {})]:
+            request_body: dict = generate_request_body("POST", user_id, timestamp, "Watt", "test",
+                                                       "Personal", equipment_type, printer_3d_info=info)
+            event, context = create_post_equipment_event_contex(request_body)
+            assert equipment_handler.handle_event(event, context)['statusCode'] == 201
+
+        # Rename the printer log's project
+        event, context = create_patch_user_equipment_event_contex("printer", {
+            "timestamp": timestamp,
+            "project_name": "renamed",
+        })
+        assert equipment_handler.handle_event(event, context)['statusCode'] == 204
+
+        # Finish the print, using the latest log
+        event, context = create_patch_user_equipment_event_contex("printer", {
+            "printer_3d_info": dict(printer_3d_info, print_status="Success", print_mass="4"),
+        })
+        assert equipment_handler.handle_event(event, context)['statusCode'] == 204
+
+        # Incomplete printer information is rejected
+        event, context = create_patch_user_equipment_event_contex("printer", {
+            "printer_3d_info": {"print_status": "Failed"},
+        })
+        assert equipment_handler.handle_event(event, context)['statusCode'] == 400
+
+        # Other equipment can't hold printer information
+        event, context = create_patch_user_equipment_event_contex("other", {
+            "printer_3d_info": printer_3d_info,
+        })
+        response = jsonify_response(equipment_handler.handle_event(event, context))
+        assert response['statusCode'] == 400
+        assert "equipment_type" in response['body']['errorMsg']
+
+        items: dict = {item['user_id']: item for item in get_all_table_items(table)['items']}
+        assert items['printer']['project_name'] == "renamed"
+        assert items['printer']['location'] == "Watt"
+        assert items['printer']['printer_3d_info']['print_status'] == "Success"
+        assert items['printer']['printer_3d_info']['print_mass'] == "4"
+        assert 'printer_3d_info' not in items['other']
+
+
+    def test_get_equipment_stats(self, get_equipment_handler):
+        """
+        Tests that usage is rolled up per equipment type, printer, and day as
+        logs are added, that patches take the old values of a log back out,
+        and that the stats endpoint reads the rollups.
+        """
+
+        # Get the equipment handler to use.
+        equipment_handler, table = get_equipment_handler
+
+        fdm_printer: str = EQUIPMENT_NAMES["FDM_PRINTER_STRING"]
+        printer_3d_info: dict = {
+            "printer_name": "prusa-1",
+            "print_name": "test print",
+            "print_duration": "30",
+            "print_status": "In Progress",
+            "print_notes": "",
+            "print_mass_estimate": "5",
+            "print_mass": "",
+        }
+
+        logs: list = [
+            ("test1", "2024-10-01T10:00:00", fdm_printer, printer_3d_info),
+            ("test2", "2024-10-01T11:00:00", fdm_printer, printer_3d_info),
+            ("test3", "2024-10-02T09:00:00", fdm_printer, dict(printer_3d_info, printer_name="prusa-2")),
+            ("test4", "2024-10-01T12:00:00", EQUIPMENT_NAMES["GLOWFORGE_STRING"], {}),
+        ]
+        for user_id, timestamp, equipment_type, info in logs:
+            request_body: dict = generate_request_body("POST", user_id, timestamp, "Watt", "test",
+                                                       "Personal", equipment_type, printer_3d_info=info)
+            event, context = create_post_equipment_event_contex(request_body)
+            assert equipment_handler.handle_event(event, context)['statusCode'] == 201
+
+        # One print finishes, and the other fails on (it turns out) another printer
+        for user_id, info in [("test1", dict(printer_3d_info, print_status="Complete", print_mass="12.5")),
+                              ("test2", dict(printer_3d_info, print_status="Failed", print_mass="2.5",
+                                             printer_name="prusa-2"))]:
+            event, context = create_patch_user_equipment_event_contex(user_id, { "printer_3d_info": info })
+            assert equipment_handler.handle_event(event, context)['statusCode'] == 204
+
+        def get_stats(query_parameters: dict) -> dict:
+            event = create_rest_http_event(httpMethod = "GET", resource = equipment_stats_path,
+                                           queryStringParameters = query_parameters)
+            return jsonify_response(equipment_handler.handle_event(event, None))
+
+        response = get_stats({ 'equipment_type': fdm_printer })
+        assert response['statusCode'] == 200
+        assert response['body']['stats'] == [
+            { 'equipment_type': fdm_printer, 'printer_name': "prusa-1", 'day': "2024-10-01",
+              'logs': 1, 'print_mass': 12.5, 'print_duration': 30, 'print_status': { 'Complete': 1 } },
+            { 'equipment_type': fdm_printer, 'printer_name': "prusa-2", 'day': "2024-10-01",
+              'logs': 1, 'print_mass': 2.5, 'print_duration': 30, 'print_status': { 'Failed': 1 } },
+            { 'equipment_type': fdm_printer, 'printer_name': "prusa-2", 'day': "2024-10-02",
+              'logs': 1, 'print_mass': 0, 'print_duration': 30, 'print_status': { 'In Progress': 1 } },
+        ]
+        totals: dict = { total['printer_name']: total for total in response['body']['totals'] }
+        assert totals['prusa-2']['print_mass'] == 2.5
+        assert totals['prusa-2']['print_duration'] == 60
+        assert totals['prusa-2']['failure_rate'] == 1.0
+
+        # A range of days, and a single printer
+        response = get_stats({ 'equipment_type': fdm_printer, 'printer_name': "prusa-2",
+                               'start_timestamp': "2024-10-02T00:00:00", 'end_timestamp': "2024-10-02T23:59:59" })
+        assert [(stat['printer_name'], stat['day']) for stat in response['body']['stats']] == [("prusa-2", "2024-10-02")]
+
+        # Every known equipment type is read by default
+        response = get_stats({ 'end_timestamp': "2024-10-01T23:59:59" })
+        assert len(response['body']['stats']) == 3
+        assert { stat['equipment_type'] for stat in response['body']['stats'] } == {
+            fdm_printer, EQUIPMENT_NAMES["GLOWFORGE_STRING"]
+        }
+
+        assert get_stats({ 'start_timestamp': "2024-10-02" })['statusCode'] == 400
+        assert get_stats({ 'end_timestamp': "2024-10-01T00:00:00",
+                           'start_timestamp': "2024-10-02T00:00:00" })['statusCode'] == 400
+        assert get_stats({ 'equipment_type': "Laser Cutter" })['statusCode'] == 400
+
+
+    def test_rebuild_equipment_rollups(self, get_equipment_handler):
+        """
+        Tests that recounting past days from the equipment table counts the
+        logs stored without being rolled up, and leaves the days after them
+        alone.
+        """
+
+        # Get the equipment handler to use.
+        equipment_handler, table = get_equipment_handler
+
+        fdm_printer: str = EQUIPMENT_NAMES["FDM_PRINTER_STRING"]
+        put_all_items_in_table(table, [
+            { 'user_id': "test1", 'timestamp': "2024-01-01T09:00:00", 'equipment_type': fdm_printer,
+              'printer_3d_info': { 'printer_name': "prusa-1", 'print_mass': "10", 'print_status': "Complete" } },
+            { 'user_id': "test2", 'timestamp': "2024-01-01T13:00:00", 'equipment_type': fdm_printer,
+              'printer_3d_info': { 'printer_name': "prusa-1", 'print_mass': "2", 'print_status': "Failed" } },
+            { 'user_id': "test3", 'timestamp': "2024-01-03T09:00:00", 'equipment_type': fdm_printer,
+              'printer_3d_info': { 'printer_name': "prusa-1", 'print_mass': "5", 'print_status': "Complete" } },
+        ])
+
+        rollups: list[dict] = countEquipmentRollups(table, "2024-01-03", segments = 2)
+        put_all_items_in_table(equipment_handler.equipment_rollups_table, rollups)
+
+        event = create_rest_http_event(httpMethod = "GET", resource = equipment_stats_path,
+                                       queryStringParameters = { 'equipment_type': fdm_printer })
+        response = jsonify_response(equipment_handler.handle_event(event, None))
+
+        assert response['body']['stats'] == [
+            { 'equipment_type': fdm_printer, 'printer_name': "prusa-1", 'day': "2024-01-01",
+              'logs': 2, 'print_mass': 12, 'print_duration': 0, 'print_status': { 'Complete': 1, 'Failed': 1 } },
+        ]
+        assert response['body']['totals'][0]['failure_rate'] == 0.5
@@ -1,4 +1,5 @@
 import json
+from botocore.exceptions import ClientError
 from moto import mock_aws
 import pytest
 from datetime import datetime, timedelta
@@ -10,16 +11,21 @@ from ..lambda_code.api_defaults import (
     qualifications_path,
     qualifications_param_path,
     TIMESTAMP_FORMAT,
+    GSI_ATTRIBUTE_NAME,
+    BUCKET_ATTRIBUTE_NAME,
 )
 
 # Test util imports
 from ..utilsFolder.utils import (
     create_gsi_table,
+    create_indexed_table,
     create_rest_http_event,
     jsonify_response,
     get_all_table_items,
-    put_all_items_in_table
+    put_all_items_in_table,
+    RecordingTable
 )
+from ..utilsFolder.migrate_qualifications import migrateQualifications
 
 
 def generate_request_body(rest_method: str,
@@ -181,7 +187,7 @@ class TestQualifications():
         with mock_aws():
             # Instantiate users table and handler
             table_name: str = "qualifications"
-            table = create_gsi_table(table_name, PRIMARY_KEY, "last_updated")
+            table = create_indexed_table(table_name, PRIMARY_KEY, "last_updated")
 
             # Setup the users handler
             qualifications_handler = QualificationsHandler(table)
@@ -321,7 +327,7 @@ class TestQualifications():
         assert len(items) == 1
 
         # Check that the item matches what was posted
-        item: dict = items[0]
+        item: dict = qualifications_handler.toResponseBody(items[0])
         assert item["user_id"] == user_id
         for key in request_body:
             assert key in item
@@ -417,8 +423,7 @@ class TestQualifications():
 
         # Prepare a patch body to update trainings
 
-        # Need to add an arbitrary timedelta due to nature of qualifications deleting
-        # "old" entries that match the same old "last_updated" timestamp.
+        # Updates are made after the entry was last updated
         new_last_updated: str = (datetime.now() + timedelta(seconds=10)) \
                                 .strftime(TIMESTAMP_FORMAT)
 
@@ -455,7 +460,7 @@ class TestQualifications():
 
         # Ensure the data was successfully updated
         data: dict = get_all_table_items(table)
-        qualifications: dict = data['items'][0]
+        qualifications: dict = qualifications_handler.toResponseBody(data['items'][0])
 
         qualifications_handler.validateQualificationRequestBody(qualifications)
 
@@ -463,3 +468,225 @@ class TestQualifications():
         for key in expected_body:
             assert key in qualifications
             assert expected_body[key] == qualifications[key]
+
+
+    def test_legacy_qualifications_migration(self, get_qualifications_handler):
+        """
+        Tests that users still in the legacy (user_id, last_updated) keyed
+        table are read from it, moved into the new table when updated, and
+        copied by the migration without overwriting newer entries.
+        """
+
+        # Get the table to use.
+        _, table = get_qualifications_handler
+
+        # Old entries: two for 'test1' (from an interrupted update) and one for 'test2'
+        legacy_table = create_gsi_table("legacy_qualifications", PRIMARY_KEY, "last_updated")
+        put_all_items_in_table(legacy_table, generate_items(
+                "POST",
+                ["test1", "test1", "test2"],
+                ["2024-01-01T10:00:00", "2024-02-01T10:00:00", "2024-01-01T10:00:00"],
+                [[], [{ 'name': "Old Training", 'completion_status': "Complete" }], []],
+                [[], [], []],
+                [[], [], []]
+        ))
+
+        qualifications_handler = QualificationsHandler(table, legacy_table)
+
+        # The latest legacy entry is read
+        event, context = create_get_user_qualifications_event_contex("test1")
+        response = jsonify_response(qualifications_handler.handle_event(event, context))
+        assert response['statusCode'] == 200
+        assert response['body']['last_updated'] == "2024-02-01T10:00:00"
+
+        # Legacy users already exist
+        event, context = create_post_qualifications_event_contex(generate_request_body(
+                "POST", "test1", "2024-03-01T10:00:00", [], [], []))
+        assert qualifications_handler.handle_event(event, context)['statusCode'] == 400
+
+        # Updating a legacy user moves it into the new table
+        event, context = create_patch_user_qualifications_event_contex("test1", {
+            'last_updated': "2024-03-01T10:00:00",
+            'trainings': [{ 'name': "New Training", 'completion_status': "Complete" }],
+        })
+        assert qualifications_handler.handle_event(event, context)['statusCode'] == 204
+
+        # The migration copies the rest, without overwriting the update
+        stats = migrateQualifications(table.meta.client, legacy_table.name, table.name, segments = 4)
+        assert (stats.scanned, stats.copied, stats.skipped) == (3, 1, 1)
+
+        items: dict = {item['user_id']: item for item in get_all_table_items(table)['items']}
+        assert set(items) == {"test1", "test2"}
+        assert items['test1']['last_updated'] == "2024-03-01T10:00:00"
+        assert items['test1']['trainings'] == {"New Training": "Complete", "Old Training": "Complete"}
+        assert items['test2']['trainings'] == {}
+        assert items['test2'][GSI_ATTRIBUTE_NAME] == "1"
+
+
+    def test_patch_qualifications_without_reading(self, get_qualifications_handler):
+        """
+        Tests that patching completable items updates them by name in a single
+        server side update, without reading the entry first.
+        """
+
+        # Get the user handler to use.
+        qualifications_handler, table = get_qualifications_handler
+
+        event, context = create_post_qualifications_event_contex(generate_request_body(
+                "POST", "test1", "2024-01-01T10:00:00",
+                [{ 'name': "Laser Training", 'completion_status': "Incomplete" }], [], []))
+        assert qualifications_handler.handle_event(event, context)['statusCode'] == 201
+
+        # Record the requests the handler makes
+        recording_table = RecordingTable(table)
+        qualifications_handler.qualifications_table = recording_table
+
+        event, context = create_patch_user_qualifications_event_contex("test1", {
+            'last_updated': "2024-02-01T10:00:00",
+            'trainings': [{ 'name': "Laser Training", 'completion_status': "Complete" },
+                          { 'name': "Welding Training", 'completion_status': "Incomplete" }],
+            'waivers': [{ 'name': "Shop Waiver", 'completion_status': "Complete" }],
+        })
+        assert qualifications_handler.handle_event(event, context)['statusCode'] == 204
+
+        assert recording_table.gets == []
+        assert recording_table.queries == []
+
+        event, context = create_get_user_qualifications_event_contex("test1")
+        response = jsonify_response(qualifications_handler.handle_event(event, context))
+
+        assert response['statusCode'] == 200
+        assert response['body']['last_updated'] == "2024-02-01T10:00:00"
+        assert response['body']['trainings'] == [
+            { 'name': "Laser Training", 'completion_status': "Complete" },
+            { 'name': "Welding Training", 'completion_status': "Incomplete" },
+        ]
+        assert response['body']['waivers'] == [{ 'name': "Shop Waiver", 'completion_status': "Complete" }]
+        assert response['body']['miscellaneous'] == []
+
+
+    def test_patch_qualifications_rejects_internal_fields(self, get_qualifications_handler):
+        """
+        Tests that patches can't set the index attributes kept by the api, or
+        a 'last_updated' that isn't a timestamp.
+        """
+
+        # Get the user handler to use.
+        qualifications_handler, table = get_qualifications_handler
+
+        event, context = create_post_qualifications_event_contex(generate_request_body(
+                "POST", "test1", "2024-01-01T10:00:00", [], [], []))
+        assert qualifications_handler.handle_event(event, context)['statusCode'] == 201
+
+        for request_body in [{ GSI_ATTRIBUTE_NAME: "3" }, { BUCKET_ATTRIBUTE_NAME: "2024-01-01" },
+                             { 'last_updated': 5 }]:
+            event, context = create_patch_user_qualifications_event_contex("test1", request_body)
+            response = jsonify_response(qualifications_handler.handle_event(event, context))
+            assert response['statusCode'] == 400
+
+        assert response['body']['errorMsg'] == ("Timestamp 'last_updated' not in the approved format. "
+                                                "Approved format is 'YYYY-MM-DDThh:mm:ss'.")
+
+        # The same message is returned when adding a user
+        event, context = create_post_qualifications_event_contex(generate_request_body(
+                "POST", "test2", "not a timestamp", [], [], []))
+        response = jsonify_response(qualifications_handler.handle_event(event, context))
+        assert response['body']['errorMsg'] == ("Timestamp 'last_updated' not in the approved format. "
+                                                "Approved format is 'YYYY-MM-DDThh:mm:ss'.")
+
+        item: dict = get_all_table_items(table)['items'][0]
+        assert item['last_updated'] == "2024-01-01T10:00:00"
+        assert item[GSI_ATTRIBUTE_NAME] == "1"
+        assert BUCKET_ATTRIBUTE_NAME not in item
+
+
+    def test_patch_many_qualifications(self, get_qualifications_handler):
+        """
+        Tests that many users' qualifications are updated together, and that
+        users without qualifications are reported instead of updated.
+        """
+
+        # Get the user handler to use.
+        qualifications_handler, table = get_qualifications_handler
+
+        for user_id in ["test1", "test2"]:
+            event, context = create_post_qualifications_event_contex(generate_request_body(
+                    "POST", user_id, "2024-01-01T10:00:00", [], [], []))
+            assert qualifications_handler.handle_event(event, context)['statusCode'] == 201
+
+        training: dict = { 'name': "Laser Training", 'completion_status': "Complete" }
+        event = create_rest_http_event(
+            httpMethod = "PATCH",
+            resource = qualifications_path,
+            body = { 'qualifications': [
+                { 'user_id': user_id, 'last_updated': "2024-02-01T10:00:00", 'trainings': [training] }
+                for user_id in ["test1", "missing", "test2"]
+            ]},
+        )
+        response = jsonify_response(qualifications_handler.handle_event(event, None))
+
+        assert response['statusCode'] == 200
+        assert response['body']['not_updated'] == ["missing"]
+
+        items: dict = {item['user_id']: item for item in get_all_table_items(table)['items']}
+        assert set(items) == {"test1", "test2"}
+        for item in items.values():
+            assert item['trainings'] == { "Laser Training": "Complete" }
+            assert item['last_updated'] == "2024-02-01T10:00:00"
+
+        # Invalid updates are reported without holding back the valid ones
+        event = create_rest_http_event(
+            httpMethod = "PATCH",
+            resource = qualifications_path,
+            body = { 'qualifications': [
+                { 'user_id': "test1", 'trainings': [{ 'name': "Welding Training", 'completion_status': "Complete" }] },
+                { 'user_id': "test2", 'trainings': [{ 'name': "Welding Training", 'completion_status': "Done" }] },
+                { 'trainings': [] },
+            ]},
+        )
+        response = jsonify_response(qualifications_handler.handle_event(event, None))
+
+        assert response['statusCode'] == 200
+        assert response['body']['not_updated'] == []
+        assert [failure['user_id'] for failure in response['body']['failed']] == ["test2", None]
+
+        items = {item['user_id']: item for item in get_all_table_items(table)['items']}
+        assert items['test1']['trainings'] == { "Laser Training": "Complete", "Welding Training": "Complete" }
+        assert items['test2']['trainings'] == { "Laser Training": "Complete" }
+
+
+    def test_patch_many_qualifications_after_conflict(self, get_qualifications_handler):
+        """
+        Tests that a batch whose transaction fails as a whole (e.g., on a
+        conflicting transaction) is applied one user at a time instead.
+        """
+
+        # Get the user handler to use.
+        qualifications_handler, table = get_qualifications_handler
+
+        for user_id in ["test1", "test2"]:
+            event, context = create_post_qualifications_event_contex(generate_request_body(
+                    "POST", user_id, "2024-01-01T10:00:00", [], [], []))
+            assert qualifications_handler.handle_event(event, context)['statusCode'] == 201
+
+        def conflict(**kwargs):
+            raise ClientError({ 'Error': { 'Code': "TransactionConflictException", 'Message': "conflict" } },
+                              "TransactWriteItems")
+        table.meta.client.meta.events.register("before-call.dynamodb.TransactWriteItems", conflict)
+
+        training: dict = { 'name': "Laser Training", 'completion_status': "Complete" }
+        event = create_rest_http_event(
+            httpMethod = "PATCH",
+            resource = qualifications_path,
+            body = { 'qualifications': [
+                { 'user_id': user_id, 'last_updated': "2024-02-01T10:00:00", 'trainings': [training] }
+                for user_id in ["test1", "missing", "test2"]
+            ]},
+        )
+        response = jsonify_response(qualifications_handler.handle_event(event, None))
+
+        assert response['statusCode'] == 200
+        assert response['body'] == { 'not_updated': ["missing"], 'failed': [] }
+
+        for item in get_all_table_items(table)['items']:
+            assert item['trainings'] == { "Laser Training": "Complete" }
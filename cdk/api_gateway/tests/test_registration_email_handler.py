@@ -0,0 +1,171 @@
+from moto import mock_aws
+import pytest
+import json
+import time
+
+# Lambda code imports
+from ..lambda_code.registration_email_handler.registration_email_handler import (
+    RegistrationEmailHandler,
+    DEFAULT_REGISTRATION_TEMPLATE_NAME,
+    SENDER,
+    getUserEmail
+)
+from ..lambda_code.api_defaults import (
+    PRIMARY_KEY,
+    SUPPRESSION_TTL_ATTRIBUTE,
+    InMemoryQueue
+)
+
+# Test util imports
+from ..utilsFolder.utils import (
+    create_table,
+    create_ses_client,
+    get_all_table_items,
+    put_all_items_in_table
+)
+
+
+class TestRegistrationEmailHandler():
+    """
+    Tests draining the registration queue: check-ins queue every user who
+    checked in, and the handler emails the ones that aren't registered.
+    """
+
+    @pytest.fixture
+    def get_registration_email_handler(self):
+        """
+        Creates new 'users' and 'reminders' dynamodb tables, an ses client
+        able to send the registration template, and an in memory
+        registration queue, and yields the new RegistrationEmailHandler, its
+        queue, and the list of the SendBulkTemplatedEmail requests it makes.
+
+        :yields: The tuple (handler, InMemoryQueue, list of requests)
+        """
+
+        with mock_aws():
+            users_table = create_table("users", PRIMARY_KEY)
+            put_all_items_in_table(users_table, [{ 'user_id': "registered" }])
+
+            reminders_table = create_table("reminders", PRIMARY_KEY)
+
+            ses = create_ses_client()
+            ses.verify_email_identity(EmailAddress=SENDER)
+
+            # Record the arguments of every bulk email request
+            requests: list[dict] = []
+            ses.meta.events.register("provide-client-params.ses.SendBulkTemplatedEmail",
+                                     lambda params, **kwargs: requests.append(params))
+
+            handler = RegistrationEmailHandler(users_table, reminders_table, ses)
+
+            yield (handler, InMemoryQueue(), requests)
+
+
+    def test_email_unregistered_users(self, get_registration_email_handler):
+        """
+        Tests that a batch of messages is deduped, and each unregistered user
+        is emailed once in a single bulk request.
+        """
+
+        handler, queue, requests = get_registration_email_handler
+        handler.client.create_template(Template={
+            'TemplateName': DEFAULT_REGISTRATION_TEMPLATE_NAME,
+            'SubjectPart': "Clemson University Makerspace Registration",
+            'TextPart': "Hello {{user}},",
+        })
+
+        queue.send([
+            { 'user_id': "registered" },
+            { 'user_id': "new" },
+            { 'user_id': "new" },
+            { 'user_id': "someone@example.com" },
+            { 'not_a_user_id': "new" },
+        ])
+
+        dropped: int = queue.process(handler, batch_size = 10)
+
+        assert dropped == 0
+        assert len(queue) == 0
+
+        assert len(requests) == 1
+        destinations: list = [
+            destination['Destination']['ToAddresses'] for destination in requests[0]['Destinations']
+        ]
+        assert destinations == [["new@clemson.edu"], ["someone@example.com"]]
+        assert json.loads(requests[0]['Destinations'][0]['ReplacementTemplateData']) == { 'user': "new@clemson.edu" }
+
+
+    def test_retry_failed_emails(self, get_registration_email_handler):
+        """
+        Tests that the messages of users whose email failed (here, because
+        the template doesn't exist) are reported back to the queue, and are
+        dropped after being received too many times.
+        """
+
+        handler, queue, requests = get_registration_email_handler
+
+        queue.send([{ 'user_id': "new" }, { 'user_id': "registered" }, { 'user_id': "new" }])
+
+        response: dict = handler.handle_event(queue.receiveEvent(), None)
+        assert response == { 'batchItemFailures': [{ 'itemIdentifier': "1" }, { 'itemIdentifier': "3" }] }
+
+        # Put the failed messages back and let the queue give up on them
+        queue.send([{ 'user_id': "new" }])
+        assert queue.process(handler, max_receives = 2) == 1
+        assert len(requests) == 1 + 2
+
+
+    def test_suppress_repeat_reminders(self, get_registration_email_handler):
+        """
+        Tests that a user reminded within the window isn't emailed (or looked
+        up) again, and is emailed again once the window has passed.
+        """
+
+        handler, queue, requests = get_registration_email_handler
+        handler.client.create_template(Template={
+            'TemplateName': DEFAULT_REGISTRATION_TEMPLATE_NAME,
+            'SubjectPart': "Clemson University Makerspace Registration",
+            'TextPart': "Hello {{user}},",
+        })
+
+        # The reminder is recorded with an expiry for the table's TTL
+        queue.send([{ 'user_id': "daily" }])
+        queue.process(handler)
+        assert len(requests) == 1
+
+        reminders: list = get_all_table_items(handler.reminders.table)['items']
+        assert [reminder['user_id'] for reminder in reminders] == ["daily"]
+        assert int(reminders[0][SUPPRESSION_TTL_ATTRIBUTE]) > time.time()
+
+        # Checking in again within the window sends nothing, and the cached
+        # reminder answers without reading either table
+        lookups: list[dict] = []
+        for table in (handler.users_table, handler.reminders.table):
+            table.meta.client.meta.events.register("provide-client-params.dynamodb.BatchGetItem",
+                                                   lambda params, **kwargs: lookups.append(params))
+        queue.send([{ 'user_id': "daily" }, { 'user_id': "daily" }])
+        queue.process(handler)
+        assert len(requests) == 1
+        assert lookups == []
+
+        # Another container (no cache) reads the stored reminder instead
+        other_handler = RegistrationEmailHandler(handler.users_table, handler.reminders.table, handler.client)
+        assert other_handler.reminders.isSuppressed("daily")
+        assert not other_handler.reminders.isSuppressed("someone_else")
+        assert len(lookups) == 2
+
+        # Once the window passes, the user is reminded again
+        window: float = handler.reminders.window.total_seconds()
+        handler.reminders.clock = lambda: time.time() + window + 1
+        queue.send([{ 'user_id': "daily" }])
+        queue.process(handler)
+        assert len(requests) == 2
+
+
+    def test_get_user_email(self):
+        """
+        Tests that usernames get the university domain.
+        """
+
+        assert getUserEmail("tiger") == "tiger@clemson.edu"
+        assert getUserEmail("tiger@g.clemson.edu") == "tiger@g.clemson.edu"
@@ -0,0 +1,53 @@
+import pytest
+
+# The stack can only be imported where the CDK is installed
+pytest.importorskip("aws_cdk")
+
+from ..shared_api_gateway import (
+    ROUTE_CACHE_TTLS,
+    CACHE_KEY_QUERY_PARAMETERS,
+)
+from ..lambda_code.api_defaults import (
+    VALID_QUERY_PARAMETERS,
+    users_path,
+    users_param_path,
+    visits_path,
+    visits_param_path,
+    visits_stats_path,
+    equipment_path,
+    equipment_param_path,
+    equipment_stats_path,
+    qualifications_path,
+    qualifications_param_path,
+)
+
+
+class TestApiCache():
+    """
+    Tests the response cache settings of the api's GET routes.
+    """
+
+    def test_route_cache_ttls(self):
+        """
+        Tests that only GET routes the handlers serve are cached, for no
+        longer than API Gateway allows (1 hour).
+        """
+
+        get_paths: set = {
+            users_path, users_param_path,
+            visits_path, visits_param_path, visits_stats_path,
+            equipment_path, equipment_param_path, equipment_stats_path,
+            qualifications_path, qualifications_param_path,
+        }
+
+        assert set(ROUTE_CACHE_TTLS) <= get_paths
+        for path, ttl in ROUTE_CACHE_TTLS.items():
+            assert 0 < ttl <= 3600, path
+
+    def test_cache_key_query_parameters(self):
+        """
+        Tests that every query parameter a handler reads is part of the cache
+        key, so requests differing only by it don't share a cached response.
+        """
+
+        assert set(VALID_QUERY_PARAMETERS) <= set(CACHE_KEY_QUERY_PARAMETERS)
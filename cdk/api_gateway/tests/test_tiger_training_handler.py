@@ -0,0 +1,132 @@
+import json
+from moto import mock_aws
+import pytest
+
+# Lambda code imports
+from ..lambda_code.tiger_training_handler.tiger_training_handler import (
+    TigerTrainingHandler,
+    Learner
+)
+from ..lambda_code.qualifications_handler.qualifications_handler import QualificationsHandler
+from ..lambda_code.api_defaults import (
+    PRIMARY_KEY,
+    qualifications_path,
+)
+
+# Test util imports
+from ..utilsFolder.utils import (
+    create_indexed_table,
+    get_all_table_items
+)
+
+
+def create_learner(user_id: str, last_updated: str, *course_names: str) -> Learner:
+    learner = Learner(user_id, last_updated)
+    for name in course_names:
+        learner.add_enrolled_course(name, "Complete")
+
+    return learner
+
+
+class TestTigerTraining():
+    """
+    Tests storing the learners of a Tiger Training sync through the
+    qualifications handler. The handler's lambda invocations are sent to a
+    QualificationsHandler in the same process.
+    """
+
+    @pytest.fixture
+    def get_tiger_training_handler(self, monkeypatch):
+        """
+        Creates a new 'qualifications' dynamodb table and QualificationsHandler,
+        and yields a TigerTrainingHandler whose events are handled by it.
+
+        :yields: The tuple (tiger_training_handler, list of the events sent, dynamodb.Table)
+        """
+
+        for name, value in [("BRIDGE_URL", "https://bridge.test"), ("BRIDGE_KEY", "key"),
+                            ("BRIDGE_SECRET", "secret"), ("BRIDGE_PROGRAM_ID", "1"),
+                            ("QUALIFICATIONS_LAMBDA", "qualifications"),
+                            ("AWS_DEFAULT_REGION", "us-east-1")]:
+            monkeypatch.setenv(name, value)
+
+        with mock_aws():
+            table = create_indexed_table("qualifications", PRIMARY_KEY, "last_updated")
+            qualifications_handler = QualificationsHandler(table)
+
+            tiger_training_handler = TigerTrainingHandler()
+
+            # Send events the way the lambda client would: serialized
+            events: list[dict] = []
+            def send_event_to_lambda(target_lambda: str, event: dict) -> dict:
+                events.append(event)
+                response = qualifications_handler.handle_event(json.loads(json.dumps(event)), None)
+                return json.loads(json.dumps(response))
+            tiger_training_handler.send_event_to_lambda = send_event_to_lambda
+
+            yield (tiger_training_handler, events, table)
+
+
+    def test_sync_learners(self, get_tiger_training_handler):
+        """
+        Tests that existing learners are updated in one batch, new learners
+        are added, and a learner the batch couldn't update is reported
+        without losing the others.
+        """
+
+        tiger_training_handler, events, table = get_tiger_training_handler
+
+        tiger_training_handler.sync_learners([create_learner("test1", "2024-01-01T10:00:00")])
+
+        events.clear()
+        failed: list[str] = tiger_training_handler.sync_learners([
+            create_learner("test1", "2024-02-01T10:00:00", "Laser Training"),
+            create_learner("test2", "2024-02-01T10:00:00", "Shop Waiver"),
+            create_learner("invalid", "not a timestamp", "Laser Training"),
+        ])
+
+        assert failed == ["invalid"]
+        # One batch patch, one post for the new learner, and a patch and post
+        # retrying the invalid one
+        assert [(event['httpMethod'], event['resource']) for event in events] == [
+            ("PATCH", qualifications_path), ("POST", qualifications_path),
+            ("PATCH", "/qualifications/{user_id}"), ("POST", qualifications_path),
+        ]
+
+        items: dict = { item['user_id']: item for item in get_all_table_items(table)['items'] }
+        assert set(items) == {"test1", "test2"}
+        assert items['test1']['trainings'] == { "Laser Training": "Complete" }
+        assert items['test2']['waivers'] == { "Shop Waiver": "Complete" }
+
+
+    def test_sync_learners_after_failed_batch(self, get_tiger_training_handler):
+        """
+        Tests that every learner is patched (or posted) on their own when the
+        batch patch fails as a whole.
+        """
+
+        tiger_training_handler, events, table = get_tiger_training_handler
+
+        tiger_training_handler.sync_learners([create_learner("test1", "2024-01-01T10:00:00")])
+
+        # The batch patch fails (e.g., the qualifications lambda is throttled)
+        send_event_to_lambda = tiger_training_handler.send_event_to_lambda
+        def fail_batch(target_lambda: str, event: dict) -> dict:
+            if event['httpMethod'] == "PATCH" and event['resource'] == qualifications_path:
+                events.append(event)
+                return { 'statusCode': 500, 'body': json.dumps({ 'errorMsg': "Throttled" }) }
+            return send_event_to_lambda(target_lambda, event)
+        tiger_training_handler.send_event_to_lambda = fail_batch
+
+        events.clear()
+        failed: list[str] = tiger_training_handler.sync_learners([
+            create_learner("test1", "2024-02-01T10:00:00", "Laser Training"),
+            create_learner("test2", "2024-02-01T10:00:00", "Laser Training"),
+        ])
+
+        assert failed == []
+        assert [event['httpMethod'] for event in events] == ["PATCH", "PATCH", "PATCH", "POST"]
+
+        for item in get_all_table_items(table)['items']:
+            assert item['trainings'] == { "Laser Training": "Complete" }
+            assert item['last_updated'] == "2024-02-01T10:00:00"
@@ -1,12 +1,19 @@
+from botocore.stub import Stubber
 from moto import mock_aws
+import boto3
 import pytest
+import sys
 
 # Lambda code imports
+from ..lambda_code.users_handler import users_handler as users_handler_module
 from ..lambda_code.users_handler.users_handler import UsersHandler
 from ..lambda_code.api_defaults import (
     PRIMARY_KEY,
     users_path,
     users_param_path,
+    scanTable,
+    scanTablePage,
+    iterateScanTable,
 )
 
 # Test util imports
@@ -15,7 +22,8 @@ from ..utilsFolder.utils import (
     create_rest_http_event,
     jsonify_response,
     get_all_table_items,
-    put_all_items_in_table
+    put_all_items_in_table,
+    RecordingTable
 )
 
 
@@ -92,6 +100,22 @@ def create_get_all_limited_event_contex(limit: int):
 
     return (event, context)
 
+def create_get_all_paged_event_contex(limit: int, next_token: str):
+
+    query_parameters: dict = {
+        'limit': limit,
+        'next_token': next_token,
+    }
+
+    event = create_rest_http_event(
+        httpMethod = "GET",
+        resource = users_path,
+        queryStringParameters=query_parameters,
+    )
+    context = None
+
+    return (event, context)
+
 def create_post_user_event_contex(request_body: dict) -> tuple:
     event = create_rest_http_event(
         httpMethod = "POST",
@@ -102,7 +126,7 @@ def create_post_user_event_contex(request_body: dict) -> tuple:
 
     return (event, context)
 
-def create_get_user_event_contex(user_id: str):
+def create_get_user_event_contex(user_id: str, headers: dict = {}):
 
     path_parameters: dict = {
         'user_id': user_id
@@ -111,7 +135,8 @@ def create_get_user_event_contex(user_id: str):
     event = create_rest_http_event(
         httpMethod = "GET",
         resource = users_param_path,
-        pathParameters = path_parameters
+        pathParameters = path_parameters,
+        headers = headers,
     )
     context = None
 
@@ -270,6 +295,159 @@ class TestUsers():
         assert len(body['users']) <= limit
 
 
+
+    def test_get_all_users_with_next_token(self, get_user_handler):
+        """
+        Tests that following 'next_token' returns every user exactly once.
+        """
+
+        # Get the user handler to use.
+        user_handler, table = get_user_handler
+
+        # Create some test users
+        user_ids: list[str] = ["test1", "test2", "test3"]
+        statuses: list[str] = ["Faculty", "Faculty", "Faculty"]
+        undergrad_classes: list[str] = ["", "", ""]
+        majors: list[str] = ["", "", ""]
+
+        put_items: list[dict] = generate_items(
+                "POST",
+                user_ids,
+                statuses,
+                undergrad_classes,
+                majors
+        )
+
+        # Put them into the table
+        put_all_items_in_table(table, put_items)
+
+        # Keep requesting pages of 2 users until no next_token is returned
+        limit: int = 2
+        event, context = create_get_all_limited_event_contex(limit)
+        returned_user_ids: list[str] = []
+
+        while True:
+            response = user_handler.handle_event(event, context)
+            response = jsonify_response(response)
+
+            assert response['statusCode'] == 200
+            body = response['body']
+            assert len(body['users']) <= limit
+            returned_user_ids += [user['user_id'] for user in body['users']]
+
+            if "next_token" not in body:
+                break
+
+            event, context = create_get_all_paged_event_contex(limit, body['next_token'])
+
+        assert sorted(returned_user_ids) == user_ids
+
+
+    def test_parallel_scan_users(self, get_user_handler):
+        """
+        Tests that a segmented scan returns every user exactly once, both
+        when reading the whole table and when paging through it.
+        """
+
+        # Get the user handler to use.
+        user_handler, table = get_user_handler
+
+        # Create some test users
+        count: int = 20
+        user_ids: list[str] = [f"test{i}" for i in range(count)]
+
+        put_items: list[dict] = generate_items(
+                "POST",
+                user_ids,
+                ["Faculty"] * count,
+                [""] * count,
+                [""] * count
+        )
+
+        # Put them into the table
+        put_all_items_in_table(table, put_items)
+
+        # Read the whole table with 4 segments
+        users: list = scanTable(table, segments = 4)
+        assert sorted(user['user_id'] for user in users) == sorted(user_ids)
+
+        # Page through the table 3 users at a time with 3 segments
+        limit: int = 3
+        users, next_token = scanTablePage(table, limit = limit, segments = 3)
+        returned_user_ids: list[str] = [user['user_id'] for user in users]
+
+        while next_token:
+            users, next_token = scanTablePage(table, limit = limit, next_token = next_token)
+            assert len(users) <= limit
+            returned_user_ids += [user['user_id'] for user in users]
+
+        assert sorted(returned_user_ids) == sorted(user_ids)
+
+    def test_iterate_scan_table_reads_lazily(self, get_user_handler):
+        """
+        Tests that a table is only scanned as its items are iterated over,
+        and that a limit is pushed down into the scan.
+        """
+
+        # Get the users table to use.
+        _, table = get_user_handler
+
+        user_ids: list[str] = ["test1", "test2", "test3"]
+        put_all_items_in_table(table, generate_items("POST", user_ids, ["Faculty"] * 3, [""] * 3, [""] * 3))
+
+        # Record the requests made
+        recording_table = RecordingTable(table)
+
+        # Nothing is scanned until the first item is asked for
+        users = iterateScanTable(recording_table)
+        assert recording_table.scans == []
+
+        assert next(users)['user_id'] in user_ids
+        users.close()
+        assert len(recording_table.scans) == 1
+
+        # A limited scan only asks for the items it yields
+        recording_table.scans.clear()
+        users = list(iterateScanTable(recording_table, limit = 2, fields = ['user_id']))
+        assert len(users) == 2
+        assert len(recording_table.scans) == 1
+        assert recording_table.scans[0]['Limit'] == 2
+
+
+    def test_handler_reused_between_invocations(self, get_user_handler, monkeypatch):
+        """
+        Tests that the module level handler (and the dynamodb table it uses)
+        is created on the first invocation and reused by every invocation
+        after it, the same way a warm lambda container would reuse it.
+        """
+
+        # Get the table to use. Only the table is needed; the module level
+        # handler creates its own UsersHandler.
+        _, table = get_user_handler
+
+        # Start from a cold container
+        api_defaults = sys.modules[users_handler_module.getTable.__module__]
+        monkeypatch.setattr(api_defaults, "_aws_resources", {})
+        monkeypatch.setattr(api_defaults, "_aws_tables", {})
+        monkeypatch.setattr(users_handler_module, "user_handler", None)
+        monkeypatch.setenv("USERS_TABLE_NAME", table.name)
+
+        event, context = create_get_all_event_context()
+
+        # First (cold) invocation
+        response = users_handler_module.handler(event, context)
+        assert response['statusCode'] == 200
+        first_handler = users_handler_module.user_handler
+
+        # Second (warm) invocation
+        response = users_handler_module.handler(event, context)
+        assert response['statusCode'] == 200
+
+        assert users_handler_module.user_handler is first_handler
+        assert first_handler.users_table is api_defaults.getTable("USERS_TABLE_NAME", region_name="us-east-1")
+        assert len(api_defaults._aws_resources) == 1
+
+
     def test_post_new_user_faculty(self, get_user_handler):
         """
         Tests for the successful creation of a new faculty user.
@@ -311,6 +489,33 @@ class TestUsers():
             assert request_body[key] == item[key]
 
 
+    def test_post_existing_user(self, get_user_handler):
+        """
+        Tests that creating a user that already exists fails without
+        overwriting the stored user.
+        """
+
+        # Get the user handler to use.
+        user_handler, table = get_user_handler
+
+        request_body: dict = generate_request_body("POST", "test", university_status="Faculty")
+        event, context = create_post_user_event_contex(request_body)
+        assert user_handler.handle_event(event, context)['statusCode'] == 201
+
+        # Try creating the same user as a graduate student
+        request_body = generate_request_body("POST", "test", university_status="Graduate",
+                                             major="Computer Science")
+        event, context = create_post_user_event_contex(request_body)
+        response = jsonify_response(user_handler.handle_event(event, context))
+
+        assert response['statusCode'] == 400
+        assert "already exists" in response['body']['errorMsg']
+
+        items: list = get_all_table_items(table)['items']
+        assert len(items) == 1
+        assert items[0]['university_status'] == "Faculty"
+
+
     def test_get_user(self, get_user_handler):
         """
         Tests for a successful get response when requesting a specific
@@ -356,6 +561,67 @@ class TestUsers():
         assert body['university_status'] == university_status
 
 
+    def test_get_user_not_modified(self, get_user_handler):
+        """
+        Tests that a get response includes an ETag, that repeating the request
+        with a matching If-None-Match header returns 304 with an empty body,
+        and that changing the user changes the ETag.
+        """
+
+        # Get the user handler to use.
+        user_handler, table = get_user_handler
+
+        # Create the test user
+        user_id: str = "test1"
+
+        put_items: list[dict] = generate_items(
+                "POST",
+                [user_id],
+                ["Faculty"],
+                [""],
+                [""]
+        )
+
+        # Put them into the table
+        put_all_items_in_table(table, put_items)
+
+        # First request gets the full user and its ETag
+        event, context = create_get_user_event_contex(user_id)
+        response = user_handler.handle_event(event, context)
+
+        assert response['statusCode'] == 200
+        etag: str = response['headers']['ETag']
+
+        # Matching (strong or weak) ETags return 304 with no body
+        for if_none_match in [etag, f"W/{etag}", f"\"other\", {etag}", "*"]:
+            event, context = create_get_user_event_contex(user_id, {"If-None-Match": if_none_match})
+            response = user_handler.handle_event(event, context)
+
+            assert response['statusCode'] == 304
+            assert response['body'] == ""
+            assert response['headers']['ETag'] == etag
+
+        # Change the user
+        request_body: dict = generate_request_body(
+                "PATCH",
+                university_status="Graduate",
+                major="Computer Science"
+        )
+        event, context = create_patch_user_event_contex(user_id, request_body)
+        response = user_handler.handle_event(event, context)
+
+        assert response['statusCode'] == 204
+
+        # The old ETag no longer matches
+        event, context = create_get_user_event_contex(user_id, {"If-None-Match": etag})
+        response = user_handler.handle_event(event, context)
+        response = jsonify_response(response)
+
+        assert response['statusCode'] == 200
+        assert response['headers']['ETag'] != etag
+        assert response['body']['university_status'] == "Graduate"
+
+
     def test_patch_user(self, get_user_handler):
         """
         Tests that a patch request updates the matched user's
@@ -412,3 +678,104 @@ class TestUsers():
         assert item['user_id'] == user_id
         assert item['university_status'] == new_university_status
         assert item['major'] == new_major
+
+        # Index attributes kept by the api can't be patched
+        event, context = create_patch_user_event_contex(user_id, { '_ignore': "3" })
+        assert user_handler.handle_event(event, context)['statusCode'] == 400
+
+
+    def test_patch_user_dependent_fields(self, get_user_handler):
+        """
+        Tests that patches are checked against the fields the stored
+        university_status requires and allows, and only change the patched
+        fields.
+        """
+
+        # Get the user handler to use.
+        user_handler, table = get_user_handler
+
+        put_all_items_in_table(table, generate_items(
+                "POST",
+                ["grad", "faculty"],
+                ["Graduate", "Faculty"],
+                ["", ""],
+                ["Computer Science", ""]
+        ))
+
+        # A major is allowed for graduate students
+        event, context = create_patch_user_event_contex("grad", {"major": "Mathematics"})
+        assert user_handler.handle_event(event, context)['statusCode'] == 204
+
+        # But not for faculty
+        event, context = create_patch_user_event_contex("faculty", {"major": "Mathematics"})
+        response = jsonify_response(user_handler.handle_event(event, context))
+        assert response['statusCode'] == 400
+        assert "university_status" in response['body']['errorMsg']
+
+        # Undergraduates need a class, which the graduate user doesn't have
+        event, context = create_patch_user_event_contex("grad", {"university_status": "Undergraduate"})
+        assert user_handler.handle_event(event, context)['statusCode'] == 400
+
+        # Becoming faculty removes the major
+        event, context = create_patch_user_event_contex("grad", {"university_status": "Faculty"})
+        assert user_handler.handle_event(event, context)['statusCode'] == 204
+
+        # Users that don't exist can't be patched
+        event, context = create_patch_user_event_contex("missing", {"major": "Mathematics"})
+        response = jsonify_response(user_handler.handle_event(event, context))
+        assert response['statusCode'] == 400
+        assert "could not be found" in response['body']['errorMsg']
+
+        items: dict = {item['user_id']: item for item in get_all_table_items(table)['items']}
+        assert items['grad'] == {"user_id": "grad", "university_status": "Faculty"}
+        assert items['faculty'] == {"user_id": "faculty", "university_status": "Faculty"}
+
+
+    def test_flush_api_cache(self, get_user_handler, monkeypatch):
+        """
+        Tests that successful writes through API Gateway flush the cache of
+        the stage they came through, and that failed writes, reads, and
+        direct invocations don't flush anything.
+        """
+
+        # Get the user handler to use.
+        user_handler, table = get_user_handler
+
+        put_all_items_in_table(table, generate_items("POST", ["test1"], ["Graduate"], [""], ["Physics"]))
+
+        # Stub the (container wide) apigateway client flushApiCache uses
+        api_defaults = sys.modules[users_handler_module.flushApiCache.__module__]
+        client = boto3.client('apigateway', region_name='us-east-1')
+        monkeypatch.setattr(api_defaults, "_aws_clients", { ('apigateway', None): client })
+
+        request_context: dict = { 'apiId': "abc123", 'stage': "Prod" }
+        request_body: dict = generate_request_body("PATCH", major="Computer Science")
+
+        with Stubber(client) as stubber:
+            # A successful write flushes its stage once
+            stubber.add_response('flush_stage_cache', {},
+                                 { 'restApiId': "abc123", 'stageName': "Prod" })
+            event, context = create_patch_user_event_contex("test1", request_body)
+            event['requestContext'] = request_context
+            assert user_handler.handle_event(event, context)['statusCode'] == 204
+            stubber.assert_no_pending_responses()
+
+            # Any unexpected flush would fail these requests
+            event, context = create_patch_user_event_contex("missing", request_body)
+            event['requestContext'] = request_context
+            assert user_handler.handle_event(event, context)['statusCode'] == 400
+
+            event, context = create_get_user_event_contex("test1")
+            event['requestContext'] = request_context
+            assert user_handler.handle_event(event, context)['statusCode'] == 200
+
+            event, context = create_patch_user_event_contex("test1", request_body)
+            assert user_handler.handle_event(event, context)['statusCode'] == 204
+
+            # A failed flush doesn't fail the write
+            stubber.add_client_error('flush_stage_cache', service_error_code="TooManyRequestsException",
+                                     http_status_code=429)
+            event, context = create_patch_user_event_contex("test1", request_body)
+            event['requestContext'] = request_context
+            assert user_handler.handle_event(event, context)['statusCode'] == 204
+            stubber.assert_no_pending_responses()
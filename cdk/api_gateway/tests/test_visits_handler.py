@@ -1,6 +1,11 @@
 from moto import mock_aws
 import pytest
+import base64
+import gzip
+import json
+import sys
 from datetime import datetime
+from boto3.dynamodb.conditions import Key
 
 # Lambda code imports
 from ..lambda_code.visits_handler.visits_handler import VisitsHandler
@@ -8,19 +13,29 @@ from ..lambda_code.api_defaults import (
     PRIMARY_KEY,
     visits_path,
     visits_param_path,
-    TIMESTAMP_FORMAT
+    visits_batch_path,
+    visits_stats_path,
+    TIMESTAMP_FORMAT,
+    GSI_ATTRIBUTE_NAME,
+    BUCKET_ATTRIBUTE_NAME,
+    TIMESTAMP_BUCKET_INDEX,
+    InMemoryQueue,
+    iteratePages,
+    iterateQueryByKeyExpression
 )
 
 # Test util imports
 from ..utilsFolder.utils import (
-    create_table,
     create_gsi_table,
-    create_ses_client,
+    create_sorted_table,
     create_rest_http_event,
     jsonify_response,
     get_all_table_items,
-    put_all_items_in_table
+    put_all_items_in_table,
+    RecordingTable
 )
+from ..utilsFolder.reshard_timestamp_index import reshardTable
+from ..utilsFolder.rebuild_visit_rollups import countVisitRollups
 
 
 def generate_request_body(user_id: str,
@@ -81,6 +96,33 @@ def create_get_all_limited_event_contex(limit: int):
 
     return (event, context)
 
+def create_get_all_paged_event_contex(limit: int, next_token: str):
+
+    query_parameters: dict = {
+        'limit': limit,
+        'next_token': next_token,
+    }
+
+    event = create_rest_http_event(
+        httpMethod = "GET",
+        resource = visits_path,
+        queryStringParameters=query_parameters,
+    )
+    context = None
+
+    return (event, context)
+
+def create_get_all_encoded_event_contex(headers: dict):
+
+    event = create_rest_http_event(
+        httpMethod = "GET",
+        resource = visits_path,
+        headers = headers,
+    )
+    context = None
+
+    return (event, context)
+
 def create_post_visit_event_contex(request_body: dict) -> tuple:
     event = create_rest_http_event(
         httpMethod = "POST",
@@ -124,8 +166,8 @@ class TestVisits():
     @pytest.fixture
     def get_visit_handler(self):
         """
-        Creates a new 'visits' and 'users' dynamodb tables, creates
-        an ses client, and provides all of these resources to a
+        Creates new 'visits' and 'visit_rollups' dynamodb tables, creates an
+        in memory registration queue, and provides these resources to a
         VisitsHandler, and yields the new VisitsHandler and visits table
         to the test function. Yielding allows for the table to persist
         through to the test function; otherwise, the mock_aws
@@ -147,17 +189,16 @@ class TestVisits():
         """
 
         with mock_aws():
-            # Instantiate users table, visits table, ses client, and handler
-            users_table_name: str = "users"
-            users_table = create_table(users_table_name, PRIMARY_KEY)
-
+            # Instantiate visits table, rollups table, registration queue, and handler
             visits_table_name: str = "visits"
             visits_table = create_gsi_table(visits_table_name, PRIMARY_KEY, "timestamp")
 
-            ses = create_ses_client()
+            visit_rollups_table = create_sorted_table("visit_rollups", "location", "day")
+
+            registration_queue = InMemoryQueue()
 
-            # Setup the users handler
-            visit_handler = VisitsHandler(visits_table, users_table, ses)
+            # Setup the visits handler
+            visit_handler = VisitsHandler(visits_table, visit_rollups_table, registration_queue)
 
             yield (visit_handler, visits_table)
 
@@ -247,6 +288,320 @@ class TestVisits():
         assert len(body['visits']) <= limit
 
 
+    def test_get_all_visits_with_next_token(self, get_visit_handler):
+        """
+        Tests that a limited response includes a 'next_token' that can be
+        used to get the remaining visits, and that the last page has no
+        'next_token'.
+        """
+
+        # Get the visit handler to use.
+        visit_handler, visits_table = get_visit_handler
+
+        # Create some test visits
+        user_ids: list[str] = ["test1", "test2", "test3"]
+        timestamps: list[str] = [
+            "2024-01-01T10:00:00",
+            "2024-01-02T10:00:00",
+            "2024-01-03T10:00:00",
+        ]
+        locations: list[str] = ["Watt", "Watt", "Cooper"]
+
+        put_items: list[dict] = generate_items(
+                user_ids,
+                timestamps,
+                locations,
+        )
+
+        # Items need the GSI attribute to be found through the TimestampIndex
+        for item in put_items:
+            item[GSI_ATTRIBUTE_NAME] = "1"
+
+        # Put them into the table
+        put_all_items_in_table(visits_table, put_items)
+
+        # Get the first page of visits
+        limit: int = 2
+        event, context = create_get_all_limited_event_contex(limit)
+
+        response = visit_handler.handle_event(event, context)
+        response = jsonify_response(response)
+
+        statusCode = response['statusCode']
+        body = response['body']
+
+        assert statusCode == 200
+        assert len(body['visits']) == limit
+        assert "next_token" in body
+
+        # Get the second page using the returned token
+        event, context = create_get_all_paged_event_contex(limit, body['next_token'])
+
+        response = visit_handler.handle_event(event, context)
+        response = jsonify_response(response)
+
+        statusCode = response['statusCode']
+        next_body = response['body']
+
+        assert statusCode == 200
+        assert len(next_body['visits']) == 1
+        assert "next_token" not in next_body
+
+        # Pages should be in descending timestamp order without repeats
+        returned_timestamps: list[str] = [visit['timestamp'] for visit in body['visits'] + next_body['visits']]
+        assert returned_timestamps == sorted(timestamps, reverse=True)
+
+
+    def test_get_all_visits_pushes_down_limit(self, get_visit_handler):
+        """
+        Tests that a limited request only asks DynamoDB for the number of
+        visits it needs, in a single query.
+        """
+
+        # Get the visit handler to use.
+        visit_handler, visits_table = get_visit_handler
+
+        # Create some test visits
+        user_ids: list[str] = ["test1", "test2", "test3"]
+        timestamps: list[str] = [
+            "2024-01-01T10:00:00",
+            "2024-01-02T10:00:00",
+            "2024-01-03T10:00:00",
+        ]
+        locations: list[str] = ["Watt", "Watt", "Cooper"]
+
+        put_items: list[dict] = generate_items(
+                user_ids,
+                timestamps,
+                locations,
+        )
+
+        # Items need the GSI attribute to be found through the TimestampIndex
+        for item in put_items:
+            item[GSI_ATTRIBUTE_NAME] = "1"
+
+        # Put them into the table
+        put_all_items_in_table(visits_table, put_items)
+
+        # Record the requests the handler makes
+        recording_table = RecordingTable(visits_table)
+        visit_handler.visits_table = recording_table
+
+        event, context = create_get_all_limited_event_contex(1)
+
+        response = visit_handler.handle_event(event, context)
+        response = jsonify_response(response)
+
+        assert response['statusCode'] == 200
+        assert [visit['timestamp'] for visit in response['body']['visits']] == ["2024-01-03T10:00:00"]
+
+        # Only one query asking for one item should have been made
+        assert len(recording_table.queries) == 1
+        assert recording_table.queries[0]['Limit'] == 1
+
+
+    def test_iterate_pages_reads_lazily(self, get_visit_handler):
+        """
+        Tests that pages (and the items of a query) are only read as they
+        are iterated over, so stopping early stops reading.
+        """
+
+        # Get the visits table to use.
+        _, visits_table = get_visit_handler
+
+        timestamps: list[str] = [f"2024-01-0{day}T10:00:00" for day in range(1, 6)]
+        put_all_items_in_table(visits_table, generate_items(["test1"] * 5, timestamps, ["Watt"] * 5))
+
+        # Record the requests made
+        recording_table = RecordingTable(visits_table)
+        key_expression = Key('user_id').eq("test1")
+        read = lambda **kwargs: recording_table.query(KeyConditionExpression=key_expression, **kwargs)
+
+        # Nothing is read until the first page is asked for
+        pages = iteratePages(read, page_size = 2)
+        assert recording_table.queries == []
+
+        assert len(next(pages).items) == 2
+        assert len(recording_table.queries) == 1
+
+        # The second page is read when it is reached, starting after the first
+        assert len(next(pages).items) == 2
+        assert len(recording_table.queries) == 2
+        assert 'ExclusiveStartKey' in recording_table.queries[1]
+
+        # Stopping early never reads the last page
+        pages.close()
+        assert len(recording_table.queries) == 2
+
+        # Iterating over every page reads until no items remain
+        recording_table.queries.clear()
+        assert [len(page.items) for page in iteratePages(read, page_size = 2)] == [2, 2, 1]
+        assert len(recording_table.queries) == 3
+
+        # Items are queried (newest first) only once the first one is asked for
+        recording_table.queries.clear()
+        visits = iterateQueryByKeyExpression(recording_table, key_expression)
+        assert recording_table.queries == []
+        assert next(visits)['timestamp'] == "2024-01-05T10:00:00"
+        visits.close()
+        assert len(recording_table.queries) == 1
+
+        # A limit is pushed down into the single query made
+        recording_table.queries.clear()
+        visits = list(iterateQueryByKeyExpression(recording_table, key_expression, limit = 2))
+        assert [visit['timestamp'] for visit in visits] == ["2024-01-05T10:00:00", "2024-01-04T10:00:00"]
+        assert len(recording_table.queries) == 1
+        assert recording_table.queries[0]['Limit'] == 2
+
+
+    def test_get_all_visits_hydrates_in_batches(self, get_visit_handler):
+        """
+        Tests that a sorted request for more visits than fit in one batched
+        lookup returns every full visit in descending timestamp order.
+        """
+
+        # Get the visit handler to use.
+        visit_handler, visits_table = get_visit_handler
+
+        # Create more visits than a single BatchGetItem request can hold
+        count: int = 150
+        user_ids: list[str] = [f"test{i}" for i in range(count)]
+        timestamps: list[str] = [f"2024-01-01T10:{i // 60:02d}:{i % 60:02d}" for i in range(count)]
+        locations: list[str] = ["Watt"] * count
+
+        put_items: list[dict] = generate_items(
+                user_ids,
+                timestamps,
+                locations,
+        )
+
+        # Items need the GSI attribute to be found through the TimestampIndex
+        for item in put_items:
+            item[GSI_ATTRIBUTE_NAME] = "1"
+
+        # Put them into the table
+        put_all_items_in_table(visits_table, put_items)
+
+        event, context = create_get_all_limited_event_contex(count)
+
+        response = visit_handler.handle_event(event, context)
+        response = jsonify_response(response)
+
+        statusCode = response['statusCode']
+        body = response['body']
+
+        assert statusCode == 200
+        assert len(body['visits']) == count
+        assert [visit['timestamp'] for visit in body['visits']] == sorted(timestamps, reverse=True)
+        for visit in body['visits']:
+            assert visit['location'] == "Watt"
+
+
+    def test_get_all_visits_with_invalid_next_token(self, get_visit_handler):
+        """
+        Tests that a malformed 'next_token' is rejected with a 400.
+        """
+
+        # Get the visit handler to use.
+        visit_handler, visits_table = get_visit_handler
+
+        event, context = create_get_all_paged_event_contex(1, "not a token")
+
+        response = visit_handler.handle_event(event, context)
+
+        assert response['statusCode'] == 400
+
+
+    def test_get_all_visits_compressed(self, get_visit_handler):
+        """
+        Tests that large responses are gzip compressed (and base64 encoded)
+        when the request accepts gzip and a binary media type, and are left
+        uncompressed otherwise.
+        """
+
+        # Get the visit handler to use.
+        visit_handler, visits_table = get_visit_handler
+
+        # Create enough test visits to pass the compression threshold
+        count: int = 100
+        user_ids: list[str] = [f"test{i}" for i in range(count)]
+        timestamps: list[str] = [f"2024-01-01T10:00:{i % 60:02d}" for i in range(count)]
+        locations: list[str] = ["Watt"] * count
+
+        put_items: list[dict] = generate_items(
+                user_ids,
+                timestamps,
+                locations,
+        )
+
+        # Put them into the table
+        put_all_items_in_table(visits_table, put_items)
+
+        # Request a compressed response
+        headers: dict = {
+            "accept": "application/json",
+            "Accept-Encoding": "gzip, deflate",
+        }
+        event, context = create_get_all_encoded_event_contex(headers)
+
+        response = visit_handler.handle_event(event, context)
+
+        assert response['statusCode'] == 200
+        assert response['isBase64Encoded'] == True
+        assert response['headers']['Content-Encoding'] == "gzip"
+        assert response['headers']['ETag'].endswith('-gzip"')
+
+        body: dict = json.loads(gzip.decompress(base64.b64decode(response['body'])))
+        assert len(body['visits']) == count
+
+        # The compressed ETag is still accepted by If-None-Match
+        event, context = create_get_all_encoded_event_contex({**headers, "If-None-Match": response['headers']['ETag']})
+        response = visit_handler.handle_event(event, context)
+
+        assert response['statusCode'] == 304
+
+        # API Gateway won't decode the body for other Accept types
+        headers["accept"] = "*/*"
+        event, context = create_get_all_encoded_event_contex(headers)
+
+        response = visit_handler.handle_event(event, context)
+        response = jsonify_response(response)
+
+        assert response['statusCode'] == 200
+        assert "isBase64Encoded" not in response
+        assert "Content-Encoding" not in response['headers']
+        assert len(response['body']['visits']) == count
+
+
+    def test_post_base64_encoded_visit(self, get_visit_handler):
+        """
+        Tests that base64 encoded request bodies (sent by API Gateway for
+        binary media types) are decoded before being handled.
+        """
+
+        # Get the visit handler to use.
+        visit_handler, visits_table = get_visit_handler
+
+        request_body: dict = generate_request_body(
+                "test",
+                datetime.now().strftime(TIMESTAMP_FORMAT),
+                "Watt"
+        )
+
+        # Encode the body the way API Gateway would
+        event, context = create_post_visit_event_contex(request_body)
+        event['body'] = base64.b64encode(event['body'].encode()).decode()
+        event['isBase64Encoded'] = True
+
+        response = visit_handler.handle_event(event, context)
+
+        assert response['statusCode'] == 201
+
+        items: list = get_all_table_items(visits_table)['items']
+        assert len(items) == 1
+        assert items[0]["user_id"] == "test"
+
+
     def test_post_new_visit(self, get_visit_handler):
         """
         Tests for the successful creation of a new visit.
@@ -289,6 +644,67 @@ class TestVisits():
             assert key in item
             assert request_body[key] == item[key]
 
+        # The user is queued for a registration check instead of looked up
+        queued: list = visit_handler.registration_queue.messages
+        assert [json.loads(message['body']) for message in queued] == [{ 'user_id': user_id }]
+
+
+    def test_post_duplicate_visit(self, get_visit_handler):
+        """
+        Tests that posting a visit that already exists is rejected with a
+        single conditional write, leaving the stored visit untouched.
+        """
+
+        # Get the visit handler to use.
+        visit_handler, visits_table = get_visit_handler
+
+        timestamp: str = datetime.now().strftime(TIMESTAMP_FORMAT)
+        event, context = create_post_visit_event_contex(generate_request_body("test", timestamp, "Watt"))
+        assert visit_handler.handle_event(event, context)['statusCode'] == 201
+
+        # Record the requests the handler makes
+        recording_table = RecordingTable(visits_table)
+        visit_handler.visits_table = recording_table
+
+        # Same user and timestamp, different location
+        event, context = create_post_visit_event_contex(generate_request_body("test", timestamp, "Cooper"))
+        response = jsonify_response(visit_handler.handle_event(event, context))
+
+        assert response['statusCode'] == 400
+        assert "already exists" in response['body']['errorMsg']
+
+        # Nothing should have been read before writing
+        assert recording_table.gets == []
+
+        items: list = get_all_table_items(visits_table)['items']
+        assert len(items) == 1
+        assert items[0]['location'] == "Watt"
+
+
+    @pytest.mark.parametrize("timestamp", [
+        "2023-02-29T10:00:00",
+        "2024-04-31T10:00:00",
+        "2024-01-01T24:00:00",
+        "2024-01-01 10:00:00",
+        "2024-1-01T10:00:00",
+    ])
+    def test_post_visit_with_invalid_timestamp(self, get_visit_handler, timestamp):
+        """
+        Tests that visits with malformed or impossible timestamps are rejected
+        without being stored.
+        """
+
+        # Get the visit handler to use.
+        visit_handler, visits_table = get_visit_handler
+
+        request_body: dict = generate_request_body("test", timestamp, "Watt")
+        event, context = create_post_visit_event_contex(request_body)
+
+        response = visit_handler.handle_event(event, context)
+
+        assert response['statusCode'] == 400
+        assert get_all_table_items(visits_table)['items'] == []
+
 
     def test_get_user_visits(self, get_visit_handler):
         """
@@ -334,3 +750,485 @@ class TestVisits():
         assert visit['user_id'] == user_id
         assert visit['timestamp'] == timestamp
         assert visit['location'] == location
+
+
+    def test_get_all_visits_from_sharded_index(self, get_visit_handler, monkeypatch):
+        """
+        Tests that visits spread over the shards of the TimestampIndex are
+        paged through in descending timestamp order, without repeats.
+        """
+
+        # Get the visit handler to use, with a sharded TimestampIndex
+        visit_handler, visits_table = get_visit_handler
+        monkeypatch.setenv("TIMESTAMP_INDEX_SHARDS", "4")
+        visit_handler = VisitsHandler(visits_table, visit_handler.visit_rollups_table, visit_handler.registration_queue)
+
+        # Create some test visits, written to their shards
+        timestamps: list[str] = [f"2024-01-{day:02d}T10:00:00" for day in range(1, 11)]
+        put_items: list[dict] = generate_items(
+                [f"test{i % 3}" for i in range(len(timestamps))],
+                timestamps,
+                ["Watt"] * len(timestamps),
+        )
+        for item in put_items:
+            item[GSI_ATTRIBUTE_NAME] = visit_handler.timestamp_index.shardKey(item)
+
+        assert len({ item[GSI_ATTRIBUTE_NAME] for item in put_items }) > 1
+
+        put_all_items_in_table(visits_table, put_items)
+
+        # Page through every visit
+        returned_timestamps: list[str] = []
+        event, context = create_get_all_limited_event_contex(3)
+        while True:
+            response = jsonify_response(visit_handler.handle_event(event, context))
+
+            assert response['statusCode'] == 200
+            assert len(response['body']['visits']) <= 3
+            returned_timestamps += [visit['timestamp'] for visit in response['body']['visits']]
+
+            if "next_token" not in response['body']:
+                break
+            event, context = create_get_all_paged_event_contex(3, response['body']['next_token'])
+
+        assert returned_timestamps == sorted(timestamps, reverse=True)
+
+        # Time ranges are applied to every shard
+        event = create_rest_http_event(
+            httpMethod = "GET",
+            resource = visits_path,
+            queryStringParameters = { 'start_timestamp': "2024-01-05T00:00:00", 'limit': 4 },
+        )
+        response = jsonify_response(visit_handler.handle_event(event, None))
+
+        assert [visit['timestamp'] for visit in response['body']['visits']] == sorted(timestamps, reverse=True)[:4]
+
+        # A token can't be used with a different number of shards
+        monkeypatch.setenv("TIMESTAMP_INDEX_SHARDS", "2")
+        other_handler = VisitsHandler(visits_table, visit_handler.visit_rollups_table, visit_handler.registration_queue)
+        event, context = create_get_all_paged_event_contex(3, response['body']['next_token'])
+
+        assert other_handler.handle_event(event, context)['statusCode'] == 400
+
+
+    def test_reshard_timestamp_index(self, get_visit_handler, monkeypatch):
+        """
+        Tests that visits written before the TimestampIndex was sharded stay
+        readable, and are moved to their shards by the backfill.
+        """
+
+        # Get the visit handler to use, with a sharded TimestampIndex
+        visit_handler, visits_table = get_visit_handler
+        monkeypatch.setenv("TIMESTAMP_INDEX_SHARDS", "4")
+        visit_handler = VisitsHandler(visits_table, visit_handler.visit_rollups_table, visit_handler.registration_queue)
+
+        # Create some unsharded test visits
+        timestamps: list[str] = [f"2024-01-{day:02d}T10:00:00" for day in range(1, 9)]
+        put_items: list[dict] = generate_items(
+                [f"test{i}" for i in range(len(timestamps))],
+                timestamps,
+                ["Watt"] * len(timestamps),
+        )
+        for item in put_items:
+            item[GSI_ATTRIBUTE_NAME] = "1"
+
+        # A visit that isn't indexed at all is left alone
+        put_all_items_in_table(visits_table, put_items + [{ 'user_id': "other", 'timestamp': "2024-02-01T10:00:00", 'location': "Watt" }])
+
+        event, context = create_get_all_limited_event_contex(100)
+        response = jsonify_response(visit_handler.handle_event(event, context))
+        assert [visit['timestamp'] for visit in response['body']['visits']] == sorted(timestamps, reverse=True)
+
+        # Move every visit to its shard
+        stats = reshardTable(visits_table.meta.client, "visits", "timestamp", 4, segments = 2)
+
+        shards: list[str] = [visit_handler.timestamp_index.shardKey(item) for item in put_items]
+        assert stats.scanned == len(put_items)
+        assert stats.moved == len([shard for shard in shards if shard != "1"])
+
+        items: dict = { item['user_id']: item for item in get_all_table_items(visits_table)['items'] }
+        for item, shard in zip(put_items, shards):
+            assert items[item['user_id']][GSI_ATTRIBUTE_NAME] == shard
+        assert GSI_ATTRIBUTE_NAME not in items["other"]
+
+        response = jsonify_response(visit_handler.handle_event(event, context))
+        assert [visit['timestamp'] for visit in response['body']['visits']] == sorted(timestamps, reverse=True)
+
+        # Running it again moves nothing
+        assert reshardTable(visits_table.meta.client, "visits", "timestamp", 4, segments = 2).moved == 0
+
+        # Backfilling the day buckets puts every indexed visit in one
+        stats = reshardTable(visits_table.meta.client, "visits", "timestamp", 4, segments = 2,
+                             bucket_length = 10)
+        assert stats.moved == len(put_items)
+
+        items = { item['user_id']: item for item in get_all_table_items(visits_table)['items'] }
+        for item in put_items:
+            assert items[item['user_id']][BUCKET_ATTRIBUTE_NAME] == item['timestamp'][:10]
+        assert BUCKET_ATTRIBUTE_NAME not in items["other"]
+
+
+    def test_get_visits_by_day_buckets(self, get_visit_handler, monkeypatch):
+        """
+        Tests that a date range is read from just the day buckets covering
+        it, newest first, and can be paged through.
+        """
+
+        # Get the visit handler to use, reading date ranges by day
+        visit_handler, visits_table = get_visit_handler
+        monkeypatch.setenv("TIMESTAMP_INDEX_SHARDS", "4")
+        monkeypatch.setenv("TIMESTAMP_BUCKET_READS", "1")
+        visit_handler = VisitsHandler(visits_table, visit_handler.visit_rollups_table, visit_handler.registration_queue)
+
+        # Create two visits a day for two weeks, written to their shards and buckets
+        timestamps: list[str] = [f"2024-03-{day:02d}T{hour}:00:00" for day in range(1, 15) for hour in (9, 15)]
+        put_items: list[dict] = generate_items(
+                [f"test{i % 5}" for i in range(len(timestamps))],
+                timestamps,
+                ["Watt"] * len(timestamps),
+        )
+        for item in put_items:
+            item.update(visit_handler.timestamp_index.indexAttributes(item))
+
+        assert put_items[0][BUCKET_ATTRIBUTE_NAME] == "2024-03-01"
+
+        put_all_items_in_table(visits_table, put_items)
+
+        # Record the partitions every query reads
+        queried_buckets: list[str] = []
+        def record_query(params, **kwargs):
+            request: dict = json.loads(params['body'])
+            if request.get('IndexName') == TIMESTAMP_BUCKET_INDEX:
+                queried_buckets.append(request['ExpressionAttributeValues'][':v0']['S'])
+        visits_table.meta.client.meta.events.register('before-call.dynamodb.Query', record_query)
+
+        # Page through one week of visits
+        expected: list[str] = sorted([timestamp for timestamp in timestamps
+                                      if "2024-03-04" <= timestamp <= "2024-03-10T23:59:59"], reverse=True)
+        query_parameters: dict = {
+            'start_timestamp': "2024-03-04T00:00:00",
+            'end_timestamp': "2024-03-10T23:59:59",
+            'limit': 3,
+        }
+        returned_timestamps: list[str] = []
+        while True:
+            event = create_rest_http_event(
+                httpMethod = "GET",
+                resource = visits_path,
+                queryStringParameters = query_parameters,
+            )
+            response = jsonify_response(visit_handler.handle_event(event, None))
+
+            assert response['statusCode'] == 200
+            returned_timestamps += [visit['timestamp'] for visit in response['body']['visits']]
+
+            if "next_token" not in response['body']:
+                break
+            query_parameters['next_token'] = response['body']['next_token']
+
+        assert returned_timestamps == expected
+
+        # Only the days in the range were read
+        assert set(queried_buckets) == { f"2024-03-{day:02d}" for day in range(4, 11) }
+
+        # A single day is a single bucket
+        queried_buckets.clear()
+        event = create_rest_http_event(
+            httpMethod = "GET",
+            resource = visits_path,
+            queryStringParameters = { 'start_timestamp': "2024-03-02T12:00:00", 'end_timestamp': "2024-03-02T23:59:59" },
+        )
+        response = jsonify_response(visit_handler.handle_event(event, None))
+
+        assert [visit['timestamp'] for visit in response['body']['visits']] == ["2024-03-02T15:00:00"]
+        assert queried_buckets == ["2024-03-02"]
+
+        # Open ended ranges still read the TimestampIndex
+        queried_buckets.clear()
+        event = create_rest_http_event(
+            httpMethod = "GET",
+            resource = visits_path,
+            queryStringParameters = { 'start_timestamp': "2024-03-13T00:00:00" },
+        )
+        response = jsonify_response(visit_handler.handle_event(event, None))
+
+        assert len(response['body']['visits']) == 4
+        assert queried_buckets == []
+
+
+    def test_iterate_sharded_index_reads_lazily(self, get_visit_handler, monkeypatch):
+        """
+        Tests that the shards (and buckets) of the TimestampIndex are only
+        read as their items are iterated over.
+        """
+
+        # Get the visit handler to use, with a sharded and bucketed TimestampIndex
+        visit_handler, visits_table = get_visit_handler
+        monkeypatch.setenv("TIMESTAMP_INDEX_SHARDS", "4")
+        monkeypatch.setenv("TIMESTAMP_BUCKET_READS", "1")
+        visit_handler = VisitsHandler(visits_table, visit_handler.visit_rollups_table, visit_handler.registration_queue)
+        timestamp_index = visit_handler.timestamp_index
+
+        # The handler's ShardedIndex is only recognized by the handler's own
+        # copy of api_defaults
+        api_defaults = sys.modules[type(timestamp_index).__module__]
+
+        # Create two visits a day for a week, written to their shards and buckets
+        timestamps: list[str] = [f"2024-03-{day:02d}T{hour:02d}:00:00" for day in range(1, 8) for hour in (9, 15)]
+        put_items: list[dict] = generate_items(
+                [f"test{i}" for i in range(len(timestamps))],
+                timestamps,
+                ["Watt"] * len(timestamps),
+        )
+        for item in put_items:
+            item.update(timestamp_index.indexAttributes(item))
+
+        put_all_items_in_table(visits_table, put_items)
+
+        expected: list[str] = sorted(timestamps, reverse=True)
+        users: dict = { item['timestamp']: item['user_id'] for item in put_items }
+
+        # Record the requests made
+        recording_table = RecordingTable(visits_table)
+
+        # Nothing is read until the first item is asked for, and then only
+        # the first page of every shard
+        visits = api_defaults.iterateQueryByKeyExpression(recording_table, None, GSI = timestamp_index, limit = 2)
+        assert recording_table.queries == []
+
+        assert next(visits)['timestamp'] == expected[0]
+        assert len(recording_table.queries) == timestamp_index.shards
+
+        # The shards are merged in descending order as they are read
+        assert [visit['timestamp'] for visit in visits] == expected[1:2]
+        assert len(recording_table.queries) == timestamp_index.shards
+
+        # Every shard is read until no items remain, even when the fields
+        # projected leave out the timestamp the shards are merged by
+        recording_table.queries.clear()
+        visits = list(api_defaults.iterateQueryByKeyExpression(recording_table, None, GSI = timestamp_index,
+                                                  fields = [PRIMARY_KEY]))
+
+        assert visits == [{ PRIMARY_KEY: users[timestamp] } for timestamp in expected]
+
+        visits, _ = api_defaults.queryPageByKeyExpression(visits_table, None, GSI = timestamp_index,
+                                                          limit = 3, fields = [PRIMARY_KEY])
+
+        assert visits == [{ PRIMARY_KEY: users[timestamp] } for timestamp in expected[:3]]
+
+        # Resumes from a page of the shards
+        _, next_token = api_defaults.queryPageByKeyExpression(visits_table, None, GSI = timestamp_index, limit = 5)
+        visits = api_defaults.iterateQueryByKeyExpression(visits_table, None, GSI = timestamp_index, next_token = next_token)
+
+        assert [visit['timestamp'] for visit in visits] == expected[5:]
+
+        # A bounded range reads one bucket at a time, newest first, and stops
+        # querying buckets once the limit is met
+        recording_table.queries.clear()
+        key_expression = Key('timestamp').between("2024-03-02T00:00:00", "2024-03-05T23:59:59")
+        visits = api_defaults.iterateQueryByKeyExpression(recording_table, key_expression, GSI = timestamp_index, limit = 3)
+
+        assert next(visits)['timestamp'] == "2024-03-05T15:00:00"
+        assert len(recording_table.queries) == 1
+
+        assert [visit['timestamp'] for visit in visits] == ["2024-03-05T09:00:00", "2024-03-04T15:00:00"]
+        assert len(recording_table.queries) == 2
+        assert recording_table.queries[1]['Limit'] == 1
+
+        # Resumes from a page of the buckets
+        _, next_token = api_defaults.queryPageByKeyExpression(visits_table, key_expression, GSI = timestamp_index, limit = 3)
+        visits = api_defaults.iterateQueryByKeyExpression(visits_table, key_expression, GSI = timestamp_index, next_token = next_token)
+
+        assert [visit['timestamp'] for visit in visits] == [timestamp for timestamp in expected
+                                                            if "2024-03-02" <= timestamp < "2024-03-04T15"]
+
+
+    def test_post_visits_batch(self, get_visit_handler):
+        """
+        Tests that a batch of visits is validated and added in one request,
+        with a status for each visit, and that each user who checked in is
+        queued for a registration check once.
+        """
+
+        # Get the visit handler to use.
+        visit_handler, visits_table = get_visit_handler
+
+        # test1 already has a visit
+        put_all_items_in_table(visits_table, [generate_request_body("test1", "2024-01-01T09:00:00", "Cooper")])
+
+        visits: list = [
+            generate_request_body("test1", "2024-01-01T10:00:00", "Watt"),
+            generate_request_body("test2", "2024-01-01T10:00:00", "Watt"),
+            generate_request_body("test2", "2024-01-01T10:05:00", "Watt"),
+            generate_request_body("test3", "2024-01-01T10:00:00", "Nowhere"),
+            generate_request_body("test1", "2024-01-01T09:00:00", "Watt"),
+            generate_request_body("test2", "2024-01-01T10:05:00", "Watt"),
+            "test4",
+        ]
+        event = create_rest_http_event(
+            httpMethod = "POST",
+            resource = visits_batch_path,
+            body = { 'visits': visits },
+        )
+        response = jsonify_response(visit_handler.handle_event(event, None))
+
+        assert response['statusCode'] == 200
+        statuses: list[dict] = response['body']['visits']
+        assert [status['statusCode'] for status in statuses] == [201, 201, 201, 400, 400, 400, 400]
+        assert statuses[1] == { 'user_id': "test2", 'timestamp': "2024-01-01T10:00:00", 'statusCode': 201 }
+        assert "already exists" in statuses[4]['errorMsg']
+        assert "more than once" in statuses[5]['errorMsg']
+
+        # Only the new visits were added, and the existing one is untouched
+        items: dict = { (item['user_id'], item['timestamp']): item for item in get_all_table_items(visits_table)['items'] }
+        assert set(items) == {
+            ("test1", "2024-01-01T09:00:00"),
+            ("test1", "2024-01-01T10:00:00"),
+            ("test2", "2024-01-01T10:00:00"),
+            ("test2", "2024-01-01T10:05:00"),
+        }
+        assert items[("test1", "2024-01-01T09:00:00")]['location'] == "Cooper"
+        assert items[("test2", "2024-01-01T10:05:00")][GSI_ATTRIBUTE_NAME] == "1"
+
+        # Each user with a new visit is queued once
+        queued: list = [json.loads(message['body']) for message in visit_handler.registration_queue.messages]
+        assert queued == [{ 'user_id': "test1" }, { 'user_id': "test2" }]
+
+        # Empty (or missing) batches are rejected
+        event = create_rest_http_event(httpMethod = "POST", resource = visits_batch_path, body = { 'visits': [] })
+        assert visit_handler.handle_event(event, None)['statusCode'] == 400
+
+        # User ids that aren't strings are rejected per visit
+        visits = [
+            generate_request_body(["test5"], "2024-01-02T10:00:00", "Watt"),
+            generate_request_body({ 'id': "test5" }, "2024-01-02T10:00:00", "Watt"),
+        ]
+        event = create_rest_http_event(httpMethod = "POST", resource = visits_batch_path, body = { 'visits': visits })
+        response = jsonify_response(visit_handler.handle_event(event, None))
+
+        assert response['statusCode'] == 200
+        assert [status['statusCode'] for status in response['body']['visits']] == [400, 400]
+
+
+    def test_post_visits_batch_after_concurrent_write(self, get_visit_handler):
+        """
+        Tests that a visit another request adds while a batch is being
+        written is reported as existing instead of being overwritten (and
+        counted twice).
+        """
+
+        # Get the visit handler to use.
+        visit_handler, visits_table = get_visit_handler
+
+        # Another request adds test2's visit right before the batch is written
+        def add_visit(**kwargs):
+            visits_table.meta.client.meta.events.unregister('before-call.dynamodb.TransactWriteItems', add_visit)
+            visits_table.put_item(Item = generate_request_body("test2", "2024-01-01T10:00:00", "Cooper"))
+        visits_table.meta.client.meta.events.register('before-call.dynamodb.TransactWriteItems', add_visit)
+
+        visits: list = [
+            generate_request_body("test1", "2024-01-01T10:00:00", "Watt"),
+            generate_request_body("test2", "2024-01-01T10:00:00", "Watt"),
+            generate_request_body("test3", "2024-01-01T10:00:00", "Watt"),
+        ]
+        event = create_rest_http_event(httpMethod = "POST", resource = visits_batch_path, body = { 'visits': visits })
+        response = jsonify_response(visit_handler.handle_event(event, None))
+
+        assert response['statusCode'] == 200
+        statuses: list[dict] = response['body']['visits']
+        assert [status['statusCode'] for status in statuses] == [201, 400, 201]
+        assert "already exists" in statuses[1]['errorMsg']
+
+        # The other request's visit is untouched, and the rest were added
+        items: dict = { item['user_id']: item for item in get_all_table_items(visits_table)['items'] }
+        assert set(items) == { "test1", "test2", "test3" }
+        assert items["test2"]['location'] == "Cooper"
+
+        # Only the visits this batch added are counted
+        rollups: list[dict] = get_all_table_items(visit_handler.visit_rollups_table)['items']
+        assert sum(rollup['visits'] for rollup in rollups) == 2
+
+
+    def test_get_visit_stats(self, get_visit_handler):
+        """
+        Tests that visits are counted per location, day, and hour as they are
+        added (once each, however they are added), and that the stats endpoint
+        reads the counts within a time range.
+        """
+
+        # Get the visit handler to use.
+        visit_handler, visits_table = get_visit_handler
+
+        visits: list = [
+            generate_request_body("test1", "2024-01-01T09:30:00", "Watt"),
+            generate_request_body("test2", "2024-01-01T09:45:00", "Watt"),
+            generate_request_body("test1", "2024-01-01T14:00:00", "Cooper"),
+            generate_request_body("test3", "2024-01-02T10:00:00", "Watt"),
+        ]
+        for visit in visits[:2]:
+            event, context = create_post_visit_event_contex(dict(visit))
+            assert visit_handler.handle_event(event, context)['statusCode'] == 201
+
+        # A repeated visit isn't counted again
+        event = create_rest_http_event(httpMethod = "POST", resource = visits_batch_path,
+                                       body = { 'visits': visits[1:] })
+        assert visit_handler.handle_event(event, None)['statusCode'] == 200
+
+        def get_stats(query_parameters: dict) -> dict:
+            event = create_rest_http_event(httpMethod = "GET", resource = visits_stats_path,
+                                           queryStringParameters = query_parameters)
+            return jsonify_response(visit_handler.handle_event(event, None))
+
+        response = get_stats({})
+        assert response['statusCode'] == 200
+        assert response['body']['stats'] == [
+            { 'location': "Watt", 'day': "2024-01-01", 'visits': 2, 'hours': { '09': 2 } },
+            { 'location': "Cooper", 'day': "2024-01-01", 'visits': 1, 'hours': { '14': 1 } },
+            { 'location': "Watt", 'day': "2024-01-02", 'visits': 1, 'hours': { '10': 1 } },
+        ]
+        assert response['body']['totals'] == { 'Watt': 3, 'Cooper': 1, 'CUICAR': 0 }
+        assert response['body']['total'] == 4
+
+        # Hours of the first and last day outside the range aren't counted
+        response = get_stats({ 'start_timestamp': "2024-01-01T10:00:00",
+                               'end_timestamp': "2024-01-02T09:59:59" })
+        assert response['body']['stats'] == [
+            { 'location': "Cooper", 'day': "2024-01-01", 'visits': 1, 'hours': { '14': 1 } },
+        ]
+
+        response = get_stats({ 'location': "Watt", 'end_timestamp': "2024-01-01T23:59:59" })
+        assert response['body']['totals'] == { 'Watt': 2 }
+
+        # Invalid parameters are rejected
+        assert get_stats({ 'location': "Nowhere" })['statusCode'] == 400
+        assert get_stats({ 'start_timestamp': "2024-01-02" })['statusCode'] == 400
+        assert get_stats({ 'start_timestamp': "2024-01-02T00:00:00",
+                           'end_timestamp': "2024-01-01T00:00:00" })['statusCode'] == 400
+
+
+    def test_rebuild_visit_rollups(self, get_visit_handler):
+        """
+        Tests that recounting past days from the visits table replaces their
+        rollups, and leaves the days after them alone.
+        """
+
+        # Get the visit handler to use.
+        visit_handler, visits_table = get_visit_handler
+
+        # Visits stored without being counted
+        put_all_items_in_table(visits_table, generate_items(
+            ["test1", "test2", "test3", "test4"],
+            ["2024-01-01T09:00:00", "2024-01-01T13:00:00", "2024-01-02T09:00:00", "2024-01-03T09:00:00"],
+            ["Watt", "Watt", "Cooper", "Watt"],
+        ))
+
+        rollups: list[dict] = countVisitRollups(visits_table, "2024-01-03", segments = 2)
+        put_all_items_in_table(visit_handler.visit_rollups_table, rollups)
+
+        event = create_rest_http_event(httpMethod = "GET", resource = visits_stats_path)
+        response = jsonify_response(visit_handler.handle_event(event, None))
+
+        assert response['body']['stats'] == [
+            { 'location': "Watt", 'day': "2024-01-01", 'visits': 2, 'hours': { '09': 1, '13': 1 } },
+            { 'location': "Cooper", 'day': "2024-01-02", 'visits': 1, 'hours': { '09': 1 } },
+        ]
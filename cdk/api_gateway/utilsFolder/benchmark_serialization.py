@@ -0,0 +1,104 @@
+"""
+Benchmark for serializing large list responses (e.g., GET /equipment).
+
+Compares the plain json.dumps the api used to build responses with, against
+dumpsJSON from api_defaults (with and without orjson, when it is installed).
+Items are shaped like equipment logs, and half of them hold dynamodb number
+and set attributes (which plain json.dumps can't serialize, so the baseline
+is given a copy of the items with those attributes converted beforehand).
+
+Usage (from the cdk/ directory):
+
+python api_gateway/utilsFolder/benchmark_serialization.py [--items N] [--repeat N]
+"""
+from decimal import Decimal
+import argparse
+import json
+import os
+import sys
+import timeit
+
+# Import api_defaults the same way the lambdas do
+LAMBDA_CODE_DIR: str = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "lambda_code")
+sys.path.append(LAMBDA_CODE_DIR)
+
+import api_defaults
+
+def generateItems(count: int) -> list[dict]:
+    """
+    Generates equipment log shaped items. Every other item stores its print
+    information as dynamodb numbers and a string set.
+
+    :params count: The number of items to generate.
+    """
+    items: list[dict] = []
+
+    for i in range(count):
+        item: dict = {
+            "user_id": f"user{i % 500}",
+            "timestamp": f"2024-10-{(i % 28) + 1:02d}T{i % 24:02d}:00:00",
+            "location": "Watt",
+            "project_name": f"project {i}",
+            "project_type": "Personal",
+            "equipment_type": "FDM 3D Printer",
+            "_ignore": "1",
+        }
+
+        if i % 2:
+            item["printer_3d_info"] = {
+                "printer_name": "Prusa MK4",
+                "print_duration": Decimal(i % 300),
+                "print_mass_estimate": Decimal("12.5"),
+                "print_mass": Decimal(f"{i % 100}.25"),
+                "print_tags": {"pla", "black"},
+            }
+        else:
+            item["printer_3d_info"] = {
+                "printer_name": "Prusa MK4",
+                "print_duration": "5",
+                "print_mass_estimate": "12.5",
+                "print_mass": "",
+            }
+
+        items.append(item)
+
+    return items
+
+def timeIt(label: str, function, repeat: int):
+    """
+    Prints the best time of several runs of function.
+
+    :params label: What is being timed.
+    :params function: A function taking no arguments.
+    :params repeat: The number of times to run function.
+    """
+    best: float = min(timeit.repeat(function, number=1, repeat=repeat))
+    print(f"  {best * 1000:8.2f} ms  {label}")
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark response serialization.")
+    parser.add_argument("--items", type=int, default=10000, help="Items in the response.")
+    parser.add_argument("--repeat", type=int, default=20, help="Runs per serializer.")
+    args = parser.parse_args()
+
+    body: dict = {"equipment_logs": generateItems(args.items)}
+    # json.dumps can't serialize Decimals or sets, so give it a converted copy
+    plain_body: dict = json.loads(api_defaults.dumpsJSON(body))
+
+    print(f"Serializing {args.items} items (best of {args.repeat} runs):")
+    timeIt("json.dumps (no Decimals/sets)", lambda: json.dumps(plain_body), args.repeat)
+
+    orjson = api_defaults.orjson
+    try:
+        api_defaults.orjson = None
+        timeIt("dumpsJSON (json module)", lambda: api_defaults.dumpsJSON(body), args.repeat)
+    finally:
+        api_defaults.orjson = orjson
+
+    if orjson is not None:
+        timeIt("dumpsJSON (orjson)", lambda: api_defaults.dumpsJSON(body), args.repeat)
+    else:
+        print("  orjson is not installed; skipped")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,83 @@
+"""
+Benchmark for validating timestamps.
+
+Compares validTimestamp from api_defaults against the strptime/strftime round
+trip the api used to validate timestamps with (kept below as the baseline),
+over a column of timestamps shaped like a bulk import (mostly valid, with a
+few malformed or impossible dates mixed in).
+
+Usage (from the cdk/ directory):
+
+python api_gateway/utilsFolder/benchmark_timestamps.py [--timestamps N] [--repeat N]
+"""
+from datetime import datetime
+import argparse
+import os
+import sys
+import timeit
+
+# Import api_defaults the same way the lambdas do
+LAMBDA_CODE_DIR: str = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "lambda_code")
+sys.path.append(LAMBDA_CODE_DIR)
+
+import api_defaults
+
+def legacyValidTimestamp(timestamp: str) -> bool:
+    """
+    The round trip timestamp validation the api used before the fixed width
+    checks.
+    """
+    try:
+        parsed = datetime.strptime(timestamp, api_defaults.TIMESTAMP_FORMAT)
+    except:
+        return False
+
+    return timestamp == parsed.strftime(api_defaults.TIMESTAMP_FORMAT)
+
+def generateTimestamps(count: int) -> list[str]:
+    """
+    Generates a month of timestamps, with every 50th one invalid.
+
+    :params count: The number of timestamps to generate.
+    """
+    invalid: list[str] = ["2024-02-30T10:00:00", "2024-10-01 10:00:00",
+                          "2024-10-01T25:00:00", "10/01/2024 10:00:00"]
+    timestamps: list[str] = []
+
+    for i in range(count):
+        if i % 50 == 0:
+            timestamps.append(invalid[(i // 50) % len(invalid)])
+        else:
+            timestamps.append(f"2024-10-{(i % 31) + 1:02d}T{i % 24:02d}:{i % 60:02d}:{(i * 7) % 60:02d}")
+
+    return timestamps
+
+def timeIt(label: str, function, repeat: int):
+    """
+    Prints the best time of several runs of function.
+
+    :params label: What is being timed.
+    :params function: A function taking no arguments.
+    :params repeat: The number of times to run function.
+    """
+    best: float = min(timeit.repeat(function, number=1, repeat=repeat))
+    print(f"  {best * 1000:8.2f} ms  {label}")
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark timestamp validation.")
+    parser.add_argument("--timestamps", type=int, default=100000, help="Timestamps to validate.")
+    parser.add_argument("--repeat", type=int, default=10, help="Runs per validator.")
+    args = parser.parse_args()
+
+    timestamps: list[str] = generateTimestamps(args.timestamps)
+
+    # Every validator must agree with the baseline
+    expected: list[bool] = [legacyValidTimestamp(timestamp) for timestamp in timestamps]
+    assert [api_defaults.validTimestamp(timestamp) for timestamp in timestamps] == expected
+
+    print(f"Validating {args.timestamps} timestamps (best of {args.repeat} runs):")
+    timeIt("strptime/strftime round trip", lambda: [legacyValidTimestamp(timestamp) for timestamp in timestamps], args.repeat)
+    timeIt("validTimestamp (per timestamp)", lambda: [api_defaults.validTimestamp(timestamp) for timestamp in timestamps], args.repeat)
+
+if __name__ == "__main__":
+    main()
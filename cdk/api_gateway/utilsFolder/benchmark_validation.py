@@ -0,0 +1,181 @@
+"""
+Benchmark for validating request bodies.
+
+Compares the compiled RequestValidators of the users and equipment handlers
+against the validation they used to do, which rebuilt its FieldChecks, lookup
+dictionaries and field lists on every call (kept below as the baseline).
+
+Usage (from the cdk/ directory):
+
+python api_gateway/utilsFolder/benchmark_validation.py [--number N] [--repeat N]
+"""
+import argparse
+import os
+import sys
+import timeit
+
+# Import the handlers the same way the lambdas are laid out
+LAMBDA_CODE_DIR: str = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "lambda_code")
+sys.path.insert(0, LAMBDA_CODE_DIR)
+sys.path.insert(0, os.path.join(LAMBDA_CODE_DIR, "users_handler"))
+sys.path.insert(0, os.path.join(LAMBDA_CODE_DIR, "equipment_handler"))
+
+from api_defaults import *
+import users_handler
+import equipment_handler
+from equipment_handler import EQUIPMENT_NAMES
+
+def legacyValidateUserRequestBody(data: dict):
+    """
+    The per call user validation the users handler used before schemas.
+    """
+    required_fields: list[str] = ["user_id", "university_status"]
+
+    undergrad_fields = FieldCheck(required = ["undergraduate_class", "major"],
+                                  disallowed = [])
+    grad_fields = FieldCheck(required = ["major"],
+                             disallowed = ["undergraduate_class"])
+    faculty_fields = FieldCheck(required = [],
+                                disallowed = ["undergraduate_class", "major"])
+
+    fields_lookup: dict = {
+        'Undergraduate': undergrad_fields,
+        'Graduate': grad_fields,
+        'Faculty': faculty_fields,
+    }
+
+    valid_undergraduate_classes: list[str] = ["Freshman", "Sophomore", "Junior", "Senior"]
+
+    if not allKeysPresent(required_fields, data):
+        raise InvalidRequestBody()
+
+    university_status: str = data['university_status']
+    if university_status not in fields_lookup:
+        raise InvalidRequestBody()
+
+    data = checkAndCleanRequestFields(data, fields_lookup[university_status])
+
+    if 'undergraduate_class' in data:
+        if data['undergraduate_class'] not in valid_undergraduate_classes:
+            raise InvalidRequestBody()
+    return data
+
+def legacyValidateEquipmentRequestBody(data: dict):
+    """
+    The per call equipment validation the equipment handler used before schemas.
+    """
+    required_fields: list[str] = ["user_id", "timestamp", "location",
+                                  "project_name", "project_type", "equipment_type"]
+
+    personal_project_fields = FieldCheck(
+        required = [],
+        disallowed = ["class_number", "faculty_name", "project_sponsor", "organization_affiliation"],
+    )
+    class_project_fields = FieldCheck(
+        required = ["class_number", "faculty_name", "project_sponsor"],
+        disallowed = ["organization_affiliation"]
+    )
+    club_project_fields = FieldCheck(
+        required = ["organization_affiliation"],
+        disallowed = ["class_number", "faculty_name", "project_sponsor"]
+    )
+    project_type_field_lookup = {
+        'Personal': personal_project_fields,
+        'Class': class_project_fields,
+        'Club': club_project_fields
+    }
+
+    printer_3d_fields = FieldCheck(required = ["printer_3d_info"], disallowed = [])
+    other_equipment_type_fields = FieldCheck(required = [], disallowed = ["printer_3d_info"])
+    required_equipment_field_check_lookup: dict = {
+        EQUIPMENT_NAMES["FDM_PRINTER_STRING"]: printer_3d_fields,
+        EQUIPMENT_NAMES["SLA_PRINTER_STRING"]: printer_3d_fields,
+        "Other": other_equipment_type_fields,
+    }
+
+    if not allKeysPresent(required_fields, data):
+        raise InvalidRequestBody()
+
+    project_type: str = data['project_type']
+    if project_type not in project_type_field_lookup:
+        raise InvalidRequestBody()
+
+    equipment_type: str = data['equipment_type']
+    if equipment_type not in required_equipment_field_check_lookup:
+        equipment_type = "Other"
+
+    data = checkAndCleanRequestFields(data, project_type_field_lookup[project_type])
+    data = checkAndCleanRequestFields(data, required_equipment_field_check_lookup[equipment_type])
+
+    general_printer_3d_info_fields: list[str] = ["printer_name", "print_name", "print_duration",
+                                                 "print_status", "print_notes"]
+    fdm_printer_3d_required_fields: list[str] = ["print_mass_estimate", "print_mass"] + general_printer_3d_info_fields
+    sla_printer_3d_required_fields: list[str] = ["resin_volume", "resin_type"] + general_printer_3d_info_fields
+
+    if data["equipment_type"] == EQUIPMENT_NAMES["FDM_PRINTER_STRING"] and not \
+        allKeysPresent(fdm_printer_3d_required_fields, data['printer_3d_info']):
+        raise InvalidRequestBody()
+    elif data["equipment_type"] == EQUIPMENT_NAMES["SLA_PRINTER_STRING"] and not \
+        allKeysPresent(sla_printer_3d_required_fields, data['printer_3d_info']):
+        raise InvalidRequestBody()
+
+    if not validTimestamp(data['timestamp']):
+        raise InvalidRequestBody()
+
+    return data
+
+USER_BODY: dict = {
+    "user_id": "test1",
+    "university_status": "Undergraduate",
+    "undergraduate_class": "Junior",
+    "major": "Computer Science",
+}
+
+EQUIPMENT_BODY: dict = {
+    "user_id": "test1",
+    "timestamp": "2024-10-01T10:00:00",
+    "location": "Watt",
+    "project_name": "test",
+    "project_type": "Class",
+    "equipment_type": EQUIPMENT_NAMES["FDM_PRINTER_STRING"],
+    "class_number": "CPSC 1010",
+    "faculty_name": "test",
+    "project_sponsor": "test",
+    "printer_3d_info": {
+        "printer_name": "test-printer",
+        "print_name": "test print",
+        "print_duration": "5",
+        "print_status": "In Progress",
+        "print_notes": "",
+        "print_mass_estimate": "5",
+        "print_mass": "",
+    },
+}
+
+def timeIt(label: str, validate, body: dict, number: int, repeat: int):
+    """
+    Prints the best per call time of a validation function.
+
+    :params label: What is being timed.
+    :params validate: The validation function.
+    :params body: The request body to validate (a copy is validated each call).
+    :params number: Calls per run.
+    :params repeat: The number of runs.
+    """
+    best: float = min(timeit.repeat(lambda: validate(dict(body)), number=number, repeat=repeat))
+    print(f"  {best / number * 1e6:8.2f} us  {label}")
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark request body validation.")
+    parser.add_argument("--number", type=int, default=20000, help="Validations per run.")
+    parser.add_argument("--repeat", type=int, default=5, help="Runs per validator.")
+    args = parser.parse_args()
+
+    print(f"Per request validation cost (best of {args.repeat} runs of {args.number}):")
+    timeIt("users (per call FieldChecks)", legacyValidateUserRequestBody, USER_BODY, args.number, args.repeat)
+    timeIt("users (compiled schema)", users_handler.USER_REQUEST_VALIDATOR.validate, USER_BODY, args.number, args.repeat)
+    timeIt("equipment (per call FieldChecks)", legacyValidateEquipmentRequestBody, EQUIPMENT_BODY, args.number, args.repeat)
+    timeIt("equipment (compiled schema)", equipment_handler.EQUIPMENT_REQUEST_VALIDATOR.validate, EQUIPMENT_BODY, args.number, args.repeat)
+
+if __name__ == "__main__":
+    main()
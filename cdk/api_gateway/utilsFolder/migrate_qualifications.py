@@ -0,0 +1,183 @@
+"""
+Online migration of qualifications into the user_id keyed qualifications table.
+
+The old qualifications table is keyed by (user_id, last_updated), so a user
+can end up with more than one entry (e.g., from an interrupted update). The new
+table is keyed by user_id alone. This script copies the latest entry of every
+user from the old table into the new one (storing its completable items as
+maps keyed by name), reading the old table as a parallel (segmented) scan.
+
+It is safe to run while the api is live, and to run more than once: entries
+are only copied for users that don't have one in the new table yet, so
+anything the api has written there (which is always newer) is never
+overwritten. Until it finishes, the qualifications handler reads users it
+can't find in the new table from the old one (when its
+LEGACY_QUALIFICATIONS_TABLE_NAME is set).
+
+Usage (from the cdk/ directory):
+
+python api_gateway/utilsFolder/migrate_qualifications.py SOURCE_TABLE DESTINATION_TABLE [--shards N] [--segments N] [--region REGION] [--dry-run]
+"""
+from dataclasses import dataclass
+import argparse
+import os
+import sys
+
+import boto3
+from botocore.exceptions import ClientError
+
+# Import api_defaults the same way the lambdas do
+LAMBDA_CODE_DIR: str = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "lambda_code")
+sys.path.append(LAMBDA_CODE_DIR)
+
+from api_defaults import (
+    AWS_CLIENT_CONFIG,
+    COMPLETABLE_ITEM_LISTS,
+    DEFAULT_SCAN_LIMIT,
+    DEFAULT_TIMESTAMP_INDEX_SHARDS,
+    GSI_ATTRIBUTE_NAME,
+    PRIMARY_KEY,
+    completableItemsToMap,
+    timestampIndex,
+)
+
+# Default number of segments (and threads) the old table is scanned with
+DEFAULT_SEGMENTS: int = 8
+
+@dataclass
+class MigrationStats():
+    """
+    Class counting what a migration did. Comprised of the number of old
+    entries 'scanned', the number of users 'copied' into the new table, and
+    the number of users 'skipped' because they were already in it.
+    """
+    scanned: int = 0
+    copied: int = 0
+    skipped: int = 0
+
+    def __add__(self, other):
+        return MigrationStats(scanned = self.scanned + other.scanned,
+                              copied = self.copied + other.copied,
+                              skipped = self.skipped + other.skipped)
+
+def migrateSegment(client, source: str, destination: str, segment: int,
+                   total_segments: int, dry_run: bool = False,
+                   shards: int = DEFAULT_TIMESTAMP_INDEX_SHARDS) -> MigrationStats:
+    """
+    Copies the latest entry of every user in one segment of the old table
+    into the new table. Every entry of a user is in the same segment, since
+    segments split a table by partition key.
+
+    :params client: The client of a dynamodb resource (e.g., table.meta.client),
+                    which takes and returns plain python values.
+    :params source: The name of the old, (user_id, last_updated) keyed, table.
+    :params destination: The name of the new, user_id keyed, table.
+    :params segment: The segment of the old table to copy.
+    :params total_segments: The number of segments the old table is split into.
+    :params dry_run: Count what would be copied without writing anything.
+    :params shards: The number of shards the new table's TimestampIndex uses.
+    """
+    stats = MigrationStats()
+    index = timestampIndex('last_updated', [PRIMARY_KEY], shards = shards)
+
+    # Latest entry of each user in the segment
+    latest: dict = {}
+
+    scan_kwargs: dict = {
+        'TableName': source,
+        'Segment': segment,
+        'TotalSegments': total_segments,
+        'Limit': DEFAULT_SCAN_LIMIT,
+    }
+    while True:
+        response = client.scan(**scan_kwargs)
+
+        for item in response['Items']:
+            stats.scanned += 1
+            user_id: str = item[PRIMARY_KEY]
+            if user_id not in latest or item['last_updated'] > latest[user_id]['last_updated']:
+                latest[user_id] = item
+
+        if 'LastEvaluatedKey' not in response:
+            break
+        scan_kwargs['ExclusiveStartKey'] = response['LastEvaluatedKey']
+
+    for item in latest.values():
+        # Entries are always found through (their shard of) the TimestampIndex
+        item[GSI_ATTRIBUTE_NAME] = index.shardKey(item)
+
+        # Completable items are stored keyed by name
+        for key in COMPLETABLE_ITEM_LISTS:
+            if isinstance(item.get(key), list):
+                item[key] = completableItemsToMap(item[key])
+
+        if dry_run:
+            response = client.get_item(TableName=destination, Key={ PRIMARY_KEY: item[PRIMARY_KEY] },
+                                       ProjectionExpression=PRIMARY_KEY)
+            if 'Item' in response:
+                stats.skipped += 1
+            else:
+                stats.copied += 1
+            continue
+
+        try:
+            client.put_item(
+                TableName=destination,
+                Item=item,
+                ConditionExpression=f"attribute_not_exists({PRIMARY_KEY})"
+            )
+            stats.copied += 1
+        except ClientError as e:
+            if e.response['Error']['Code'] != 'ConditionalCheckFailedException':
+                raise
+            stats.skipped += 1
+
+    return stats
+
+def migrateQualifications(client, source: str, destination: str,
+                          segments: int = DEFAULT_SEGMENTS, dry_run: bool = False,
+                          shards: int = DEFAULT_TIMESTAMP_INDEX_SHARDS) -> MigrationStats:
+    """
+    Copies the latest entry of every user in the old table into the new
+    table, migrating every segment of the old table at the same time.
+
+    :params client: The client of a dynamodb resource (e.g., table.meta.client).
+                    Clients are thread safe, unlike the resource itself.
+    :params source: The name of the old, (user_id, last_updated) keyed, table.
+    :params destination: The name of the new, user_id keyed, table.
+    :params segments: The number of segments (and threads) to scan the old table with.
+    :params dry_run: Count what would be copied without writing anything.
+    :params shards: The number of shards the new table's TimestampIndex uses.
+    """
+    from concurrent.futures import ThreadPoolExecutor
+
+    with ThreadPoolExecutor(max_workers=segments) as executor:
+        results = executor.map(
+            lambda segment: migrateSegment(client, source, destination, segment, segments, dry_run, shards),
+            range(segments)
+        )
+
+        return sum(results, MigrationStats())
+
+def main():
+    parser = argparse.ArgumentParser(description="Migrate qualifications into the user_id keyed table.")
+    parser.add_argument("source", help="Name of the old (user_id, last_updated) keyed table.")
+    parser.add_argument("destination", help="Name of the new user_id keyed table.")
+    parser.add_argument("--shards", type=int, default=DEFAULT_TIMESTAMP_INDEX_SHARDS,
+                        help="Shards of the new table's TimestampIndex (see Database.timestamp_index_shards).")
+    parser.add_argument("--segments", type=int, default=DEFAULT_SEGMENTS, help="Segments to scan the old table with.")
+    parser.add_argument("--region", default=None, help="AWS region of the tables.")
+    parser.add_argument("--dry-run", action="store_true", help="Count what would be copied without writing.")
+    args = parser.parse_args()
+
+    client = boto3.resource('dynamodb', region_name=args.region, config=AWS_CLIENT_CONFIG).meta.client
+    stats: MigrationStats = migrateQualifications(client, args.source, args.destination,
+                                                  segments = args.segments, dry_run = args.dry_run,
+                                                  shards = args.shards)
+
+    action: str = "Would copy" if args.dry_run else "Copied"
+    print(f"Scanned {stats.scanned} entries. {action} {stats.copied} users; "
+          f"skipped {stats.skipped} already in {args.destination}.")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,188 @@
+"""
+Cold start import profiler for the lambda asset directories.
+
+Each lambda's INIT phase is mostly spent importing its handler module (and
+everything that module imports). This script imports every handler module in
+a fresh interpreter using `python -X importtime`, the same way the lambda
+runtime would on a cold start, and reports how long each import took.
+
+Every handler is profiled twice:
+- with the bytecode of the asset's modules cached, as if the asset shipped
+  its .pyc files, and
+- compiling the asset's modules (the handler module and api_defaults.py) on
+  every import. This is what a deployed lambda pays on each cold start when
+  its asset has no (matching) .pyc files, since /var/task is read only and
+  the compiled bytecode can't be cached there. Library modules (boto3, the
+  standard library) come with their bytecode in both cases.
+
+Usage (from the cdk/ directory):
+
+python api_gateway/utilsFolder/profile_imports.py [handler ...] [--runs N] [--top N]
+
+E.g., to profile only the kiosk facing visits lambda over 10 cold starts:
+
+python api_gateway/utilsFolder/profile_imports.py visits_handler --runs 10
+"""
+from dataclasses import dataclass
+import argparse
+import os
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+
+# Directory holding every lambda asset directory (and api_defaults.py, which
+# the pipeline links into each asset directory)
+LAMBDA_CODE_DIR: str = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "lambda_code")
+# Prefix python puts on every line written by -X importtime
+IMPORT_TIME_PREFIX: str = "import time:"
+
+@dataclass
+class ImportTiming():
+    """
+    Class representing one line of `python -X importtime` output. Comprised of
+    the imported module's 'name', the microseconds spent in the module itself
+    ('self_us'), the microseconds including everything it imported
+    ('cumulative_us'), and its nesting 'depth' (0 for top level imports).
+    """
+    name: str
+    self_us: int
+    cumulative_us: int
+    depth: int
+
+def parseImportTime(output: str) -> list[ImportTiming]:
+    """
+    Parses the stderr of `python -X importtime` into a list of ImportTimings.
+
+    :params output: The stderr written by the interpreter.
+    :returns: A list of ImportTimings in the order python printed them.
+    """
+    timings: list[ImportTiming] = []
+
+    for line in output.splitlines():
+        if not line.startswith(IMPORT_TIME_PREFIX):
+            continue
+
+        self_us, cumulative_us, name = line[len(IMPORT_TIME_PREFIX):].split("|")
+
+        # Skip the header line ("self [us] | cumulative | imported package")
+        if not self_us.strip().isdigit():
+            continue
+
+        # Nested imports are indented by two spaces per level
+        depth: int = (len(name) - len(name.lstrip()) - 1) // 2
+        timings.append(ImportTiming(name.strip(), int(self_us), int(cumulative_us), depth))
+
+    return timings
+
+def findHandlers() -> list[str]:
+    """
+    Returns the names of all lambda handler modules. A handler module is any
+    asset directory 'x' under lambda_code/ containing a module named 'x.py'.
+    """
+    handlers: list[str] = []
+
+    for name in sorted(os.listdir(LAMBDA_CODE_DIR)):
+        if os.path.isfile(os.path.join(LAMBDA_CODE_DIR, name, f"{name}.py")):
+            handlers.append(name)
+
+    return handlers
+
+def profileHandler(handler: str, bytecode_cached: bool = True) -> list[ImportTiming]:
+    """
+    Imports a handler module in a fresh interpreter and returns its import
+    timings. The interpreter runs from inside the asset directory with
+    lambda_code/ on the path, matching the layout of a deployed lambda.
+
+    :params handler: The name of the handler module (e.g., 'visits_handler').
+    :params bytecode_cached: Whether the asset's modules may be loaded from
+                             (and cached as) .pyc files. If False, they are
+                             imported from a copy without any __pycache__,
+                             and no bytecode is written, so every import
+                             compiles them.
+    """
+    with tempfile.TemporaryDirectory() as temp_dir:
+        asset_dir: str = os.path.join(LAMBDA_CODE_DIR, handler)
+        code_dir: str = LAMBDA_CODE_DIR
+        command: list[str] = [sys.executable, "-X", "importtime"]
+
+        if not bytecode_cached:
+            asset_dir = shutil.copytree(asset_dir, os.path.join(temp_dir, handler),
+                                        ignore=shutil.ignore_patterns("__pycache__"))
+            shutil.copy(os.path.join(LAMBDA_CODE_DIR, "api_defaults.py"), temp_dir)
+            code_dir = temp_dir
+            command.append("-B")
+
+        env: dict = dict(os.environ)
+        env["PYTHONPATH"] = os.pathsep.join([asset_dir, code_dir])
+
+        result = subprocess.run(
+            command + ["-c", f"import {handler}"],
+            cwd=asset_dir,
+            env=env,
+            capture_output=True,
+            text=True,
+        )
+
+    if result.returncode != 0:
+        raise Exception(f"Importing {handler} failed:\n{result.stderr}")
+
+    return parseImportTime(result.stderr)
+
+def summarize(handler: str, runs: list[list[ImportTiming]], top: int, label: str = ""):
+    """
+    Prints the median total import time of a handler module, followed by the
+    modules that contributed the most to it.
+
+    :params handler: The name of the handler module.
+    :params runs: The import timings of every profiled run.
+    :params top: The number of modules to list.
+    :params label: Optional description of how the runs were profiled.
+    """
+    # Median cumulative time (in microseconds) of each module across all runs
+    cumulative: dict[str, list[int]] = {}
+    self_time: dict[str, list[int]] = {}
+    for timings in runs:
+        for timing in timings:
+            cumulative.setdefault(timing.name, []).append(timing.cumulative_us)
+            self_time.setdefault(timing.name, []).append(timing.self_us)
+
+    total_ms: float = statistics.median(cumulative[handler]) / 1000
+    print(f"{handler}{label}: {total_ms:.1f} ms to import (median of {len(runs)} runs)")
+
+    # Modules imported directly by the handler, by cumulative time
+    direct: list[ImportTiming] = [timing for timing in runs[0] if timing.depth == 1]
+    direct.sort(key=lambda timing: statistics.median(cumulative[timing.name]), reverse=True)
+    print("  direct imports (cumulative):")
+    for timing in direct[:top]:
+        print(f"    {statistics.median(cumulative[timing.name]) / 1000:8.1f} ms  {timing.name}")
+
+    # Individual modules, by time spent in the module itself
+    slowest: list[str] = sorted(self_time, key=lambda name: statistics.median(self_time[name]), reverse=True)
+    print("  slowest modules (self):")
+    for name in slowest[:top]:
+        print(f"    {statistics.median(self_time[name]) / 1000:8.1f} ms  {name}")
+    print()
+
+def main():
+    parser = argparse.ArgumentParser(description="Profile the cold start imports of each lambda.")
+    parser.add_argument("handlers", nargs="*", help="Handler modules to profile (default: all).")
+    parser.add_argument("--runs", type=int, default=5, help="Cold starts to profile per handler.")
+    parser.add_argument("--top", type=int, default=10, help="Modules to list per handler.")
+    args = parser.parse_args()
+
+    handlers: list[str] = args.handlers or findHandlers()
+
+    for handler in handlers:
+        # The first import fills the bytecode cache, so it is not counted
+        profileHandler(handler)
+
+        runs: list[list[ImportTiming]] = [profileHandler(handler) for _ in range(args.runs)]
+        summarize(handler, runs, args.top, " (bytecode cached)")
+
+        runs = [profileHandler(handler, bytecode_cached = False) for _ in range(args.runs)]
+        summarize(handler, runs, args.top, " (compiling the asset, as a deployed lambda does)")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,93 @@
+"""
+Rebuilds the equipment rollups (usage per equipment type, printer, and day)
+from the equipment table.
+
+The equipment handler counts logs into the rollups as they are added and
+patched, so logs added before the rollups existed (or any a failed count
+missed) are only counted after this script recounts their days. Every day
+before --before is recounted from a parallel (segmented) scan of the
+equipment table, and its rollup items are replaced with the recount.
+
+Logs are patched after their day is over (e.g., once a print finishes), so
+unlike the visit rollups, a recount can race a patch of an older log. Run it
+when few prints are in progress, and run it again if a patch landed while it
+was running; it is safe to run more than once.
+
+Usage (from the cdk/ directory):
+
+python api_gateway/utilsFolder/rebuild_equipment_rollups.py EQUIPMENT_TABLE ROLLUPS_TABLE [--before YYYY-MM-DD] [--segments N] [--region REGION] [--dry-run]
+"""
+from datetime import date
+import argparse
+import os
+import sys
+
+import boto3
+from boto3.dynamodb.conditions import Attr
+
+# Import api_defaults the same way the lambdas do
+LAMBDA_CODE_DIR: str = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "lambda_code")
+sys.path.append(LAMBDA_CODE_DIR)
+
+from api_defaults import (
+    AWS_CLIENT_CONFIG,
+    DATE_PATTERN,
+    EQUIPMENT_COUNT_ATTRIBUTE,
+    EQUIPMENT_ROLLUP_KEY,
+    batchPutItems,
+    equipmentRollupIncrements,
+    scanTable,
+)
+
+# Default number of segments (and threads) the equipment table is scanned with
+DEFAULT_SEGMENTS: int = 8
+
+def countEquipmentRollups(equipment_table, before: str, segments: int = DEFAULT_SEGMENTS) -> list[dict]:
+    """
+    Counts every equipment log before a day into rollup items.
+
+    :params equipment_table: The dynamodb.Table of equipment logs.
+    :params before: The first day ("YYYY-MM-DD") not to count.
+    :params segments: The number of segments (and threads) to scan the table with.
+    :returns: The rollup items: { 'equipment_type', 'bucket', 'logs', ... }
+    """
+    logs: list[dict] = scanTable(equipment_table, filter_expression = Attr('timestamp').lt(before),
+                                 segments = segments,
+                                 fields = ['equipment_type', 'timestamp', 'printer_3d_info'])
+
+    increments: dict = equipmentRollupIncrements(logs)
+
+    return [
+        { **dict(zip(EQUIPMENT_ROLLUP_KEY, key_values)), **counters }
+        for key_values, counters in increments.items()
+    ]
+
+def main():
+    parser = argparse.ArgumentParser(description="Recount the equipment rollups of past days from the equipment table.")
+    parser.add_argument("equipment_table", help="Name of the equipment table.")
+    parser.add_argument("rollups_table", help="Name of the equipment rollups table.")
+    parser.add_argument("--before", default=date.today().isoformat(),
+                        help="First day (YYYY-MM-DD) not to recount. Defaults to today.")
+    parser.add_argument("--segments", type=int, default=DEFAULT_SEGMENTS, help="Segments to scan the table with.")
+    parser.add_argument("--region", default=None, help="AWS region of the tables.")
+    parser.add_argument("--dry-run", action="store_true", help="Count the logs without writing.")
+    args = parser.parse_args()
+
+    if not DATE_PATTERN.fullmatch(args.before):
+        parser.error("--before must be a day in the format YYYY-MM-DD.")
+
+    dynamodb = boto3.resource('dynamodb', region_name=args.region, config=AWS_CLIENT_CONFIG)
+    rollups: list[dict] = countEquipmentRollups(dynamodb.Table(args.equipment_table), args.before,
+                                                segments = args.segments)
+
+    logs: int = sum(rollup.get(EQUIPMENT_COUNT_ATTRIBUTE, 0) for rollup in rollups)
+    if args.dry_run:
+        print(f"Would write {len(rollups)} rollups counting {logs} logs before {args.before}.")
+        return
+
+    round_trips: int = batchPutItems(dynamodb.Table(args.rollups_table), rollups)
+    print(f"Wrote {len(rollups)} rollups counting {logs} logs before {args.before} "
+          f"in {round_trips} round trips.")
+
+if __name__ == "__main__":
+    main()
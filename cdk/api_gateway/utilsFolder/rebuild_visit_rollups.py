@@ -0,0 +1,91 @@
+"""
+Rebuilds the visit rollups (visits per location per day, and per hour) from
+the visits table.
+
+The visits handler counts visits into the rollups as they are added, so
+visits added before the rollups existed (or any a failed count missed) are
+only counted after this script recounts their days. Every day before --before
+is recounted from a parallel (segmented) scan of the visits table, and its
+rollup items are replaced with the recount.
+
+It is safe to run while the api is live, and to run more than once, as long
+as no visits are still being added for the days it recounts. --before
+defaults to today, so only days that are over are recounted.
+
+Usage (from the cdk/ directory):
+
+python api_gateway/utilsFolder/rebuild_visit_rollups.py VISITS_TABLE ROLLUPS_TABLE [--before YYYY-MM-DD] [--segments N] [--region REGION] [--dry-run]
+"""
+from datetime import date
+import argparse
+import os
+import sys
+
+import boto3
+from boto3.dynamodb.conditions import Attr
+
+# Import api_defaults the same way the lambdas do
+LAMBDA_CODE_DIR: str = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "lambda_code")
+sys.path.append(LAMBDA_CODE_DIR)
+
+from api_defaults import (
+    AWS_CLIENT_CONFIG,
+    DATE_PATTERN,
+    VISIT_ROLLUP_KEY,
+    batchPutItems,
+    scanTable,
+    visitRollupIncrements,
+)
+
+# Default number of segments (and threads) the visits table is scanned with
+DEFAULT_SEGMENTS: int = 8
+
+def countVisitRollups(visits_table, before: str, segments: int = DEFAULT_SEGMENTS) -> list[dict]:
+    """
+    Counts every visit before a day into rollup items.
+
+    :params visits_table: The dynamodb.Table of visits.
+    :params before: The first day ("YYYY-MM-DD") not to count.
+    :params segments: The number of segments (and threads) to scan the table with.
+    :returns: The rollup items: { 'location', 'day', 'visits', 'hNN' }
+    """
+    visits: list[dict] = scanTable(visits_table, filter_expression = Attr('timestamp').lt(before),
+                                   segments = segments, fields = ['location', 'timestamp'])
+
+    # Visits from before locations were required can't be counted
+    increments: dict = visitRollupIncrements([visit for visit in visits if 'location' in visit])
+
+    return [
+        { **dict(zip(VISIT_ROLLUP_KEY, key_values)), **counters }
+        for key_values, counters in increments.items()
+    ]
+
+def main():
+    parser = argparse.ArgumentParser(description="Recount the visit rollups of past days from the visits table.")
+    parser.add_argument("visits_table", help="Name of the visits table.")
+    parser.add_argument("rollups_table", help="Name of the visit rollups table.")
+    parser.add_argument("--before", default=date.today().isoformat(),
+                        help="First day (YYYY-MM-DD) not to recount. Defaults to today.")
+    parser.add_argument("--segments", type=int, default=DEFAULT_SEGMENTS, help="Segments to scan the table with.")
+    parser.add_argument("--region", default=None, help="AWS region of the tables.")
+    parser.add_argument("--dry-run", action="store_true", help="Count the visits without writing.")
+    args = parser.parse_args()
+
+    if not DATE_PATTERN.fullmatch(args.before):
+        parser.error("--before must be a day in the format YYYY-MM-DD.")
+
+    dynamodb = boto3.resource('dynamodb', region_name=args.region, config=AWS_CLIENT_CONFIG)
+    rollups: list[dict] = countVisitRollups(dynamodb.Table(args.visits_table), args.before,
+                                            segments = args.segments)
+
+    visits: int = sum(rollup['visits'] for rollup in rollups)
+    if args.dry_run:
+        print(f"Would write {len(rollups)} rollups counting {visits} visits before {args.before}.")
+        return
+
+    round_trips: int = batchPutItems(dynamodb.Table(args.rollups_table), rollups)
+    print(f"Wrote {len(rollups)} rollups counting {visits} visits before {args.before} "
+          f"in {round_trips} round trips.")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,215 @@
+"""
+Online backfill of the sharded TimestampIndex (and TimestampBucketIndex) of a table.
+
+Every entry found through a TimestampIndex holds the shard (an _ignore value
+from "1" to the number of shards) it was written to. Entries written before the
+index was sharded are all in shard "1", which the lambdas keep reading, so they
+stay visible; this script spreads them over every shard. It has to be run
+before lowering the number of shards, since entries in shards above the new
+count are no longer read.
+
+Entries written before the TimestampBucketIndex existed have no _bucket (the
+day or month of their timestamp), so bounded time range reads would miss them.
+Given --bucket-length, this script adds it; turn on bucket reads (see
+Database.timestamp_bucket_reads) only after it has run.
+
+This script scans the table in parallel (segments) and updates every entry
+whose _ignore value isn't the shard ShardedIndex.shardKey picks for it (or
+whose _bucket isn't the one BucketedIndex.bucketKey picks). Only entries that
+already have an _ignore value are updated, and only if they still exist, so
+it is safe to run while the api is live and to run more than once.
+
+Usage (from the cdk/ directory):
+
+python api_gateway/utilsFolder/reshard_timestamp_index.py TABLE SORT_KEY --shards N [--bucket-length {10,7}] [--segments N] [--region REGION] [--dry-run]
+
+SORT_KEY is the attribute the TimestampIndex sorts by ('timestamp' for visits
+and equipment, 'last_updated' for qualifications).
+"""
+from dataclasses import dataclass
+import argparse
+import os
+import sys
+
+import boto3
+from botocore.exceptions import ClientError
+
+# Import api_defaults the same way the lambdas do
+LAMBDA_CODE_DIR: str = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "lambda_code")
+sys.path.append(LAMBDA_CODE_DIR)
+
+from api_defaults import (
+    AWS_CLIENT_CONFIG,
+    BUCKET_ATTRIBUTE_NAME,
+    DAY_BUCKET_LENGTH,
+    DEFAULT_SCAN_LIMIT,
+    GSI_ATTRIBUTE_NAME,
+    MONTH_BUCKET_LENGTH,
+    TIMESTAMP_BUCKET_INDEX,
+    BucketedIndex,
+    ShardedIndex,
+    timestampIndex,
+)
+
+# Default number of segments (and threads) the table is scanned with
+DEFAULT_SEGMENTS: int = 8
+
+@dataclass
+class ReshardStats():
+    """
+    Class counting what a backfill did. Comprised of the number of indexed
+    entries 'scanned', the number of entries 'moved' to another shard (or
+    bucket), and the number of entries 'skipped' because they were deleted
+    while moving.
+    """
+    scanned: int = 0
+    moved: int = 0
+    skipped: int = 0
+
+    def __add__(self, other):
+        return ReshardStats(scanned = self.scanned + other.scanned,
+                            moved = self.moved + other.moved,
+                            skipped = self.skipped + other.skipped)
+
+def getKeyAttributes(client, table_name: str) -> list[str]:
+    """
+    Gets the names of a table's key attributes (partition key first).
+
+    :params client: The client of a dynamodb resource.
+    :params table_name: The name of the table.
+    """
+    key_schema: list = client.describe_table(TableName=table_name)['Table']['KeySchema']
+
+    return [key['AttributeName'] for key in sorted(key_schema, key=lambda key: key['KeyType'] != 'HASH')]
+
+def reshardSegment(client, table_name: str, index: ShardedIndex, segment: int,
+                   total_segments: int, dry_run: bool = False) -> ReshardStats:
+    """
+    Moves every indexed entry in one segment of a table to its shard (and
+    bucket, if the index has a bucket index).
+
+    :params client: The client of a dynamodb resource (e.g., table.meta.client),
+                    which takes and returns plain python values.
+    :params table_name: The name of the table.
+    :params index: The ShardedIndex describing the table's TimestampIndex.
+    :params segment: The segment of the table to backfill.
+    :params total_segments: The number of segments the table is split into.
+    :params dry_run: Count what would be moved without writing anything.
+    """
+    stats = ReshardStats()
+
+    # Only the keys, timestamp, and current shard (and bucket) of indexed entries are needed
+    projected: list[str] = list(index.key_attributes) + [index.sort_key, index.partition_key]
+    if index.bucket_index is not None:
+        projected.append(index.bucket_index.partition_key)
+
+    attribute_names: dict = { f"#p{i}": name for i, name in enumerate(dict.fromkeys(projected)) }
+    attribute_names["#s"] = GSI_ATTRIBUTE_NAME
+
+    scan_kwargs: dict = {
+        'TableName': table_name,
+        'Segment': segment,
+        'TotalSegments': total_segments,
+        'Limit': DEFAULT_SCAN_LIMIT,
+        'ProjectionExpression': ", ".join(name for name in attribute_names if name != "#s"),
+        'FilterExpression': "attribute_exists(#s)",
+        'ExpressionAttributeNames': attribute_names,
+    }
+    while True:
+        response = client.scan(**scan_kwargs)
+
+        for item in response['Items']:
+            stats.scanned += 1
+
+            # Index attributes the entry doesn't have (the right value of) yet
+            changes: dict = {
+                name: value for name, value in index.indexAttributes(item).items()
+                if item.get(name) != value
+            }
+            if not changes:
+                continue
+
+            if dry_run:
+                stats.moved += 1
+                continue
+
+            try:
+                client.update_item(
+                    TableName=table_name,
+                    Key={ name: item[name] for name in index.key_attributes },
+                    UpdateExpression="SET " + ", ".join(f"#u{i} = :u{i}" for i in range(len(changes))),
+                    ConditionExpression="attribute_exists(#s)",
+                    ExpressionAttributeNames={
+                        "#s": GSI_ATTRIBUTE_NAME,
+                        **{ f"#u{i}": name for i, name in enumerate(changes) },
+                    },
+                    ExpressionAttributeValues={ f":u{i}": value for i, value in enumerate(changes.values()) }
+                )
+                stats.moved += 1
+            except ClientError as e:
+                if e.response['Error']['Code'] != 'ConditionalCheckFailedException':
+                    raise
+                stats.skipped += 1
+
+        if 'LastEvaluatedKey' not in response:
+            break
+        scan_kwargs['ExclusiveStartKey'] = response['LastEvaluatedKey']
+
+    return stats
+
+def reshardTable(client, table_name: str, sort_key: str, shards: int,
+                 segments: int = DEFAULT_SEGMENTS, dry_run: bool = False,
+                 bucket_length: int = None) -> ReshardStats:
+    """
+    Moves every indexed entry of a table to its shard (and bucket),
+    backfilling every segment of the table at the same time.
+
+    :params client: The client of a dynamodb resource (e.g., table.meta.client).
+                    Clients are thread safe, unlike the resource itself.
+    :params table_name: The name of the table.
+    :params sort_key: The name of the attribute the TimestampIndex sorts by.
+    :params shards: The number of shards to spread the entries over.
+    :params segments: The number of segments (and threads) to scan the table with.
+    :params dry_run: Count what would be moved without writing anything.
+    :params bucket_length: Optional length of the TimestampBucketIndex buckets
+                           (DAY_BUCKET_LENGTH or MONTH_BUCKET_LENGTH) to backfill.
+    """
+    from concurrent.futures import ThreadPoolExecutor
+
+    index: ShardedIndex = timestampIndex(sort_key, getKeyAttributes(client, table_name), shards = shards)
+    if bucket_length is not None:
+        index.bucket_index = BucketedIndex(name = TIMESTAMP_BUCKET_INDEX, partition_key = BUCKET_ATTRIBUTE_NAME,
+                                           sort_key = sort_key, bucket_length = bucket_length)
+
+    with ThreadPoolExecutor(max_workers=segments) as executor:
+        results = executor.map(
+            lambda segment: reshardSegment(client, table_name, index, segment, segments, dry_run),
+            range(segments)
+        )
+
+        return sum(results, ReshardStats())
+
+def main():
+    parser = argparse.ArgumentParser(description="Spread the entries of a table over the shards of its TimestampIndex.")
+    parser.add_argument("table", help="Name of the table to backfill.")
+    parser.add_argument("sort_key", help="Attribute the TimestampIndex sorts by.")
+    parser.add_argument("--shards", type=int, required=True,
+                        help="Shards of the TimestampIndex (see Database.timestamp_index_shards).")
+    parser.add_argument("--bucket-length", type=int, choices=[DAY_BUCKET_LENGTH, MONTH_BUCKET_LENGTH], default=None,
+                        help="Also backfill the TimestampBucketIndex, bucketed by day (10) or month (7).")
+    parser.add_argument("--segments", type=int, default=DEFAULT_SEGMENTS, help="Segments to scan the table with.")
+    parser.add_argument("--region", default=None, help="AWS region of the table.")
+    parser.add_argument("--dry-run", action="store_true", help="Count what would be moved without writing.")
+    args = parser.parse_args()
+
+    client = boto3.resource('dynamodb', region_name=args.region, config=AWS_CLIENT_CONFIG).meta.client
+    stats: ReshardStats = reshardTable(client, args.table, args.sort_key, args.shards,
+                                       segments = args.segments, dry_run = args.dry_run,
+                                       bucket_length = args.bucket_length)
+
+    action: str = "Would move" if args.dry_run else "Moved"
+    print(f"Scanned {stats.scanned} indexed entries. {action} {stats.moved} to their shard (or bucket); "
+          f"skipped {stats.skipped} deleted while moving.")
+
+if __name__ == "__main__":
+    main()
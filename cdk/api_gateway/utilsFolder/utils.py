@@ -44,7 +44,8 @@ def create_table(table_name: str, primary_key: str):
 @mock_aws
 def create_gsi_table(table_name: str, primary_key: str, sort_key: str):
     """
-    Create a dynamodb table with a global secondary index to use when testing.
+    Create a dynamodb table with the timestamp (and timestamp bucket) global
+    secondary indexes to use when testing.
 
     :params table_name: The name of the dynamodb table.
     :params primary_key: The name of the primary key to use.
@@ -79,6 +80,10 @@ def create_gsi_table(table_name: str, primary_key: str, sort_key: str):
                 'AttributeName': GSI_ATTRIBUTE_NAME,
                 'AttributeType': 'S'
             },
+            {
+                'AttributeName': BUCKET_ATTRIBUTE_NAME,
+                'AttributeType': 'S'
+            },
         ],
         GlobalSecondaryIndexes=[
             {
@@ -101,6 +106,142 @@ def create_gsi_table(table_name: str, primary_key: str, sort_key: str):
                     'WriteCapacityUnits': 5
                 },
             },
+            {
+                'IndexName': TIMESTAMP_BUCKET_INDEX,
+                'KeySchema': [
+                    {
+                        'AttributeName': BUCKET_ATTRIBUTE_NAME,
+                        'KeyType': 'HASH'
+                    },
+                    {
+                        'AttributeName': sort_key,
+                        'KeyType': 'RANGE'
+                    },
+                ],
+                'Projection': {
+                    'ProjectionType': 'KEYS_ONLY'
+                },
+                'ProvisionedThroughput': {
+                    'ReadCapacityUnits': 5,
+                    'WriteCapacityUnits': 5
+                },
+            },
+        ],
+        ProvisionedThroughput={
+            'ReadCapacityUnits': 5,
+            'WriteCapacityUnits': 5
+        }
+    )
+
+    table.wait_until_exists()
+
+    return table
+
+
+@mock_aws
+def create_indexed_table(table_name: str, primary_key: str, index_sort_key: str):
+    """
+    Create a dynamodb table keyed only by its primary key, whose global
+    secondary index sorts by a (non key) attribute, to use when testing.
+
+    :params table_name: The name of the dynamodb table.
+    :params primary_key: The name of the primary key to use.
+    :params index_sort_key: The name of the attribute the index sorts by.
+    :returns: A dynamodb.Table to use.
+    """
+
+    boto3.setup_default_session()
+    resource = boto3.resource('dynamodb', region_name='us-east-1')
+    table = resource.create_table(
+        TableName=table_name,
+        KeySchema=[
+            {
+                'AttributeName': primary_key,
+                'KeyType': 'HASH'  # Partition key
+            },
+        ],
+        AttributeDefinitions=[
+            {
+                'AttributeName': primary_key,
+                'AttributeType': 'S'
+            },
+            {
+                'AttributeName': index_sort_key,
+                'AttributeType': 'S'
+            },
+            {
+                'AttributeName': GSI_ATTRIBUTE_NAME,
+                'AttributeType': 'S'
+            },
+        ],
+        GlobalSecondaryIndexes=[
+            {
+                'IndexName': TIMESTAMP_INDEX,
+                'KeySchema': [
+                    {
+                        'AttributeName': GSI_ATTRIBUTE_NAME,
+                        'KeyType': 'HASH'
+                    },
+                    {
+                        'AttributeName': index_sort_key,
+                        'KeyType': 'RANGE'
+                    },
+                ],
+                'Projection': {
+                    'ProjectionType': 'KEYS_ONLY'
+                },
+                'ProvisionedThroughput': {
+                    'ReadCapacityUnits': 5,
+                    'WriteCapacityUnits': 5
+                },
+            },
+        ],
+        ProvisionedThroughput={
+            'ReadCapacityUnits': 5,
+            'WriteCapacityUnits': 5
+        }
+    )
+
+    table.wait_until_exists()
+
+    return table
+
+
+@mock_aws
+def create_sorted_table(table_name: str, primary_key: str, sort_key: str):
+    """
+    Create a dynamodb table keyed by a primary and sort key, without any
+    secondary index, to use when testing.
+
+    :params table_name: The name of the dynamodb table.
+    :params primary_key: The name of the primary key to use.
+    :params sort_key: The name of the sort key to use.
+    :returns: A dynamodb.Table to use.
+    """
+
+    boto3.setup_default_session()
+    resource = boto3.resource('dynamodb', region_name='us-east-1')
+    table = resource.create_table(
+        TableName=table_name,
+        KeySchema=[
+            {
+                'AttributeName': primary_key,
+                'KeyType': 'HASH'  # Partition key
+            },
+            {
+                'AttributeName': sort_key,
+                'KeyType': 'RANGE'  # Sort key
+            },
+        ],
+        AttributeDefinitions=[
+            {
+                'AttributeName': primary_key,
+                'AttributeType': 'S'
+            },
+            {
+                'AttributeName': sort_key,
+                'AttributeType': 'S'
+            },
         ],
         ProvisionedThroughput={
             'ReadCapacityUnits': 5,
@@ -121,10 +262,40 @@ def create_ses_client():
     return client
 
 
+class RecordingTable():
+    """
+    Wraps a dynamodb.Table and records the keyword arguments of every
+    query, scan, and get_item request made through it. Every other attribute
+    is passed through to the wrapped table.
+    """
+
+    def __init__(self, table):
+        self.table = table
+        self.queries: list[dict] = []
+        self.scans: list[dict] = []
+        self.gets: list[dict] = []
+
+    def query(self, **kwargs):
+        self.queries.append(kwargs)
+        return self.table.query(**kwargs)
+
+    def scan(self, **kwargs):
+        self.scans.append(kwargs)
+        return self.table.scan(**kwargs)
+
+    def get_item(self, **kwargs):
+        self.gets.append(kwargs)
+        return self.table.get_item(**kwargs)
+
+    def __getattr__(self, name):
+        return getattr(self.table, name)
+
+
 def create_rest_http_event(httpMethod: str, resource: str,
                       body = {},
                       pathParameters: dict = {},
-                      queryStringParameters: dict = {}
+                      queryStringParameters: dict = {},
+                      headers: dict = {}
                       ) -> dict:
     """
     Creates a Rest HTTP event similar to what ApiGateway will
@@ -144,6 +315,7 @@ def create_rest_http_event(httpMethod: str, resource: str,
                            their values.
     :params queryStringParameters: A dictionary of query parameter
                                    names and their values as strings.
+    :params headers: A dictionary of request header names and their values.
     :returns: A json object representing an AWS ApiGateway event.
     """
 
@@ -175,7 +347,7 @@ def get_all_table_items(dynamodb_table) -> dict:
     """
 
     # Scan for all items in the table
-    items: list = scanTable(dynamodb_table)
+    items: list = scanTable(dynamodb_table, segments = SCAN_SEGMENTS_AUTO)
 
     # Format them into a dictionary
     data: dict = { 'items': items }
@@ -8,6 +8,28 @@ from aws_cdk import (
 )
 from constructs import Construct
 
+# Number of shards (_ignore values "1" to TIMESTAMP_INDEX_SHARDS) each
+# TimestampIndex spreads its entries over. More shards raise the write
+# throughput of the index, but every time range read queries each shard.
+# Run api_gateway/utilsFolder/reshard_timestamp_index.py after changing it.
+TIMESTAMP_INDEX_SHARDS: int = 4
+
+# Number of characters of a timestamp kept as the partition key (_bucket) of
+# the TimestampBucketIndex of visits and equipment: 10 buckets entries by day
+# ("YYYY-MM-DD"), 7 by month ("YYYY-MM"). Date range reads only query the
+# buckets covering them.
+TIMESTAMP_BUCKET_LENGTH: int = 10
+
+# Whether date range reads use the TimestampBucketIndex. Entries written
+# before it existed have no _bucket, so only turn this on after running
+# api_gateway/utilsFolder/reshard_timestamp_index.py with --bucket-length.
+TIMESTAMP_BUCKET_READS: bool = False
+
+# Days after a registration reminder before the same user can be reminded
+# again. Reminders expire from the registration reminders table (through its
+# TTL) once their window has passed.
+REGISTRATION_REMINDER_WINDOW_DAYS: int = 7
+
 class Database(Stack):
     """
     The Database stack is responsible for provisioning DynamoDB tables required for 
@@ -21,6 +43,9 @@ class Database(Stack):
         - Visits Table
         - Equipment Table
         - Qualifications Table
+        - Registration Reminders Table
+        - Visit Rollups Table
+        - Equipment Rollups Table
     - Configures GSIs to enhance query capabilities.
     - Enables point-in-time recovery for all tables.
     - Retains tables upon stack deletion for data preservation.
@@ -29,6 +54,12 @@ class Database(Stack):
     - scope (Construct): The scope in which this construct is defined.
     - stage (str): The deployment stage (e.g., "dev", "prod") for environment-specific naming.
     - env (Environment): The AWS environment, including account and region, in which the stack is deployed.
+    - timestamp_index_shards (int): The number of shards each TimestampIndex is spread over.
+    - timestamp_bucket_length (int): The length of the timestamp prefix (day or month) the
+      TimestampBucketIndex partitions by.
+    - timestamp_bucket_reads (bool): Whether date range reads use the TimestampBucketIndex.
+    - registration_reminder_window_days (int): Days a reminded user isn't sent another
+      registration reminder.
 
     DynamoDB Tables:
     - Users Table:
@@ -40,6 +71,9 @@ class Database(Stack):
         - GSI (TimestampIndex):
             - Partition Key: `_ignore` (string)
             - Sort Key: `timestamp` (string)
+        - GSI (TimestampBucketIndex):
+            - Partition Key: `_bucket` (string)
+            - Sort Key: `timestamp` (string)
         - Example Query:
             - Query by `user_id` and `timestamp`.
             - Query the TimestampIndex by `_ignore` and `timestamp`.
@@ -49,23 +83,49 @@ class Database(Stack):
         - GSI (TimestampIndex):
             - Partition Key: `_ignore` (string)
             - Sort Key: `timestamp` (string)
+        - GSI (TimestampBucketIndex):
+            - Partition Key: `_bucket` (string)
+            - Sort Key: `timestamp` (string)
         - Example Query:
             - Query by `user_id` and `timestamp`.
             - Query the TimestampIndex by `_ignore` and `timestamp`.
     - Qualifications Table:
         - Partition Key: `user_id` (string)
-        - Sort Key: `last_updated` (string)
         - GSI (TimestampIndex):
             - Partition Key: `_ignore` (string)
             - Sort Key: `last_updated` (string)
         - Example Query:
-            - Query by `user_id` and `last_updated`.
+            - Get by `user_id`.
             - Query the TimestampIndex by `_ignore` and `last_updated`.
+    - Legacy Qualifications Table (read only, until migrated):
+        - Partition Key: `user_id` (string)
+        - Sort Key: `last_updated` (string)
+    - Registration Reminders Table:
+        - Partition Key: `user_id` (string)
+        - TTL Attribute: `expires_at` (epoch seconds)
+        - Example Query: Batch get by `user_id` to find users reminded recently.
+    - Visit Rollups Table:
+        - Partition Key: `location` (string)
+        - Sort Key: `day` (string, "YYYY-MM-DD")
+        - Counters: `visits` and `h00` to `h23` (the visits in each hour)
+        - Example Query: Query by `location` and a range of `day`s.
+    - Equipment Rollups Table:
+        - Partition Key: `equipment_type` (string)
+        - Sort Key: `bucket` (string, "YYYY-MM-DD#{printer_name}")
+        - Counters: `logs`, `print_mass`, `print_duration`, and `status_{print_status}`
+        - Example Query: Query by `equipment_type` and a range of `bucket`s.
 
     Notes:
+    - The TimestampBucketIndex (visits and equipment) partitions entries by the day (or
+      month) of their timestamp, so reads of a date range only query the buckets covering it.
+    - Every TimestampIndex is write sharded: entries are written with an `_ignore` value
+      from "1" to `timestamp_index_shards` (picked from a hash of their key), and reads
+      query every shard and merge them by timestamp.
     - All tables are configured with `PAY_PER_REQUEST` billing mode for cost efficiency.
     - Tables are retained upon stack deletion to avoid accidental data loss.
     - Point-in-time recovery is enabled to allow data recovery for up to 35 days.
+    - The registration reminders table only holds entries that expire within
+      `registration_reminder_window_days`, so it is neither retained nor backed up.
 
     Outputs:
     - None: The class focuses solely on resource creation.
@@ -85,7 +145,11 @@ class Database(Stack):
             - https://docs.aws.amazon.com/cdk/api/v2/python/aws_cdk/RemovalPolicy.html
     """
     def __init__(self, scope: Construct,
-                 stage: str, *, env: Environment):
+                 stage: str, *, env: Environment,
+                 timestamp_index_shards: int = TIMESTAMP_INDEX_SHARDS,
+                 timestamp_bucket_length: int = TIMESTAMP_BUCKET_LENGTH,
+                 timestamp_bucket_reads: bool = TIMESTAMP_BUCKET_READS,
+                 registration_reminder_window_days: int = REGISTRATION_REMINDER_WINDOW_DAYS):
         # Sets up CloudWatch logs and sets level to INFO
         self.logger = logging.getLogger()
         self.logger.setLevel(logging.INFO)
@@ -94,7 +158,15 @@ class Database(Stack):
         self.users_id = 'users'
         self.visits_id = 'visits'
         self.equipment_id = 'equipment'
-        self.qualifications_id = 'qualifications'
+        self.qualifications_id = 'qualifications_by_user'
+        self.legacy_qualifications_id = 'qualifications'
+        self.registration_reminders_id = 'registration_reminders'
+        self.visit_rollups_id = 'visit_rollups'
+        self.equipment_rollups_id = 'equipment_rollups'
+        self.timestamp_index_shards = timestamp_index_shards
+        self.timestamp_bucket_length = timestamp_bucket_length
+        self.timestamp_bucket_reads = timestamp_bucket_reads
+        self.registration_reminder_window_days = registration_reminder_window_days
 
         super().__init__(
             scope, self.id, env=env, termination_protection=True)
@@ -103,6 +175,10 @@ class Database(Stack):
         self.dynamodb_visits_table()
         self.dynamodb_equipment_table()
         self.dynamodb_qualifications_table()
+        self.dynamodb_legacy_qualifications_table()
+        self.dynamodb_registration_reminders_table()
+        self.dynamodb_visit_rollups_table()
+        self.dynamodb_equipment_rollups_table()
 
     def dynamodb_users_table(self):
         """
@@ -145,6 +221,10 @@ class Database(Stack):
             - PK = `{_ignore}` : string
             - SK = `{timestamp}` : string
 
+        GSI (TimestampBucketIndex):
+            - PK = `{_bucket}` : string
+            - SK = `{timestamp}` : string
+
         Example Query:
             python-pseudocode
                 Query the visits table by `user_id` and `timestamp`:
@@ -188,6 +268,19 @@ class Database(Stack):
                 type=aws_dynamodb.AttributeType.STRING)
         )
 
+        # Add GSI with the day (or month) of the timestamp as partition key.
+        # Reads hydrate the full entries, so only keys are projected.
+        self.visits_table.add_global_secondary_index(
+            index_name="TimestampBucketIndex",
+            partition_key=aws_dynamodb.Attribute(
+                name='_bucket',
+                type=aws_dynamodb.AttributeType.STRING),
+            sort_key=aws_dynamodb.Attribute(
+                name='timestamp',
+                type=aws_dynamodb.AttributeType.STRING),
+            projection_type=aws_dynamodb.ProjectionType.KEYS_ONLY
+        )
+
     def dynamodb_equipment_table(self):
         """
         Description:
@@ -202,6 +295,10 @@ class Database(Stack):
             - PK = `{_ignore}` : string
             - SK = `{timestamp}` : string
 
+        GSI (TimestampBucketIndex):
+            - PK = `{_bucket}` : string
+            - SK = `{timestamp}` : string
+
         Example Query:
             python-pseudocode
                 Query the equipment table by `user_id` and `timestamp`:
@@ -245,15 +342,31 @@ class Database(Stack):
                 type=aws_dynamodb.AttributeType.STRING)
         )
 
+        # Add GSI with the day (or month) of the timestamp as partition key.
+        # Reads hydrate the full entries, so only keys are projected.
+        self.equipment_table.add_global_secondary_index(
+            index_name="TimestampBucketIndex",
+            partition_key=aws_dynamodb.Attribute(
+                name='_bucket',
+                type=aws_dynamodb.AttributeType.STRING),
+            sort_key=aws_dynamodb.Attribute(
+                name='timestamp',
+                type=aws_dynamodb.AttributeType.STRING),
+            projection_type=aws_dynamodb.ProjectionType.KEYS_ONLY
+        )
+
     def dynamodb_qualifications_table(self):
         """
         Description:
             Creates the qualifications database table variable
             Adds the GSI to the qualifications_table
 
-        Visits:
+            Each user has exactly one qualifications entry, so the table is
+            keyed by `user_id` alone; reading or updating an entry is a single
+            GetItem/UpdateItem. `last_updated` is only a key of the GSI.
+
+        Qualifications:
             - PK = `{user_id}` : string
-            - SK = `{last_updated}` : string
 
         GSI (TimestampIndex):
             - PK = `{_ignore}` : string
@@ -261,10 +374,9 @@ class Database(Stack):
 
         Example Query:
             python-pseudocode
-                Query the qualifications table by `user_id` and `last_updated`:
-                    dynamodb.query({
-                        KeyConditionExpression: Key('user_id').eq('{user_id_value}') 
-                                                & Key('last_updated').eq('{last_updated_value}')
+                Get a user's qualifications by `user_id`:
+                    dynamodb.get_item({
+                        Key: { 'user_id': '{user_id_value}' }
                     })
             
                 Query the TimestampIndex by `_ignore` and `last_updated`:
@@ -284,6 +396,44 @@ class Database(Stack):
                 name='user_id',
                 type=aws_dynamodb.AttributeType.STRING
             ),
+            billing_mode=aws_dynamodb.BillingMode.PAY_PER_REQUEST
+        )
+        
+        # Add GSI with _ignore as partition key and last_updated as sort key
+        self.qualifications_table.add_global_secondary_index(
+            index_name="TimestampIndex",
+            partition_key=aws_dynamodb.Attribute(
+                name='_ignore',
+                type=aws_dynamodb.AttributeType.STRING),
+            sort_key=aws_dynamodb.Attribute(
+                name='last_updated',
+                type=aws_dynamodb.AttributeType.STRING)
+        )
+
+    def dynamodb_legacy_qualifications_table(self):
+        """
+        Description:
+            Creates the legacy qualifications database table variable
+
+            The original qualifications table, keyed by (`user_id`, `last_updated`).
+            It is only read from (for users not in the qualifications table yet)
+            until api_gateway/utilsFolder/migrate_qualifications.py has copied
+            every user into the qualifications table.
+
+        Legacy Qualifications:
+            - PK = `{user_id}` : string
+            - SK = `{last_updated}` : string
+        """
+        
+        self.legacy_qualifications_table = aws_dynamodb.Table(
+            self,
+            self.legacy_qualifications_id,
+            point_in_time_recovery=True,
+            removal_policy=RemovalPolicy.RETAIN,
+            partition_key=aws_dynamodb.Attribute(
+                name='user_id',
+                type=aws_dynamodb.AttributeType.STRING
+            ),
             sort_key=aws_dynamodb.Attribute(
                 name='last_updated',
                 type=aws_dynamodb.AttributeType.STRING
@@ -291,8 +441,8 @@ class Database(Stack):
             billing_mode=aws_dynamodb.BillingMode.PAY_PER_REQUEST
         )
         
-        # Add GSI with _ignore as partition key and last_updated as sort key
-        self.qualifications_table.add_global_secondary_index(
+        # Keep the existing GSI so the table doesn't change until it is removed
+        self.legacy_qualifications_table.add_global_secondary_index(
             index_name="TimestampIndex",
             partition_key=aws_dynamodb.Attribute(
                 name='_ignore',
@@ -301,3 +451,107 @@ class Database(Stack):
                 name='last_updated',
                 type=aws_dynamodb.AttributeType.STRING)
         )
+
+    def dynamodb_registration_reminders_table(self):
+        """
+        Description:
+            Creates the registration reminders database table variable
+
+            Holds the last registration reminder sent to each user, so users
+            who check in often aren't emailed on every visit. Entries expire
+            (through the table's TTL) once the reminder window has passed.
+
+        Registration Reminders:
+            - PK = `{user_id}` : string
+            - TTL = `{expires_at}` : number (epoch seconds)
+        """
+
+        self.registration_reminders_table = aws_dynamodb.Table(
+            self,
+            self.registration_reminders_id,
+            removal_policy=RemovalPolicy.DESTROY,
+            partition_key=aws_dynamodb.Attribute(
+                name='user_id',
+                type=aws_dynamodb.AttributeType.STRING
+            ),
+            time_to_live_attribute='expires_at',
+            billing_mode=aws_dynamodb.BillingMode.PAY_PER_REQUEST
+        )
+
+    def dynamodb_visit_rollups_table(self):
+        """
+        Description:
+            Creates the visit rollups database table variable
+
+            Holds the number of visits to each location on each day (and in
+            each hour of the day), counted as visits are added, so visit
+            reports read a handful of items instead of every visit.
+
+        Visit Rollups:
+            - PK = `{location}` : string
+            - SK = `{day}` : string
+
+        Example Query:
+            python-pseudocode
+                Query the visit rollups of a location for a range of days:
+                    dynamodb.query({
+                        KeyConditionExpression: Key('location').eq('{location_value}') &
+                                                Key('day').between('{start_day}', '{end_day}')
+                    })
+        """
+
+        self.visit_rollups_table = aws_dynamodb.Table(
+            self,
+            self.visit_rollups_id,
+            point_in_time_recovery=True,
+            removal_policy=RemovalPolicy.RETAIN,
+            partition_key=aws_dynamodb.Attribute(
+                name='location',
+                type=aws_dynamodb.AttributeType.STRING
+            ),
+            sort_key=aws_dynamodb.Attribute(
+                name='day',
+                type=aws_dynamodb.AttributeType.STRING
+            ),
+            billing_mode=aws_dynamodb.BillingMode.PAY_PER_REQUEST
+        )
+
+    def dynamodb_equipment_rollups_table(self):
+        """
+        Description:
+            Creates the equipment rollups database table variable
+
+            Holds the usage of each printer (of each equipment type) on each
+            day: the number of logs, the print mass and duration they add up
+            to, and the number of logs with each print status. Counted as
+            logs are added and patched, so usage reports read a handful of
+            items instead of every log.
+
+        Equipment Rollups:
+            - PK = `{equipment_type}` : string
+            - SK = `{day}#{printer_name}` : string
+
+        Example Query:
+            python-pseudocode
+                Query the equipment rollups of a type for a range of days:
+                    dynamodb.query({
+                        KeyConditionExpression: Key('equipment_type').eq('{equipment_type_value}') &
+                                                Key('bucket').between('{start_day}', '{end_day}$')
+                    })
+        """
+
+        self.equipment_rollups_table = aws_dynamodb.Table(
+            self,
+            self.equipment_rollups_id,
+            point_in_time_recovery=True,
+            removal_policy=RemovalPolicy.RETAIN,
+            partition_key=aws_dynamodb.Attribute(
+                name='equipment_type',
+                type=aws_dynamodb.AttributeType.STRING
+            ),
+            sort_key=aws_dynamodb.Attribute(
+                name='bucket',
+                type=aws_dynamodb.AttributeType.STRING
+            ),
+            billing_mode=aws_dynamodb.BillingMode.PAY_PER_REQUEST
+        )
@@ -142,14 +142,21 @@ class MakerspaceStack(Stack):
         # Set permissions for each lambda function to respective DDB table
         self.database.visits_table.grant_read_write_data(
             self.backend_api.lambda_visits_handler)
+        self.database.visit_rollups_table.grant_read_write_data(
+            self.backend_api.lambda_visits_handler)
 
-        # Both visits and users handlers need access to users table
-        self.database.users_table.grant_read_data(self.backend_api.lambda_visits_handler)
+        # The registration email handler checks who is registered; the
+        # users handler manages them
+        self.database.users_table.grant_read_data(self.backend_api.lambda_registration_email_handler)
+        self.database.registration_reminders_table.grant_read_write_data(
+            self.backend_api.lambda_registration_email_handler)
         self.database.users_table.grant_read_write_data(self.backend_api.lambda_users_handler)
         
         self.database.equipment_table.grant_read_write_data(self.backend_api.lambda_equipment_handler)
+        self.database.equipment_rollups_table.grant_read_write_data(self.backend_api.lambda_equipment_handler)
         
         self.database.qualifications_table.grant_read_write_data(self.backend_api.lambda_qualifications_handler)
+        self.database.legacy_qualifications_table.grant_read_data(self.backend_api.lambda_qualifications_handler)
             
     # def data_migration_stack(self):
         
@@ -204,6 +211,14 @@ class MakerspaceStack(Stack):
             self.database.visits_table.table_name,
             self.database.equipment_table.table_name,
             self.database.qualifications_table.table_name,
+            legacy_qualifications_table_name=self.database.legacy_qualifications_table.table_name,
+            timestamp_index_shards=self.database.timestamp_index_shards,
+            timestamp_bucket_length=self.database.timestamp_bucket_length,
+            timestamp_bucket_reads=self.database.timestamp_bucket_reads,
+            registration_reminders_table_name=self.database.registration_reminders_table.table_name,
+            registration_reminder_window_days=self.database.registration_reminder_window_days,
+            visit_rollups_table_name=self.database.visit_rollups_table.table_name,
+            equipment_rollups_table_name=self.database.equipment_rollups_table.table_name,
             zones=self.dns,
             env=self.env,
         )